@@ -12,11 +12,12 @@ from rich import print
 from rich.table import Table
 from typing_extensions import Annotated
 
+from isra.src.component.mock_iriusrisk import MockIriusRiskServer
 from isra.src.component.template import read_current_component, write_current_component, check_current_component
 from isra.src.config.constants import TEMPLATE_FILE, THREAT_MODEL_FILE, TM_SCHEMA, PREFIX_COMPONENT_DEFINITION, \
     PREFIX_RISK_PATTERN, PREFIX_THREAT, PREFIX_COUNTERMEASURE
 from isra.src.utils.api_functions import upload_xml, add_to_batch, release_component_batch, \
-    pull_remote_component_xml
+    pull_remote_component_xml, reset_api_call_stats, print_api_call_stats
 from isra.src.utils.decorators import get_time
 from isra.src.utils.gpt_functions import query_chatgpt, get_prompt
 from isra.src.utils.questionary_wrapper import qconfirm, qselect, qtext, qmulti
@@ -180,6 +181,7 @@ def upload_component():
     # This should use the IR Python client to make requests to the API, but I'll use requests
     template = read_current_component()
     balance_mitigation_values()
+    reset_api_call_stats()
 
     try:
         # TODO: This function should be replaced at some point when the APIv2 is ready
@@ -188,6 +190,8 @@ def upload_component():
         print(f"Component {template['component']['ref']} uploaded successfully")
     except Exception as e:
         print(f"An error happened when uploading the component to IriusRisk: {e}")
+    finally:
+        print_api_call_stats()
 
 
 def add_component_to_batch():
@@ -822,6 +826,22 @@ def release():
     release_batch()
 
 
+@app.command(hidden=True)
+def mock_iriusrisk(port: Annotated[int, typer.Option(help="Port to listen on")] = 8766,
+                   latency: Annotated[float, typer.Option(help="Seconds to wait before every answer")] = 0.1,
+                   rate_limit: Annotated[int, typer.Option(help="Calls per second answered before returning 429. "
+                                                                "0 to disable it")] = 0):
+    """
+    Starts a local stand-in of the IriusRisk API to benchmark and test component uploads
+    """
+    server = MockIriusRiskServer(port=port, latency=latency, rate_limit=rate_limit)
+    print(f"Mock IriusRisk listening, set iriusrisk_url to {server.base_url} and any iriusrisk_api_token to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Calls answered: {dict(server.calls)}, rejected: {server.rejected}")
+
+
 @app.command()
 def pull():
     """
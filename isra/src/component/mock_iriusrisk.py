@@ -0,0 +1,283 @@
+"""This file provides a local stand-in of the IriusRisk API, to test and benchmark component uploads offline"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from isra.src.config.constants import CUSTOM_FIELD_STRIDE, CUSTOM_FIELD_SCOPE, CUSTOM_FIELD_STANDARD_BASELINE_REF, \
+    CUSTOM_FIELD_STANDARD_BASELINE_SECTION, CUSTOM_FIELD_ATTACK_ENTERPRISE_TECHNIQUE, \
+    CUSTOM_FIELD_ATTACK_ENTERPRISE_MITIGATION
+
+EMPTY_LIBRARY_XML = ('<?xml version="1.0" encoding="UTF-8"?>'
+                     '<library ref="{ref}" name="{name}" enabled="true" revision="{revision}" tags="">'
+                     '<desc></desc><categoryComponents/><componentDefinitions/><supportedStandards/>'
+                     '<riskPatterns/><rules/></library>')
+
+# Collection of the items by the path used to list and create them
+COLLECTIONS = {
+    "/api/v2/components/categories/summary": "categories",
+    "/api/v2/components/categories": "categories",
+    "/api/v2/components": "components",
+    "/api/v2/libraries": "libraries",
+    "/api/v2/libraries/risk-patterns": "risk-patterns",
+    "/api/v2/libraries/use-cases": "use-cases",
+    "/api/v2/libraries/threats": "threats",
+    "/api/v2/libraries/weaknesses": "weaknesses",
+    "/api/v2/libraries/countermeasures": "countermeasures",
+    "/api/v2/custom-fields": "custom-fields",
+}
+
+# Collections of the elements that v1 relations can reference
+RELATED_COLLECTIONS = {"weaknesses", "countermeasures"}
+
+# Items listed under another one, with the field that points to the parent
+NESTED_COLLECTIONS = {
+    ("libraries", "risk-patterns"): ("risk-patterns", "library"),
+    ("libraries/risk-patterns", "use-cases"): ("use-cases", "riskPattern"),
+}
+
+
+def parse_filter(text):
+    """Returns the (field, value) conditions of an API filter like 'referenceId'='x':AND:'riskPattern.id'='y'"""
+    return re.findall(r"'([^']+)'='([^']*)'", text or "")
+
+
+def get_field(item, path):
+    for part in path.split("."):
+        if not isinstance(item, dict):
+            return None
+        item = item.get(part)
+    return item
+
+
+class _MockIriusRiskHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def handle_request(self, method):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        server = self.server
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+
+        if not server.register(method):
+            return self._send(429, {"error": "Too many requests"}, {"Retry-After": "0"})
+        try:
+            time.sleep(server.latency)
+            with server.lock:
+                if path.startswith("/api/v1/"):
+                    status, answer = server.relate(method, path, json.loads(body or b"{}"))
+                else:
+                    status, answer = server.dispatch(method, path, query, body)
+        finally:
+            server.release()
+
+        if isinstance(answer, bytes):
+            return self._send_bytes(status, answer, "application/xml")
+        return self._send(status, answer)
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def _send(self, status, body, headers=None):
+        self._send_bytes(status, json.dumps(body).encode("utf-8"), "application/hal+json", headers)
+
+    def _send_bytes(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or dict()).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _MockIriusRiskHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency, rate_limit):
+        super().__init__(address, _MockIriusRiskHandler)
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.window = list()
+        self.items = {c: dict() for c in set(COLLECTIONS.values())}
+        self.associations = set()
+        self.relations = list()
+        self.exports = dict()
+        self.next_id = 0
+        for ref in (CUSTOM_FIELD_STRIDE, CUSTOM_FIELD_SCOPE, CUSTOM_FIELD_STANDARD_BASELINE_REF,
+                    CUSTOM_FIELD_STANDARD_BASELINE_SECTION, CUSTOM_FIELD_ATTACK_ENTERPRISE_TECHNIQUE,
+                    CUSTOM_FIELD_ATTACK_ENTERPRISE_MITIGATION):
+            self.create("custom-fields", {"referenceId": ref, "name": ref})
+
+    def register(self, method):
+        """Counts a call. Returns False if it goes over the rate limit of calls per second"""
+        with self.lock:
+            now = time.monotonic()
+            self.window = [t for t in self.window if now - t < 1.0]
+            if self.rate_limit and len(self.window) >= self.rate_limit:
+                self.rejected += 1
+                return False
+            self.window.append(now)
+            self.calls[method] += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def new_id(self):
+        self.next_id += 1
+        return f"00000000-0000-0000-0000-{self.next_id:012d}"
+
+    def page(self, items, query):
+        size = int(query.get("size", ["20"])[0])
+        conditions = parse_filter(query.get("filter", [""])[0])
+        items = [i for i in items if all(str(get_field(i, f)) == v for f, v in conditions)]
+        return {"_embedded": {"items": items[:size]},
+                "page": {"size": size, "totalElements": len(items), "totalPages": -(-len(items) // size),
+                         "number": 0}}
+
+    def dispatch(self, method, path, query, body):
+        if path in COLLECTIONS:
+            collection = self.items[COLLECTIONS[path]]
+            if method == "GET":
+                return 200, self.page(list(collection.values()), query)
+            if method == "POST":
+                return 200, self.create(COLLECTIONS[path], json.loads(body))
+
+        parts = path[len("/api/v2/"):].split("/")
+        # Items by ID: /api/v2/libraries/threats/<id>
+        for prefix, collection in COLLECTIONS.items():
+            if path.startswith(prefix + "/") and path.count("/") == prefix.count("/") + 1:
+                item_id = path.rsplit("/", 1)[1]
+                items = self.items[collection]
+                if item_id not in items:
+                    continue
+                if method == "GET":
+                    return 200, items[item_id]
+                if method == "PUT":
+                    items[item_id].update(json.loads(body))
+                    return 200, items[item_id]
+                if method == "DELETE":
+                    self.delete(collection, item_id)
+                    return 204, {}
+
+        if parts[0] == "libraries" and len(parts) == 3 and parts[2] == "risk-patterns" and method == "GET":
+            items = [i for i in self.items["risk-patterns"].values() if i["library"]["id"] == parts[1]]
+            return 200, self.page(items, query)
+        if parts[:2] == ["libraries", "risk-patterns"] and len(parts) == 4 and parts[3] == "use-cases":
+            items = [i for i in self.items["use-cases"].values() if i["riskPattern"]["id"] == parts[2]]
+            return 200, self.page(items, query)
+        if parts[0] == "components" and len(parts) == 3 and parts[2] == "risk-patterns":
+            if method == "POST":
+                self.associations.add((parts[1], json.loads(body)["riskPattern"]["id"]))
+                return 200, {}
+            items = [self.items["risk-patterns"][rp] for c, rp in self.associations if c == parts[1]]
+            return 200, self.page(items, query)
+        if parts[0] == "libraries" and len(parts) == 3 and parts[2] == "export":
+            library = self.items["libraries"][parts[1]]
+            return 200, self.exports.get(parts[1], EMPTY_LIBRARY_XML.format(
+                ref=library["referenceId"], name=library["name"], revision=1).encode("utf-8"))
+        if parts[0] == "libraries" and len(parts) == 3 and parts[2] == "update-with-file":
+            # Multipart body, the XML is between the headers of the part and the closing boundary
+            start = body.index(b"<?xml")
+            end = body.index(b"</library>") + len(b"</library>")
+            self.exports[parts[1]] = body[start:end]
+            return 202, {}
+        return 404, {"error": f"Unknown path {method} {path}"}
+
+    def relate(self, method, path, data):
+        """Records a relation sent to the v1 API, as long as the weaknesses and countermeasures it references exist"""
+        parts = path[len("/api/v1/"):].split("/")
+        # Elements in the path, like /weaknesses/<ref>/countermeasures, and the one sent in the body
+        references = [(part, parts[i + 1]) for i, part in enumerate(parts[:-1]) if part in RELATED_COLLECTIONS]
+        if parts[-1] in RELATED_COLLECTIONS and isinstance(data, dict) and "ref" in data:
+            references.append((parts[-1], data["ref"]))
+        for collection, ref in references:
+            if not any(i["referenceId"] == ref for i in self.items[collection].values()):
+                return 404, {"error": f"Unknown element {ref} in {collection}"}
+        self.relations.append((method, path, data))
+        return 200, {}
+
+    def create(self, collection, data):
+        item = {"id": self.new_id(), **data}
+        self.items[collection][item["id"]] = item
+        return item
+
+    def delete(self, collection, item_id):
+        del self.items[collection][item_id]
+        if collection == "use-cases":
+            for th_id in [k for k, th in self.items["threats"].items() if th["useCase"]["id"] == item_id]:
+                del self.items["threats"][th_id]
+
+
+class MockIriusRiskServer:
+    """Local server that answers the IriusRisk API calls made to upload components
+
+    Point iriusrisk_url to base_url. Items are kept in memory and every list call honours the filter and size
+    parameters. Relations sent to the v1 API are only recorded, or answered with 404 if they reference weaknesses or
+    countermeasures that don't exist yet. Every answer waits latency seconds, and calls over
+    rate_limit per second are answered with 429 to exercise the retries of the client.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.1, rate_limit=0):
+        self.httpd = _MockIriusRiskHTTPServer((host, port), latency, rate_limit)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def calls(self):
+        return self.httpd.calls
+
+    @property
+    def max_in_flight(self):
+        return self.httpd.max_in_flight
+
+    @property
+    def rejected(self):
+        return self.httpd.rejected
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
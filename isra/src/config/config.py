@@ -1,6 +1,10 @@
+import atexit
+import builtins
 import configparser
+import copy
 import json
 import os
+import threading
 from typing import Annotated
 
 import typer
@@ -32,8 +36,31 @@ def get_info():
         "openai_assistant_id": "OpenAI Assistant ID that will be used to generate answers",
         "iriusrisk_url": "IriusRisk instance URL",
         "iriusrisk_api_token": "IriusRisk API Token",
+        "iriusrisk_timeout_seconds": "Seconds to wait for an answer of the IriusRisk API. Leave empty to use 60",
+        "iriusrisk_max_retries": "Times a rate limited or failed IriusRisk API call is retried, with exponential "
+                                 "backoff. Leave empty to use 4",
+        "iriusrisk_max_concurrency": "Maximum number of IriusRisk API calls in flight when uploading a component. "
+                                     "Leave empty to use 4",
+        "iriusrisk_requests_per_second": "Maximum number of IriusRisk API calls per second. Leave empty to use 10",
+        "iriusrisk_api_spinner": "Show a spinner while waiting for every IriusRisk API call: ENABLED or DISABLED. "
+                                 "Leave empty to enable it",
         "company_name": "Fill only if the content will be released for a specific company",
         "openai_client": "Choose between OPENAI or AZURE",
+        "llm_cache": "Reuse previous answers for identical LLM requests: ENABLED or DISABLED. Leave empty to enable it",
+        "llm_cache_ttl_hours": "Hours a cached LLM answer can be reused. Leave empty to use 720 (30 days)",
+        "llm_cache_max_mb": "Maximum size of the LLM answer cache in MB. Leave empty to use 100",
+        "llm_max_concurrency": "Maximum number of LLM requests in flight during autoscreening. Leave empty to use 4",
+        "llm_requests_per_minute": "Maximum number of LLM requests per minute. Leave empty to use 60",
+        "llm_max_retries": "Times a failed LLM request is retried, with exponential backoff. Leave empty to use 4",
+        "llm_run_timeout_seconds": "Seconds to wait for an OpenAI Assistant answer before giving up. "
+                                   "Leave empty to use 300",
+        "llm_metrics": "Record tokens, latency and cost of every LLM request: ENABLED or DISABLED. "
+                       "Leave empty to enable it",
+        "llm_candidate_retrieval": "Send only the closest CWEs and ASVS sections in the prompt: "
+                                   "ENABLED, DISABLED or COMPARE (send both prompts and record if they agree). "
+                                   "Leave empty to enable it",
+        "llm_candidate_top_k": "Number of candidates sent in the prompt when retrieval is enabled. "
+                               "Leave empty to use 20",
     }
 
 
@@ -60,19 +87,108 @@ def get_property(key):
         raise typer.Exit(-1)
 
 
+def get_number_property(key, default):
+    """
+    Return a numeric property, or the default value if the property is empty, not a number or not positive
+    """
+    try:
+        value = float(get_property(key) or default)
+    except (TypeError, ValueError):
+        value = default
+    return value if value > 0 else default
+
+
+class FrozenDict(dict):
+    """Read-only dict shared by every caller of get_resource. Use copy.deepcopy to get a mutable copy"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Resources are shared and read-only, use copy.deepcopy() to get a copy that can be modified")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __deepcopy__(self, memo):
+        return {copy.deepcopy(k, memo): copy.deepcopy(v, memo) for k, v in self.items()}
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class FrozenList(list):
+    """Read-only list shared by every caller of get_resource. Use copy.deepcopy to get a mutable copy"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Resources are shared and read-only, use copy.deepcopy() to get a copy that can be modified")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = append = extend = insert = remove = pop = clear = sort = \
+        reverse = _read_only
+
+    def __deepcopy__(self, memo):
+        return [copy.deepcopy(v, memo) for v in self]
+
+    def __reduce__(self):
+        return builtins.list, (builtins.list(self),)
+
+
+# Frozen resources can be dumped like the plain dicts and lists they come from
+for _dumper in (yaml.SafeDumper, yaml.Dumper):
+    _dumper.add_representer(FrozenDict, _dumper.represent_dict)
+    _dumper.add_representer(FrozenList, _dumper.represent_list)
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    # The list command of this module hides the built-in list
+    if isinstance(value, builtins.list):
+        return FrozenList(freeze(v) for v in value)
+    return value
+
+
+# Parsed resources by (resource, filetype), with the modification time of the file when it was parsed
+_resource_cache = dict()
+_resource_cache_lock = threading.Lock()
+_resource_cache_stats = {"hits": 0, "misses": 0}
+_resource_paths = dict()
+RESOURCE_STATS_ENV = "ISRA_RESOURCE_STATS"
+
+
+def get_resource_path(resource):
+    # Looking up the package is much slower than reading a cached resource, so it is only done once per resource
+    resource_path = _resource_paths.get(resource)
+    if resource_path is None:
+        resource_path = files('isra.src.resources').joinpath(resource)
+        _resource_paths[resource] = resource_path
+    return resource_path
+
+
 def get_resource(resource, filetype="yaml"):
     """
-    Return the parsed resource, ready to use. By default it parses YAML
+    Return the parsed resource, ready to use. By default it parses YAML.
+    Resources are parsed once per process and parsed again only if the file changes. The same read-only object is
+    returned to every caller, so use copy.deepcopy if it has to be modified
     :param resource: the resource to get
-    :param filetype: the file type of the resource: [json, yaml, path, text].
+    :param filetype: the file type of the resource: [json, jsonl, yaml, path, text].
     :return:
     """
-    resource_path = files('isra.src.resources').joinpath(resource)
+    resource_path = get_resource_path(resource)
+    if filetype == "path":
+        return resource_path
+
+    key = (str(resource), filetype)
+    mtime = os.stat(str(resource_path)).st_mtime_ns
+    with _resource_cache_lock:
+        cached = _resource_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            _resource_cache_stats["hits"] += 1
+            return cached[1]
+        _resource_cache_stats["misses"] += 1
+
     if filetype == "json":
         with open(str(resource_path)) as f:
             result = json.load(f)
-    elif filetype == "path":
-        result = resource_path
+    elif filetype == "jsonl":
+        with open(str(resource_path), 'r', encoding="utf8") as f:
+            result = [json.loads(line) for line in f if line.strip()]
     elif filetype == "text":
         with open(str(resource_path), 'r', encoding="utf8") as f:
             result = str(f.read())
@@ -80,9 +196,32 @@ def get_resource(resource, filetype="yaml"):
         with open(str(resource_path), 'r', encoding="utf8") as yml:
             result = yaml.safe_load(yml)
 
+    result = freeze(result)
+    with _resource_cache_lock:
+        _resource_cache[key] = (mtime, result)
     return result
 
 
+def get_resource_cache_stats():
+    """Return the hits and misses of the resource cache, and the number of resources parsed"""
+    with _resource_cache_lock:
+        return dict(_resource_cache_stats, entries=len(_resource_cache))
+
+
+def clear_resource_cache():
+    with _resource_cache_lock:
+        _resource_cache.clear()
+
+
+def print_resource_cache_stats():
+    stats = get_resource_cache_stats()
+    print(f"Resource cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} resources parsed")
+
+
+if os.getenv(RESOURCE_STATS_ENV) == "1":
+    atexit.register(print_resource_cache_stats)
+
+
 def get_sf_values(key=None):
     system_field_values = get_resource(SYSTEM_FIELD_VALUES)
     if key:
@@ -238,6 +377,15 @@ def update():
                 value = ""
         elif opt == "openai_client":
             value = qselect("Select OpenAI client", choices=["OPENAI", "AZURE"])
+        elif opt == "llm_cache":
+            value = qselect("Reuse previous LLM answers?", choices=["ENABLED", "DISABLED"])
+        elif opt == "llm_metrics":
+            value = qselect("Record LLM request metrics?", choices=["ENABLED", "DISABLED"])
+        elif opt == "iriusrisk_api_spinner":
+            value = qselect("Show a spinner on every IriusRisk API call?", choices=["ENABLED", "DISABLED"])
+        elif opt == "llm_candidate_retrieval":
+            value = qselect("Send only the closest candidates in the prompt?",
+                            choices=["ENABLED", "DISABLED", "COMPARE"])
         elif opt == "iriusrisk_url":
             value = qtext("Write the new value: ", default=properties[opt])
             if value.endswith("/ui#!app"):
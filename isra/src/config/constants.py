@@ -12,6 +12,9 @@ def get_app_dir():
 
 CONFIG_FOLDER = Path(get_app_dir()) / "config"
 BACKUP_FOLDER = Path(get_app_dir()) / "backup"
+CACHE_FOLDER = Path(get_app_dir()) / "cache"
+METRICS_FOLDER = Path(get_app_dir()) / "metrics"
+BATCH_FOLDER = Path(get_app_dir()) / "batch"
 
 # Configuration files
 
@@ -21,10 +24,29 @@ AUTOSCREENING_CONFIG_FILE = CONFIG_FOLDER / 'autoscreening.yaml'
 TEMPLATE_FILE = CONFIG_FOLDER / "temp.irius"
 THREAT_MODEL_FILE = CONFIG_FOLDER / "threat_model.json"
 
+# Cache files
+
+COMPONENT_CORPUS_CACHE_FILE = CACHE_FOLDER / "component_corpus.json"
+LLM_CACHE_FILE = CACHE_FOLDER / "llm_responses.sqlite"
+CWE_INDEX_CACHE_FILE = CACHE_FOLDER / "cwe_index.pickle"
+OPENCRE_INDEX_CACHE_FILE = CACHE_FOLDER / "opencre_index.pickle"
+UPLOAD_STATE_FOLDER = CACHE_FOLDER / "uploads"
+
+# Metrics files
+
+LLM_METRICS_FILE = METRICS_FOLDER / "llm_requests.jsonl"
+RETRIEVAL_METRICS_FILE = METRICS_FOLDER / "retrieval_agreement.jsonl"
+
+# Batch files
+
+BATCH_CHECKPOINT_FILE = BATCH_FOLDER / "autoscreening_checkpoint.jsonl"
+
 # Resource files
 
 CWE_SOURCE_FILE = "cwec_v4.13.xml"
 PROMPTS_DIR = "prompts"
+CWE_CANDIDATES = "external_info/cwe.jsonl"
+ASVS_CANDIDATES = "external_info/asvs.jsonl"
 ILE_JAR_FILE = "editor-2.0.0.jar"
 TEST_ANSWERS_FILE = "test_answers.yaml"
 OPENCRE_PLUS = "cre_mappings_plus.yaml"
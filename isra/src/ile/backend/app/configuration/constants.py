@@ -23,6 +23,9 @@ class ILEConstants:
 
     # Configuration keys
     MAIN_LIBRARY_FOLDER = "main-library-folder"
+    CHANGELOG_WORKERS = "changelog-workers"
+    CHANGELOG_CACHE_SIZE = "changelog-cache-size"
+    TEST_WORKERS = "test-workers"
 
     # Non-ASCII character mapping for text processing
     NON_ASCII_CODES: Dict[int, str] = {
@@ -3,6 +3,7 @@ Changelog controller for IriusRisk Content Manager API
 """
 
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from isra.src.ile.backend.app.models import ChangelogRequest, Graph, GraphList, LibrarySummariesResponse, ChangelogReport
 from isra.src.ile.backend.app.facades.project_facade import ProjectFacade
 
@@ -26,6 +27,12 @@ async def changelog_between_versions(request: ChangelogRequest, project_facade:
     return project_facade.create_changelog_between_versions(request)
 
 
+@router.post("/project/diff/versions/stream")
+async def changelog_between_versions_stream(request: ChangelogRequest, project_facade: ProjectFacade = Depends(get_project_facade)) -> StreamingResponse:
+    """Create changelog between versions as an NDJSON stream, one record per library"""
+    return StreamingResponse(project_facade.stream_changelog_between_versions(request), media_type="application/x-ndjson")
+
+
 @router.post("/project/diff/versions/summaries")
 async def get_library_summaries(request: ChangelogRequest, project_facade: ProjectFacade = Depends(get_project_facade)) -> LibrarySummariesResponse:
     """Get library summaries"""
@@ -2,7 +2,9 @@
 Test controller for IriusRisk Content Manager API
 """
 
-from fastapi import APIRouter, Depends
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query
 from isra.src.ile.backend.app.models import IRTestReport
 from isra.src.ile.backend.app.facades.version_facade import VersionFacade
 
@@ -14,7 +16,13 @@ def get_version_facade() -> VersionFacade:
     return VersionFacade()
 
 
+# Not async: tests can take long, so they run in the threadpool instead of blocking the event loop
 @router.get("/version/{version_ref}/test")
-async def run_tests(version_ref: str, version_facade: VersionFacade = Depends(get_version_facade)) -> IRTestReport:
-    """Run tests for version"""
-    return version_facade.run_tests(version_ref)
+def run_tests(version_ref: str, tests: Optional[List[str]] = Query(None), workers: Optional[int] = None,
+              timeout: Optional[float] = None, incremental: bool = False, profile_memory: bool = False,
+              version_facade: VersionFacade = Depends(get_version_facade)) -> IRTestReport:
+    """Run tests for version, only what changed since the last run if incremental
+
+    The peak memory of every test is only reported with profile_memory, since tracing allocations is much slower.
+    """
+    return version_facade.run_tests(version_ref, tests, workers, timeout, incremental, profile_memory)
@@ -2,14 +2,15 @@
 Project facade for IriusRisk Content Manager API
 """
 
-from typing import List
+import json
+from typing import Iterator, List
 from isra.src.ile.backend.app.models import (
     ILEProject, ILEVersion, IRBaseElement, IRProjectReport, 
     VersionNamesResponse, MergeLibraryRequest, ChangelogRequest,
     Graph, GraphList, LibrarySummariesResponse, ChangelogReport
 )
 from isra.src.ile.backend.app.services.project_service import ProjectService
-from isra.src.ile.backend.app.services.changelog_service import ChangelogService
+from isra.src.ile.backend.app.services.changelog_service import ChangelogContext, ChangelogService
 
 
 class ProjectFacade:
@@ -81,30 +82,49 @@ class ProjectFacade:
     
     def create_changelog_between_libraries(self, changelog_request: ChangelogRequest) -> Graph:
         """Create changelog between libraries"""
-        self.changelog_service.set_changelog_items(changelog_request)
-        return self.changelog_service.get_library_changes()
+        context = self.changelog_service.create_context(changelog_request)
+        return self.changelog_service.get_library_changes(context)
     
     def create_changelog_between_versions(self, changelog_request: ChangelogRequest) -> GraphList:
         """Create changelog between versions"""
-        self.changelog_service.set_changelog_items(changelog_request)
-        return self.changelog_service.get_version_changes()
+        context = self.changelog_service.create_context(changelog_request)
+        return self.changelog_service.get_version_changes(context)
+    
+    def stream_changelog_between_versions(self, changelog_request: ChangelogRequest) -> Iterator[str]:
+        """Create changelog between versions as NDJSON records
+        
+        There is one record per library present in both versions, emitted as soon as its diff completes, and a
+        last record with the added and deleted libraries.
+        """
+        # The context is created right away so that errors are raised before the response starts
+        context = self.changelog_service.create_context(changelog_request)
+        if not context.fv or not context.sv:
+            raise ValueError("Version not found")
+        return self._stream_version_changes(context)
+    
+    def _stream_version_changes(self, context: ChangelogContext) -> Iterator[str]:
+        for library_ref, graph in self.changelog_service.iter_version_changes(context):
+            yield f'{{"library": {json.dumps(library_ref)}, "graph": {graph.model_dump_json()}}}\n'
+        
+        added, deleted = self.changelog_service.get_added_and_deleted_libraries(context)
+        yield json.dumps({"deleted_libraries": deleted, "added_libraries": added}) + "\n"
     
     def create_changelog_between_versions_simple(self, changelog_request: ChangelogRequest) -> str:
         """Create simple changelog between versions"""
-        self.changelog_service.set_changelog_items(changelog_request)
-        return self.changelog_service.create_changelog_between_versions_simple()
+        context = self.changelog_service.create_context(changelog_request)
+        return self.changelog_service.create_changelog_between_versions_simple(context)
     
     def generate_relations_changelog(self, changelog_request: ChangelogRequest) -> ChangelogReport:
         """Generate relations changelog"""
-        self.changelog_service.set_changelog_items(changelog_request)
-        return self.changelog_service.generate_relations_changelog()
+        context = self.changelog_service.create_context(changelog_request)
+        return self.changelog_service.generate_relations_changelog(context)
     
     def get_library_summaries(self, changelog_request: ChangelogRequest) -> LibrarySummariesResponse:
         """Get library summaries"""
-        self.changelog_service.set_changelog_items(changelog_request)
-        return self.changelog_service.get_library_summaries()
+        context = self.changelog_service.create_context(changelog_request)
+        return self.changelog_service.get_library_summaries(context)
     
     def get_library_specific_changes(self, changelog_request: ChangelogRequest) -> Graph:
         """Get library specific changes"""
-        self.changelog_service.set_changelog_items(changelog_request)
-        return self.changelog_service.get_library_specific_changes(changelog_request.library_ref)
+        context = self.changelog_service.create_context(changelog_request)
+        return self.changelog_service.get_library_specific_changes(context, changelog_request.library_ref)
@@ -2,7 +2,7 @@
 Version facade for IriusRisk Content Manager API
 """
 
-from typing import Collection, List
+from typing import Collection, List, Optional
 
 from fastapi import UploadFile
 
@@ -47,9 +47,11 @@ class VersionFacade:
         """Create version report"""
         return self.version_service.create_version_report(version_ref)
     
-    def run_tests(self, version_ref: str) -> IRTestReport:
+    def run_tests(self, version_ref: str, test_names: Optional[List[str]] = None, workers: Optional[int] = None,
+                  timeout: Optional[float] = None, incremental: bool = False,
+                  profile_memory: bool = False) -> IRTestReport:
         """Run tests"""
-        return self.test_service.run_tests(version_ref)
+        return self.test_service.run_tests(version_ref, test_names, workers, timeout, incremental, profile_memory)
     
     def import_library_to_version(self, version_ref: str, submissions: List[UploadFile]) -> None:
         """Import library to version"""
@@ -140,6 +140,18 @@ class IRExtendedRelation(BaseModel):
             mitigation=relation.mitigation
         )
 
+    def __eq__(self, other):
+        if not isinstance(other, IRExtendedRelation):
+            return False
+        return self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def _key(self):
+        return (self.library_ref, self.risk_pattern_ref, self.usecase_ref, self.threat_ref,
+                self.weakness_ref, self.control_ref, self.mitigation)
+
 
 # Elements extending IRBaseElement
 class IRCategoryComponent(IRBaseElement):
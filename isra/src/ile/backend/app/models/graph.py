@@ -1,7 +1,7 @@
 import uuid
-from typing import Any, Dict, List, Optional, Union, Set, TYPE_CHECKING
+from typing import Any, Dict, List, Optional, Union, Set, Tuple, TYPE_CHECKING
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, model_validator
 
 if TYPE_CHECKING:
     pass
@@ -33,9 +33,42 @@ class Graph(BaseModel):
     equalRevisionNumber: bool = False
     changelogList: List['ChangelogItem'] = Field(default_factory=list)
 
+    model_config = ConfigDict(validate_assignment=True)
+
+    # Indexes of the node ids and links. They are built when the graph is created or its lists are replaced, so the
+    # lists must only be grown with add_node and add_link
+    _node_ids: Set[str] = PrivateAttr(default_factory=set)
+    _link_keys: Set[Tuple[str, str]] = PrivateAttr(default_factory=set)
+
+    @model_validator(mode="after")
+    def _build_indexes(self) -> 'Graph':
+        self._node_ids = {node.id for node in self.nodes}
+        self._link_keys = {(link.source, link.target) for link in self.links}
+        return self
+
     def has_node_value(self, node_id: str) -> bool:
         """Check if a node with the given ID exists"""
-        return any(node.id == node_id for node in self.nodes)
+        return node_id in self._node_ids
+
+    def has_link(self, source: str, target: str) -> bool:
+        """Check if a link between the given nodes exists"""
+        return (source, target) in self._link_keys
+
+    def add_node(self, node: 'Node') -> bool:
+        """Add a node unless there is already one with the same ID, returns whether it was added"""
+        if self.has_node_value(node.id):
+            return False
+        self.nodes.append(node)
+        self._node_ids.add(node.id)
+        return True
+
+    def add_link(self, source: str, target: str) -> bool:
+        """Add a link unless it already exists, returns whether it was added"""
+        if self.has_link(source, target):
+            return False
+        self.links.append(Link(source=source, target=target))
+        self._link_keys.add((source, target))
+        return True
 
 
 class GraphList(BaseModel):
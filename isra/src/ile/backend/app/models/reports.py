@@ -79,3 +79,10 @@ class IRTestReport(BaseModel):
     num_failed_tests: int = 0
     num_success_tests: int = 0
     test_results: Dict[str, List[str]] = Field(default_factory=dict)
+    # Seconds taken by every test and by the shared aggregates all of them query
+    test_durations: Dict[str, float] = Field(default_factory=dict)
+    # Peak of memory allocated by every test, in bytes, only when memory profiling was requested
+    test_peak_memory: Dict[str, int] = Field(default_factory=dict)
+    aggregates_duration: float = 0.0
+    # Tests whose results were taken from the last run in an incremental run
+    reused_tests: List[str] = Field(default_factory=list)
@@ -6,6 +6,8 @@ from .project_service import ProjectService
 from .library_service import LibraryService
 from .version_service import VersionService
 from .changelog_service import ChangelogService
+from .changelog_cache import ChangelogCache
+from .digest_service import DigestService
 from .test_service import TestService
 from .data_service import DataService
 from .io import (
@@ -18,6 +20,8 @@ __all__ = [
     'LibraryService',
     'VersionService',
     'ChangelogService',
+    'ChangelogCache',
+    'DigestService',
     'TestService',
     'DataService',
     'XMLImportService',
@@ -0,0 +1,120 @@
+"""
+Change tracker for IriusRisk Content Manager API
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Set, Tuple
+
+# Element types that can be touched. Library elements are always tracked with the library they belong to
+USECASES = "usecases"
+THREATS = "threats"
+WEAKNESSES = "weaknesses"
+CONTROLS = "controls"
+REFERENCES = "references"
+STANDARDS = "standards"
+SUPPORTED_STANDARDS = "supported_standards"
+CATEGORIES = "categories"
+LIBRARIES = "libraries"
+COMPONENTS = "components"
+RISK_PATTERNS = "risk_patterns"
+RELATIONS = "relations"
+RULES = "rules"
+
+LIBRARY_ELEMENT_TYPES = {LIBRARIES, COMPONENTS, RISK_PATTERNS, RELATIONS, RULES}
+
+# Type used when a whole version was replaced or changed in bulk
+ALL = "*"
+
+
+@dataclass
+class VersionChanges:
+    """Elements of a version touched after a given point"""
+    everything: bool = False
+    element_types: Set[str] = field(default_factory=set)
+    # Libraries touched, with the element types touched in each one
+    libraries: Dict[str, Set[str]] = field(default_factory=dict)
+
+    def affects(self, element_types: Set[str]) -> bool:
+        """Whether any of the element types was touched"""
+        return self.everything or bool(self.element_types & element_types)
+
+    def get_libraries(self, element_types: Set[str]) -> Set[str]:
+        """Libraries where any of the element types was touched"""
+        return {ref for ref, types in self.libraries.items() if types & element_types}
+
+
+class ChangeTracker:
+    """Records which elements of every version were touched by the services
+
+    Every touch gets a sequence number, so each consumer can ask for the changes made after its own last
+    checkpoint without interfering with other consumers.
+    """
+
+    _instance: Optional['ChangeTracker'] = None
+
+    def __new__(cls) -> 'ChangeTracker':
+        """
+        Singleton pattern implementation
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._lock = threading.Lock()
+            self._sequence = 0
+            # Sequence number of the last project load, everything before it is outdated
+            self._project_sequence = 0
+            # (element type, library ref) -> sequence number of the last touch, by version
+            self._touches: Dict[str, Dict[Tuple[str, Optional[str]], int]] = {}
+            self._initialized = True
+
+    def get_sequence(self) -> int:
+        """Get the sequence number of the last touch"""
+        return self._sequence
+
+    def touch(self, version_ref: str, element_type: str, library_ref: Optional[str] = None) -> None:
+        """Record that elements of a type were touched, in a library for library elements"""
+        with self._lock:
+            self._sequence += 1
+            self._touches.setdefault(version_ref, {})[(element_type, library_ref)] = self._sequence
+
+    def touch_version(self, version_ref: str) -> None:
+        """Record that a whole version was replaced or changed in bulk"""
+        self.touch(version_ref, ALL)
+
+    def touch_project(self) -> None:
+        """Record that the whole project was replaced"""
+        with self._lock:
+            self._sequence += 1
+            self._project_sequence = self._sequence
+            self._touches.clear()
+
+    def get_library_sequence(self, version_ref: str, library_ref: str) -> int:
+        """Get the sequence number of the last touch of a library, its elements or its whole version"""
+        with self._lock:
+            touches = self._touches.get(version_ref, {})
+            return max([self._project_sequence, touches.get((ALL, None), 0)] +
+                       [sequence for (_, touched_library), sequence in touches.items()
+                        if touched_library == library_ref])
+
+    def get_changes(self, version_ref: str, since: int) -> VersionChanges:
+        """Get the elements of a version touched after the given sequence number"""
+        changes = VersionChanges()
+        with self._lock:
+            if since < self._project_sequence:
+                changes.everything = True
+                return changes
+            touches = list(self._touches.get(version_ref, {}).items())
+
+        for (element_type, library_ref), sequence in touches:
+            if sequence <= since:
+                continue
+            if element_type == ALL:
+                changes.everything = True
+            changes.element_types.add(element_type)
+            if library_ref is not None:
+                changes.libraries.setdefault(library_ref, set()).add(element_type)
+        return changes
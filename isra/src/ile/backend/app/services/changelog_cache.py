@@ -0,0 +1,93 @@
+"""
+Changelog cache for IriusRisk Content Manager API
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+from isra.src.ile.backend.app.configuration.constants import ILEConstants
+from isra.src.ile.backend.app.configuration.properties_manager import PropertiesManager
+
+logger = logging.getLogger(__name__)
+
+
+class ChangelogCache:
+    """In-process LRU cache of changelog results and other graphs derived from the library contents
+
+    Keys always include the content digests of the compared elements or the ChangeTracker sequence of the last
+    touch, so an edit in a version produces new keys and the outdated entries are never hit again: they are just
+    evicted when the cache is full.
+    Cached values are shared between requests and must be treated as read-only.
+    """
+
+    _instance: Optional['ChangelogCache'] = None
+
+    DEFAULT_SIZE = 1024
+
+    def __new__(cls) -> 'ChangelogCache':
+        """
+        Singleton pattern implementation
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._entries: OrderedDict = OrderedDict()
+            self._lock = threading.Lock()
+            self.max_size = self._get_max_size()
+            self.hits = 0
+            self.misses = 0
+            self._initialized = True
+
+    def get_or_create(self, key: Hashable, create: Callable[[], Any]) -> Any:
+        """Get the cached value for the key, creating and storing it if it isn't cached"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Created outside the lock so different keys can be computed at the same time
+        value = create()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        logger.debug(f"Changelog cache: {len(self._entries)} entries, {self.hits} hits, {self.misses} misses")
+        return value
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get the cached value for the key, or None if it isn't cached. Nothing is stored on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        return None
+
+    def clear(self) -> None:
+        """Remove all the entries"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def _get_max_size(cls) -> int:
+        """Maximum number of entries, configurable with the changelog-cache-size property"""
+        value = PropertiesManager.get_property(ILEConstants.CHANGELOG_CACHE_SIZE)
+        try:
+            return max(0, int(value))
+        except (TypeError, ValueError):
+            return cls.DEFAULT_SIZE
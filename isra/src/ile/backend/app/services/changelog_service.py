@@ -4,36 +4,76 @@ Changelog service for IriusRisk Content Manager API
 
 import logging
 import json
-from typing import List, Set, Dict, Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Set, Dict, Optional, Tuple
 from collections import OrderedDict
 
+from isra.src.ile.backend.app.configuration.constants import ILEConstants
+from isra.src.ile.backend.app.configuration.properties_manager import PropertiesManager
 from isra.src.ile.backend.app.models import (
     ILEVersion, IRCategoryComponent, IRComponentDefinition, IRControl,
     IRLibrary, IRReference, IRRelation, IRRiskPattern, IRRule,
     IRStandard, IRSupportedStandard, IRThreat, IRUseCase, IRWeakness,
     Change, ChangelogItem, ChangelogReport, Graph, GraphList,
-    IRNode, Link, LibrarySummary, LibrarySummariesResponse,
+    IRNode, LibrarySummary, LibrarySummariesResponse,
     ChangelogRequest, IRExtendedRelation,
     IRRiskPatternItem, IRUseCaseItem, IRThreatItem, IRWeaknessItem, IRControlItem
 )
+from isra.src.ile.backend.app.services.changelog_cache import ChangelogCache
 from isra.src.ile.backend.app.services.data_service import DataService
+from isra.src.ile.backend.app.services.digest_service import DigestService, LibraryDigest, get_digest
 
 logger = logging.getLogger(__name__)
 
 
+def create_changelog_item(category: str, name: str, action: str, changes: List[Change]) -> ChangelogItem:
+    """Create changelog item"""
+    item = ChangelogItem()
+    item.element = category
+    item.elementRef = name
+    item.action = action
+    item.changes = changes
+    # Set info based on action
+    if action == "N":
+        item.info = f"The element {name} has been added"
+    elif action == "D":
+        item.info = f"The element {name} has been deleted"
+    elif action == "E":
+        item.info = f"The element {name} has been modified"
+    return item
+
+
+class ChangelogContext:
+    """Request-scoped data of a changelog: the versions and libraries being compared
+    
+    The context is never modified once created. The digest services only memoize values that are the same
+    for every caller, so a context can be shared by the workers that diff the libraries in parallel.
+    """
+    
+    def __init__(self, fv: ILEVersion, sv: ILEVersion, first: Optional[IRLibrary] = None,
+                 second: Optional[IRLibrary] = None):
+        self.fv = fv
+        self.sv = sv
+        self.first = first
+        self.second = second
+        # Missing versions are reported by each operation
+        self.fv_digests = DigestService(fv) if fv else None
+        self.sv_digests = DigestService(sv) if sv and (not fv or sv.version != fv.version) else self.fv_digests
+
+
 class ChangelogService:
-    """Service for generating changelogs between versions and libraries"""
+    """Service for generating changelogs between versions and libraries
+    
+    The service doesn't keep any state between calls: everything a changelog needs lives in a ChangelogContext
+    and every library comparison builds its own graph in a LibraryChangelog.
+    """
     
     def __init__(self):
         self.data_service = DataService()
-        self.graph: Optional[Graph] = None
-        self.fv: Optional[ILEVersion] = None
-        self.first: Optional[IRLibrary] = None
-        self.sv: Optional[ILEVersion] = None
-        self.second: Optional[IRLibrary] = None
+        self.cache = ChangelogCache()
     
-    def set_changelog_items(self, changelog_request: ChangelogRequest) -> None:
-        """Set changelog items for comparison"""
+    def create_context(self, changelog_request: ChangelogRequest) -> ChangelogContext:
+        """Create the context with the items to compare"""
         fv = self.data_service.get_version(changelog_request.from_version)
         first = None
         if changelog_request.first_library:
@@ -44,88 +84,130 @@ class ChangelogService:
         if changelog_request.second_library:
             second = self.data_service.get_library(sv.version, changelog_request.library_ref)
         
-        self.graph = Graph()
-        self.fv = fv
-        self.first = first
-        self.sv = sv
-        self.second = second
+        return ChangelogContext(fv, sv, first, second)
     
-    def get_library_changes(self) -> Graph:
+    def get_library_changes(self, context: ChangelogContext) -> Graph:
         """Get changes between two libraries"""
-        if not self.first or not self.second:
+        if not context.first or not context.second:
             return Graph()
-        
-        # If the libraries and the versions are the same there is no point to do the changelog
-        if (self.first.ref == self.second.ref and 
-            self.fv.version == self.sv.version):
-            return Graph()
-        
-        logger.info(f"Creating changelog for {self.fv.version}/{self.first.ref} => {self.sv.version}/{self.second.ref}")
-        
-        changes = []
-        self._get_change(changes, "revision", self.first.revision, self.second.revision)
-        self._get_change(changes, "ref", self.first.ref, self.second.ref)
-        self._get_change(changes, "name", self.first.name, self.second.name)
-        self._get_change(changes, "desc", self.first.desc, self.second.desc)
-        self._get_change(changes, "filename", self.first.filename, self.second.filename)
-        self._get_change(changes, "enabled", self.first.enabled, self.second.enabled)
-        
-        # Root node, always appears
-        root = IRNode(self.second.ref, changes, "ROOT")
-        if changes:
-            root.type = "E"
-            self._add_item_to_changelog_list("Library", self.second.ref, "E", changes)
-        self.graph.nodes.append(root)
-        
-        # Add various elements to graph
-        self._add_categories_to_graph(root.id)
-        self._add_components_to_graph(root.id)
-        self._add_supported_standards_to_graph(root.id)
-        self._add_standards_to_graph(root.id)
-        self._add_risk_patterns_to_graph(root.id)
-        self._add_rules_to_graph(root.id)
-        
-        # If we are checking libraries from the same version we don't have to check for differences
-        if self.fv.version != self.sv.version:
-            self._add_usecases_to_graph(root.id)
-            self._add_threats_to_graph(root.id)
-            self._add_controls_to_graph(root.id)
-            self._add_weaknesses_to_graph(root.id)
-            self._add_references_to_graph(root.id)
-        
-        self.graph.revFirst = self.first.revision
-        self.graph.revSecond = self.second.revision
-        
-        if self.graph.changelogList and self.first.revision == self.second.revision:
-            logger.info("This library has the same revision number but it has changes")
-            self.graph.equalRevisionNumber = True
-        
-        return self.graph
+        return self._get_library_graph(context, context.first, context.second)
     
-    def get_version_changes(self) -> GraphList:
+    def get_version_changes(self, context: ChangelogContext) -> GraphList:
         """Get changes between two versions"""
         gl = GraphList()
         
-        for l1 in self.fv.libraries.keys():
-            if l1 in self.sv.libraries:
-                self.first = self.fv.libraries[l1]
-                self.second = self.sv.libraries[l1]
-                # Initialize self.graph before calling get_library_changes() which uses it
-                self.graph = Graph()
-                gl.graphs[l1] = self.get_library_changes()
+        common_libraries = [l1 for l1 in context.fv.libraries.keys() if l1 in context.sv.libraries]
+        graphs = self._diff_libraries(context, common_libraries)
+        
+        for l1 in context.fv.libraries.keys():
+            if l1 in context.sv.libraries:
+                gl.graphs[l1] = graphs[l1]
             else:
-                gl.deleted_libraries.append(self.fv.libraries[l1].name)
+                gl.deleted_libraries.append(context.fv.libraries[l1].name)
         
-        for l2 in self.sv.libraries.keys():
-            if l2 not in self.fv.libraries:
-                gl.added_libraries.append(self.sv.libraries[l2].name)
+        for l2 in context.sv.libraries.keys():
+            if l2 not in context.fv.libraries:
+                gl.added_libraries.append(context.sv.libraries[l2].name)
         
         return gl
     
-    def create_changelog_between_versions_simple(self) -> str:
+    def iter_version_changes(self, context: ChangelogContext) -> Iterator[Tuple[str, Graph]]:
+        """Get changes between two versions library by library, as soon as each diff completes
+        
+        Only the libraries present in both versions are yielded: added and deleted ones are listed in
+        get_added_and_deleted_libraries. Graphs already cached are reused, but the new ones are not stored: a
+        whole version would evict everything else from the cache.
+        """
+        common_libraries = [l1 for l1 in context.fv.libraries.keys() if l1 in context.sv.libraries]
+        yield from self._iter_libraries(common_libraries, lambda ref: self._get_library_graph(
+            context, context.fv.libraries[ref], context.sv.libraries[ref], store=False))
+    
+    @staticmethod
+    def get_added_and_deleted_libraries(context: ChangelogContext) -> Tuple[List[str], List[str]]:
+        """Get the names of the libraries added to and deleted from the first version"""
+        added = [context.sv.libraries[l2].name for l2 in context.sv.libraries.keys() if l2 not in context.fv.libraries]
+        deleted = [context.fv.libraries[l1].name for l1 in context.fv.libraries.keys() if l1 not in context.sv.libraries]
+        return added, deleted
+    
+    def _diff_libraries(self, context: ChangelogContext, library_refs: List[str]) -> Dict[str, Graph]:
+        """Diff the libraries present in both versions"""
+        return self._map_libraries(library_refs, lambda ref: self._get_library_graph(
+            context, context.fv.libraries[ref], context.sv.libraries[ref]))
+    
+    def _get_library_graph(self, context: ChangelogContext, first: IRLibrary, second: IRLibrary,
+                           store: bool = True) -> Graph:
+        """Get the changelog graph of two libraries, reusing the cached one if their contents haven't changed
+        
+        The key includes the content digests of both libraries, so any edit leads to a new entry. Cached graphs
+        are shared by every endpoint and must not be modified. With store=False the cache is only read.
+        """
+        first_digest = context.fv_digests.get_library_digest(first)
+        second_digest = context.sv_digests.get_library_digest(second)
+        key = ("library", context.fv.version, context.sv.version, first.ref, second.ref,
+               first_digest.root, second_digest.root)
+        if not store:
+            graph = self.cache.get(key)
+            return graph if graph is not None else LibraryChangelog(context, first, second).create()
+        return self.cache.get_or_create(key, lambda: LibraryChangelog(context, first, second).create())
+    
+    def _map_libraries(self, library_refs: List[str], task) -> Dict[str, object]:
+        """Run a task for every library across a worker pool
+        
+        Results are collected in the order of library_refs, so the output doesn't depend on which worker
+        finishes first.
+        """
+        workers = self._get_workers()
+        if workers <= 1 or len(library_refs) <= 1:
+            return {ref: task(ref) for ref in library_refs}
+        
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="changelog") as executor:
+            return dict(zip(library_refs, executor.map(task, library_refs)))
+    
+    def _iter_libraries(self, library_refs: List[str], task: Callable[[str], Graph]) -> Iterator[Tuple[str, Graph]]:
+        """Run a task for every library across a worker pool, yielding the results in completion order
+        
+        Only a few tasks per worker are submitted at a time, so the results that the consumer hasn't taken yet
+        don't pile up in memory.
+        """
+        workers = self._get_workers()
+        if workers <= 1 or len(library_refs) <= 1:
+            for ref in library_refs:
+                yield ref, task(ref)
+            return
+        
+        pending_refs = iter(library_refs)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="changelog") as executor:
+            running = {}
+            for ref in pending_refs:
+                running[executor.submit(task, ref)] = ref
+                if len(running) >= workers * 2:
+                    break
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ref = running.pop(future)
+                    next_ref = next(pending_refs, None)
+                    if next_ref is not None:
+                        running[executor.submit(task, next_ref)] = next_ref
+                    yield ref, future.result()
+    
+    @staticmethod
+    def _get_workers() -> int:
+        """Number of threads used to diff libraries, configurable with the changelog-workers property
+        
+        Diffing is pure Python and holds the GIL, so extra threads don't make it faster: libraries are diffed
+        one after another unless the property asks for more workers.
+        """
+        value = PropertiesManager.get_property(ILEConstants.CHANGELOG_WORKERS)
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return 1
+    
+    def create_changelog_between_versions_simple(self, context: ChangelogContext) -> str:
         """Create simple changelog between versions"""
         json_obj = {}
-        gl = self.get_version_changes()
+        gl = self.get_version_changes(context)
         
         items_allowed = {"RiskPattern", "Component Definitions", "Supported Standards", 
                         "Usecases", "Threats", "Weaknesses", "Controls", "Rules"}
@@ -170,17 +252,28 @@ class ChangelogService:
         
         return json.dumps(json_obj)
     
-    def generate_relations_changelog(self) -> ChangelogReport:
+    def generate_relations_changelog(self, context: ChangelogContext) -> ChangelogReport:
         """Generate relations changelog"""
+        # The report depends on the relations of every library and on the controls of the first version
+        key = ("relations", context.fv.version, context.sv.version,
+               tuple((ref, context.fv_digests.get_library_digest(lib).relations)
+                     for ref, lib in context.fv.libraries.items()),
+               tuple((ref, context.sv_digests.get_library_digest(lib).relations)
+                     for ref, lib in context.sv.libraries.items()),
+               get_digest(sorted(context.fv.controls.keys())))
+        return self.cache.get_or_create(key, lambda: self._create_relations_changelog(context))
+    
+    def _create_relations_changelog(self, context: ChangelogContext) -> ChangelogReport:
+        """Compare the relations of all the libraries of both versions"""
         report = ChangelogReport()
         
         old_relations = []
-        for lib in self.fv.libraries.values():
+        for lib in context.fv.libraries.values():
             for rel in lib.relations.values():
                 old_relations.append(IRExtendedRelation.from_relation(lib.ref, "", rel))
         
         new_relations = []
-        for lib in self.sv.libraries.values():
+        for lib in context.sv.libraries.values():
             for rel in lib.relations.values():
                 new_relations.append(IRExtendedRelation.from_relation(lib.ref, "", rel))
         
@@ -194,7 +287,7 @@ class ChangelogService:
         for c in new_relations:
             if not c.control_ref or c.control_ref == "":
                 continue
-            if c.control_ref not in self.fv.controls:
+            if c.control_ref not in context.fv.controls:
                 if c.control_ref not in new_countermeasures:
                     new_countermeasures[c.control_ref] = []
                 new_countermeasures[c.control_ref].append(c)
@@ -203,17 +296,17 @@ class ChangelogService:
         
         return report
     
-    def get_library_summaries(self) -> LibrarySummariesResponse:
+    def get_library_summaries(self, context: ChangelogContext) -> LibrarySummariesResponse:
         """Get library summaries"""
         response = LibrarySummariesResponse()
         
-        if not self.fv or not self.sv:
+        if not context.fv or not context.sv:
             return response
         
         # Get added libraries
-        for lib_name in self.sv.libraries.keys():
-            if lib_name not in self.fv.libraries:
-                library = self.sv.libraries[lib_name]
+        for lib_name in context.sv.libraries.keys():
+            if lib_name not in context.fv.libraries:
+                library = context.sv.libraries[lib_name]
                 response.added_libraries.append(LibrarySummary(
                     ref=library.ref,
                     name=library.name,
@@ -224,9 +317,9 @@ class ChangelogService:
                 ))
         
         # Get deleted libraries
-        for lib_name in self.fv.libraries.keys():
-            if lib_name not in self.sv.libraries:
-                library = self.fv.libraries[lib_name]
+        for lib_name in context.fv.libraries.keys():
+            if lib_name not in context.sv.libraries:
+                library = context.fv.libraries[lib_name]
                 response.deleted_libraries.append(LibrarySummary(
                     ref=library.ref,
                     name=library.name,
@@ -237,51 +330,57 @@ class ChangelogService:
                 ))
         
         # Get modified libraries
-        for lib_name in self.fv.libraries.keys():
-            if lib_name in self.sv.libraries:
-                old_library = self.fv.libraries[lib_name]
-                new_library = self.sv.libraries[lib_name]
-                
-                # Check if there are actual changes
-                has_changes = (old_library.revision != new_library.revision or
-                             old_library.name != new_library.name or
-                             old_library.desc != new_library.desc or
-                             old_library.filename != new_library.filename or
-                             old_library.enabled != new_library.enabled)
-
-                # Check if there are changes in the components, supported standards, standards, risk patterns, usecases, threats, weaknesses, controls, rules
-                # Here I should call the method that compares two libraries, if the result is not empty, then there are changes
-                # library_changes = self.get_library_specific_changes(new_library.ref)
-                # if library_changes.changelogList:
-                #     has_changes = True
-                             
-                if has_changes:
-                    response.modified_libraries.append(LibrarySummary(
-                        ref=new_library.ref,
-                        name=new_library.name,
-                        status="MODIFIED",
-                        old_revision=old_library.revision,
-                        new_revision=new_library.revision,
-                        has_changes=has_changes
-                    ))
+        common_libraries = [l1 for l1 in context.fv.libraries.keys() if l1 in context.sv.libraries]
+        library_changes = self._map_libraries(common_libraries, lambda ref: self._has_changes(context, ref))
+        
+        for lib_name in common_libraries:
+            old_library = context.fv.libraries[lib_name]
+            new_library = context.sv.libraries[lib_name]
+            has_changes = library_changes[lib_name]
+            
+            if has_changes:
+                response.modified_libraries.append(LibrarySummary(
+                    ref=new_library.ref,
+                    name=new_library.name,
+                    status="MODIFIED",
+                    old_revision=old_library.revision,
+                    new_revision=new_library.revision,
+                    has_changes=has_changes
+                ))
         
         return response
     
-    def get_library_specific_changes(self, library_ref: str) -> Graph:
+    def _has_changes(self, context: ChangelogContext, library_ref: str) -> bool:
+        """Check if a library present in both versions has changes"""
+        old_library = context.fv.libraries[library_ref]
+        new_library = context.sv.libraries[library_ref]
+        
+        if (old_library.revision != new_library.revision or
+                old_library.name != new_library.name or
+                old_library.desc != new_library.desc or
+                old_library.filename != new_library.filename or
+                old_library.enabled != new_library.enabled):
+            return True
+        
+        # Check if there are changes in the components, supported standards, standards, risk patterns, usecases,
+        # threats, weaknesses, controls and rules. Libraries with the same content digest are skipped right away
+        return bool(self._get_library_graph(context, old_library, new_library).changelogList)
+    
+    def get_library_specific_changes(self, context: ChangelogContext, library_ref: str) -> Graph:
         """Get library specific changes"""
-        if not self.fv or not self.sv:
+        if not context.fv or not context.sv:
             raise ValueError(f"Library not found: {library_ref}")
         
         # Find the library in both versions
         first_library = None
         second_library = None
         
-        for lib in self.fv.libraries.values():
+        for lib in context.fv.libraries.values():
             if lib.ref == library_ref:
                 first_library = lib
                 break
         
-        for lib in self.sv.libraries.values():
+        for lib in context.sv.libraries.values():
             if lib.ref == library_ref:
                 second_library = lib
                 break
@@ -295,26 +394,111 @@ class ChangelogService:
         if first_library is None:
             # This is a new library (added)
             root = IRNode(second_library.ref, [], "N")
-            self._add_item_to_changelog_list("Library", second_library.ref, "N", [], graph)
-            graph.nodes.append(root)
+            graph.changelogList.append(create_changelog_item("Library", second_library.ref, "N", []))
+            graph.add_node(root)
             graph.revFirst = ""
             graph.revSecond = second_library.revision
         elif second_library is None:
             # This is a deleted library
             root = IRNode(first_library.ref, [], "D")
-            self._add_item_to_changelog_list("Library", first_library.ref, "D", [], graph)
-            graph.nodes.append(root)
+            graph.changelogList.append(create_changelog_item("Library", first_library.ref, "D", []))
+            graph.add_node(root)
             graph.revFirst = first_library.revision
             graph.revSecond = ""
         else:
             # This is a modified library - use the existing logic
-            self.first = first_library
-            self.second = second_library
-            # Initialize self.graph before calling get_library_changes() which uses it
-            self.graph = Graph()
-            graph = self.get_library_changes()
+            graph = self._get_library_graph(context, first_library, second_library)
         
         return graph
+
+
+class LibraryChangelog:
+    """Changelog between two libraries
+    
+    Holds the graph that is being built, so every library comparison needs its own instance.
+    """
+    
+    def __init__(self, context: ChangelogContext, first: IRLibrary, second: IRLibrary):
+        self.fv = context.fv
+        self.sv = context.sv
+        self.first = first
+        self.second = second
+        self.fv_digests = context.fv_digests
+        self.sv_digests = context.sv_digests
+        self.graph = Graph()
+        # Content digests, used to skip everything that hasn't changed between both sides
+        self.first_digest: Optional[LibraryDigest] = None
+        self.second_digest: Optional[LibraryDigest] = None
+    
+    def create(self) -> Graph:
+        """Get changes between the two libraries"""
+        # If the libraries and the versions are the same there is no point to do the changelog
+        if (self.first.ref == self.second.ref and 
+            self.fv.version == self.sv.version):
+            return Graph()
+        
+        logger.info(f"Creating changelog for {self.fv.version}/{self.first.ref} => {self.sv.version}/{self.second.ref}")
+        
+        self.first_digest = self.fv_digests.get_library_digest(self.first)
+        self.second_digest = self.sv_digests.get_library_digest(self.second)
+        
+        changes = []
+        self._get_change(changes, "revision", self.first.revision, self.second.revision)
+        self._get_change(changes, "ref", self.first.ref, self.second.ref)
+        self._get_change(changes, "name", self.first.name, self.second.name)
+        self._get_change(changes, "desc", self.first.desc, self.second.desc)
+        self._get_change(changes, "filename", self.first.filename, self.second.filename)
+        self._get_change(changes, "enabled", self.first.enabled, self.second.enabled)
+        
+        # Root node, always appears
+        root = IRNode(self.second.ref, changes, "ROOT")
+        if changes:
+            root.type = "E"
+            self._add_item_to_changelog_list("Library", self.second.ref, "E", changes)
+        self.graph.add_node(root)
+        
+        if self.first_digest.root == self.second_digest.root:
+            logger.info(f"Library {self.second.ref} has no changes")
+        else:
+            # Add various elements to graph, skipping the sections whose content is the same
+            if self._section_changed("categories"):
+                self._add_categories_to_graph(root.id)
+            if self._section_changed("components"):
+                self._add_components_to_graph(root.id)
+            if self._section_changed("supported_standards"):
+                self._add_supported_standards_to_graph(root.id)
+            if self._section_changed("standards"):
+                self._add_standards_to_graph(root.id)
+            if self._section_changed("risk_patterns"):
+                self._add_risk_patterns_to_graph(root.id)
+            if self._section_changed("rules"):
+                self._add_rules_to_graph(root.id)
+            
+            # If we are checking libraries from the same version we don't have to check for differences
+            if self.fv.version != self.sv.version:
+                if self._section_changed("usecases"):
+                    self._add_usecases_to_graph(root.id)
+                if self._section_changed("threats"):
+                    self._add_threats_to_graph(root.id)
+                if self._section_changed("controls"):
+                    self._add_controls_to_graph(root.id)
+                if self._section_changed("weaknesses"):
+                    self._add_weaknesses_to_graph(root.id)
+                if self._section_changed("references"):
+                    self._add_references_to_graph(root.id)
+        
+        self.graph.revFirst = self.first.revision
+        self.graph.revSecond = self.second.revision
+        
+        if self.graph.changelogList and self.first.revision == self.second.revision:
+            logger.info("This library has the same revision number but it has changes")
+            self.graph.equalRevisionNumber = True
+        
+        return self.graph
+    
+    def _section_changed(self, section: str) -> bool:
+        """Check if a section of the libraries being compared has different content"""
+        return self.first_digest.sections[section] != self.second_digest.sections[section]
     
     def _get_change(self, changes: List[Change], field: str, old_value: Optional[str], new_value: Optional[str]) -> None:
         """Add change to list if values are different"""
@@ -329,8 +513,8 @@ class ChangelogService:
         """Add categories to graph"""
         node_list = []
         
-        cat_first = self._get_categories_of_components(self.first, self.fv)
-        cat_second = self._get_categories_of_components(self.second, self.sv)
+        cat_first = self.first_digest.categories
+        cat_second = self.second_digest.categories
         
         for cat1 in cat_first:
             if cat1 in cat_second:
@@ -386,7 +570,7 @@ class ChangelogService:
         # Modified
         for c1 in self.first.component_definitions.values():
             c2 = components_second_by_ref.get(c1.ref)
-            if c2:
+            if c2 and self.first_digest.components.get(c1.ref) != self.second_digest.components.get(c2.ref):
                 changes = []
                 self._get_change(changes, "name", c1.name or "", c2.name or "")
                 self._get_change(changes, "desc", c1.desc or "", c2.desc or "")
@@ -440,30 +624,18 @@ class ChangelogService:
         
         standards_first = list(self.fv.standards.values())
         standards_second = list(self.sv.standards.values())
+        keys_first = {(st.standard_ref, st.supported_standard_ref) for st in standards_first}
+        keys_second = {(st.standard_ref, st.supported_standard_ref) for st in standards_second}
         
         for st1 in standards_first:
-            found = False
-            for st2 in standards_second:
-                if (st1.standard_ref == st2.standard_ref and 
-                    st1.supported_standard_ref == st2.supported_standard_ref):
-                    found = True
-                    break
-            
-            if not found:
+            if (st1.standard_ref, st1.supported_standard_ref) not in keys_second:
                 # Deleted
                 s_node = IRNode(f"{st1.supported_standard_ref}-{st1.standard_ref}", [], "D")
                 self._add_item_to_changelog_list("Standards", s_node.name, "D", [])
                 node_list.append(s_node)
         
         for st2 in standards_second:
-            found = False
-            for st1 in standards_first:
-                if (st1.standard_ref == st2.standard_ref and 
-                    st1.supported_standard_ref == st2.supported_standard_ref):
-                    found = True
-                    break
-            
-            if not found:
+            if (st2.standard_ref, st2.supported_standard_ref) not in keys_first:
                 # Added
                 s_node = IRNode(f"{st2.supported_standard_ref}-{st2.standard_ref}", [], "N")
                 self._add_item_to_changelog_list("Standards", s_node.name, "N", [])
@@ -502,6 +674,8 @@ class ChangelogService:
         
         for rp_key, rp in self.first.risk_patterns.items():
             if rp_key in self.second.risk_patterns:
+                if self.first_digest.risk_patterns[rp_key] == self.second_digest.risk_patterns[rp_key]:
+                    continue
                 rp2 = self.second.risk_patterns[rp_key]
                 changes = []
                 self._get_change(changes, "name", rp.name or "", rp2.name or "")
@@ -533,21 +707,22 @@ class ChangelogService:
         """Add use cases to graph for a risk pattern"""
         node_list = []
         
-        risk_pattern_tree1 = self.data_service.get_relations_in_tree(self.first)
-        risk_pattern_tree2 = self.data_service.get_relations_in_tree(self.second)
-        
-        rp_item1 = risk_pattern_tree1.get(rp_first.ref)
-        rp_item2 = risk_pattern_tree2.get(rp_second.ref)
+        rp_item1 = self.fv_digests.get_relations_in_tree(self.first).get(rp_first.ref)
+        rp_item2 = self.sv_digests.get_relations_in_tree(self.second).get(rp_second.ref)
         
         if rp_item1 and rp_item2:
             for uc_key, uc_item1 in rp_item1.usecases.items():
                 if uc_key in rp_item2.usecases:
+                    if (self.first_digest.tree_digests[(rp_item1.ref, uc_key)] ==
+                            self.second_digest.tree_digests[(rp_item2.ref, uc_key)]):
+                        continue
                     uc_item2 = rp_item2.usecases[uc_key]
                     
                     n = IRNode(uc_key, [], "E")
                     usecase_id = n.id
                     # Threats
-                    t = self._add_threat_relations_to_graph(usecase_id, uc_item1, uc_item2)
+                    t = self._add_threat_relations_to_graph(usecase_id, uc_item1, uc_item2,
+                                                            (rp_item1.ref, uc_key), (rp_item2.ref, uc_key))
                     
                     if t:
                         self._add_item_to_changelog_list("Relation:Threat", uc_item2.ref, "E", [])
@@ -555,7 +730,8 @@ class ChangelogService:
         
         return self._add_nodes_to_graph(parent_id, node_list)
     
-    def _add_threat_relations_to_graph(self, parent_id: str, uc1: IRUseCaseItem, uc2: IRUseCaseItem) -> bool:
+    def _add_threat_relations_to_graph(self, parent_id: str, uc1: IRUseCaseItem, uc2: IRUseCaseItem,
+                                       path1: tuple, path2: tuple) -> bool:
         """Add threat relations to graph"""
         node_list = []
         
@@ -564,6 +740,9 @@ class ChangelogService:
         
         for threat_key, threat_item1 in th1.items():
             if threat_key in th2:
+                if (self.first_digest.tree_digests[path1 + (threat_key,)] ==
+                        self.second_digest.tree_digests[path2 + (threat_key,)]):
+                    continue
                 threat_item2 = th2[threat_key]
                 
                 n = IRNode(threat_key, [], "E")
@@ -678,23 +857,25 @@ class ChangelogService:
                 node_list.append(node)
         
         # Modified
+        rules_second_by_name = {}
+        for r2 in self.second.rules:
+            rules_second_by_name.setdefault(r2.name, r2)
         for r1 in self.first.rules:
-            for r2 in self.second.rules:
-                if r1.name == r2.name:
-                    changes = []
-                    self._get_change(changes, "name", r1.name or "", r2.name or "")
-                    self._get_change(changes, "module", r1.module or "", r2.module or "")
-                    self._get_change(changes, "gui", r1.gui or "", r2.gui or "")
-                    
-                    n = IRNode(r2.name, changes, "E")
-                    
-                    conditions = self._add_conditions_to_rule(n.id, r1, r2)
-                    actions = self._add_actions_to_rule(n.id, r1, r2)
-                    
-                    if changes or conditions or actions:
-                        self._add_item_to_changelog_list("Rules", r2.name, "E", changes)
-                        node_list.append(n)
-                    break
+            r2 = rules_second_by_name.get(r1.name)
+            if r2 and self.first_digest.rules.get(r1.name) != self.second_digest.rules.get(r2.name):
+                changes = []
+                self._get_change(changes, "name", r1.name or "", r2.name or "")
+                self._get_change(changes, "module", r1.module or "", r2.module or "")
+                self._get_change(changes, "gui", r1.gui or "", r2.gui or "")
+                
+                n = IRNode(r2.name, changes, "E")
+                
+                conditions = self._add_conditions_to_rule(n.id, r1, r2)
+                actions = self._add_actions_to_rule(n.id, r1, r2)
+                
+                if changes or conditions or actions:
+                    self._add_item_to_changelog_list("Rules", r2.name, "E", changes)
+                    node_list.append(n)
         
         return self._create_intermediate_node(parent_id, "rules", node_list)
     
@@ -744,11 +925,13 @@ class ChangelogService:
         """Add use cases to graph"""
         node_list = []
         
-        usecase_first = self._get_list_from_relations(self.first, "usecases")
-        usecase_second = self._get_list_from_relations(self.second, "usecases")
+        usecase_first = self.first_digest.usecases
+        usecase_second = self.second_digest.usecases
         
         for uc1 in usecase_first:
             if uc1 in usecase_second:
+                if self.fv_digests.get_usecase_digest(uc1) == self.sv_digests.get_usecase_digest(uc1):
+                    continue
                 u1 = self.fv.usecases.get(uc1)
                 u2 = self.sv.usecases.get(uc1)
                 if u1 and u2:
@@ -782,11 +965,13 @@ class ChangelogService:
         """Add threats to graph"""
         node_list = []
         
-        threats_first = self._get_list_from_relations(self.first, "threats")
-        threats_second = self._get_list_from_relations(self.second, "threats")
+        threats_first = self.first_digest.threats
+        threats_second = self.second_digest.threats
         
         for th1 in threats_first:
             if th1 in threats_second:
+                if self.fv_digests.get_threat_digest(th1) == self.sv_digests.get_threat_digest(th1):
+                    continue
                 t1 = self.fv.threats.get(th1)
                 t2 = self.sv.threats.get(th1)
                 if t1 and t2:
@@ -834,11 +1019,13 @@ class ChangelogService:
         """Add controls to graph"""
         node_list = []
         
-        control_first = self._get_list_from_relations(self.first, "controls")
-        control_second = self._get_list_from_relations(self.second, "controls")
+        control_first = self.first_digest.controls
+        control_second = self.second_digest.controls
         
         for control1 in control_first:
             if control1 in control_second:
+                if self.fv_digests.get_control_digest(control1) == self.sv_digests.get_control_digest(control1):
+                    continue
                 c1 = self.fv.controls.get(control1)
                 c2 = self.sv.controls.get(control1)
                 if c1 and c2:
@@ -919,11 +1106,13 @@ class ChangelogService:
         """Add weaknesses to graph"""
         node_list = []
         
-        weakness_first = self._get_list_from_relations(self.first, "weaknesses")
-        weakness_second = self._get_list_from_relations(self.second, "weaknesses")
+        weakness_first = self.first_digest.weaknesses
+        weakness_second = self.second_digest.weaknesses
         
         for weakness1 in weakness_first:
             if weakness1 in weakness_second:
+                if self.fv_digests.get_weakness_digest(weakness1) == self.sv_digests.get_weakness_digest(weakness1):
+                    continue
                 w1 = self.fv.weaknesses.get(weakness1)
                 w2 = self.sv.weaknesses.get(weakness1)
                 if w1 and w2:
@@ -962,54 +1151,17 @@ class ChangelogService:
         """Add references to graph at root level"""
         node_list = []
         
-        # Collect references from relations in first library
-        references_first = set()
-        for rel in self.first.relations.values():
-            if rel.threat_uuid and rel.threat_uuid in self.fv.threats:
-                for ref_key in self.fv.threats[rel.threat_uuid].references.values():
-                    if ref_key in self.fv.references:
-                        references_first.add(self.fv.references[ref_key])
-            
-            if rel.weakness_uuid and rel.weakness_uuid in self.fv.weaknesses:
-                for ref_key in self.fv.weaknesses[rel.weakness_uuid].test.references.values():
-                    if ref_key in self.fv.references:
-                        references_first.add(self.fv.references[ref_key])
-            
-            if rel.control_uuid and rel.control_uuid in self.fv.controls:
-                for ref_key in self.fv.controls[rel.control_uuid].references.values():
-                    if ref_key in self.fv.references:
-                        references_first.add(self.fv.references[ref_key])
-                for ref_key in self.fv.controls[rel.control_uuid].test.references.values():
-                    if ref_key in self.fv.references:
-                        references_first.add(self.fv.references[ref_key])
-        
-        # Collect references from relations in second library
-        references_second = set()
-        for rel in self.second.relations.values():
-            if rel.threat_uuid and rel.threat_uuid in self.sv.threats:
-                for ref_key in self.sv.threats[rel.threat_uuid].references.values():
-                    if ref_key in self.sv.references:
-                        references_second.add(self.sv.references[ref_key])
-            
-            if rel.weakness_uuid and rel.weakness_uuid in self.sv.weaknesses:
-                for ref_key in self.sv.weaknesses[rel.weakness_uuid].test.references.values():
-                    if ref_key in self.sv.references:
-                        references_second.add(self.sv.references[ref_key])
-            
-            if rel.control_uuid and rel.control_uuid in self.sv.controls:
-                for ref_key in self.sv.controls[rel.control_uuid].references.values():
-                    if ref_key in self.sv.references:
-                        references_second.add(self.sv.references[ref_key])
-                for ref_key in self.sv.controls[rel.control_uuid].test.references.values():
-                    if ref_key in self.sv.references:
-                        references_second.add(self.sv.references[ref_key])
+        # References reached through the relations of each library
+        references_first = self.first_digest.references
+        references_second = self.second_digest.references
+        
+        references_second_by_name = {}
+        for ref2 in references_second:
+            references_second_by_name.setdefault(ref2.name, ref2)
+        names_first = {ref1.name for ref1 in references_first}
         
         for ref1 in references_first:
-            found_ref = None
-            for ref2 in references_second:
-                if ref2.name == ref1.name:
-                    found_ref = ref2
-                    break
+            found_ref = references_second_by_name.get(ref1.name)
             
             if found_ref:
                 # Modified references
@@ -1027,13 +1179,7 @@ class ChangelogService:
                 node_list.append(node)
         
         for ref2 in references_second:
-            found_ref = None
-            for ref1 in references_first:
-                if ref1.name == ref2.name:
-                    found_ref = ref1
-                    break
-            
-            if not found_ref:
+            if ref2.name not in names_first:
                 # Added references
                 node = IRNode(ref2.name, [], "N")
                 self._add_item_to_changelog_list("References", node.name, "N", [])
@@ -1066,48 +1212,13 @@ class ChangelogService:
         else:
             return self._add_nodes_to_graph(parent_id, node_list)
     
-    def _get_list_from_relations(self, library: IRLibrary, element_type: str) -> Set[str]:
-        """Get list of elements from relations"""
-        elements = set()
-        for rel in library.relations.values():
-            if element_type == "usecases":
-                if rel.usecase_uuid:
-                    elements.add(rel.usecase_uuid)
-            elif element_type == "threats":
-                if rel.threat_uuid:
-                    elements.add(rel.threat_uuid)
-            elif element_type == "weaknesses":
-                if rel.weakness_uuid:
-                    elements.add(rel.weakness_uuid)
-            elif element_type == "controls":
-                if rel.control_uuid:
-                    elements.add(rel.control_uuid)
-        return elements
-    
-    def _get_categories_of_components(self, lib: IRLibrary, version: ILEVersion) -> Set[str]:
-        """Get all category UUIDs from component definitions in library"""
-        category_refs = set()
-        for comp_def in lib.component_definitions.values():
-            if comp_def.category_ref:
-                category_refs.add(comp_def.category_ref)
-        
-        # Convert category references to UUIDs by looking up in version
-        category_uuids = set()
-        for category_ref in category_refs:
-            for category in version.categories.values():
-                if category.ref == category_ref:
-                    category_uuids.add(category.uuid)
-                    break
-        
-        return category_uuids
-    
     def _add_node(self, node: IRNode) -> None:
         """Add node to graph"""
-        self.graph.nodes.append(node)
+        self.graph.add_node(node)
     
     def _add_link(self, parent_id: str, child_id: str) -> None:
         """Add link to graph"""
-        self.graph.links.append(Link(source=parent_id, target=child_id))
+        self.graph.add_link(parent_id, child_id)
     
     def _create_intermediate_node(self, parent_id: str, intermediate_name: str, node_list: List[IRNode]) -> bool:
         """Create intermediate node with child nodes"""
@@ -1137,22 +1248,6 @@ class ChangelogService:
         
         return True
     
-    def _add_item_to_changelog_list(self, category: str, name: str, action: str, changes: List[Change], target_graph: Optional[Graph] = None) -> None:
+    def _add_item_to_changelog_list(self, category: str, name: str, action: str, changes: List[Change]) -> None:
         """Add item to changelog list"""
-        graph_to_use = target_graph if target_graph else self.graph
-        if not graph_to_use:
-            return
-        
-        item = ChangelogItem()
-        item.element = category
-        item.elementRef = name
-        item.action = action
-        item.changes = changes
-        # Set info based on action
-        if action == "N":
-            item.info = f"The element {name} has been added"
-        elif action == "D":
-            item.info = f"The element {name} has been deleted"
-        elif action == "E":
-            item.info = f"The element {name} has been modified"
-        graph_to_use.changelogList.append(item)
+        self.graph.changelogList.append(create_changelog_item(category, name, action, changes))
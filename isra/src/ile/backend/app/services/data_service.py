@@ -4,6 +4,7 @@ Data service for IriusRisk Content Manager API
 
 from typing import Dict, List, Set, Optional
 from isra.src.ile.backend.app.configuration.safety import Safety
+from isra.src.ile.backend.app.services.change_tracker import LIBRARIES, ChangeTracker
 from isra.src.ile.backend.app.models import (
     ILEProject, ILEVersion, IRBaseElement, IRLibrary,
     IRRiskPatternItem, IRUseCaseItem, IRThreatItem, 
@@ -28,6 +29,7 @@ class DataService:
     def __init__(self):
         if not hasattr(self, '_initialized'):
             self.project: ILEProject = None
+            self.change_tracker = ChangeTracker()
             self._initialized = True
     
     def set_project(self, project: ILEProject) -> None:
@@ -35,6 +37,7 @@ class DataService:
         if not Safety.is_safe_input(project.ref):
             raise ValueError("Project name is not valid. Project names must be alphanumeric w/o hyphen")
         self.project = project
+        self.change_tracker.touch_project()
     
     def get_project(self) -> ILEProject:
         """Get current project"""
@@ -63,19 +66,23 @@ class DataService:
         if not Safety.is_safe_input(version.version):
             raise ValueError("Version name is not valid. Version names must be alphanumeric w/o hyphen")
         self.project.versions[version.version] = version
+        self.change_tracker.touch_version(version.version)
     
     def put_library(self, version: str, library: IRLibrary) -> None:
         """Add library to version"""
         v = self.project.versions.get(version)
         v.libraries[library.ref] = library
+        self.change_tracker.touch(version, LIBRARIES, library.ref)
     
     def remove_version(self, version: str) -> None:
         """Remove version"""
         self.project.versions.pop(version, None)
+        self.change_tracker.touch_version(version)
     
     def remove_library(self, version: str, library: str) -> None:
         """Remove library from version"""
         self.project.versions.get(version).libraries.pop(library, None)
+        self.change_tracker.touch(version, LIBRARIES, library)
     
     def get_relations_in_tree(self, lib: IRLibrary) -> Dict[str, IRRiskPatternItem]:
         """Get relations organized in tree structure
@@ -0,0 +1,253 @@
+"""
+Digest service for IriusRisk Content Manager API
+"""
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from isra.src.ile.backend.app.models import (
+    ILEVersion, IRLibrary, IRReference, IRRiskPatternItem
+)
+from isra.src.ile.backend.app.services.data_service import DataService
+
+# Sections of a library digest. The first group only depends on the library itself (and the version-wide
+# standards), the second one on the version elements reached through the library relations
+LIBRARY_SECTIONS = ["library", "categories", "components", "supported_standards", "standards", "risk_patterns",
+                    "rules"]
+RELATED_SECTIONS = ["usecases", "threats", "controls", "weaknesses", "references"]
+
+
+def get_digest(value: Any) -> str:
+    """Return a stable content digest for a value made of strings, lists and tuples"""
+    return hashlib.blake2b(repr(value).encode("utf-8"), digest_size=16).hexdigest()
+
+
+@dataclass
+class LibraryDigest:
+    """Content digests of a library plus the indexes needed to diff it
+
+    Every digest covers the fields that the changelog compares, normalized the same way, plus the references used
+    to name the changelog nodes, so two equal digests mean that the changelog of that element or section is empty.
+    The relations digest covers every relation of the library and is not part of the root digest.
+    """
+    root: str = ""
+    sections: Dict[str, str] = field(default_factory=dict)
+    components: Dict[str, str] = field(default_factory=dict)
+    risk_patterns: Dict[str, str] = field(default_factory=dict)
+    rules: Dict[str, str] = field(default_factory=dict)
+    # Digests of the relation subtrees (Risk pattern > Use case > Threat) keyed by path
+    tree_digests: Dict[Tuple[str, ...], str] = field(default_factory=dict)
+    categories: Set[str] = field(default_factory=set)
+    usecases: Set[str] = field(default_factory=set)
+    threats: Set[str] = field(default_factory=set)
+    weaknesses: Set[str] = field(default_factory=set)
+    controls: Set[str] = field(default_factory=set)
+    references: Set[IRReference] = field(default_factory=set)
+    relations: str = ""
+
+
+class DigestService:
+    """Computes canonical content digests for the elements and libraries of a version
+
+    Element digests are computed lazily and memoized, so they must not outlive the request that created them:
+    a version can be edited at any time. Memoized values are the same whoever computes them, so an instance can be
+    shared between threads.
+    """
+
+    def __init__(self, version: ILEVersion):
+        self.data_service = DataService()
+        self.version = version
+        self._libraries: Dict[str, LibraryDigest] = {}
+        self._relation_trees: Dict[str, Dict[str, IRRiskPatternItem]] = {}
+        self._elements: Dict[str, Dict[str, Optional[str]]] = {
+            "usecases": {}, "threats": {}, "weaknesses": {}, "controls": {}
+        }
+        self._category_uuids: Optional[Dict[str, str]] = None
+        self._supported_standards_digest: Optional[str] = None
+        self._standards_digest: Optional[str] = None
+
+    def get_library_digest(self, lib: IRLibrary) -> LibraryDigest:
+        """Get the digest of a library, computing it the first time"""
+        digest = self._libraries.get(lib.ref)
+        if digest is None:
+            digest = self._create_library_digest(lib)
+            self._libraries[lib.ref] = digest
+        return digest
+
+    def get_relations_in_tree(self, lib: IRLibrary) -> Dict[str, IRRiskPatternItem]:
+        """Get the relation tree of a library, building it the first time"""
+        tree = self._relation_trees.get(lib.ref)
+        if tree is None:
+            tree = self.data_service.get_relations_in_tree(lib)
+            self._relation_trees[lib.ref] = tree
+        return tree
+
+    def get_usecase_digest(self, uuid: str) -> Optional[str]:
+        """Get use case digest, None if the use case doesn't exist in the version"""
+        return self._get_element_digest("usecases", uuid, self._usecase_fields)
+
+    def get_threat_digest(self, uuid: str) -> Optional[str]:
+        """Get threat digest, None if the threat doesn't exist in the version"""
+        return self._get_element_digest("threats", uuid, self._threat_fields)
+
+    def get_weakness_digest(self, uuid: str) -> Optional[str]:
+        """Get weakness digest, None if the weakness doesn't exist in the version"""
+        return self._get_element_digest("weaknesses", uuid, self._weakness_fields)
+
+    def get_control_digest(self, uuid: str) -> Optional[str]:
+        """Get control digest, None if the control doesn't exist in the version"""
+        return self._get_element_digest("controls", uuid, self._control_fields)
+
+    def get_supported_standards_digest(self) -> str:
+        """Get digest of the supported standards of the version"""
+        if self._supported_standards_digest is None:
+            self._supported_standards_digest = get_digest(sorted(
+                [key, st.supported_standard_ref or "", st.supported_standard_name or ""] for key, st in self.version.supported_standards.items()
+            ))
+        return self._supported_standards_digest
+
+    def get_standards_digest(self) -> str:
+        """Get digest of the standards of the version"""
+        if self._standards_digest is None:
+            self._standards_digest = get_digest(sorted(
+                {(st.supported_standard_ref, st.standard_ref) for st in self.version.standards.values()}
+            ))
+        return self._standards_digest
+
+    def get_category_uuids(self, category_refs: Set[str]) -> Set[str]:
+        """Convert category references to UUIDs"""
+        if self._category_uuids is None:
+            # Built aside and then published, as other threads may be reading it
+            category_uuids = {}
+            for category in self.version.categories.values():
+                category_uuids.setdefault(category.ref, category.uuid)
+            self._category_uuids = category_uuids
+        return {self._category_uuids[ref] for ref in category_refs if ref in self._category_uuids}
+
+    def _get_element_digest(self, element_type: str, uuid: str, get_fields) -> Optional[str]:
+        cache = self._elements[element_type]
+        if uuid not in cache:
+            element = getattr(self.version, element_type).get(uuid)
+            cache[uuid] = get_digest(get_fields(element)) if element is not None else None
+        return cache[uuid]
+
+    @staticmethod
+    def _usecase_fields(u) -> Tuple:
+        return u.ref or "", u.name or "", u.desc or ""
+
+    @staticmethod
+    def _threat_fields(t) -> Tuple:
+        return (t.ref or "", t.name or "", t.desc or "",
+                t.risk_rating.confidentiality or "", t.risk_rating.integrity or "",
+                t.risk_rating.availability or "", t.risk_rating.ease_of_exploitation or "",
+                sorted(t.mitre or []), sorted(t.stride or []), sorted(t.references.keys()))
+
+    @staticmethod
+    def _weakness_fields(w) -> Tuple:
+        return w.ref or "", w.name or "", w.desc or "", w.impact or "", w.test.steps or "", sorted(w.test.references.keys())
+
+    @staticmethod
+    def _control_fields(c) -> Tuple:
+        return (c.ref or "", c.name or "", c.desc or "", c.state or "", c.cost or "", c.test.steps or "",
+                sorted(c.base_standard or []), sorted(c.base_standard_section or []),
+                sorted(c.scope or []), sorted(c.mitre or []),
+                sorted(c.standards.keys()), sorted(c.references.keys()), sorted(c.test.references.keys()),
+                sorted(set(c.implementations or [])))
+
+    def _create_library_digest(self, lib: IRLibrary) -> LibraryDigest:
+        digest = LibraryDigest()
+        v = self.version
+
+        # Relations grouped by risk pattern > use case > threat
+        tree: Dict[str, Dict[str, Dict[str, List[Tuple[str, str, str]]]]] = {}
+        for rel in lib.relations.values():
+            if rel.usecase_uuid:
+                digest.usecases.add(rel.usecase_uuid)
+            if rel.threat_uuid:
+                digest.threats.add(rel.threat_uuid)
+            if rel.weakness_uuid:
+                digest.weaknesses.add(rel.weakness_uuid)
+            if rel.control_uuid:
+                digest.controls.add(rel.control_uuid)
+            tree.setdefault(rel.risk_pattern_uuid, {}).setdefault(rel.usecase_uuid, {}).setdefault(
+                rel.threat_uuid, []).append((rel.weakness_uuid, rel.control_uuid, rel.mitigation or ""))
+
+        for t in digest.threats:
+            if t in v.threats:
+                self._add_references(digest, v.threats[t].references)
+        for w in digest.weaknesses:
+            if w in v.weaknesses:
+                self._add_references(digest, v.weaknesses[w].test.references)
+        for c in digest.controls:
+            if c in v.controls:
+                self._add_references(digest, v.controls[c].references)
+                self._add_references(digest, v.controls[c].test.references)
+
+        digest.categories = self.get_category_uuids(
+            {c.category_ref for c in lib.component_definitions.values() if c.category_ref}
+        )
+
+        for c in lib.component_definitions.values():
+            digest.components[c.ref] = get_digest([c.name or "", c.desc or "", c.category_ref or "",
+                                                   sorted(c.risk_pattern_refs or []), c.visible or ""])
+
+        for r in lib.rules:
+            digest.rules.setdefault(r.name, get_digest([
+                r.module or "", r.gui or "",
+                sorted(f"{c.field}####{c.name}####{c.value}" for c in r.conditions),
+                sorted(f"{a.project}####{a.name}####{a.value}" for a in r.actions)
+            ]))
+
+        for rp_key, rp in lib.risk_patterns.items():
+            # The changelog looks for the relations of a risk pattern by its ref
+            rp_tree = self._add_tree_digests(digest, rp.ref, tree[rp.ref]) if rp.ref in tree else ""
+            digest.risk_patterns[rp_key] = get_digest((rp.ref, rp.name or "", rp.desc or "", rp.uuid or "", rp_tree))
+
+        sections = digest.sections
+        sections["library"] = get_digest([lib.revision or "", lib.ref or "", lib.name or "", lib.desc or "",
+                                          lib.filename or "", lib.enabled or ""])
+        sections["categories"] = get_digest(sorted([x, v.categories[x].ref or "", v.categories[x].name or ""]
+                                                 for x in digest.categories))
+        sections["components"] = get_digest(sorted(digest.components.items()))
+        sections["supported_standards"] = self.get_supported_standards_digest()
+        sections["standards"] = self.get_standards_digest()
+        sections["risk_patterns"] = get_digest(sorted(digest.risk_patterns.items()))
+        sections["rules"] = get_digest(sorted(digest.rules.items()))
+        sections["usecases"] = get_digest(sorted([x, self.get_usecase_digest(x)] for x in digest.usecases))
+        sections["threats"] = get_digest(sorted([x, self.get_threat_digest(x)] for x in digest.threats))
+        sections["controls"] = get_digest(sorted([x, self.get_control_digest(x)] for x in digest.controls))
+        sections["weaknesses"] = get_digest(sorted([x, self.get_weakness_digest(x)] for x in digest.weaknesses))
+        sections["references"] = get_digest(sorted({(r.name or "", r.url or "") for r in digest.references}))
+
+        digest.root = get_digest([sections[s] for s in LIBRARY_SECTIONS + RELATED_SECTIONS])
+        digest.relations = get_digest(sorted(
+            (r.risk_pattern_uuid or "", r.usecase_uuid or "", r.threat_uuid or "", r.weakness_uuid or "",
+             r.control_uuid or "", r.mitigation or "") for r in lib.relations.values()
+        ))
+        return digest
+
+    def _add_references(self, digest: LibraryDigest, references: Dict[str, str]) -> None:
+        for ref_key in references.values():
+            if ref_key in self.version.references:
+                digest.references.add(self.version.references[ref_key])
+
+    @staticmethod
+    def _add_tree_digests(digest: LibraryDigest, rp_key: str,
+                          usecases: Dict[str, Dict[str, List[Tuple[str, str, str]]]]) -> str:
+        """Compute the Merkle digests of the relation tree of a risk pattern, bottom-up
+
+        Leaves are the (weakness, control, mitigation) triples of the relations, so a subtree digest covers every
+        relation below it.
+        """
+        usecase_digests = []
+        for uc_key, threats in usecases.items():
+            threat_digests = []
+            for t_key, leaves in threats.items():
+                t_digest = get_digest(sorted(leaves))
+                digest.tree_digests[(rp_key, uc_key, t_key)] = t_digest
+                threat_digests.append((t_key, t_digest))
+            uc_digest = get_digest(sorted(threat_digests))
+            digest.tree_digests[(rp_key, uc_key)] = uc_digest
+            usecase_digests.append((uc_key, uc_digest))
+        return get_digest(sorted(usecase_digests))
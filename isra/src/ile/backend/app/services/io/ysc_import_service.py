@@ -13,10 +13,10 @@ from isra.src.ile.backend.app.models import (
     IRRule, IRRuleAction, IRRuleCondition, IRStandard, IRSupportedStandard,
     IRTest, IRThreat, IRUseCase, IRWeakness
 )
-from isra.src.config.constants import OUTPUT_NAME, CATEGORIES_LIST, STRIDE_LIST, OPENCRE_PLUS, CRE_MAPPING_NAME
-from isra.src.config.config import get_resource
+from isra.src.config.constants import OUTPUT_NAME, CATEGORIES_LIST, STRIDE_LIST, CRE_MAPPING_NAME
 from isra.src.utils.text_functions import generate_identifier_from_ref
 from isra.src.utils.cwe_functions import get_original_cwe_weaknesses, get_cwe_description, get_cwe_impact
+from isra.src.utils.opencre_functions import get_opencre_expansion, get_opencre_standards
 
 logger = logging.getLogger(__name__)
 
@@ -24,48 +24,16 @@ logger = logging.getLogger(__name__)
 class YSCImportService:
     """Service for importing YSC component files"""
     
-    def __init__(self):
-        self._opencre_mappings = None
-    
-    def _get_opencre_mappings(self):
-        """Get OpenCRE+ mappings, caching the result"""
-        if self._opencre_mappings is None:
-            self._opencre_mappings = get_resource(OPENCRE_PLUS)
-        return self._opencre_mappings
-    
     def _get_standard_from_opencre(self, baseline_ref: str, base_standard_section: str) -> Dict[str, set]:
         """
         Get expanded standards from OpenCRE+ mappings for a given baseline standard and section.
         Returns a dictionary mapping standard names to sets of sections.
         """
-        mappings_yaml = self._get_opencre_mappings()
-        
         # Check if baseline_ref is in CRE_MAPPING_NAME
         if baseline_ref not in CRE_MAPPING_NAME:
             return {}
         
-        opencre_standard_name = CRE_MAPPING_NAME[baseline_ref]
-        standards_to_add = dict()
-        
-        # Now we iterate over the OpenCRE+ keys searching for the standard
-        for cre_id, cre_values in mappings_yaml.items():
-            if opencre_standard_name in cre_values:
-                # Now it may happen that the section doesn't appear exactly as it is in the OpenCRE+, so we
-                # apply special techniques to look for the best match
-                adapted = base_standard_section
-                
-                if adapted in cre_values[opencre_standard_name]:
-                    # If the section of the standard can be found inside the CRE we add all values
-                    # of that standard and the CRE ID
-                    standards_to_add.update(cre_values)
-                    if "CRE" not in standards_to_add:
-                        standards_to_add["CRE"] = set()
-                    standards_to_add["CRE"].add(cre_id)
-        
-        # We convert the lists to sets to remove duplicates
-        standards_to_add = {key: set(value) for key, value in standards_to_add.items()}
-        
-        return standards_to_add
+        return get_opencre_expansion(CRE_MAPPING_NAME[baseline_ref], base_standard_section)
     
     def _expand_standards_from_base(self, base_standard: str, base_standard_sections: List[str]) -> Dict[str, List[str]]:
         """
@@ -1192,12 +1160,8 @@ class YSCImportService:
         Check if a standard could be from OpenCRE mappings.
         Returns True if the standard appears in OpenCRE mappings, False otherwise.
         """
-        mappings_yaml = self._get_opencre_mappings()
-        
         # Get all standard names that appear in OpenCRE+
-        opencre_standards = {'CRE', 'OpenCRE'}
-        for cre_values in mappings_yaml.values():
-            opencre_standards.update(cre_values.keys())
+        opencre_standards = {'CRE', 'OpenCRE'} | get_opencre_standards()
         
         # Map supported_standard_ref to standard name for comparison
         standard_name = supported_standard_ref
@@ -12,12 +12,15 @@ from isra.src.ile.backend.app.models import (
     ILEVersion, IRBaseElement, IRComponentDefinition, IRLibrary,
     IRRelation, IRRiskPattern, IRRiskPatternItem, IRRule,
     IRRuleAction, IRRuleCondition, IRThreatItem, IRUseCaseItem,
-    Graph, Link, RuleNode, IRLibraryReport, IRMitigationItem,
+    Graph, RuleNode, IRLibraryReport, IRMitigationItem,
     IRMitigationReport, IRMitigationRiskPattern, ComponentRequest,
     LibraryUpdateRequest, RelationRequest, RiskPatternRequest
 )
+from isra.src.ile.backend.app.services.changelog_cache import ChangelogCache
+from isra.src.ile.backend.app.services.change_tracker import (
+    COMPONENTS, LIBRARIES, RELATIONS, RISK_PATTERNS, ChangeTracker
+)
 from isra.src.ile.backend.app.services.data_service import DataService
-from isra.src.ile.backend.app.facades.io_facade import IOFacade
 
 logger = logging.getLogger(__name__)
 
@@ -26,8 +29,14 @@ class LibraryService:
     """Service for handling library operations"""
     
     def __init__(self):
+        # The facades import this module, so importing them at the top would make the services package
+        # impossible to import on its own, which is what the test worker processes do
+        from isra.src.ile.backend.app.facades.io_facade import IOFacade
+        
         self.data_service = DataService()
         self.io_facade = IOFacade()
+        self.cache = ChangelogCache()
+        self.change_tracker = ChangeTracker()
         self.exceptions = [
             ["GENERIC-SERVICE:AUTHN-SF", "CAPEC-16"],
             ["GENERIC-SERVICE:DATA-SENS:AUTHZ", "CAPEC-232"]
@@ -57,12 +66,22 @@ class LibraryService:
                 raise RuntimeError("Couldn't export to XLSX") from e
     
     def create_rules_graph(self, version_ref: str, library_ref: str) -> Graph:
-        """Create rules graph"""
+        """Create rules graph, reusing the cached one while the library isn't touched
+        
+        The cached graph is shared, so every caller gets its own copy.
+        """
+        lib = self.data_service.get_library(version_ref, library_ref)
+        key = ("rules_graph", version_ref, library_ref,
+               self.change_tracker.get_library_sequence(version_ref, library_ref))
+        return self.cache.get_or_create(key, lambda: self._build_rules_graph(lib)).model_copy(deep=True)
+    
+    @staticmethod
+    def _build_rules_graph(lib: IRLibrary) -> Graph:
+        """Build the graph of rule conditions and actions of a library"""
         g = Graph()
         g.directed = True
         g.multigraph = False
         
-        lib = self.data_service.get_library(version_ref, library_ref)
         rules = lib.rules
         risk_patterns = lib.risk_patterns  # Dict keyed by uuid
         component_definitions = {comp.ref: comp for comp in lib.component_definitions.values()}
@@ -71,19 +90,16 @@ class LibraryService:
             condition_ids = set()
             for c in r.conditions:
                 new_condition = RuleNode(c.name, c.value, "CONDITION", component_definitions)
-                if not g.has_node_value(new_condition.id):
-                    g.nodes.append(new_condition)
+                g.add_node(new_condition)
                 
                 condition_ids.add(new_condition.id)
             
             for a in r.actions:
                 new_action = RuleNode(a.name, a.value, "", risk_patterns, project=a.project)
-                
-                if not g.has_node_value(new_action.id):
-                    g.nodes.append(new_action)
+                g.add_node(new_action)
                 
                 for cond in condition_ids:
-                    g.links.append(Link(source=cond, target=new_action.id))
+                    g.add_link(cond, new_action.id)
         
         return g
     
@@ -194,6 +210,7 @@ class LibraryService:
                         self._fix_mitigation_values(relation_list, 100)
         
         logger.info("Balanced!")
+        self.change_tracker.touch(version_ref, RELATIONS, library_ref)
     
     def _fix_mitigation_values(self, all_relations: List[IRRelation], goal: int) -> None:
         """Fix mitigation values to reach goal"""
@@ -229,6 +246,7 @@ class LibraryService:
         current_lib.revision = new_lib.revision
         current_lib.filename = new_lib.filename
         current_lib.enabled = new_lib.enabled
+        self.change_tracker.touch(version_ref, LIBRARIES, library_ref)
     
     def list_components(self, version_ref: str, library: str) -> Collection[IRComponentDefinition]:
         """List components"""
@@ -246,6 +264,7 @@ class LibraryService:
             visible=body.visible
         )
         l.component_definitions[comp.uuid] = comp
+        self.change_tracker.touch(version_ref, COMPONENTS, lib)
         return comp
     
     def update_component(self, version_ref: str, lib: str, new_comp: IRComponentDefinition) -> IRComponentDefinition:
@@ -253,6 +272,7 @@ class LibraryService:
         v = self.data_service.get_version(version_ref)
         l = v.get_library(lib)
         l.component_definitions[new_comp.uuid] = new_comp
+        self.change_tracker.touch(version_ref, COMPONENTS, lib)
         return new_comp
     
     def delete_component(self, version_ref: str, lib: str, comp: IRComponentDefinition) -> None:
@@ -260,6 +280,7 @@ class LibraryService:
         v = self.data_service.get_version(version_ref)
         l = v.get_library(lib)
         l.component_definitions.pop(comp.uuid, None)
+        self.change_tracker.touch(version_ref, COMPONENTS, lib)
     
     def list_risk_patterns(self, version_ref: str, library: str) -> Collection[IRRiskPattern]:
         """List risk patterns"""
@@ -275,6 +296,7 @@ class LibraryService:
             desc=request.desc
         )
         l.risk_patterns[rp.uuid] = rp
+        self.change_tracker.touch(version_ref, RISK_PATTERNS, library_ref)
         return rp
     
     def update_risk_pattern(self, version_ref: str, lib: str, new_rp: RiskPatternRequest) -> IRRiskPattern:
@@ -293,6 +315,7 @@ class LibraryService:
             rp.desc = new_rp.desc
         
         l.risk_patterns[rp.uuid] = rp
+        self.change_tracker.touch(version_ref, RISK_PATTERNS, lib)
         return rp
     
     def delete_risk_pattern(self, version_ref: str, lib: str, rp: IRRiskPattern) -> None:
@@ -300,6 +323,7 @@ class LibraryService:
         v = self.data_service.get_version(version_ref)
         l = v.get_library(lib)
         l.risk_patterns.pop(rp.uuid, None)
+        self.change_tracker.touch(version_ref, RISK_PATTERNS, lib)
     
     def list_relations(self, version_ref: str, library: str) -> Collection[IRRelation]:
         """List relations"""
@@ -318,6 +342,7 @@ class LibraryService:
             mitigation=body.mitigation
         )
         l.relations[rel.uuid] = rel
+        self.change_tracker.touch(version_ref, RELATIONS, lib)
         return rel
     
     def update_relation(self, version_ref: str, lib: str, new_rel: IRRelation) -> IRRelation:
@@ -325,6 +350,7 @@ class LibraryService:
         v = self.data_service.get_version(version_ref)
         l = v.get_library(lib)
         l.relations[new_rel.uuid] = new_rel
+        self.change_tracker.touch(version_ref, RELATIONS, lib)
         return new_rel
     
     def delete_relation(self, version_ref: str, lib: str, rel: IRRelation) -> None:
@@ -332,3 +358,4 @@ class LibraryService:
         v = self.data_service.get_version(version_ref)
         l = v.get_library(lib)
         l.relations.pop(rel.uuid, None)
+        self.change_tracker.touch(version_ref, RELATIONS, lib)
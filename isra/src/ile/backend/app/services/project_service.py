@@ -16,6 +16,7 @@ from isra.src.ile.backend.app.models import (
     IRComponentDefinition, IRControl, IRRelation, IRRiskPattern,
     IRRule, IRStandard, IRThreat, IRUseCase, IRWeakness
 )
+from isra.src.ile.backend.app.services.change_tracker import ChangeTracker
 from isra.src.ile.backend.app.services.data_service import DataService
 
 logger = logging.getLogger(__name__)
@@ -26,6 +27,7 @@ class ProjectService:
     
     def __init__(self):
         self.data_service = DataService()
+        self.change_tracker = ChangeTracker()
     
     def get_current_project(self) -> ILEProject:
         """Get current project"""
@@ -290,6 +292,7 @@ class ProjectService:
                                 dst_version.references[ref_uuid] = src_version.references[ref_uuid]
                                 result.append(f"Added reference {ref_uuid}")
         
+        self.change_tracker.touch_version(merge_library_request.dst_version)
         return result
     
     def generate_full_library_from_version(self, source: str) -> ILEVersion:
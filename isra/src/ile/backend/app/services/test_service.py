@@ -4,8 +4,16 @@ Test service for IriusRisk Content Manager API
 
 import inspect
 import logging
-from typing import List, Set, Dict
+import multiprocessing
+import signal
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Collection, Dict, FrozenSet, List, Optional, Set, Tuple
 
+from isra.src.ile.backend.app.configuration.constants import ILEConstants
+from isra.src.ile.backend.app.configuration.properties_manager import PropertiesManager
 from isra.src.ile.backend.app.models import (
     ILEVersion, IRCategoryComponent, IRComponentDefinition, IRControl,
     IRLibrary, IRReference, IRRelation, IRRiskPattern, IRRule,
@@ -13,11 +21,328 @@ from isra.src.ile.backend.app.models import (
     IRMitigationItem, IRMitigationReport, IRMitigationRiskPattern,
     IRTestReport
 )
+from isra.src.ile.backend.app.services.change_tracker import (
+    CATEGORIES, COMPONENTS, CONTROLS, LIBRARIES, LIBRARY_ELEMENT_TYPES, REFERENCES, RELATIONS, RISK_PATTERNS,
+    RULES, THREATS, USECASES, WEAKNESSES, ChangeTracker
+)
 from isra.src.ile.backend.app.services.data_service import DataService
 from isra.src.ile.backend.app.services.library_service import LibraryService
 
 logger = logging.getLogger(__name__)
 
+# Rule actions that import a risk pattern into a component
+IMPORT_RISK_PATTERN_ACTIONS = {
+    "IMPORT_RISK_PATTERN", "EXTEND_RISK_PATTERN",
+    "IMPORT_RISK_PATTERN_ORIGIN", "IMPORT_RISK_PATTERN_DESTINATION"
+}
+
+
+@dataclass
+class LibraryAggregates:
+    """Indexes of a single library, they only depend on the contents of the library"""
+    used_usecases: Set[str] = field(default_factory=set)
+    used_threats: Set[str] = field(default_factory=set)
+    used_weaknesses: Set[str] = field(default_factory=set)
+    used_controls: Set[str] = field(default_factory=set)
+    # Relations with a weakness and no control
+    weaknesses_without_controls: List[IRRelation] = field(default_factory=list)
+    # Relations with a control and no weakness
+    orphaned_relations: List[IRRelation] = field(default_factory=list)
+    # Risk pattern > use case > threat, in the same order as the relations tree of the library
+    mitigation_tree: Dict[str, Dict[str, Dict[str, None]]] = field(default_factory=dict)
+    # First mitigation value of every control of a (risk pattern, use case, threat)
+    mitigations: Dict[Tuple[str, str, str], Dict[str, str]] = field(default_factory=dict)
+    risk_pattern_refs: Set[str] = field(default_factory=set)
+    component_risk_pattern_refs: Set[str] = field(default_factory=set)
+    # Values of the actions that import risk patterns
+    import_action_values: List[str] = field(default_factory=list)
+    
+    @classmethod
+    def create(cls, l: IRLibrary) -> 'LibraryAggregates':
+        """Walk the library once and build every index"""
+        aggregates = cls()
+        for rp in l.risk_patterns.values():
+            aggregates.risk_pattern_refs.add(rp.ref)
+        for c in l.component_definitions.values():
+            aggregates.component_risk_pattern_refs.update(c.risk_pattern_refs)
+        for r in l.rules:
+            for a in r.actions:
+                if a.name in IMPORT_RISK_PATTERN_ACTIONS:
+                    aggregates.import_action_values.append(a.value)
+        
+        for rel in l.relations.values():
+            aggregates.used_usecases.add(rel.usecase_uuid)
+            aggregates.used_threats.add(rel.threat_uuid)
+            aggregates.used_weaknesses.add(rel.weakness_uuid)
+            aggregates.used_controls.add(rel.control_uuid)
+            
+            if rel.weakness_uuid != "" and rel.control_uuid == "":
+                aggregates.weaknesses_without_controls.append(rel)
+            if rel.weakness_uuid == "" and rel.control_uuid != "":
+                aggregates.orphaned_relations.append(rel)
+            
+            controls = aggregates.mitigations.setdefault((rel.risk_pattern_uuid, rel.usecase_uuid, rel.threat_uuid), {})
+            if rel.control_uuid != "":
+                controls.setdefault(rel.control_uuid, rel.mitigation)
+            
+            # Same rules as DataService.get_relations_in_tree to know which threats are in the tree
+            if rel.risk_pattern_uuid == "" or rel.usecase_uuid == "":
+                continue
+            threats = aggregates.mitigation_tree.setdefault(rel.risk_pattern_uuid, {}).setdefault(rel.usecase_uuid, {})
+            if rel.control_uuid != "" and rel.mitigation == "":
+                continue
+            if rel.threat_uuid != "":
+                threats.setdefault(rel.threat_uuid, None)
+        return aggregates
+
+
+@dataclass
+class VersionAggregates:
+    """Indexes of a version shared by all the tests
+    
+    They are combined from the aggregates of every library, in the order of the libraries in the version, so the
+    tests report their errors in the same order as if they walked the version themselves.
+    """
+    libraries: Dict[str, LibraryAggregates] = field(default_factory=dict)
+    used_usecases: Set[str] = field(default_factory=set)
+    used_threats: Set[str] = field(default_factory=set)
+    used_weaknesses: Set[str] = field(default_factory=set)
+    used_controls: Set[str] = field(default_factory=set)
+    library_refs: Set[str] = field(default_factory=set)
+    risk_pattern_refs: Set[str] = field(default_factory=set)
+    component_definitions: List[IRComponentDefinition] = field(default_factory=list)
+    component_risk_pattern_refs: Set[str] = field(default_factory=set)
+    rules: List[IRRule] = field(default_factory=list)
+    import_action_values: List[str] = field(default_factory=list)
+    
+    @classmethod
+    def create(cls, v: ILEVersion, previous: Optional['VersionAggregates'] = None,
+               changed_libraries: Collection[str] = ()) -> 'VersionAggregates':
+        """Build the aggregates of a version
+        
+        The library aggregates of a previous run are reused for every library that hasn't changed since then.
+        """
+        aggregates = cls()
+        for l in v.libraries.values():
+            library = None
+            if previous is not None and l.ref not in changed_libraries:
+                library = previous.libraries.get(l.ref)
+            if library is None:
+                library = LibraryAggregates.create(l)
+            aggregates.libraries[l.ref] = library
+            
+            aggregates.library_refs.add(l.ref)
+            aggregates.rules.extend(l.rules)
+            aggregates.component_definitions.extend(l.component_definitions.values())
+            aggregates.risk_pattern_refs |= library.risk_pattern_refs
+            aggregates.component_risk_pattern_refs |= library.component_risk_pattern_refs
+            aggregates.import_action_values.extend(library.import_action_values)
+            aggregates.used_usecases |= library.used_usecases
+            aggregates.used_threats |= library.used_threats
+            aggregates.used_weaknesses |= library.used_weaknesses
+            aggregates.used_controls |= library.used_controls
+        return aggregates
+
+
+@dataclass(frozen=True)
+class TestDependencies:
+    """Element types a test reads
+    
+    Tests with a library check compute their errors library by library, so they can be evaluated again only for
+    the libraries that changed.
+    """
+    element_types: FrozenSet[str]
+    library_check: Optional[str] = None
+
+
+# Tests not listed here are always evaluated again in incremental runs
+TEST_DEPENDENCIES: Dict[str, TestDependencies] = {
+    "test_ascii_control_desc": TestDependencies(frozenset({CONTROLS})),
+    "test_ascii_control_test_steps": TestDependencies(frozenset({CONTROLS})),
+    "test_ascii_weakness_desc": TestDependencies(frozenset({WEAKNESSES})),
+    "test_ascii_weakness_test_steps": TestDependencies(frozenset({WEAKNESSES})),
+    "test_ascii_threat_desc": TestDependencies(frozenset({THREATS})),
+    "test_correct_mitigation": TestDependencies(frozenset({LIBRARIES, RISK_PATTERNS, RELATIONS}),
+                                                "_check_mitigation_in_library"),
+    "test_empty_threat_desc": TestDependencies(frozenset({THREATS})),
+    "test_weaknesses_without_controls": TestDependencies(frozenset({LIBRARIES, RELATIONS}),
+                                                         "_check_weaknesses_without_controls_in_library"),
+    "test_empty_control_desc": TestDependencies(frozenset({CONTROLS})),
+    "test_orphaned_controls": TestDependencies(frozenset({LIBRARIES, RELATIONS}),
+                                               "_check_orphaned_controls_in_library"),
+    "test_whitespaces_in_references": TestDependencies(frozenset({REFERENCES})),
+    "test_all_controls_are_recommended": TestDependencies(frozenset({CONTROLS})),
+    "test_unused_usecases": TestDependencies(frozenset({USECASES, LIBRARIES, RELATIONS})),
+    "test_unused_threats": TestDependencies(frozenset({THREATS, LIBRARIES, RELATIONS})),
+    "test_unused_weaknesses": TestDependencies(frozenset({WEAKNESSES, LIBRARIES, RELATIONS})),
+    "test_unused_controls": TestDependencies(frozenset({CONTROLS, LIBRARIES, RELATIONS})),
+    "test_integrity_categories": TestDependencies(frozenset({CATEGORIES})),
+    "test_integrity_component_definitions": TestDependencies(frozenset({LIBRARIES, COMPONENTS}),
+                                                             "_check_component_definitions_in_library"),
+    "test_unimported_risk_pattern": TestDependencies(frozenset({LIBRARIES, COMPONENTS, RISK_PATTERNS, RULES})),
+    "test_wrong_risk_pattern_in_component": TestDependencies(frozenset({LIBRARIES, COMPONENTS, RISK_PATTERNS})),
+    "test_wrong_library_reference_in_rule": TestDependencies(frozenset({LIBRARIES, RULES})),
+    "test_unhandled_rules_elements": TestDependencies(frozenset({LIBRARIES, RULES})),
+    "test_duplicated_risk_patterns": TestDependencies(frozenset({LIBRARIES, RISK_PATTERNS})),
+}
+
+
+class TestTimeoutError(Exception):
+    """Raised inside a test that ran out of time"""
+
+
+@dataclass
+class TestResult:
+    """Outcome of a single test"""
+    errors: List[str]
+    duration: float
+    # Only measured when memory profiling is requested
+    peak_memory: Optional[int]
+    # Errors of every library, for the tests with a library check
+    library_errors: Optional[Dict[str, List[str]]] = None
+
+
+@dataclass
+class VersionTestRun:
+    """Last results of the tests of a version, with the change sequence numbers they are up to date with"""
+    aggregates: Optional[VersionAggregates] = None
+    aggregates_sequence: int = 0
+    results: Dict[str, TestResult] = field(default_factory=dict)
+    sequences: Dict[str, int] = field(default_factory=dict)
+
+
+class TestRunHistory:
+    """Keeps the last test run of every version, for incremental runs
+    
+    Stored runs are never modified: a new run starts from a copy of the last one and replaces it when it ends, so
+    runs of the same version at the same time don't mix their results.
+    """
+    
+    _instance: Optional['TestRunHistory'] = None
+    
+    def __new__(cls) -> 'TestRunHistory':
+        """
+        Singleton pattern implementation
+        """
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+    
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._runs: Dict[str, VersionTestRun] = {}
+            self._lock = threading.Lock()
+            self._initialized = True
+    
+    def get(self, version_ref: str) -> VersionTestRun:
+        """Get the last run of a version, an empty one if the version was never tested"""
+        with self._lock:
+            return self._runs.get(version_ref) or VersionTestRun()
+    
+    def put(self, version_ref: str, run: VersionTestRun) -> None:
+        """Store a finished run, unless a run that started later was already stored"""
+        with self._lock:
+            last_run = self._runs.get(version_ref)
+            if last_run is None or last_run.aggregates_sequence <= run.aggregates_sequence:
+                self._runs[version_ref] = run
+
+
+def _raise_timeout(signum, frame):
+    raise TestTimeoutError()
+
+
+# tracemalloc is global to the process, so tests profiled in the server process take turns
+_tracemalloc_lock = threading.Lock()
+
+
+def _run_test(test_name: str, task, v: ILEVersion, aggregates: VersionAggregates,
+              timeout: Optional[float], profile_memory: bool = False) -> TestResult:
+    """Run a test measuring its wall time, and its peak memory if profile_memory is set
+    
+    Tracing allocations makes tests several times slower, which is why memory is only profiled on request.
+    """
+    if not profile_memory:
+        return _run_timed_test(test_name, task, v, aggregates, timeout)
+    
+    with _tracemalloc_lock:
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            result = _run_timed_test(test_name, task, v, aggregates, timeout)
+            result.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+    return result
+
+
+def _run_timed_test(test_name: str, task, v: ILEVersion, aggregates: VersionAggregates,
+                    timeout: Optional[float]) -> TestResult:
+    """Run a test measuring its wall time, stopping it after the timeout if possible
+    
+    Interval timers can only interrupt the main thread of a process, which is how tests run in the worker pool.
+    Anywhere else, like in the threads that serve the requests, the test runs in its own thread and is reported
+    as timed out when it takes too long, although it can't be stopped and finishes in the background.
+    """
+    use_timer = (bool(timeout) and hasattr(signal, "setitimer") and
+                 threading.current_thread() is threading.main_thread())
+    if timeout and not use_timer:
+        return _run_test_in_thread(test_name, task, v, aggregates, timeout)
+    if use_timer:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    
+    library_errors = None
+    start = time.perf_counter()
+    try:
+        errors = task(v, aggregates)
+        if isinstance(errors, dict):
+            library_errors = errors
+            errors = [e for library in library_errors.values() for e in library]
+    except TestTimeoutError:
+        logger.error(f"Test {test_name} timed out after {timeout} seconds")
+        errors = [f"Test timed out after {timeout} seconds"]
+    except Exception as e:
+        logger.error(f"Error running test {test_name}: {e}")
+        errors = [f"Test failed with error: {e}"]
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    duration = time.perf_counter() - start
+    return TestResult(errors=errors, duration=duration, peak_memory=None, library_errors=library_errors)
+
+
+def _run_test_in_thread(test_name: str, task, v: ILEVersion, aggregates: VersionAggregates,
+                        timeout: float) -> TestResult:
+    """Run a test in a separate thread, waiting for it until the timeout"""
+    results: List[TestResult] = []
+    thread = threading.Thread(target=lambda: results.append(_run_timed_test(test_name, task, v, aggregates, None)),
+                              name=f"test-{test_name}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if results:
+        return results[0]
+    logger.error(f"Test {test_name} timed out after {timeout} seconds")
+    return TestResult([f"Test timed out after {timeout} seconds"], timeout, None)
+
+
+# Snapshot of the version tested by a worker process
+_worker_snapshot: Dict[str, object] = {}
+
+
+def _init_test_worker(v: ILEVersion, aggregates: VersionAggregates) -> None:
+    _worker_snapshot["version"] = v
+    _worker_snapshot["aggregates"] = aggregates
+
+
+def _run_test_in_worker(test_name: str, library_refs: Optional[Set[str]], timeout: Optional[float],
+                        profile_memory: bool) -> TestResult:
+    task = TestService().get_test_task(test_name, library_refs)
+    return _run_test(test_name, task, _worker_snapshot["version"], _worker_snapshot["aggregates"], timeout,
+                     profile_memory)
+
 
 class TestService:
     """Service for running tests on versions"""
@@ -25,40 +350,202 @@ class TestService:
     def __init__(self):
         self.data_service = DataService()
         self.library_service = LibraryService()
+        self.change_tracker = ChangeTracker()
+        self.history = TestRunHistory()
     
-    def run_tests(self, version_ref: str) -> IRTestReport:
-        """Run all tests on version using reflection-like approach"""
+    def run_tests(self, version_ref: str, test_names: Optional[List[str]] = None, workers: Optional[int] = None,
+                  timeout: Optional[float] = None, incremental: bool = False,
+                  profile_memory: bool = False) -> IRTestReport:
+        """Run all tests on version using reflection-like approach
+        
+        The version is walked once to build the aggregates, then every test queries them. With more than one
+        worker, tests run in a process pool over a snapshot of the version, so changes made to the version while
+        the tests run don't affect them. With a single worker they run in this process.
+        
+        In incremental mode only the tests that read elements touched since the last run are evaluated again,
+        library by library when possible, and the rest of the results are taken from the last run.
+        
+        Args:
+            version_ref: Version to test
+            test_names: Run only these tests, all of them if empty
+            workers: Number of worker processes, the test-workers property if not set
+            timeout: Seconds after which a test is stopped and counted as failed
+            incremental: Evaluate only what changed since the last run instead of running everything
+            profile_memory: Trace the allocations of every test to report its peak memory, which is much slower
+        """
         report = IRTestReport(version_ref=version_ref)
         v = self.data_service.get_version(version_ref)
+        if v is None:
+            raise ValueError(f"Version not found: {version_ref}")
+        
+        test_names = list(self._get_test_methods(test_names))
+        # Anything touched from now on will be evaluated again in the next incremental run
+        sequence = self.change_tracker.get_sequence()
+        last_run = self.history.get(version_ref)
+        
+        start = time.perf_counter()
+        aggregates = self._get_aggregates(v, last_run if incremental else None)
+        report.aggregates_duration = time.perf_counter() - start
+        run = VersionTestRun(aggregates=aggregates, aggregates_sequence=sequence, results=dict(last_run.results),
+                             sequences=dict(last_run.sequences))
+        
+        jobs = {}
+        for name in test_names:
+            library_refs = self._get_libraries_to_test(v, name, last_run) if incremental else None
+            if library_refs is None or library_refs:
+                jobs[name] = library_refs
+        
+        workers = workers if workers is not None else self._get_workers()
+        if workers > 1 and len(jobs) > 1:
+            results = self._run_in_pool(v, aggregates, jobs, workers, timeout, profile_memory)
+        else:
+            results = {name: _run_test(name, self.get_test_task(name, library_refs), v, aggregates, timeout,
+                                       profile_memory)
+                       for name, library_refs in jobs.items()}
+        
+        for name in test_names:
+            if name in results:
+                result = self._merge_results(v, last_run.results.get(name), results[name], jobs[name])
+                run.results[name] = result
+                run.sequences[name] = sequence
+            else:
+                result = last_run.results[name]
+                report.reused_tests.append(name)
+            
+            report.tests.append(name)
+            report.test_results[name] = result.errors
+            report.test_durations[name] = result.duration
+            if result.peak_memory is not None:
+                report.test_peak_memory[name] = result.peak_memory
+            if not result.errors:
+                report.num_success_tests += 1
+            else:
+                report.num_failed_tests += 1
+        
+        self.history.put(version_ref, run)
+        return report
+    
+    def get_test_task(self, test_name: str, library_refs: Optional[Set[str]] = None):
+        """Get the function that evaluates a test
+        
+        Tests with a library check return their errors by library, only for the given libraries if any.
+        """
+        dependencies = TEST_DEPENDENCIES.get(test_name)
+        if dependencies is None or dependencies.library_check is None:
+            return getattr(self, test_name)
+        
+        check = getattr(self, dependencies.library_check)
+        return lambda v, aggregates: {
+            l.ref: check(v, aggregates, l) for l in v.libraries.values()
+            if library_refs is None or l.ref in library_refs
+        }
+    
+    def _get_aggregates(self, v: ILEVersion, last_run: Optional[VersionTestRun]) -> VersionAggregates:
+        """Build the aggregates, reusing the ones of the last run for the libraries that didn't change"""
+        if last_run is None or last_run.aggregates is None:
+            return VersionAggregates.create(v)
         
-        success = 0
-        failed = 0
+        changes = self.change_tracker.get_changes(v.version, last_run.aggregates_sequence)
+        if changes.everything:
+            return VersionAggregates.create(v)
+        return VersionAggregates.create(v, last_run.aggregates, changes.get_libraries(LIBRARY_ELEMENT_TYPES))
+    
+    def _get_libraries_to_test(self, v: ILEVersion, test_name: str, last_run: VersionTestRun) -> Optional[Set[str]]:
+        """Get what an incremental run has to evaluate for a test
+        
+        Returns None to evaluate the whole test, the libraries to evaluate for tests with a library check, or an
+        empty set when the last result is still valid.
+        """
+        dependencies = TEST_DEPENDENCIES.get(test_name)
+        last_result = last_run.results.get(test_name)
+        if dependencies is None or last_result is None:
+            return None
+        
+        changes = self.change_tracker.get_changes(v.version, last_run.sequences[test_name])
+        if changes.everything:
+            return None
+        if not changes.affects(dependencies.element_types):
+            return set()
+        
+        if (dependencies.library_check is None or last_result.library_errors is None or
+                changes.element_types & dependencies.element_types - LIBRARY_ELEMENT_TYPES):
+            return None
         
+        library_refs = {l.ref for l in v.libraries.values()}
+        touched = changes.get_libraries(dependencies.element_types) | (library_refs - set(last_result.library_errors))
+        return touched & library_refs
+    
+    @staticmethod
+    def _merge_results(v: ILEVersion, last_result: Optional[TestResult], result: TestResult,
+                       library_refs: Optional[Set[str]]) -> TestResult:
+        """Merge the result of the libraries evaluated again into the last result of a test"""
+        if library_refs is None or result.library_errors is None or last_result is None:
+            return result
+        
+        library_errors = {}
+        for l in v.libraries.values():
+            if l.ref in result.library_errors:
+                library_errors[l.ref] = result.library_errors[l.ref]
+            elif l.ref in last_result.library_errors:
+                library_errors[l.ref] = last_result.library_errors[l.ref]
+        errors = [e for library in library_errors.values() for e in library]
+        return TestResult(errors=errors, duration=result.duration, peak_memory=result.peak_memory,
+                          library_errors=library_errors)
+    
+    def _get_test_methods(self, test_names: Optional[List[str]]) -> Dict[str, object]:
+        """Get the test methods, all of them or only the requested ones"""
         # Get all methods that start with "test"
-        test_methods = [
-            method for name, method in inspect.getmembers(self, predicate=inspect.ismethod)
+        test_methods = {
+            name: method for name, method in inspect.getmembers(self, predicate=inspect.ismethod)
             if name.startswith("test") and name != "run_tests"
-        ]
+        }
+        if not test_names:
+            return test_methods
         
-        for method in test_methods:
-            try:
-                errors = method(v)
-                report.test_results[method.__name__] = errors
-                if not errors:
-                    success += 1
-                else:
-                    failed += 1
-            except Exception as e:
-                logger.error(f"Error running test {method.__name__}: {e}")
-                report.test_results[method.__name__] = [f"Test failed with error: {e}"]
-                failed += 1
+        unknown = [name for name in test_names if name not in test_methods]
+        if unknown:
+            raise ValueError(f"Unknown tests: {', '.join(unknown)}")
+        return {name: method for name, method in test_methods.items() if name in test_names}
+    
+    @staticmethod
+    def _run_in_pool(v: ILEVersion, aggregates: VersionAggregates, jobs: Dict[str, Optional[Set[str]]],
+                     workers: int, timeout: Optional[float], profile_memory: bool) -> Dict[str, TestResult]:
+        """Run the tests in a process pool, every worker gets its own copy of the version
         
-        report.num_success_tests = success
-        report.num_failed_tests = failed
+        Workers are not forked from this process: it serves requests from several threads, and a fork could
+        inherit locks held by them, like the ones of logging or the services, and wait for them forever.
+        """
+        results = {}
+        processes = max(1, min(workers, len(jobs)))
+        # Without interval timers the workers can't stop a test, so the wait is limited here instead
+        wait_timeout = timeout if timeout and not hasattr(signal, "setitimer") else None
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(start_method)
         
-        return report
+        # Leaving the block terminates the pool, which also stops the tests that didn't finish in time
+        with context.Pool(processes, initializer=_init_test_worker, initargs=(v, aggregates)) as pool:
+            pending = {
+                name: pool.apply_async(_run_test_in_worker, (name, library_refs, timeout, profile_memory))
+                for name, library_refs in jobs.items()
+            }
+            for name, pending_result in pending.items():
+                try:
+                    results[name] = pending_result.get(wait_timeout)
+                except multiprocessing.TimeoutError:
+                    logger.error(f"Test {name} timed out after {timeout} seconds")
+                    results[name] = TestResult([f"Test timed out after {timeout} seconds"], timeout, None)
+        return results
     
-    def test_ascii_control_desc(self, v: ILEVersion) -> List[str]:
+    @staticmethod
+    def _get_workers() -> int:
+        """Number of processes used to run the tests, configurable with the test-workers property"""
+        value = PropertiesManager.get_property(ILEConstants.TEST_WORKERS)
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return 1
+    
+    def test_ascii_control_desc(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test ASCII characters in control descriptions"""
         errors = []
         for c in v.controls.values():
@@ -67,7 +554,7 @@ class TestService:
                 errors.append(f"{c.ref} has non-ASCII character {non_ascii}")
         return errors
     
-    def test_ascii_control_test_steps(self, v: ILEVersion) -> List[str]:
+    def test_ascii_control_test_steps(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test ASCII characters in control test steps"""
         errors = []
         for c in v.controls.values():
@@ -76,7 +563,7 @@ class TestService:
                 errors.append(f"{c.ref} has non-ASCII character {non_ascii}")
         return errors
     
-    def test_ascii_weakness_desc(self, v: ILEVersion) -> List[str]:
+    def test_ascii_weakness_desc(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test ASCII characters in weakness descriptions"""
         errors = []
         for c in v.weaknesses.values():
@@ -85,7 +572,7 @@ class TestService:
                 errors.append(f"{c.ref} has non-ASCII character {non_ascii}")
         return errors
     
-    def test_ascii_weakness_test_steps(self, v: ILEVersion) -> List[str]:
+    def test_ascii_weakness_test_steps(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test ASCII characters in weakness test steps"""
         errors = []
         for c in v.weaknesses.values():
@@ -94,7 +581,7 @@ class TestService:
                 errors.append(f"{c.ref} has non-ASCII character {non_ascii}")
         return errors
     
-    def test_ascii_threat_desc(self, v: ILEVersion) -> List[str]:
+    def test_ascii_threat_desc(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test ASCII characters in threat descriptions"""
         errors = []
         for c in v.threats.values():
@@ -103,18 +590,26 @@ class TestService:
                 errors.append(f"{c.ref} has non-ASCII character {non_ascii}")
         return errors
     
-    def test_correct_mitigation(self, v: ILEVersion) -> List[str]:
+    def test_correct_mitigation(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test correct mitigation values"""
+        return self._check_libraries(v, aggregates, self._check_mitigation_in_library)
+    
+    def _check_mitigation_in_library(self, v: ILEVersion, aggregates: VersionAggregates, l: IRLibrary) -> List[str]:
         errors = []
-        for library_ref in v.libraries.keys():
-            report = self.library_service.check_mitigation(v.version, library_ref)
-            for rp in report.risk_patterns:
-                for item in rp.threats:
-                    if item.error:
-                        errors.append(f"{library_ref} -> {rp.ref} -> {item.threat_ref} -> {item.message}")
+        exceptions = {tuple(e) for e in self.library_service.exceptions}
+        library = aggregates.libraries[l.ref]
+        for rp in l.risk_patterns.values():
+            for uc_ref, threats in library.mitigation_tree.get(rp.uuid, {}).items():
+                for t_ref in threats:
+                    if (rp.ref, t_ref) in exceptions:
+                        continue
+                    controls = library.mitigations[(rp.uuid, uc_ref, t_ref)]
+                    mitigation_count = sum(int(m) for m in controls.values())
+                    if mitigation_count != 100:
+                        errors.append(f"{l.ref} -> {rp.ref} -> {t_ref} -> Error with mitigation: {mitigation_count}")
         return errors
     
-    def test_empty_threat_desc(self, v: ILEVersion) -> List[str]:
+    def test_empty_threat_desc(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for empty threat descriptions"""
         errors = []
         for t in v.threats.values():
@@ -122,20 +617,21 @@ class TestService:
                 errors.append(f"{t.ref} has empty description")
         return errors
     
-    def test_weaknesses_without_controls(self, v: ILEVersion) -> List[str]:
+    def test_weaknesses_without_controls(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for weaknesses without controls"""
+        return self._check_libraries(v, aggregates, self._check_weaknesses_without_controls_in_library)
+    
+    def _check_weaknesses_without_controls_in_library(self, v: ILEVersion, aggregates: VersionAggregates,
+                                                       l: IRLibrary) -> List[str]:
         errors = []
         exceptions = ["CWE-7-KINGDOMS"]  # Special risk pattern
         
-        for l in v.libraries.values():
-            for rel in l.relations.values():
-                if (rel.risk_pattern_uuid not in exceptions and 
-                    rel.weakness_uuid != "" and 
-                    rel.control_uuid == ""):
-                    errors.append(f"There is a weakness without controls on {rel.risk_pattern_uuid} -> {rel.usecase_uuid} -> {rel.threat_uuid} -> {rel.weakness_uuid}")
+        for rel in aggregates.libraries[l.ref].weaknesses_without_controls:
+            if rel.risk_pattern_uuid not in exceptions:
+                errors.append(f"There is a weakness without controls on {rel.risk_pattern_uuid} -> {rel.usecase_uuid} -> {rel.threat_uuid} -> {rel.weakness_uuid}")
         return errors
     
-    def test_empty_control_desc(self, v: ILEVersion) -> List[str]:
+    def test_empty_control_desc(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for empty control descriptions"""
         errors = []
         for c in v.controls.values():
@@ -143,20 +639,22 @@ class TestService:
                 errors.append(f"{c.ref} has empty description")
         return errors
     
-    def test_orphaned_controls(self, v: ILEVersion) -> List[str]:
+    def test_orphaned_controls(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for orphaned controls"""
+        return self._check_libraries(v, aggregates, self._check_orphaned_controls_in_library)
+    
+    def _check_orphaned_controls_in_library(self, v: ILEVersion, aggregates: VersionAggregates,
+                                            l: IRLibrary) -> List[str]:
         exceptions = ["IR-Functional-Components", "mitre-attack-framework"]
         errors = []
         
-        for l in v.libraries.values():
-            if l.ref in exceptions:
-                continue
-            for rel in l.relations.values():
-                if rel.weakness_uuid == "" and rel.control_uuid != "":
-                    errors.append(f"There is an orphaned relation on {rel}")
+        if l.ref in exceptions:
+            return errors
+        for rel in aggregates.libraries[l.ref].orphaned_relations:
+            errors.append(f"There is an orphaned relation on {rel}")
         return errors
     
-    def test_whitespaces_in_references(self, v: ILEVersion) -> List[str]:
+    def test_whitespaces_in_references(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for whitespaces in reference URLs"""
         errors = []
         for ref_key, ref in v.references.items():
@@ -164,7 +662,7 @@ class TestService:
                 errors.append(f"Reference '{ref_key}' has whitespaces in URL: {ref.url}")
         return errors
     
-    def test_all_controls_are_recommended(self, v: ILEVersion) -> List[str]:
+    def test_all_controls_are_recommended(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test that all controls are recommended by default"""
         errors = []
         for c in v.controls.values():
@@ -172,23 +670,23 @@ class TestService:
                 errors.append(f"Control {c.ref} is not Recommended by default")
         return errors
     
-    def test_unused_usecases(self, v: ILEVersion) -> List[str]:
+    def test_unused_usecases(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for unused use cases"""
-        return self._get_unused_elements(v, "usecase")
+        return self._get_unused_elements(v.usecases.keys(), aggregates.used_usecases)
     
-    def test_unused_threats(self, v: ILEVersion) -> List[str]:
+    def test_unused_threats(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for unused threats"""
-        return self._get_unused_elements(v, "threat")
+        return self._get_unused_elements(v.threats.keys(), aggregates.used_threats)
     
-    def test_unused_weaknesses(self, v: ILEVersion) -> List[str]:
+    def test_unused_weaknesses(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for unused weaknesses"""
-        return self._get_unused_elements(v, "weakness")
+        return self._get_unused_elements(v.weaknesses.keys(), aggregates.used_weaknesses)
     
-    def test_unused_controls(self, v: ILEVersion) -> List[str]:
+    def test_unused_controls(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for unused controls"""
-        return self._get_unused_elements(v, "control")
+        return self._get_unused_elements(v.controls.keys(), aggregates.used_controls)
     
-    def test_integrity_categories(self, v: ILEVersion) -> List[str]:
+    def test_integrity_categories(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test category integrity"""
         errors = []
         for c in v.categories.values():
@@ -196,83 +694,53 @@ class TestService:
                 errors.append(f"Wrong category content: {c}")
         return errors
     
-    def test_integrity_component_definitions(self, v: ILEVersion) -> List[str]:
+    def test_integrity_component_definitions(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test component definition integrity"""
+        return self._check_libraries(v, aggregates, self._check_component_definitions_in_library)
+    
+    def _check_component_definitions_in_library(self, v: ILEVersion, aggregates: VersionAggregates,
+                                                l: IRLibrary) -> List[str]:
         errors = []
-        for l in v.libraries.values():
-            for c in l.component_definitions.values():
-                if (c.ref == "" or c.name == "" or 
-                    c.category_ref == "" or not c.risk_pattern_refs):
-                    errors.append(f"Wrong component content: {c}")
+        for c in l.component_definitions.values():
+            if (c.ref == "" or c.name == "" or 
+                c.category_ref == "" or not c.risk_pattern_refs):
+                errors.append(f"Wrong component content: {c}")
         return errors
     
-    def test_unimported_risk_pattern(self, v: ILEVersion) -> List[str]:
+    def test_unimported_risk_pattern(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for unimported risk patterns"""
         errors = []
-        actions = {
-            "IMPORT_RISK_PATTERN", "EXTEND_RISK_PATTERN", 
-            "IMPORT_RISK_PATTERN_ORIGIN", "IMPORT_RISK_PATTERN_DESTINATION"
-        }
-        
-        rules = []
-        for l in v.libraries.values():
-            rules.extend(l.rules)
-        
-        component_definitions = []
-        for l in v.libraries.values():
-            component_definitions.extend(l.component_definitions.values())
-        
+        # Rule actions reference risk patterns as part of their value, so they are searched as substrings
+        import_values = "\x00".join(aggregates.import_action_values)
         exceptions = ["mitre-attack-framework"]
         
         for l in v.libraries.values():
             if l.ref in exceptions:
                 continue
             for rp in l.risk_patterns.values():
-                found = False
-                
-                # Check if referenced in component definitions
-                if any(rp.ref in comp.risk_pattern_refs for comp in component_definitions):
-                    found = True
-                
-                # Check if referenced in rules
-                for r in rules:
-                    for ra in r.actions:
-                        if ra.name in actions and rp.ref in ra.value:
-                            found = True
-                            break
+                found = (rp.ref in aggregates.component_risk_pattern_refs or
+                         (bool(aggregates.import_action_values) and rp.ref in import_values))
                 
                 if not found:
                     errors.append(f"Risk pattern {rp.ref} cannot be imported")
         return errors
     
-    def test_wrong_risk_pattern_in_component(self, v: ILEVersion) -> List[str]:
+    def test_wrong_risk_pattern_in_component(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for wrong risk patterns in components"""
         errors = []
         
-        all_risk_patterns = set()
-        component_definitions = []
-        for l in v.libraries.values():
-            component_definitions.extend(l.component_definitions.values())
-            for rp in l.risk_patterns.values():
-                all_risk_patterns.add(rp.ref)
-        
-        for c in component_definitions:
+        for c in aggregates.component_definitions:
             for rp in c.risk_pattern_refs:
-                if rp not in all_risk_patterns:
+                if rp not in aggregates.risk_pattern_refs:
                     errors.append(f"{c.ref}: risk pattern not found: {rp}")
         return errors
     
-    def test_wrong_library_reference_in_rule(self, v: ILEVersion) -> List[str]:
+    def test_wrong_library_reference_in_rule(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for wrong library references in rules"""
         errors = []
-        libraries = set()
-        rules = []
+        libraries = aggregates.library_refs
         
-        for l in v.libraries.values():
-            rules.extend(l.rules)
-            libraries.add(l.ref)
-        
-        for r in rules:
+        for r in aggregates.rules:
             for c in r.conditions:
                 if c.name == "CONDITION_RISK_PATTERN_EXISTS":
                     lib = c.value.split("_::_")[0]
@@ -288,12 +756,10 @@ class TestService:
                         errors.append(f"An action on rule '{r.name}' has a library reference wrong: {a.project}")
         return errors
     
-    def test_unhandled_rules_elements(self, v: ILEVersion) -> List[str]:
+    def test_unhandled_rules_elements(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for unhandled rule elements"""
         errors = []
-        rules = []
-        for l in v.libraries.values():
-            rules.extend(l.rules)
+        rules = aggregates.rules
         
         # Hardcoded: If the condition/action is not here we need to add them
         handled_conditions = {
@@ -332,7 +798,7 @@ class TestService:
                     errors.append(f"Unhandled action: {a.name}")
         return errors
     
-    def test_duplicated_risk_patterns(self, v: ILEVersion) -> List[str]:
+    def test_duplicated_risk_patterns(self, v: ILEVersion, aggregates: VersionAggregates) -> List[str]:
         """Test for duplicated risk patterns"""
         errors = []
         seen = set()
@@ -345,37 +811,21 @@ class TestService:
                     errors.append(f"Risk pattern {rp_uuid} appears more than once")
         return errors
     
-    def _get_unused_elements(self, v: ILEVersion, element: str) -> List[str]:
-        """Get unused elements of specified type"""
+    @staticmethod
+    def _check_libraries(v: ILEVersion, aggregates: VersionAggregates, check) -> List[str]:
+        """Run a library check on every library of the version"""
         errors = []
-        
-        used = set()
         for l in v.libraries.values():
-            for rel in l.relations.values():
-                if element == "usecase":
-                    used.add(rel.usecase_uuid)
-                elif element == "threat":
-                    used.add(rel.threat_uuid)
-                elif element == "weakness":
-                    used.add(rel.weakness_uuid)
-                elif element == "control":
-                    used.add(rel.control_uuid)
-        
-        elements = None
-        if element == "usecase":
-            elements = set(v.usecases.keys())
-        elif element == "threat":
-            elements = set(v.threats.keys())
-        elif element == "weakness":
-            elements = set(v.weaknesses.keys())
-        elif element == "control":
-            elements = set(v.controls.keys())
-        
-        if elements is not None:
-            unused = elements - used
-            if unused:
-                errors.append(f"Unused: {unused}")
-        
+            errors.extend(check(v, aggregates, l))
+        return errors
+    
+    @staticmethod
+    def _get_unused_elements(elements: Collection[str], used: Set[str]) -> List[str]:
+        """Get the elements that are not used by any relation"""
+        errors = []
+        unused = set(elements) - used
+        if unused:
+            errors.append(f"Unused: {unused}")
         return errors
     
     def _check_ascii(self, text: str) -> Set[str]:
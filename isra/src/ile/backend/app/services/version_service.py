@@ -12,7 +12,6 @@ from fastapi import UploadFile
 
 from isra.src.ile.backend.app.configuration.constants import ILEConstants
 from isra.src.ile.backend.app.configuration.properties_manager import PropertiesManager
-from isra.src.ile.backend.app.facades.io_facade import IOFacade
 from isra.src.ile.backend.app.models import (
     ILEVersion, IRCategoryComponent, IRControl,
     IRLibrary, IRReference, IRRiskRating,
@@ -24,6 +23,10 @@ from isra.src.ile.backend.app.models import (
     ThreatRequest, ThreatUpdateRequest, UsecaseRequest, UsecaseUpdateRequest, WeaknessRequest
 )
 from isra.src.ile.backend.app.models.requests import WeaknessUpdateRequest
+from isra.src.ile.backend.app.services.change_tracker import (
+    CATEGORIES, CONTROLS, LIBRARIES, REFERENCES, STANDARDS, SUPPORTED_STANDARDS, THREATS, USECASES, WEAKNESSES,
+    ChangeTracker
+)
 from isra.src.ile.backend.app.services.data_service import DataService
 
 logger = logging.getLogger(__name__)
@@ -33,8 +36,12 @@ class VersionService:
     """Service for handling version operations"""
 
     def __init__(self):
+        # Not imported at the top because the facades import this module
+        from isra.src.ile.backend.app.facades.io_facade import IOFacade
+
         self.data_service = DataService()
         self.io_facade = IOFacade()
+        self.change_tracker = ChangeTracker()
 
     def get_version(self, version_ref: str) -> ILEVersion:
         """Get version by reference"""
@@ -97,6 +104,7 @@ class VersionService:
         self.data_service.remove_version(version_ref)
         self.data_service.put_version(ILEVersion(version=version_ref))
         self.import_libraries_from_folder(version_ref)
+        self.change_tracker.touch_version(version_ref)
 
     def create_version_report(self, version_ref: str) -> IRVersionReport:
         """Create version report"""
@@ -109,6 +117,7 @@ class VersionService:
             folder_path = Path(folder)
             if folder_path.is_dir():
                 self._import_files_recursively(folder_path, version_ref)
+        self.change_tracker.touch_version(version_ref)
 
     def _import_files_recursively(self, directory: Path, version_ref: str) -> None:
         """Import files recursively from directory"""
@@ -157,6 +166,7 @@ class VersionService:
             except Exception as e:
                 logger.error(f"Error when importing {file.filename}: {e}")
                 raise RuntimeError("Error when importing") from e
+        self.change_tracker.touch_version(version_ref)
 
     def export_version_to_folder(self, version_ref: str, format: str) -> None:
         """Export version to folder"""
@@ -339,6 +349,7 @@ class VersionService:
             control.name = self._fix_ascii(control.ref, control.name)
             control.desc = self._fix_ascii(control.ref, control.desc)
             control.test.steps = self._fix_ascii(control.ref, control.test.steps)
+        self.change_tracker.touch_version(version_ref)
 
     def _fix_ascii(self, ref: str, text: str) -> str:
         """Fix non-ASCII characters in text"""
@@ -369,6 +380,7 @@ class VersionService:
             supported_standard_name=st.supported_standard_name
         )
         v.supported_standards[standard.uuid] = standard
+        self.change_tracker.touch(version_ref, SUPPORTED_STANDARDS)
         return standard
 
     def update_supported_standard(self, version_ref: str,
@@ -379,12 +391,14 @@ class VersionService:
         standard.supported_standard_ref = updated.supported_standard_ref
         standard.supported_standard_name = updated.supported_standard_name
         v.supported_standards[updated.uuid] = standard
+        self.change_tracker.touch(version_ref, SUPPORTED_STANDARDS)
         return standard
 
     def delete_supported_standard(self, version_ref: str, st: IRSupportedStandard) -> None:
         """Delete supported standard"""
         v = self.data_service.get_version(version_ref)
         v.supported_standards.pop(st.uuid, None)
+        self.change_tracker.touch(version_ref, SUPPORTED_STANDARDS)
 
     def list_standards(self, version_ref: str) -> Collection[IRStandard]:
         """List standards"""
@@ -398,6 +412,7 @@ class VersionService:
             standard_ref=st.standard_ref
         )
         v.standards[standard.uuid] = standard
+        self.change_tracker.touch(version_ref, STANDARDS)
         return standard
 
     def update_standard(self, version_ref: str, updated: StandardUpdateRequest) -> IRStandard:
@@ -407,12 +422,14 @@ class VersionService:
         standard.supported_standard_ref = updated.supported_standard_ref
         standard.standard_ref = updated.standard_ref
         v.standards[updated.uuid] = standard
+        self.change_tracker.touch(version_ref, STANDARDS)
         return standard
 
     def delete_standard(self, version_ref: str, st: IRStandard) -> None:
         """Delete standard"""
         v = self.data_service.get_version(version_ref)
         v.standards.pop(st.uuid, None)
+        self.change_tracker.touch(version_ref, STANDARDS)
 
     def get_reference(self, version_ref: str, uuid: str) -> IRReference:
         """Get reference by UUID"""
@@ -430,6 +447,7 @@ class VersionService:
             url=body.url
         )
         v.references[ref.uuid] = ref
+        self.change_tracker.touch(version_ref, REFERENCES)
         return ref
 
     def update_reference(self, version_ref: str, body: ReferenceUpdateRequest) -> IRReference:
@@ -439,12 +457,14 @@ class VersionService:
         reference.name = body.name
         reference.url = body.url
         v.references[body.uuid] = reference
+        self.change_tracker.touch(version_ref, REFERENCES)
         return reference
 
     def delete_reference(self, version_ref: str, body: IRReference) -> None:
         """Delete reference"""
         v = self.data_service.get_version(version_ref)
         v.references.pop(body.uuid, None)
+        self.change_tracker.touch(version_ref, REFERENCES)
 
     def list_categories(self, version_ref: str) -> Collection[IRCategoryComponent]:
         """List categories"""
@@ -459,6 +479,7 @@ class VersionService:
             desc=""
         )
         v.categories[category.uuid] = category
+        self.change_tracker.touch(version_ref, CATEGORIES)
         return category
 
     def update_category(self, version_ref: str, new_cat: CategoryUpdateRequest) -> IRCategoryComponent:
@@ -468,6 +489,7 @@ class VersionService:
         category.ref = new_cat.ref
         category.name = new_cat.name
         v.categories[new_cat.uuid] = category
+        self.change_tracker.touch(version_ref, CATEGORIES)
         return category
 
     def delete_category(self, version_ref: str, ref: str) -> None:
@@ -478,6 +500,7 @@ class VersionService:
             if cat.ref == ref:
                 v.categories.pop(uuid)
                 break
+        self.change_tracker.touch(version_ref, CATEGORIES)
 
     def list_controls(self, version_ref: str) -> Collection[IRControl]:
         """List controls"""
@@ -501,6 +524,7 @@ class VersionService:
         if control.steps:
             ctrl.test.steps = control.steps
         v.controls[ctrl.uuid] = ctrl
+        self.change_tracker.touch(version_ref, CONTROLS)
         return ctrl
 
     def update_control(self, version_ref: str, new_control: ControlUpdateRequest) -> IRControl:
@@ -530,12 +554,14 @@ class VersionService:
             control.mitre = new_control.mitre
 
         v.controls[control.uuid] = control
+        self.change_tracker.touch(version_ref, CONTROLS)
         return control
 
     def delete_control(self, version_ref: str, control: IRControl) -> None:
         """Delete control"""
         v = self.data_service.get_version(version_ref)
         v.controls.pop(control.uuid, None)
+        self.change_tracker.touch(version_ref, CONTROLS)
 
     def get_control(self, version_ref: str, uuid: str) -> IRControl:
         """Get control by UUID"""
@@ -563,6 +589,7 @@ class VersionService:
         elif item_type == "WEAKNESS_TEST":
             if item_uuid in v.weaknesses:
                 v.weaknesses[item_uuid].test.references[reference_key] = ref_uuid
+        self.change_tracker.touch(version_ref, self._get_item_type(reference_item_request.item_type))
 
     def delete_reference_from_element(self, version_ref: str, reference_item_request: ReferenceItemRequest) -> None:
         """Delete reference from element"""
@@ -596,6 +623,12 @@ class VersionService:
                                   if value == ref_uuid]
                 for key in keys_to_remove:
                     del v.weaknesses[item_uuid].test.references[key]
+        self.change_tracker.touch(version_ref, self._get_item_type(reference_item_request.item_type))
+
+    @staticmethod
+    def _get_item_type(item_type: str) -> str:
+        """Get the element type touched when changing the references of an item"""
+        return THREATS if item_type == "THREAT" else WEAKNESSES if item_type == "WEAKNESS_TEST" else CONTROLS
 
     def add_standard_to_element(self, version_ref: str, standard_item_request: StandardItemRequest) -> None:
         """Add standard to element"""
@@ -610,6 +643,7 @@ class VersionService:
         if item_type == "CONTROL":
             if item_uuid in v.controls:
                 v.controls[item_uuid].standards[standard_key] = standard_uuid
+        self.change_tracker.touch(version_ref, CONTROLS)
 
     def delete_standard_from_element(self, version_ref: str, standard_item_request: StandardItemRequest) -> None:
         """Delete standard from element"""
@@ -625,6 +659,7 @@ class VersionService:
                                   if value == standard_uuid]
                 for key in keys_to_remove:
                     del v.controls[item_uuid].standards[key]
+        self.change_tracker.touch(version_ref, CONTROLS)
 
     def list_weaknesses(self, version_ref: str) -> Collection[IRWeakness]:
         """List weaknesses"""
@@ -640,6 +675,7 @@ class VersionService:
             impact=weakness.impact
         )
         v.weaknesses[w.uuid] = w
+        self.change_tracker.touch(version_ref, WEAKNESSES)
         return w
 
     def update_weakness(self, version_ref: str, new_weakness: WeaknessUpdateRequest) -> IRWeakness:
@@ -657,12 +693,14 @@ class VersionService:
             weakness.impact = new_weakness.impact
 
         v.weaknesses[weakness.uuid] = weakness
+        self.change_tracker.touch(version_ref, WEAKNESSES)
         return weakness
 
     def delete_weakness(self, version_ref: str, weakness: IRWeakness) -> None:
         """Delete weakness"""
         v = self.data_service.get_version(version_ref)
         v.weaknesses.pop(weakness.uuid, None)
+        self.change_tracker.touch(version_ref, WEAKNESSES)
 
     def get_weakness(self, version_ref: str, uuid: str) -> IRWeakness:
         """Get weakness by UUID"""
@@ -693,6 +731,7 @@ class VersionService:
             stride=threat.stride
         )
         v.threats[t.uuid] = t
+        self.change_tracker.touch(version_ref, THREATS)
         return t
 
     def update_threat(self, version_ref: str, new_threat: ThreatUpdateRequest) -> IRThreat:
@@ -733,12 +772,14 @@ class VersionService:
                     del threat.references[key]
 
         v.threats[threat.uuid] = threat
+        self.change_tracker.touch(version_ref, THREATS)
         return threat
 
     def delete_threat(self, version_ref: str, threat: IRThreat) -> None:
         """Delete threat"""
         v = self.data_service.get_version(version_ref)
         v.threats.pop(threat.uuid, None)
+        self.change_tracker.touch(version_ref, THREATS)
 
     def list_usecases(self, version_ref: str) -> Collection[IRUseCase]:
         """List use cases"""
@@ -753,6 +794,7 @@ class VersionService:
             desc=usecase.desc
         )
         v.usecases[uc.uuid] = uc
+        self.change_tracker.touch(version_ref, USECASES)
         return uc
 
     def update_usecase(self, version_ref: str, new_usecase: UsecaseUpdateRequest) -> IRUseCase:
@@ -765,12 +807,14 @@ class VersionService:
         usecase.name = new_usecase.name
         usecase.desc = new_usecase.desc
         v.usecases[new_usecase.uuid] = usecase
+        self.change_tracker.touch(version_ref, USECASES)
         return usecase
 
     def delete_usecase(self, version_ref: str, usecase: IRUseCase) -> None:
         """Delete use case"""
         v = self.data_service.get_version(version_ref)
         v.usecases.pop(usecase.uuid, None)
+        self.change_tracker.touch(version_ref, USECASES)
 
     def list_libraries(self, version_ref: str) -> Collection[str]:
         """List libraries"""
@@ -788,6 +832,7 @@ class VersionService:
             visible="true"
         )
         v.libraries[library_ref] = library
+        self.change_tracker.touch(version_ref, LIBRARIES, library_ref)
         return library
 
     def increment_library_revision(self, version_ref: str, library_ref: str) -> None:
@@ -796,8 +841,10 @@ class VersionService:
         library = v.libraries[library_ref]
         current_rev = int(library.revision)
         library.revision = str(current_rev + 1)
+        self.change_tracker.touch(version_ref, LIBRARIES, library_ref)
 
     def delete_library(self, version_ref: str, library_ref: str) -> None:
         """Delete library"""
         v = self.data_service.get_version(version_ref)
         v.libraries.pop(library_ref, None)
+        self.change_tracker.touch(version_ref, LIBRARIES, library_ref)
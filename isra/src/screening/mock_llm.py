@@ -0,0 +1,204 @@
+"""This file provides a local stand-in of the OpenAI chat completions and Batch APIs, to test screening offline"""
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import default
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Answer that fills every field requested by the threat and countermeasure autoscreening prompts
+MOCK_ANSWER = {
+    "C": "75",
+    "I": "75",
+    "A": "25",
+    "EE": "50",
+    "stride_lm": "Tampering",
+    "attack_enterprise_technique": "ATT&CK Enterprise - T1190 - Exploit Public-Facing Application",
+    "attack_enterprise_mitigation": "ATT&CK Enterprise - M1050 - Exploit Protection",
+    "cwe": "20:Improper Input Validation",
+    "question": "Is every input validated before it is processed?",
+    "question_desc": "Input validation ensures that only properly formed data reaches the application logic.",
+    "scope": "Application Security",
+    "baseline_standard_ref": "NIST 800-53 v5",
+    "baseline_standard_section": "SI-10 Information Input Validation",
+    "cost": "1"
+}
+
+
+def _parse_multipart(content_type, body):
+    message = BytesParser(policy=default).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    parts = dict()
+    for part in message.iter_parts():
+        parts[part.get_param("name", header="content-disposition")] = (part.get_filename(),
+                                                                        part.get_payload(decode=True))
+    return parts
+
+
+class _MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        server = self.server
+
+        if self.path.endswith("/chat/completions"):
+            time.sleep(server.latency)
+            self._send(200, server.get_completion(json.loads(body or b"{}")))
+        elif self.path.endswith("/files"):
+            parts = _parse_multipart(self.headers["Content-Type"], body)
+            filename, content = parts["file"]
+            self._send(200, server.add_file(filename, content, parts["purpose"][1].decode()))
+        elif self.path.endswith("/batches"):
+            self._send(200, server.create_batch(json.loads(body)))
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.rstrip("/").split("/")
+        if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in server.batches:
+            self._send(200, server.get_batch(parts[-1]))
+        elif len(parts) >= 3 and parts[-1] == "content" and parts[-2] in server.files:
+            self._send_bytes(200, server.files[parts[-2]]["content"], "application/octet-stream")
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _send(self, status, body):
+        self._send_bytes(status, json.dumps(body).encode("utf-8"), "application/json")
+
+    def _send_bytes(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _MockLLMHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency, failure_rate):
+        super().__init__(address, _MockLLMHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.files = dict()
+        self.batches = dict()
+
+    def get_completion(self, request):
+        with self.lock:
+            self.requests += 1
+            number = self.requests
+
+        if random.random() < self.failure_rate:
+            content = "This is not a JSON answer"
+        else:
+            content = json.dumps(MOCK_ANSWER)
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in request.get("messages", []))
+        return {
+            "id": f"chatcmpl-mock-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content.split()),
+                      "total_tokens": prompt_tokens + len(content.split())}
+        }
+
+    def add_file(self, filename, content, purpose):
+        with self.lock:
+            file_id = f"file-mock-{len(self.files) + 1}"
+            self.files[file_id] = {"id": file_id, "object": "file", "bytes": len(content),
+                                   "created_at": int(time.time()), "filename": filename, "purpose": purpose,
+                                   "status": "processed", "content": content}
+        return {k: v for k, v in self.files[file_id].items() if k != "content"}
+
+    def create_batch(self, request):
+        # Every request of the batch is answered right away, the batch just reports it later
+        lines = self.files[request["input_file_id"]]["content"].decode("utf-8").splitlines()
+        outputs = list()
+        for line in lines:
+            batch_request = json.loads(line)
+            outputs.append(json.dumps({
+                "id": f"batch_req_{len(outputs) + 1}",
+                "custom_id": batch_request["custom_id"],
+                "response": {"status_code": 200, "body": self.get_completion(batch_request["body"])},
+                "error": None
+            }))
+        output_file = self.add_file("batch_output.jsonl", "\n".join(outputs).encode("utf-8"), "batch_output")
+
+        with self.lock:
+            batch_id = f"batch_mock_{len(self.batches) + 1}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": request["endpoint"],
+                "input_file_id": request["input_file_id"],
+                "completion_window": request["completion_window"],
+                "created_at": int(time.time()),
+                "ready_at": time.time() + self.latency,
+                "output_file_id": output_file["id"],
+                "total": len(lines)
+            }
+        return self.get_batch(batch_id)
+
+    def get_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        completed = time.time() >= batch["ready_at"]
+        return {
+            "id": batch["id"],
+            "object": "batch",
+            "endpoint": batch["endpoint"],
+            "input_file_id": batch["input_file_id"],
+            "completion_window": batch["completion_window"],
+            "created_at": batch["created_at"],
+            "status": "completed" if completed else "in_progress",
+            "output_file_id": batch["output_file_id"] if completed else None,
+            "error_file_id": None,
+            "request_counts": {"total": batch["total"], "completed": batch["total"] if completed else 0,
+                               "failed": 0}
+        }
+
+
+class MockLLMServer:
+    """Local server that answers chat completion requests after a fixed latency
+
+    Point the OpenAI client to it by setting OPENAI_BASE_URL to base_url. A share of the answers can be made invalid
+    to exercise the retries of the screening executor. Batches are answered when they are created, and reported as
+    completed once the latency has passed.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.5, failure_rate=0.0):
+        self.httpd = _MockLLMHTTPServer((host, port), latency, failure_rate)
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
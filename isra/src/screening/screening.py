@@ -1,8 +1,16 @@
+from typing import Annotated
+
+import time
+
 import typer
+from rich import print
+from rich.table import Table
 
 from isra.src.config.config import get_sf_values
 from isra.src.config.constants import IR_SF_T_STRIDE, IR_SF_C_SCOPE, IR_SF_C_STANDARD_BASELINES, IR_SF_T_MITRE, \
     IR_SF_C_MITRE
+from isra.src.screening.mock_llm import MockLLMServer
+from isra.src.screening.screening_batch import batch_screening
 from isra.src.screening.screening_service import get_all_threats, screening, get_stride_category, \
     save_stride_category, \
     get_attack_technique, save_attack_technique, get_attack_mitigation, save_attack_mitigation, get_all_controls, \
@@ -12,6 +20,10 @@ from isra.src.screening.screening_service import get_all_threats, screening, get
     autoscreening_init, fix_component, get_emb3d_technique, save_emb3d_technique, get_emb3d_mitigation, \
     save_emb3d_mitigation, get_atlas_technique, save_atlas_technique, get_atlas_mitigation, save_atlas_mitigation, \
     generate_new_control_description, save_description
+from isra.src.utils.cache_functions import get_response_cache_stats, clear_response_cache
+from isra.src.utils.metrics_functions import read_llm_requests, aggregate_llm_requests, clear_llm_requests
+from isra.src.utils.retrieval_functions import read_retrieval_comparisons, aggregate_retrieval_comparisons, \
+    clear_retrieval_comparisons
 
 app = typer.Typer(no_args_is_help=True, add_help_option=False)
 
@@ -179,3 +191,94 @@ def fix():
     Tries to fix anything that doesn't fit the YSC schema
     """
     fix_component()
+
+
+@app.command()
+def batch(backend: Annotated[str, typer.Option(help="Send the requests concurrently ('executor') or through the "
+                                                    "OpenAI Batch API ('openai')")] = "executor",
+          filter: Annotated[str, typer.Option(help="Only screen the components whose file name contains this "
+                                                   "text")] = None,
+          restart: Annotated[bool, typer.Option(help="Discard the progress of an unfinished batch and start a new "
+                                                     "one")] = False):
+    """
+    Autoscreens every component in components_dir and saves the results back to each file. Progress is saved after
+    every answer, so an interrupted batch is resumed by running the command again
+    """
+    if backend not in ["executor", "openai"]:
+        print("Backend must be 'executor' or 'openai'")
+        raise typer.Exit(-1)
+    batch_screening(backend=backend, name_filter=filter, restart=restart)
+
+
+@app.command()
+def cache(clear: Annotated[bool, typer.Option(help="Remove every cached answer")] = False):
+    """
+    Shows the size of the LLM answer cache or clears it
+    """
+    if clear:
+        if clear_response_cache():
+            print("LLM answer cache cleared")
+    else:
+        entries, size = get_response_cache_stats()
+        print(f"Cached answers: {entries} ({round(size / (1024 * 1024), 2)} MB)")
+
+
+@app.command()
+def stats(hours: Annotated[float, typer.Option(help="Only include the requests of the last hours")] = None,
+          clear: Annotated[bool, typer.Option(help="Remove every recorded request")] = False):
+    """
+    Shows the tokens, latency and cost of the LLM requests per component and per prompt, and how often the prompts
+    with retrieved candidates agreed with the full prompts
+    """
+    if clear:
+        clear_llm_requests()
+        clear_retrieval_comparisons()
+        print("LLM request metrics cleared")
+        return
+
+    since = time.time() - hours * 3600 if hours else None
+    comparisons = read_retrieval_comparisons(since=since)
+    if len(comparisons) > 0:
+        table = Table("Function", "Comparisons", "Agreement", "Full answer retrieved")
+        for name, totals in aggregate_retrieval_comparisons(comparisons).items():
+            table.add_row(name, str(totals["comparisons"]),
+                          f"{100 * totals['agree'] / totals['comparisons']:.1f}%",
+                          f"{100 * totals['retrieved'] / totals['comparisons']:.1f}%")
+        print(table)
+
+    records = read_llm_requests(since=since)
+    if len(records) == 0:
+        print("No LLM requests recorded")
+        return
+
+    for key, title in [("component", "Component"), ("prompt", "Prompt")]:
+        table = Table(title, "Requests", "Cache hits", "Prompt tokens", "Completion tokens", "Avg latency (s)",
+                      "Cost ($)")
+        for name, totals in aggregate_llm_requests(records, key).items():
+            cost = f"{totals['cost']:.4f}"
+            if totals["unknown_cost"] > 0:
+                cost += f" (+{totals['unknown_cost']} unknown)"
+            table.add_row(name, str(totals["requests"]), str(totals["hits"]), str(totals["prompt_tokens"]),
+                          str(totals["completion_tokens"]), f"{totals['latency'] / totals['requests']:.2f}", cost)
+        print(table)
+
+    total = aggregate_llm_requests(records, "client")
+    requests = sum(t["requests"] for t in total.values())
+    hits = sum(t["hits"] for t in total.values())
+    cost = sum(t["cost"] for t in total.values())
+    print(f"Total: {requests} requests, {hits} answered from the cache, ${cost:.4f}")
+
+
+@app.command(hidden=True)
+def mock_llm(port: Annotated[int, typer.Option(help="Port to listen on")] = 8765,
+             latency: Annotated[float, typer.Option(help="Seconds to wait before every answer")] = 0.5,
+             failure_rate: Annotated[float, typer.Option(help="Share of answers that are not valid JSON")] = 0.0):
+    """
+    Starts a local stand-in of the OpenAI API to benchmark the screening throughput
+    """
+    server = MockLLMServer(port=port, latency=latency, failure_rate=failure_rate)
+    print(f"Mock LLM listening, set OPENAI_BASE_URL={server.base_url} and any OPENAI_API_KEY to use it")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Requests answered: {server.requests}")
@@ -0,0 +1,392 @@
+"""This file provides the batch autoscreening of every component in a folder, with a checkpoint to resume it"""
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+from json import JSONDecodeError
+
+import typer
+import yaml
+from rich import print
+from rich.table import Table
+
+from isra.src.component.component import balance_mitigation_values_process
+from isra.src.config.config import get_property, get_number_property, read_autoscreening_config
+from isra.src.config.constants import BATCH_CHECKPOINT_FILE, get_app_dir
+from isra.src.screening.screening_executor import ScreeningExecutor, DEFAULT_MAX_RETRIES
+from isra.src.screening.screening_service import get_complete_threat_messages, get_complete_control_messages, \
+    apply_autoscreening_values
+from isra.src.utils.cache_functions import is_response_cache_enabled, get_response_cache_key, \
+    get_cached_response, save_cached_response
+from isra.src.utils.cwe_functions import get_original_cwe_weaknesses
+from isra.src.utils.gpt_functions import get_client, query_chatgpt
+from isra.src.utils.text_functions import extract_json, replace_non_ascii
+from isra.src.utils.yaml_functions import load_yaml_file, save_yaml_file, validate_yaml, find_components, \
+    get_file_digest
+
+THREAT = "threat"
+CONTROL = "control"
+
+# Statuses after which an OpenAI batch won't change anymore
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hides the output of the screening functions, which is too verbose for hundreds of components"""
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            yield output
+    except Exception:
+        # The hidden output usually explains what went wrong
+        print(output.getvalue(), end="")
+        raise
+
+
+def get_request_id(component_index, kind, ref):
+    return f"{component_index}:{kind}:{ref}"
+
+
+def parse_request_id(request_id):
+    component_index, kind, ref = request_id.split(":", 2)
+    return int(component_index), kind, ref
+
+
+class BatchCheckpoint:
+    """Progress of a batch, appended to a JSONL file after every answer so that it can be resumed
+
+    The first record describes the batch. The rest are the valid answers received, the OpenAI batches submitted
+    and finished, and the components already written back.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or BATCH_CHECKPOINT_FILE
+        self.lock = threading.Lock()
+        self.header = None
+        self.answers = dict()
+        self.pending_batch = None
+        # Components changed after the pending batch was submitted, whose answers in the batch are outdated
+        self.reset_components = set()
+        self.written = set()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line can be cut if the process was killed while writing it
+                    continue
+                self._apply(record)
+
+    def create(self, backend, components):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.exists():
+            os.remove(self.path)
+        self.append({"type": "header", "created": time.time(), "backend": backend, "components": components})
+
+    def append(self, record):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(record)
+
+    def _apply(self, record):
+        record_type = record["type"]
+        if record_type == "header":
+            self.header = record
+        elif record_type == "answer":
+            self.answers[record["id"]] = record["content"]
+        elif record_type == "batch":
+            self.pending_batch = record["batch_id"]
+            self.reset_components = set()
+        elif record_type == "batch_finished":
+            self.pending_batch = None
+            self.reset_components = set()
+        elif record_type == "written":
+            self.written.add(record["component"])
+        elif record_type == "reset":
+            # The component changed after the batch started, so its answers are outdated
+            self.header["components"][record["component"]]["digest"] = record["digest"]
+            prefix = f"{record['component']}:"
+            self.answers = {k: v for k, v in self.answers.items() if not k.startswith(prefix)}
+            if self.pending_batch is not None:
+                self.reset_components.add(record["component"])
+
+    def add_answer(self, request_id, content):
+        self.append({"type": "answer", "id": request_id, "content": content})
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
+
+
+def build_requests(checkpoint):
+    """
+    Reads every component that hasn't been written yet and returns their templates and the requests of their
+    threats and countermeasures, by request ID
+    """
+    templates = dict()
+    requests = dict()
+    failed = dict()
+    for index, component in enumerate(checkpoint.header["components"]):
+        if index in checkpoint.written:
+            continue
+        path = component["path"]
+        try:
+            digest = get_file_digest(path)
+            if digest != component["digest"]:
+                print(f"{path} changed since the batch started, screening it again")
+                checkpoint.append({"type": "reset", "component": index, "digest": digest})
+            with quiet():
+                template = load_yaml_file(path)
+        except typer.Exit:
+            failed[index] = "Not a valid component, see the errors above"
+            continue
+        except Exception as e:
+            failed[index] = f"Couldn't be read: {e}"
+            continue
+
+        templates[index] = template
+        for th in template["threats"].values():
+            requests[get_request_id(index, THREAT, th["ref"])] = get_complete_threat_messages(th)
+        for c in template["controls"].values():
+            requests[get_request_id(index, CONTROL, c["ref"])] = get_complete_control_messages(c)
+    return templates, requests, failed
+
+
+def get_cache_key(messages):
+    # Same key as query_chatgpt, so batch and interactive screening share the cached answers
+    assistant_id = get_property("openai_assistant_id")
+    gpt_model = get_property("gpt_model") if assistant_id == "" else ""
+    return get_response_cache_key(get_property("openai_client"), gpt_model, assistant_id, messages)
+
+
+def run_with_executor(checkpoint, requests):
+    """Sends the requests concurrently through the screening executor, saving every valid answer as it arrives"""
+
+    def make_task(request_id, messages):
+        def screening_batch_request(attempt):
+            answer = query_chatgpt(messages, use_cache=attempt == 0)
+            # Only answers that can be used are saved, the rest are retried by the executor
+            extract_json(answer, verbose=False)
+            checkpoint.add_answer(request_id, answer)
+
+        return screening_batch_request
+
+    tasks = [make_task(request_id, messages) for request_id, messages in requests.items()]
+    results = ScreeningExecutor().run(tasks, description="Screening components...")
+    return sum(1 for result in results if result.error is not None)
+
+
+def get_batch_endpoint():
+    # Azure deployments don't use the version prefix of the OpenAI API
+    return "/chat/completions" if get_property("openai_client") == "AZURE" else "/v1/chat/completions"
+
+
+def submit_openai_batch(client, checkpoint, requests):
+    model = get_property("gpt_model")
+    lines = [json.dumps({"custom_id": request_id, "method": "POST", "url": get_batch_endpoint(),
+                         "body": {"model": model, "messages": messages}})
+             for request_id, messages in requests.items()]
+    input_file = client.files.create(file=("autoscreening_batch.jsonl", "\n".join(lines).encode("utf-8")),
+                                     purpose="batch")
+    batch = client.batches.create(input_file_id=input_file.id, endpoint=get_batch_endpoint(),
+                                  completion_window="24h")
+    checkpoint.append({"type": "batch", "batch_id": batch.id, "requests": len(lines)})
+    print(f"Batch {batch.id} submitted with {len(lines)} requests")
+    return batch.id
+
+
+def wait_for_openai_batch(client, batch_id, poll_interval):
+    wait = poll_interval
+    batch = client.batches.retrieve(batch_id)
+    while batch.status not in BATCH_FINAL_STATUSES:
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total})" if counts is not None else ""
+        print(f"Batch {batch_id} is {batch.status}{progress}, checking again in {round(wait)}s...")
+        time.sleep(wait)
+        wait = min(wait * 2, 300)
+        batch = client.batches.retrieve(batch_id)
+    return batch
+
+
+def download_openai_batch(client, checkpoint, batch):
+    """Saves the valid answers of a finished batch and returns how many answers couldn't be used"""
+    invalid = 0
+    if batch.output_file_id:
+        content = client.files.content(batch.output_file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            output = json.loads(line)
+            if parse_request_id(output["custom_id"])[0] in checkpoint.reset_components:
+                # Sent before the component changed, so it is requested again in the next batch
+                continue
+            response = output.get("response") or {}
+            if response.get("status_code") != 200:
+                invalid += 1
+                continue
+            answer = response["body"]["choices"][0]["message"]["content"]
+            try:
+                extract_json(answer, verbose=False)
+            except JSONDecodeError:
+                invalid += 1
+                continue
+            checkpoint.add_answer(output["custom_id"], answer)
+    checkpoint.append({"type": "batch_finished", "batch_id": batch.id, "status": batch.status})
+    return invalid
+
+
+def run_with_openai_batch(checkpoint, requests, poll_interval=1.0):
+    """
+    Sends the requests through the OpenAI Batch API. Requests whose answers can't be used are sent again in a new
+    batch, as many times as llm_max_retries. A batch submitted before an interruption is waited for, not resent
+    """
+    if get_property("openai_assistant_id") != "":
+        print("[red]Assistants can't be used with the Batch API, use the executor backend or remove the "
+              "openai_assistant_id")
+        return len(requests)
+
+    client = get_client()
+    max_retries = int(get_number_property("llm_max_retries", DEFAULT_MAX_RETRIES))
+    rounds = 0
+    while True:
+        if checkpoint.pending_batch is None:
+            missing = {k: v for k, v in requests.items() if k not in checkpoint.answers}
+            if len(missing) == 0 or rounds > max_retries:
+                return len(missing)
+            submit_openai_batch(client, checkpoint, missing)
+            rounds += 1
+
+        batch = wait_for_openai_batch(client, checkpoint.pending_batch, poll_interval)
+        invalid = download_openai_batch(client, checkpoint, batch)
+        if batch.status != "completed":
+            print(f"[red]Batch {batch.id} finished with status {batch.status}")
+        elif invalid > 0:
+            print(f"{invalid} answers of batch {batch.id} couldn't be used")
+
+
+def use_cached_answers(checkpoint, requests):
+    """Takes the answers of the requests already in the LLM answer cache, so they are not sent again"""
+    if not is_response_cache_enabled():
+        return
+    for request_id, messages in requests.items():
+        if request_id not in checkpoint.answers:
+            answer = get_cached_response(get_cache_key(messages))
+            if answer is not None:
+                try:
+                    extract_json(answer, verbose=False)
+                    checkpoint.add_answer(request_id, answer)
+                except JSONDecodeError:
+                    pass
+
+
+def save_answers_in_cache(checkpoint, requests):
+    if not is_response_cache_enabled():
+        return
+    for request_id, messages in requests.items():
+        if request_id in checkpoint.answers:
+            save_cached_response(get_cache_key(messages), checkpoint.answers[request_id])
+
+
+def write_component(path, template, answers, parameter_config, original_cwe_weaknesses):
+    threat_values = dict()
+    control_values = dict()
+    for request_id, answer in answers.items():
+        _, kind, ref = parse_request_id(request_id)
+        values = extract_json(replace_non_ascii(answer), verbose=False)
+        if kind == THREAT:
+            threat_values[ref] = values
+        else:
+            control_values[ref] = values
+
+    with quiet():
+        # Nobody is asked anything during a batch
+        apply_autoscreening_values(template, threat_values, control_values, parameter_config,
+                                   original_cwe_weaknesses, interactive=False)
+        template = balance_mitigation_values_process(template)
+        root = save_yaml_file(template)
+        yaml_dump = yaml.dump(root, default_flow_style=False, sort_keys=False)
+        validate_yaml(yaml_dump)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(yaml_dump)
+    os.replace(temp_path, path)
+
+
+def batch_screening(backend="executor", name_filter=None, restart=False):
+    checkpoint = BatchCheckpoint()
+    if checkpoint.exists() and not restart:
+        checkpoint.load()
+    if checkpoint.header is not None:
+        print(f"Resuming the batch started on {time.ctime(checkpoint.header['created'])} "
+              f"({len(checkpoint.answers)} answers saved). Use --restart to start a new one")
+        backend = checkpoint.header["backend"]
+    else:
+        components_dir = get_property("components_dir") or get_app_dir()
+        paths = find_components(components_dir, name_filter)
+        if len(paths) == 0:
+            print(f"No components found in {components_dir}")
+            return
+        checkpoint.create(backend, [{"path": path, "digest": get_file_digest(path)} for path in paths])
+
+    templates, requests, failed = build_requests(checkpoint)
+    print(f"{len(templates)} components to screen, {len(requests)} requests, "
+          f"{sum(1 for k in requests if k in checkpoint.answers)} already answered")
+
+    use_cached_answers(checkpoint, requests)
+    missing = {k: v for k, v in requests.items() if k not in checkpoint.answers}
+    if len(missing) > 0:
+        if backend == "openai":
+            run_with_openai_batch(checkpoint, missing)
+            save_answers_in_cache(checkpoint, missing)
+        else:
+            run_with_executor(checkpoint, missing)
+
+    # Every component with all its answers is written back, the rest are kept for the next run
+    parameter_config = read_autoscreening_config()
+    original_cwe_weaknesses = get_original_cwe_weaknesses()
+    summary = Table("Component", "Threats", "Countermeasures", "Answered", "Status")
+    components = checkpoint.header["components"]
+    for index, component in enumerate(components):
+        path = component["path"]
+        if index in checkpoint.written:
+            summary.add_row(path, "", "", "", "[green]Written before")
+            continue
+        if index in failed:
+            summary.add_row(path, "", "", "", f"[red]{failed[index]}")
+            continue
+
+        template = templates[index]
+        component_requests = [k for k in requests if parse_request_id(k)[0] == index]
+        answers = {k: checkpoint.answers[k] for k in component_requests if k in checkpoint.answers}
+        answered = f"{len(answers)}/{len(component_requests)}"
+        counts = (str(len(template["threats"])), str(len(template["controls"])), answered)
+        if len(answers) < len(component_requests):
+            summary.add_row(path, *counts, "[yellow]Pending, run the batch again")
+            continue
+        try:
+            write_component(path, template, answers, parameter_config, original_cwe_weaknesses)
+            checkpoint.append({"type": "written", "component": index})
+            summary.add_row(path, *counts, "[green]Written")
+        except Exception as e:
+            failed[index] = str(e)
+            summary.add_row(path, *counts, f"[red]Couldn't be written: {e}")
+    print(summary)
+
+    if len(checkpoint.written) + len(failed) == len(components):
+        checkpoint.remove()
+        print("Batch finished!")
+    else:
+        print(f"{len(components) - len(checkpoint.written) - len(failed)} components are pending. "
+              f"Run the batch again to resume it")
@@ -0,0 +1,90 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from json import JSONDecodeError
+from typing import Any, Callable, List, Optional
+
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, MofNCompleteColumn, TimeElapsedColumn
+
+from isra.src.config.config import get_number_property
+from isra.src.utils.gpt_functions import TRANSIENT_ERRORS
+from isra.src.utils.rate_limiter import TokenBucket
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_MINUTE = 60
+DEFAULT_MAX_RETRIES = 4
+
+# Errors after which a request is sent again
+RETRY_ERRORS = (JSONDecodeError,) + TRANSIENT_ERRORS
+
+
+@dataclass
+class TaskResult:
+    value: Any = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+
+
+class ScreeningExecutor:
+    """Runs LLM requests concurrently, with a cap on the requests in flight and on the requests per minute
+
+    Every task receives the number of the attempt, so that retries can skip cached answers. Tasks that fail with a
+    retryable error are retried with exponential backoff. Results are returned in the same order as the tasks,
+    whatever the order they finished in, so they can be applied to the template deterministically.
+    """
+
+    def __init__(self, max_concurrency=None, requests_per_minute=None, max_retries=None, backoff=1.0,
+                 max_backoff=30.0):
+        self.max_concurrency = int(max_concurrency or get_number_property("llm_max_concurrency",
+                                                                          DEFAULT_MAX_CONCURRENCY))
+        requests_per_minute = requests_per_minute or get_number_property("llm_requests_per_minute",
+                                                                         DEFAULT_REQUESTS_PER_MINUTE)
+        self.max_retries = int(max_retries if max_retries is not None else
+                               get_number_property("llm_max_retries", DEFAULT_MAX_RETRIES))
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        # The bucket starts full so the first requests don't wait, but no more than the workers can send at once
+        self.bucket = TokenBucket(requests_per_minute / 60, self.max_concurrency)
+
+    def run(self, tasks: List[Callable[[int], Any]], description="Processing...") -> List[TaskResult]:
+        """Runs every task and returns their results in the same order"""
+        results = [TaskResult() for _ in tasks]
+        if not tasks:
+            return results
+
+        with Progress(SpinnerColumn(), TextColumn(description), BarColumn(), MofNCompleteColumn(),
+                      TimeElapsedColumn(), transient=True) as progress:
+            progress_task = progress.add_task(description, total=len(tasks))
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                # Retry messages go through the console of the progress bar, so they don't break its display
+                futures = {executor.submit(self._run_task, task, progress.console): i for i, task in enumerate(tasks)}
+                try:
+                    for future in as_completed(futures):
+                        results[futures[future]] = future.result()
+                        progress.advance(progress_task)
+                except BaseException:
+                    # Unexpected errors (or the user pressing Ctrl+C) stop the whole run
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+        return results
+
+    def _run_task(self, task, console) -> TaskResult:
+        result = TaskResult()
+        while True:
+            self.bucket.acquire()
+            try:
+                result.value = task(result.attempts)
+                result.attempts += 1
+                return result
+            except RETRY_ERRORS as e:
+                result.attempts += 1
+                if result.attempts > self.max_retries:
+                    result.error = e
+                    return result
+                wait = min(self.max_backoff, self.backoff * 2 ** (result.attempts - 1))
+                console.print(f"{type(e).__name__} when processing a request, trying again in {round(wait, 1)}s..."
+                              f"({self.max_retries - result.attempts + 1})")
+                # Jitter, so that the requests that failed together are not retried together
+                time.sleep(wait * random.uniform(0.5, 1.0))
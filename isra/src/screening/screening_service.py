@@ -1,4 +1,6 @@
+import inspect
 import warnings
+from functools import partial
 from json import JSONDecodeError
 
 from bs4 import MarkupResemblesLocatorWarning
@@ -13,10 +15,12 @@ from isra.src.config.constants import CUSTOM_FIELD_STRIDE, CUSTOM_FIELD_SCOPE, \
     IR_SF_C_STANDARD_BASELINES, IR_SF_T_STRIDE, IR_SF_C_SCOPE, IR_SF_C_MITRE, IR_SF_T_MITRE, IR_SF_C_STANDARD_SECTION, \
     CUSTOM_FIELD_ATTACK_ICS_TECHNIQUE, CUSTOM_FIELD_ATLAS_TECHNIQUE, CUSTOM_FIELD_ATTACK_MOBILE_TECHNIQUE, \
     CUSTOM_FIELD_ATTACK_ICS_MITIGATION, CUSTOM_FIELD_ATTACK_MOBILE_MITIGATION, CUSTOM_FIELD_ATLAS_MITIGATION, \
-    SYSTEM_FIELD_VALUES, CUSTOM_FIELD_EMB3D_TECHNIQUE, CUSTOM_FIELD_EMB3D_MITIGATION
+    SYSTEM_FIELD_VALUES, CUSTOM_FIELD_EMB3D_TECHNIQUE, CUSTOM_FIELD_EMB3D_MITIGATION, CRE_MAPPING_NAME
+from isra.src.screening.screening_executor import ScreeningExecutor
 from isra.src.utils.cwe_functions import get_original_cwe_weaknesses, get_cwe_description, get_cwe_impact, set_weakness
 from isra.src.utils.gpt_functions import query_chatgpt, get_prompt
 from isra.src.utils.questionary_wrapper import qselect, qconfirm, qtext, qauto
+from isra.src.utils.retrieval_functions import get_candidates, query_chatgpt_with_candidates
 from isra.src.utils.text_functions import extract_json, closest_number, beautify, \
     check_valid_value, set_value, fix_value
 
@@ -188,19 +192,41 @@ def get_baseline_standard_ref(item, feedback):
             item["customFields"].get(CUSTOM_FIELD_STANDARD_BASELINE_REF, ""))
 
 
-def get_baseline_standard_section(item, feedback):
+def query_baseline_standard_section(item, feedback, prompt):
+    """
+    Asks for the section of the baseline standard of a countermeasure with the given system prompt. For ASVS only the
+    closest sections are offered, listed after the prompt
+    """
+    caller_name = inspect.currentframe().f_back.f_code.co_name
     template = read_current_component()
     control_ref = item["ref"]
     standard_reference = template["controls"][control_ref]["customFields"][CUSTOM_FIELD_STANDARD_BASELINE_REF]
     print(f"Standard reference for countermeasure is: {standard_reference}")
     messages = [
-        {"role": "system", "content": get_prompt("get_baseline_standard_section.md")},
+        {"role": "system", "content": get_prompt(prompt)},
         {"role": "user", "content": f"This is the countermeasure description: {item['desc']}"},
         {"role": "user", "content": f"This is the assigned security standard: {standard_reference}"},
         {"role": "user", "content": feedback}
     ]
 
-    result = query_chatgpt(messages)
+    # Only the ASVS sections are known locally, the sections of other standards are left to the model
+    candidates = list()
+    if CRE_MAPPING_NAME.get(standard_reference) == "ASVS":
+        candidates = get_candidates("asvs", item["name"] + ": " + beautify(item["desc"]))
+    candidates_list = "\n".join(f"{c_id}: {name}" for c_id, name in candidates)
+    candidates_messages = [
+        messages[0],
+        {"role": "system", "content": get_prompt("get_baseline_standard_section_candidates.md")},
+        {"role": "system", "content": f"These are the candidates:\n{candidates_list}"},
+        *messages[1:]
+    ]
+
+    return query_chatgpt_with_candidates(messages, candidates_messages, {c_id for c_id, _ in candidates},
+                                         lambda answer: answer.strip().split(" ")[0].rstrip(":"), caller=caller_name)
+
+
+def get_baseline_standard_section(item, feedback):
+    result = query_baseline_standard_section(item, feedback, "get_baseline_standard_section.md")
     return (check_valid_value(result, IR_SF_C_STANDARD_SECTION),
             item["customFields"].get(CUSTOM_FIELD_STANDARD_BASELINE_SECTION, ""))
 
@@ -235,7 +261,17 @@ def get_proper_cwe(item, feedback):
         {"role": "user", "content": feedback}
     ]
 
-    result = query_chatgpt(messages)
+    candidates = get_candidates("cwe", text)
+    candidates_list = "\n".join(f"{c_id}:{name}" for c_id, name in candidates)
+    candidates_messages = [
+        {"role": "system", "content": get_prompt("get_proper_cwe_candidates.md")},
+        {"role": "system", "content": f"These are the candidates:\n{candidates_list}"},
+        {"role": "user", "content": text},
+        {"role": "user", "content": feedback}
+    ]
+
+    result = query_chatgpt_with_candidates(messages, candidates_messages, {c_id for c_id, _ in candidates},
+                                           lambda answer: answer.split(":")[0].strip())
     original_cwe_weaknesses = get_original_cwe_weaknesses()
     if ":" in result:
         cwe_id, _ = result.split(":")
@@ -243,7 +279,7 @@ def get_proper_cwe(item, feedback):
         if cwe_id not in original_cwe_weaknesses:
             print(f"{cwe_id} is not a valid CWE. Try to avoid using CWE categories and pillars")
         else:
-            result = f"{cwe_id}:{original_cwe_weaknesses[cwe_id].attrib['Name']}"
+            result = f"{cwe_id}:{original_cwe_weaknesses[cwe_id].name}"
 
     current = ""
     template = read_current_component()
@@ -258,29 +294,42 @@ def get_proper_cwe(item, feedback):
         if cwe_id not in original_cwe_weaknesses:
             print(f"{cwe_id} is not a valid CWE. Try to avoid using CWE categories and pillars")
         else:
-            current = f"{cwe_id}:{original_cwe_weaknesses[cwe_id].attrib['Name']}"
+            current = f"{cwe_id}:{original_cwe_weaknesses[cwe_id].name}"
 
     return result, current
 
 
-def get_complete_threat_auto(item):
+def get_complete_threat_messages(item):
     text = item["name"] + ": " + beautify(item["desc"])
-    messages = [
+    return [
         {"role": "system", "content": get_prompt("get_complete_threat_auto.md")},
         {"role": "user", "content": text}
     ]
 
-    return query_chatgpt(messages)
-
 
-def get_complete_control_auto(item):
+def get_complete_control_messages(item):
     text = item["name"] + ": " + beautify(item["desc"])
-    messages = [
+    return [
         {"role": "system", "content": get_prompt("get_complete_control_auto.md")},
         {"role": "user", "content": text}
     ]
 
-    return query_chatgpt(messages)
+
+def get_complete_threat_auto(item, use_cache=True):
+    return query_chatgpt(get_complete_threat_messages(item), use_cache=use_cache)
+
+
+def get_complete_control_auto(item, use_cache=True):
+    return query_chatgpt(get_complete_control_messages(item), use_cache=use_cache)
+
+
+def get_complete_threat_values(item, attempt=0):
+    # A retry means that the previous answer couldn't be used, so it must not come from the cache
+    return extract_json(get_complete_threat_auto(item, use_cache=attempt == 0), verbose=False)
+
+
+def get_complete_control_values(item, attempt=0):
+    return extract_json(get_complete_control_auto(item, use_cache=attempt == 0), verbose=False)
 
 
 # Getters
@@ -439,7 +488,11 @@ def save_description(template, to_update, action="init"):
 
 # Custom behavior for saving functions
 
-def save_threats_to_stride_usecase(template):
+def save_threats_to_stride_usecase(template, interactive=True):
+    """
+    Groups every threat under the use case of its STRIDE category. If a threat has several categories the user chooses
+    one, or the first one is used if the user can't be asked
+    """
     for relation in template["relations"]:
         stride_cf = template["threats"][relation["threat"]]["customFields"].get(CUSTOM_FIELD_STRIDE, "")
 
@@ -448,7 +501,7 @@ def save_threats_to_stride_usecase(template):
         else:
             stride_categories = stride_cf.split("||")
             stride_category_initial = stride_categories[0][0]
-            if len(stride_categories) > 1:
+            if len(stride_categories) > 1 and interactive:
                 stride_category = qselect(f"Choose STRIDE category to group threat {relation['threat']}:",
                                           choices=stride_categories)
                 stride_category_initial = stride_category[0]
@@ -584,36 +637,29 @@ def screening(items, ask_function, save_function, choices=None, force=False):
             write_current_component(template)
 
 
-def autoscreening_init(force=False):
-    template = read_current_component()
-
-    parameter_config = read_autoscreening_config()
-
-    component_ref = template["component"]["ref"]
-    print(f"Starting autoscreening for {component_ref}")
-
-    assert len(template["threats"]) > 0, "No threats found"
-    assert len(template["controls"]) > 0, "No controls found"
+def get_valid_values(items, results):
+    values = dict()
+    for item, result in zip(items, results):
+        if result.error is not None:
+            print(f"Couldn't get a valid answer for {item['ref']} after {result.attempts} tries ({result.error}), "
+                  f"skipping...")
+        else:
+            values[item["ref"]] = result.value
+    return values
 
-    original_cwe_weaknesses = get_original_cwe_weaknesses()
 
+def apply_autoscreening_values(template, threat_values, control_values, parameter_config, original_cwe_weaknesses,
+                               interactive=True):
+    """
+    Sets the values answered for the threats and countermeasures of the template, by ref.
+    Elements without an answer are left as they are. Set interactive to False when the user can't be asked anything
+    """
     for th in template["threats"].values():
         k = th["ref"]
         print(f'[blue]Threat: {th["ref"]} - {th["name"]}')
-
-        tries = 5
-        valid = False
-        while tries > 0 and not valid:
-            try:
-                values = extract_json(get_complete_threat_auto(th))
-                valid = True
-            except JSONDecodeError:
-                tries -= 1
-                print(f"Failed when decoding JSON, trying again...({tries})")
-
-        if not valid:
-            print("Couldn't extract JSON after 5 tries, skipping...")
+        if k not in threat_values:
             continue
+        values = threat_values[k]
 
         risk_rating = ["C", "I", "A", "EE"]
         for category in risk_rating:
@@ -637,15 +683,14 @@ def autoscreening_init(force=False):
                           values.get(custom_field, None),
                           parameter_config[custom_field])
 
-    save_threats_to_stride_usecase(template)
+    save_threats_to_stride_usecase(template, interactive)
 
     for c in template["controls"].values():
         k = c["ref"]
         print(f'[blue]Countermeasure: {c["ref"]} - {c["name"]}')
-        try:
-            values = extract_json(get_complete_control_auto(c))
-        except JSONDecodeError:
+        if k not in control_values:
             continue
+        values = control_values[k]
 
         for var in ["question", "question_desc", "cost"]:
             template["controls"][k][var] = set_value(var,
@@ -698,6 +743,32 @@ def autoscreening_init(force=False):
     template["weaknesses"] = {w: template["weaknesses"][w] for w in template["weaknesses"] if
                               w in available_weaknesses}
 
+
+def autoscreening_init(force=False):
+    template = read_current_component()
+
+    parameter_config = read_autoscreening_config()
+
+    component_ref = template["component"]["ref"]
+    print(f"Starting autoscreening for {component_ref}")
+
+    assert len(template["threats"]) > 0, "No threats found"
+    assert len(template["controls"]) > 0, "No controls found"
+
+    original_cwe_weaknesses = get_original_cwe_weaknesses()
+
+    # Every request is sent up front and concurrently, then the answers are applied in the original order
+    threats = list(template["threats"].values())
+    controls = list(template["controls"].values())
+    tasks = [partial(get_complete_threat_values, th) for th in threats] + \
+            [partial(get_complete_control_values, c) for c in controls]
+    results = ScreeningExecutor().run(tasks, description="Screening threats and countermeasures...")
+
+    threat_values = get_valid_values(threats, results[:len(threats)])
+    control_values = get_valid_values(controls, results[len(threats):])
+
+    apply_autoscreening_values(template, threat_values, control_values, parameter_config, original_cwe_weaknesses)
+
     print("Autoscreening finished!")
     if force:
         save_results = True
@@ -781,18 +852,7 @@ def fix_component(force_save=False):
 # Experimental functions
 
 def get_baseline_standard_section_nist(item, feedback):
-    template = read_current_component()
-    control_ref = item["ref"]
-    standard_reference = template["controls"][control_ref]["customFields"][CUSTOM_FIELD_STANDARD_BASELINE_REF]
-    print(f"Standard reference for countermeasure is: {standard_reference}")
-    messages = [
-        {"role": "system", "content": get_prompt("get_baseline_standard_section_nist.md")},
-        {"role": "user", "content": f"This is the countermeasure description: {item['desc']}"},
-        {"role": "user", "content": f"This is the assigned security standard: {standard_reference}"},
-        {"role": "user", "content": feedback}
-    ]
-
-    result = query_chatgpt(messages)
+    result = query_baseline_standard_section(item, feedback, "get_baseline_standard_section_nist.md")
     print(result)
     return result, ""
 
@@ -1,3 +1,4 @@
+import json
 import os
 import uuid
 from typing import Annotated
@@ -8,10 +9,12 @@ from rich import print
 from rich.table import Table
 
 from isra.src.component.component import read_current_component, write_current_component
-from isra.src.config.config import get_resource
-from isra.src.config.constants import OPENCRE_PLUS, CRE_MAPPING_NAME, CUSTOM_FIELD_STANDARD_BASELINE_REF, \
+from isra.src.config.constants import CRE_MAPPING_NAME, CUSTOM_FIELD_STANDARD_BASELINE_REF, \
     CUSTOM_FIELD_STANDARD_BASELINE_SECTION
+from isra.src.standards.standards_batch import batch_expansion
 from isra.src.utils.gpt_functions import get_prompt, query_chatgpt
+from isra.src.utils.opencre_functions import get_opencre_expansion, get_opencre_standards, expand_standards, \
+    search_opencre
 
 app = typer.Typer(no_args_is_help=True, add_help_option=False)
 
@@ -80,42 +83,16 @@ def set_standard_on_components(standard_ref, table):
     write_current_component(template)
 
 
-def get_standard_from_opencre(mappings_yaml, baseline_ref, base_standard_section):
+def get_standard_from_opencre(baseline_ref, base_standard_section):
     opencre_standard_name = CRE_MAPPING_NAME[baseline_ref]
 
-    # If OpenCRE+ contains the base standard and section we'll include the other standards related
-    standards_to_add = dict()
-    # By default, CRE is included in the dict but we haven't found any valid CRE yet
-
-    # Now we iterate over the OpenCRE+ keys searching for the standard
-    for cre_id, cre_values in mappings_yaml.items():
-        if opencre_standard_name in cre_values:
-            # Now it may happen that the section doesn't appear exactly as it is in the OpenCRE+, so we
-            # apply special techniques to look for the best match
-            adapted = base_standard_section
-
-            if adapted in cre_values[opencre_standard_name]:
-                # If the section of the standard can be found inside the CRE we add all values
-                # of that standard and the CRE ID
-                standards_to_add.update(cre_values)
-                if "CRE" not in standards_to_add:
-                    standards_to_add["CRE"] = set()
-                standards_to_add["CRE"].add(cre_id)
-
-                # At this point we have a dictionary of the standards that have to be added in this control
-    # We convert the lists to sets to remove duplicates
-    standards_to_add = {key: set(value) for key, value in standards_to_add.items()}
-
-    return standards_to_add
+    # If OpenCRE+ contains the base standard and section we'll include the other standards related, with the CRE IDs
+    return get_opencre_expansion(opencre_standard_name, base_standard_section)
 
 
 def expand_process(template, verbose=False):
-    mappings_yaml = get_resource(OPENCRE_PLUS)
-
     # First, get all standard names that appear in OpenCRE+
-    opencre_standards = {'CRE'}
-    for cre_values in mappings_yaml.values():
-        opencre_standards.update(cre_values.keys())
+    opencre_standards = {'CRE'} | get_opencre_standards()
 
     for control_ref, control in template["controls"].items():
         # Instead of clearing the list, filter out standards from OpenCRE+
@@ -131,6 +108,8 @@ def expand_process(template, verbose=False):
         try:
             assert CUSTOM_FIELD_STANDARD_BASELINE_REF in control["customFields"], "No base standard"
             assert control["customFields"][CUSTOM_FIELD_STANDARD_BASELINE_REF] != "", "Empty base standard"
+            assert control["customFields"][CUSTOM_FIELD_STANDARD_BASELINE_REF] in CRE_MAPPING_NAME, \
+                "Unknown base standard"
             assert CUSTOM_FIELD_STANDARD_BASELINE_SECTION in control["customFields"], "No base standard section"
             assert control["customFields"][CUSTOM_FIELD_STANDARD_BASELINE_SECTION] != "", "Empty base standard section"
         except AssertionError as e:
@@ -140,33 +119,7 @@ def expand_process(template, verbose=False):
         baseline_ref = control["customFields"][CUSTOM_FIELD_STANDARD_BASELINE_REF]
         baseline_sections = control["customFields"][CUSTOM_FIELD_STANDARD_BASELINE_SECTION].split("||")
 
-        for base_standard_sections in baseline_sections:
-
-            standards_to_add = get_standard_from_opencre(mappings_yaml, baseline_ref, base_standard_sections)
-
-            # If no standards have been found we add the base standard by default
-            if len(standards_to_add) == 0:
-                for section in base_standard_sections.split("||"):
-                    # This line is to remove duplicates in case the same base standard section is added twice
-                    current_list = [x["standard-ref"] + x["standard-section"] for x in control["standards"]]
-                    if CRE_MAPPING_NAME[baseline_ref] + section not in current_list:
-                        control["standards"].append({
-                            "standard-ref": CRE_MAPPING_NAME[baseline_ref],
-                            "standard-section": section
-                        })
-                if verbose:
-                    print(f"[red]Nothing found in OpenCRE+. Added base standard")
-            else:
-                for standard_ref, sections in standards_to_add.items():
-                    for section in sections:
-                        current_list = [x["standard-ref"] + x["standard-section"] for x in control["standards"]]
-                        if standard_ref + section not in current_list:
-                            control["standards"].append({
-                                "standard-ref": standard_ref,
-                                "standard-section": section
-                            })
-                            if verbose:
-                                print(f"Added [green]{standard_ref}[/green] -> [blue]{section}")
+        expand_standards(control["standards"], baseline_ref, baseline_sections, verbose)
 
     return template
 
@@ -190,16 +143,15 @@ def reset_init():
     write_current_component(template)
 
 
-def show_init(standard_name, standard_section):
-    table = Table("OpenCRE ID", "Standard", "Section")
+def show_init(standard_name, standard_section, as_json=False):
+    rows = search_opencre(standard_name, standard_section)
+    if as_json:
+        typer.echo(json.dumps([{"cre": k, "standard": k2, "sections": v2} for k, k2, v2 in rows], indent=2))
+        return
 
-    mappings_yaml = get_resource(OPENCRE_PLUS)
-    for k, v in mappings_yaml.items():
-        for k2, v2 in v.items():
-            if standard_name.lower() in k2.lower():
-                li = [x.lower() for x in v2]
-                if any(standard_section.lower() in s for s in li):
-                    table.add_row(k, k2, str(sorted(v2)))
+    table = Table("OpenCRE ID", "Standard", "Section")
+    for k, k2, v2 in rows:
+        table.add_row(k, k2, str(v2))
     print(table)
     print("This table shows the standards that will be included using OpenCRE as the link standard")
     print("For example, if the countermeasure's base standard is related with ASVS V5.2.3 it will find all the "
@@ -208,10 +160,17 @@ def show_init(standard_name, standard_section):
           "the countermeasure and many others")
 
 
-def test_standard(standard_name, standard_section):
-    mappings_yaml = get_resource(OPENCRE_PLUS)
+def test_standard(standard_name, standard_section, as_json=False):
+    if standard_name not in CRE_MAPPING_NAME:
+        print(f"Unknown standard {standard_name}. Use one of: {', '.join(CRE_MAPPING_NAME.keys())}")
+        raise typer.Exit(-1)
+
+    standards_to_add = get_standard_from_opencre(standard_name, standard_section)
+    if as_json:
+        typer.echo(json.dumps({"standard": standard_name, "section": standard_section,
+                               "standards": {k: sorted(v) for k, v in standards_to_add.items()}}, indent=2))
+        return
 
-    standards_to_add = get_standard_from_opencre(mappings_yaml, standard_name, standard_section)
     for k, v in standards_to_add.items():
         for val in v:
             random_uuid = uuid.uuid4()
@@ -233,6 +192,19 @@ def expand(verbose: Annotated[bool, typer.Option(help="Verbose (True/False)")] =
     expand_init(verbose)
 
 
+@app.command()
+def expand_all(filter: Annotated[str, typer.Option(help="Only expand the components whose file name contains this "
+                                                        "text")] = None,
+               workers: Annotated[int, typer.Option(help="Number of processes, by default one per CPU")] = None,
+               dry_run: Annotated[bool, typer.Option(help="Show the changes without writing them")] = False,
+               verbose: Annotated[bool, typer.Option(help="Verbose (True/False)")] = False):
+    """
+    Expands the standards of every component in components_dir using the base standards, and writes back only the
+    components that changed
+    """
+    batch_expansion(name_filter=filter, workers=workers, dry_run=dry_run, verbose=verbose)
+
+
 @app.command()
 def reset():
     """
@@ -243,17 +215,19 @@ def reset():
 
 @app.command()
 def test(standard_name: Annotated[str, typer.Option(help="Filter by standard name")] = "",
-         standard_section: Annotated[str, typer.Option(help="Filter by standard section")] = ""):
+         standard_section: Annotated[str, typer.Option(help="Filter by standard section")] = "",
+         json_output: Annotated[bool, typer.Option("--json", help="Print the result as JSON")] = False):
     """
     Shows the current standard mapping used to propagate standards
     """
-    test_standard(standard_name, standard_section)
+    test_standard(standard_name, standard_section, json_output)
 
 
 @app.command()
 def show(standard_name: Annotated[str, typer.Option(help="Filter by standard name")] = "",
-         standard_section: Annotated[str, typer.Option(help="Filter by standard section")] = ""):
+         standard_section: Annotated[str, typer.Option(help="Filter by standard section")] = "",
+         json_output: Annotated[bool, typer.Option("--json", help="Print the result as JSON")] = False):
     """
     Shows the current standard mapping used to propagate standards
     """
-    show_init(standard_name, standard_section)
+    show_init(standard_name, standard_section, json_output)
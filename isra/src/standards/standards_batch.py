@@ -0,0 +1,154 @@
+"""This file provides the expansion of the standards of every component in a folder at once"""
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import jsonschema
+import yaml
+from rich import print
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, MofNCompleteColumn, TimeElapsedColumn
+from rich.table import Table
+
+from isra.src.config.config import get_property, get_resource
+from isra.src.config.constants import CRE_MAPPING_NAME, YSC_SCHEMA, get_app_dir
+from isra.src.utils.opencre_functions import get_opencre_index, get_opencre_standards, expand_standards
+from isra.src.utils.yaml_functions import find_components
+
+# The C parser is several times faster, which matters with hundreds of components
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def get_schema_validator():
+    return jsonschema.Draft7Validator(get_resource(YSC_SCHEMA, filetype="json"))
+
+
+def get_countermeasures(root):
+    """Returns every countermeasure of a YSC component. A countermeasure appears once per threat it mitigates"""
+    for threat in root["component"]["risk_pattern"].get("threats", []) or []:
+        for countermeasure in threat.get("countermeasures", []) or []:
+            yield countermeasure
+
+
+def expand_countermeasure(countermeasure, opencre_standards):
+    """
+    Expands the standards of a YSC countermeasure from its base standard.
+    Returns the new standards, grouped by standard like they are saved, and the reason why the base standard couldn't
+    be used, if any
+    """
+    standards = [{"standard-ref": standard_ref, "standard-section": section}
+                 for standard_ref, sections in (countermeasure.get("standards") or {}).items()
+                 if standard_ref not in opencre_standards
+                 for section in sections]
+
+    baseline_ref = countermeasure.get("base_standard", "")
+    baseline_sections = countermeasure.get("base_standard_section", []) or []
+    error = None
+    if baseline_ref == "":
+        error = "Empty base standard"
+    elif baseline_ref not in CRE_MAPPING_NAME:
+        error = "Unknown base standard"
+    elif len(baseline_sections) == 0:
+        error = "Empty base standard section"
+    else:
+        expand_standards(standards, baseline_ref, baseline_sections)
+
+    grouped = defaultdict(list)
+    for std in standards:
+        grouped[std["standard-ref"]].append(std["standard-section"])
+    return {k: sorted(dict.fromkeys(v)) for k, v in grouped.items()}, error
+
+
+def expand_component(path, dry_run=False):
+    """
+    Expands the standards of every countermeasure of a YSC file, and writes it back only if they changed.
+    Returns a summary of the changes
+    """
+    result = {"path": path, "countermeasures": 0, "changed": 0, "added": 0, "removed": 0, "errors": dict(),
+              "status": "unchanged"}
+    try:
+        with open(path, "r") as f:
+            root = yaml.load(f, Loader=SafeLoader)
+
+        opencre_standards = {'CRE'} | get_opencre_standards()
+        for countermeasure in get_countermeasures(root):
+            result["countermeasures"] += 1
+            new_standards, error = expand_countermeasure(countermeasure, opencre_standards)
+            if error is not None:
+                result["errors"][countermeasure["ref"]] = error
+
+            old = {(k, s) for k, v in (countermeasure.get("standards") or {}).items() for s in v}
+            new = {(k, s) for k, v in new_standards.items() for s in v}
+            if old != new:
+                countermeasure["standards"] = new_standards
+                result["changed"] += 1
+                result["added"] += len(new - old)
+                result["removed"] += len(old - new)
+
+        if result["changed"] > 0:
+            error = next(iter(sorted(get_schema_validator().iter_errors(root), key=str)), None)
+            if error is not None:
+                raise ValueError(f"YSC doesn't fit schema: {error.json_path}: {error.message}")
+            yaml_dump = yaml.dump(root, default_flow_style=False, sort_keys=False)
+            if not dry_run:
+                temp_path = f"{path}.{os.getpid()}.tmp"
+                with open(temp_path, "w") as f:
+                    f.write(yaml_dump)
+                os.replace(temp_path, path)
+            result["status"] = "changed"
+    except Exception as e:
+        result["status"] = "failed"
+        # Parser errors span several lines, the first one is enough for the summary
+        result["error"] = (str(e).strip().splitlines() or [type(e).__name__])[0]
+
+    return result
+
+
+def batch_expansion(name_filter=None, workers=None, dry_run=False, verbose=False):
+    components_dir = get_property("components_dir") or get_app_dir()
+    paths = find_components(components_dir, name_filter)
+    if len(paths) == 0:
+        print(f"No components found in {components_dir}")
+        return
+
+    # Built before starting the workers, so that they load it from the cache instead of parsing the mappings
+    get_opencre_index()
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(paths)))
+    results = dict()
+    with Progress(SpinnerColumn(), TextColumn("Expanding standards..."), BarColumn(), MofNCompleteColumn(),
+                  TimeElapsedColumn(), transient=True) as progress:
+        progress_task = progress.add_task("Expanding standards...", total=len(paths))
+        if workers == 1:
+            for path in paths:
+                results[path] = expand_component(path, dry_run)
+                progress.advance(progress_task)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(expand_component, path, dry_run) for path in paths]
+                for future in as_completed(futures):
+                    result = future.result()
+                    results[result["path"]] = result
+                    progress.advance(progress_task)
+
+    status_text = {
+        "changed": "[yellow]Would be written" if dry_run else "[green]Written",
+        "unchanged": "Unchanged"
+    }
+    summary = Table("Component", "Countermeasures", "Changed", "Added", "Removed", "Skipped", "Status")
+    for path in paths:
+        result = results[path]
+        status = status_text.get(result["status"], f"[red]{result.get('error', '')}")
+        summary.add_row(os.path.relpath(path, components_dir), str(result["countermeasures"]),
+                        str(result["changed"]), str(result["added"]), str(result["removed"]),
+                        str(len(result["errors"])), status)
+    print(summary)
+
+    if verbose:
+        for path in paths:
+            for ref, error in results[path]["errors"].items():
+                print(f"{os.path.relpath(path, components_dir)}: control {ref} error: {error}. Skipping...")
+
+    changed = sum(1 for r in results.values() if r["status"] == "changed")
+    failed = sum(1 for r in results.values() if r["status"] == "failed")
+    print(f"{len(paths)} components, {changed} {'to write' if dry_run else 'written'}, "
+          f"{len(paths) - changed - failed} unchanged, {failed} failed")
@@ -0,0 +1,153 @@
+"""This file provides the parsed YAML components shared by the component test suites"""
+import json
+import logging
+import multiprocessing
+import os
+
+from isra.src.config.constants import CACHE_FOLDER, COMPONENT_CORPUS_CACHE_FILE
+from isra.src.tests.integrity_tests_component import read_yaml
+from isra.src.utils.yaml_functions import find_components, get_file_digest
+
+logger = logging.getLogger(__name__)
+
+# Bump it whenever the cached structures may change, so old cache files are discarded
+CACHE_VERSION = 2
+
+# Number of processes used to run the component tests, set with the --component-workers option of pytest
+_workers = 1
+
+# Parsed components by content digest, shared by every suite run in the same session
+_parsed = dict()
+_disk_cache_loaded = False
+
+# Components available in the worker processes of the parallel runner
+_worker_roots = None
+
+
+def set_workers(workers):
+    """Sets the number of processes used to run the component tests"""
+    global _workers
+    _workers = max(1, workers or 1)
+
+
+def get_workers():
+    """Returns the number of processes requested to run the component tests"""
+    return _workers
+
+
+def _load_disk_cache():
+    global _disk_cache_loaded
+    _disk_cache_loaded = True
+    try:
+        with open(COMPONENT_CORPUS_CACHE_FILE, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        if isinstance(cache, dict) and cache.get("version") == CACHE_VERSION:
+            for digest, data in cache["components"].items():
+                _parsed.setdefault(digest, data)
+    except (OSError, ValueError, KeyError, AttributeError) as e:
+        # A missing or unreadable cache only means that every component has to be parsed
+        if not isinstance(e, FileNotFoundError):
+            logger.warning(f"Component cache couldn't be read, components will be parsed again: {e}")
+
+
+def _is_json_safe(data):
+    """Whether the parsed YAML comes back the same from JSON, which isn't the case of dates or non-string keys"""
+    try:
+        return json.loads(json.dumps(data)) == data
+    except (TypeError, ValueError):
+        return False
+
+
+def _save_disk_cache(digests):
+    # Only the components of this run are kept, so the cache doesn't grow forever. Components that JSON can't
+    # represent exactly are parsed again in every run
+    components = {d: _parsed[d] for d in digests if d in _parsed and _is_json_safe(_parsed[d])}
+    cache = {"version": CACHE_VERSION, "components": components}
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        temp_file = f"{COMPONENT_CORPUS_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f)
+        os.replace(temp_file, COMPONENT_CORPUS_CACHE_FILE)
+    except OSError as e:
+        logger.warning(f"Component cache couldn't be saved: {e}")
+
+
+def load_components(paths, workers=1):
+    """
+    Returns the parsed YAML of every component by path.
+    Components are only parsed when their content isn't in the cache, and cached on disk by content digest
+    """
+    digests = {path: get_file_digest(path) for path in paths}
+    if not _disk_cache_loaded and any(d not in _parsed for d in digests.values()):
+        _load_disk_cache()
+
+    missing = [path for path in paths if digests[path] not in _parsed]
+    if missing:
+        if workers > 1 and len(missing) > 1:
+            with multiprocessing.Pool(min(workers, len(missing))) as pool:
+                parsed = pool.map(read_yaml, missing, chunksize=max(1, len(missing) // (workers * 4)))
+        else:
+            parsed = [read_yaml(path) for path in missing]
+
+        for path, data in zip(missing, parsed):
+            # Components that couldn't be read are not cached, so they are tried again in the next run
+            if data is not None:
+                _parsed[digests[path]] = data
+        _save_disk_cache(set(digests.values()))
+
+    return {path: _parsed.get(digests[path]) for path in paths}
+
+
+def _init_worker(roots):
+    global _worker_roots
+    _worker_roots = roots
+
+
+def _run_check(task):
+    check, path, with_path = task
+    try:
+        root = _worker_roots[path]
+        return (check(path, root) if with_path else check(root)), None
+    except Exception as e:
+        return None, e
+
+
+class ComponentCorpus:
+    """Parsed components of a folder plus the parallel runner for the checks that apply to each component
+
+    With a single worker every check runs when it's requested, like a plain loop over the components. With more
+    workers, the first request of a check runs it for the whole corpus in a process pool and keeps the results.
+    """
+
+    def __init__(self, paths, workers=1):
+        self.paths = list(paths)
+        self.workers = workers
+        self.roots = load_components(self.paths, workers)
+        self._pool = None
+        self._results = dict()
+
+    def get_errors(self, check, path, with_path=False):
+        """Returns the errors of a check for a component, raising the exception that the check raised if any"""
+        if self.workers <= 1:
+            return check(path, self.roots[path]) if with_path else check(self.roots[path])
+
+        if check not in self._results:
+            self._results[check] = self._run(check, with_path)
+        errors, exception = self._results[check][path]
+        if exception is not None:
+            raise exception
+        return errors
+
+    def _run(self, check, with_path):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.roots,))
+        tasks = [(check, path, with_path) for path in self.paths]
+        results = self._pool.map(_run_check, tasks, chunksize=max(1, len(tasks) // (self.workers * 4)))
+        return dict(zip(self.paths, results))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,11 @@
+"""This file provides the pytest options of the component test suites"""
+from isra.src.tests.component_corpus import set_workers
+
+
+def pytest_addoption(parser):
+    parser.addoption("--component-workers", type=int, default=1,
+                     help="Number of processes used to parse and check the components")
+
+
+def pytest_configure(config):
+    set_workers(config.getoption("component_workers", default=1))
@@ -5,6 +5,7 @@ from pathlib import Path
 
 from isra.src.config.config import get_property
 from isra.src.config.constants import get_app_dir
+from isra.src.tests.component_corpus import find_components, get_workers, load_components
 from isra.src.tests.integrity_tests_all_components import *
 
 
@@ -17,14 +18,8 @@ class TestAllComponents(unittest.TestCase):
     def setUpClass(cls):
         components_dir = get_property("components_dir") or get_app_dir()
         cls.path = Path(components_dir)
-        cls.components = list()
-        for root, dirs, files in os.walk(components_dir):
-            for file in files:
-                if file.endswith(".yaml") and "to_review" not in root and ".git" not in root:
-                    cls.components.append(os.path.join(root, file))
-        cls.roots = dict()
-        for x in cls.components:
-            cls.roots[x] = read_yaml(x)
+        cls.components = find_components(components_dir)
+        cls.roots = load_components(cls.components, get_workers())
 
     def test_duplicated_components(self):
         """Check that there are no duplicated components"""
@@ -4,6 +4,8 @@ import logging
 import lxml.etree as etree
 from bs4 import BeautifulSoup
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
 
 
 # Creating a logger
@@ -42,51 +44,245 @@ def findNonASCIIWords(data):
     return words
 
 
-def checkAscii(roots):
-    errors = []
+@dataclass
+class RuleSummary:
+    name: str
+    # (name, value) of every condition
+    conditions: list = field(default_factory=list)
+    # (project, name, value) of every action
+    actions: list = field(default_factory=list)
+
+
+@dataclass
+class LibrarySummary:
+    """Everything the integrity checks need from a library, extracted in a single pass over its XML tree"""
+    path: str
+    ref: str
+    enabled: str = None
+    # Whether the element details (data rows and non-ASCII words) were extracted
+    details: bool = False
+    risk_patterns: list = field(default_factory=list)
+    countermeasures: set = field(default_factory=set)
+    # (ref, name, visible) of every component definition
+    component_definitions: list = field(default_factory=list)
+    rules: list = field(default_factory=list)
+    # Distinct (ref, name) pairs, in the order they appear
+    threat_names: list = field(default_factory=list)
+    weakness_names: list = field(default_factory=list)
+    control_names: list = field(default_factory=list)
+    # Distinct data rows used to compare the same element between libraries. Only with details
+    threats: list = field(default_factory=list)
+    weaknesses: list = field(default_factory=list)
+    controls: list = field(default_factory=list)
+    # (risk pattern ref, element type, element ref, word) for every non-ASCII word in a description. Only with details
+    non_ascii_words: list = field(default_factory=list)
+
+
+def _text(element, *path):
+    for tag in path:
+        element = element.find(tag) if element is not None else None
+    return element.text if element is not None else None
+
+
+def _attrib(element, *path, key):
+    for tag in path:
+        element = element.find(tag) if element is not None else None
+    return element.attrib.get(key) if element is not None else None
+
+
+def _sortedReferences(element, *path):
+    for tag in path:
+        element = element.find(tag) if element is not None else None
+    if element is None:
+        return str([])
+    return str(sorted([[r.attrib.get('name'), r.attrib.get('url')] for r in element.iter('reference')]))
+
+
+def _findNonASCIIWords(data):
+    # Parsing the HTML is only worth it when there is something to find
+    if data is None or html.unescape(data).isascii():
+        return []
+    return findNonASCIIWords(data)
+
+
+def _iterChildren(element, container, tag):
+    container = element.find(container)
+    return container.iter(tag) if container is not None else []
+
+
+def _controlRow(library_ref, control):
+    return (
+        library_ref,
+        control.attrib['ref'],
+        control.attrib.get('name'),
+        control.attrib.get('platform'),
+        control.attrib.get('cost'),
+        control.attrib.get('risk'),
+        control.attrib.get('state'),
+        control.attrib.get('library'),
+        control.attrib.get('source'),
+        _text(control, 'desc'),
+        _attrib(control, 'test', key='expiryDate'),
+        _attrib(control, 'test', key='expiryPeriod'),
+        _text(control, 'test', 'steps'),
+        _text(control, 'test', 'notes'),
+        _sortedReferences(control, 'test', 'references'),
+        str(sorted([[r.attrib.get('ref'), r.attrib.get('supportedStandardRef')] for r in
+                    _iterChildren(control, 'standards', 'standard')])),
+        _sortedReferences(control, 'references'),
+        str(sorted([r.attrib.get('platform') for r in
+                    _iterChildren(control, 'implementations', 'implementation')])),
+    )
+
+
+def _weaknessRow(library_ref, weakness):
+    return (
+        library_ref,
+        weakness.attrib['ref'],
+        weakness.attrib.get('name'),
+        weakness.attrib.get('state'),
+        weakness.attrib.get('impact'),
+        _text(weakness, 'desc'),
+        _attrib(weakness, 'test', key='expiryDate'),
+        _attrib(weakness, 'test', key='expiryPeriod'),
+        _text(weakness, 'test', 'steps'),
+        _text(weakness, 'test', 'notes'),
+        _sortedReferences(weakness, 'test', 'references'),
+    )
+
+
+def _threatRow(library_ref, threat):
+    return (
+        library_ref,
+        threat.attrib['ref'],
+        threat.attrib.get('name'),
+        threat.attrib.get('state'),
+        threat.attrib.get('source'),
+        threat.attrib.get('library'),
+        _text(threat, 'desc'),
+        _attrib(threat, 'riskRating', key='confidentiality'),
+        _attrib(threat, 'riskRating', key='integrity'),
+        _attrib(threat, 'riskRating', key='availability'),
+        _attrib(threat, 'riskRating', key='easeOfExploitation'),
+        _sortedReferences(threat, 'references'),
+    )
+
+
+def _findNonASCIIWordsInComponent(component):
+    rp_ref = component.attrib['ref']
+    words = []
+    for control in _iterChildren(component, "countermeasures", "countermeasure"):
+        for word in _findNonASCIIWords(_text(control, 'desc')):
+            words.append((rp_ref, "Control", control.attrib['ref'], word))
+    for weakness in _iterChildren(component, "weaknesses", "weakness"):
+        for word in _findNonASCIIWords(_text(weakness, 'desc')):
+            words.append((rp_ref, "Weakness", weakness.attrib['ref'], word))
+    for usecase in component.iter('usecase'):
+        for word in _findNonASCIIWords(usecase.attrib.get('desc')):
+            words.append((rp_ref, "Use case", usecase.attrib['ref'], word))
+        for threat in usecase.iter('threat'):
+            for word in _findNonASCIIWords(_text(threat, 'desc')):
+                words.append((rp_ref, "Threat", threat.attrib['ref'], word))
+    return words
 
-    for root in roots.values():
-        for component in root.find("riskPatterns").iter("riskPattern"):
 
-            for control in component.find("countermeasures").iter("countermeasure"):
-                words = findNonASCIIWords(control.find("desc").text)
-                for word in words:
-                    errors.append(
-                        f"Component: '{component.attrib['ref']}': Control: " + control.attrib[
-                            "ref"] + " ->The following string is not ASCII: " + word)
-            for weakness in component.find("weaknesses").iter("weakness"):
-                words = findNonASCIIWords(weakness.find("desc").text)
-                for word in words:
-                    errors.append(
-                        f"Component: '{component.attrib['ref']}': Weakness: " + weakness.attrib[
-                            "ref"] + " ->The following string is not ASCII: " + word)
-            for usecase in component.iter('usecase'):
-                words = findNonASCIIWords(usecase.attrib['desc'])
-                for word in words:
-                    errors.append(
-                        f"Component: '{component.attrib['ref']}': Use case: " + usecase.attrib[
-                            "ref"] + " ->The following string is not ASCII: " + word)
+def summarizeLibrary(path, details=False):
+    """
+    Parses a library and extracts its summary.
+    Element details are only extracted on demand because they take longer than parsing the library itself
+    """
+    root = etree.parse(str(path)).getroot()
+    library = LibrarySummary(path=str(path), ref=root.attrib['ref'], enabled=root.attrib.get('enabled'),
+                             details=details)
 
-                for threat in usecase.iter('threat'):
-                    words = findNonASCIIWords(threat.find("desc").text)
-                    for word in words:
-                        errors.append(
-                            f"Component: '{component.attrib['ref']}': Threat: " + threat.attrib[
-                                "ref"] + " ->The following string is not ASCII: " + word)
+    threat_names = dict()
+    weakness_names = dict()
+    control_names = dict()
+    threats = dict()
+    weaknesses = dict()
+    controls = dict()
+
+    for component in _iterChildren(root, "riskPatterns", "riskPattern"):
+        library.risk_patterns.append(component.attrib['ref'])
+
+        for control in _iterChildren(component, "countermeasures", "countermeasure"):
+            library.countermeasures.add(control.attrib['ref'])
+            control_names[(control.attrib['ref'], control.attrib.get('name'))] = None
+            if details:
+                controls[_controlRow(library.ref, control)] = None
+
+        for weakness in _iterChildren(component, "weaknesses", "weakness"):
+            weakness_names[(weakness.attrib['ref'], weakness.attrib.get('name'))] = None
+            if details:
+                weaknesses[_weaknessRow(library.ref, weakness)] = None
+
+        for threat in component.iter("threat"):
+            threat_names[(threat.attrib['ref'], threat.attrib.get('name'))] = None
+            if details:
+                threats[_threatRow(library.ref, threat)] = None
+
+        if details:
+            library.non_ascii_words.extend(_findNonASCIIWordsInComponent(component))
+
+    for componentDefinition in _iterChildren(root, "componentDefinitions", "componentDefinition"):
+        library.component_definitions.append((componentDefinition.attrib['ref'], componentDefinition.attrib['name'],
+                                               componentDefinition.attrib.get('visible')))
+
+    for rule in root.iter('rule'):
+        library.rules.append(RuleSummary(
+            name=rule.attrib['name'],
+            conditions=[(c.attrib['name'], c.attrib.get('value')) for c in rule.iter('condition')],
+            actions=[(a.attrib.get('project'), a.attrib['name'], a.attrib.get('value')) for a in rule.iter('action')]
+        ))
+
+    library.threat_names = list(threat_names)
+    library.weakness_names = list(weakness_names)
+    library.control_names = list(control_names)
+    library.threats = list(threats)
+    library.weaknesses = list(weaknesses)
+    library.controls = list(controls)
+    return library
+
+
+def buildLibraryIndex(paths, workers=None, details=False):
+    """
+    Parses every library once and returns their summaries by path, in the same order.
+    Libraries are parsed in parallel processes unless there is a single worker or a single library
+    """
+    paths = list(paths)
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        summaries = [summarizeLibrary(path, details) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            summaries = list(executor.map(summarizeLibrary, paths, [details] * len(paths),
+                                          chunksize=max(1, len(paths) // (workers * 4))))
+    return dict(zip(paths, summaries))
+
+
+def _checkDetails(index):
+    if not all(library.details for library in index.values()):
+        raise ValueError("This check needs a library index built with details=True")
+
+
+def checkAscii(index):
+    _checkDetails(index)
+    errors = []
+
+    for library in index.values():
+        for component, element_type, ref, word in library.non_ascii_words:
+            errors.append(
+                f"Component: '{component}': {element_type}: " + ref + " ->The following string is not ASCII: " + word)
 
     return errors
 
 
-def checkDuplicatedComponentsFromLibrary(path_libraries):
+def checkDuplicatedComponentsFromLibrary(index):
     errors = []
     riskpatterns = list()
 
-    for library in os.listdir(str(path_libraries)):
-        if library.endswith(".xml"):
-            root = etree.parse(str(path_libraries / library))
-
-            for rp in root.find("riskPatterns").iter("riskPattern"):
-                riskpatterns.append(rp.attrib['ref'])
+    for library in index.values():
+        riskpatterns.extend(library.risk_patterns)
 
     counter = Counter(riskpatterns)
     for k, v in counter.items():
@@ -98,7 +294,7 @@ def checkDuplicatedComponentsFromLibrary(path_libraries):
 
 def findErrors(itemList, tags):
     errors = []
-    for itemRef, itemDuplicated in itemList.items_v1():
+    for itemRef, itemDuplicated in itemList.items():
         if len(itemDuplicated) > 1:
             pivot = itemDuplicated[0]
             tagsFailed = []
@@ -115,273 +311,142 @@ def findErrors(itemList, tags):
     return errors
 
 
-def checkDuplicatedThreatsWithDifferentData(roots):
+def _groupByRef(rows):
     itemList = dict()
+    for row in rows:
+        itemList.setdefault(row[1], []).append(row)
+    return itemList
+
+
+def checkDuplicatedThreatsWithDifferentData(index):
+    _checkDetails(index)
     tags = ["library", "ref", "name", "state", "source", "libraryAttribute", "desc", "confidentiality",
             "integrity", "availability", "easeOfExploitation",
             "references"]
 
-    for root in roots.values():
-        library = root.getroot().attrib['ref']
-        for component in root.find("riskPatterns").iter("riskPattern"):
-            for threat in component.iter("threat"):
-                ref = threat.attrib['ref']
-                if ref not in itemList.keys():
-                    itemList[ref] = []
-                itemList[ref].append([
-                    library,
-                    threat.attrib['ref'],
-                    threat.attrib['name'],
-                    threat.attrib['state'],
-                    threat.attrib['source'],
-                    threat.attrib['library'],
-                    threat.find('desc').text,
-                    threat.find('riskRating').attrib['confidentiality'],
-                    threat.find('riskRating').attrib['integrity'],
-                    threat.find('riskRating').attrib['availability'],
-                    threat.find('riskRating').attrib['easeOfExploitation'],
-                    str(sorted([[r.attrib['name'], r.attrib['url']] for r in
-                                threat.find('references').iter('reference')]))
-                ]
-                )
-
-    return findErrors(itemList, tags)
-
-
-def checkDuplicatedWeaknessesWithDifferentData(roots):
-    itemList = dict()
+    return findErrors(_groupByRef(row for library in index.values() for row in library.threats), tags)
+
+
+def checkDuplicatedWeaknessesWithDifferentData(index):
+    _checkDetails(index)
     tags = ["library", "ref", "name", "state", "impact", "desc", "expiryDate", "expiryPeriod", "steps", "notes",
             "references"]
 
-    for root in roots.values():
-        library = root.getroot().attrib['ref']
-        for component in root.find("riskPatterns").iter("riskPattern"):
-            for weakness in component.find("weaknesses").iter("weakness"):
-                ref = weakness.attrib['ref']
-                if ref not in itemList.keys():
-                    itemList[ref] = []
-                itemList[ref].append([
-                    library,
-                    weakness.attrib['ref'],
-                    weakness.attrib['name'],
-                    weakness.attrib['state'],
-                    weakness.attrib['impact'],
-                    weakness.find('desc').text,
-                    weakness.find('test').attrib['expiryDate'],
-                    weakness.find('test').attrib['expiryPeriod'],
-                    weakness.find('test').find('steps').text,
-                    weakness.find('test').find('notes').text,
-                    str(sorted([[r.attrib['name'], r.attrib['url']] for r in
-                                weakness.find('test').find('references').iter('reference')]))
-                ]
-                )
-
-    return findErrors(itemList, tags)
-
-
-def checkDuplicatedControlsWithDifferentData(roots):
-    itemList = dict()
+    return findErrors(_groupByRef(row for library in index.values() for row in library.weaknesses), tags)
+
+
+def checkDuplicatedControlsWithDifferentData(index):
+    _checkDetails(index)
     tags = ["library", "ref", "name", "platform", "cost", "risk", "state", "libraryAttribute",
             "sourceAttribute",
             "desc", "expiryDate", "expiryPeriod", "steps", "notes", 
             "testReferences", "standards", "references", "implementations"]
 
-    for root in roots.values():
-        library = root.getroot().attrib['ref']
-        for component in root.find("riskPatterns").iter("riskPattern"):
-            for control in component.find("countermeasures").iter("countermeasure"):
-                ref = control.attrib['ref']
-                if ref not in itemList.keys():
-                    itemList[ref] = []
-                itemList[ref].append([
-                    library,
-                    control.attrib['ref'],
-                    control.attrib['name'],
-                    control.attrib['platform'],
-                    control.attrib['cost'],
-                    control.attrib['risk'],
-                    control.attrib['state'],
-                    control.attrib['library'],
-                    control.attrib['source'],
-                    control.find('desc').text,
-                    control.find('test').attrib['expiryDate'],
-                    control.find('test').attrib['expiryPeriod'],
-                    control.find('test').find('steps').text,
-                    control.find('test').find('notes').text,
-                    str(sorted([[r.attrib['name'], r.attrib['url']] for r in
-                                control.find('test').find('references').iter('reference')])),
-                    str(sorted([[r.attrib['ref'], r.attrib['supportedStandardRef']] for r in
-                                control.find('standards').iter('standard')])),
-                    str(sorted([[r.attrib['name'], r.attrib['url']] for r in
-                                control.find('references').iter('reference')])),
-                    str(sorted([r.attrib['platform'] for r in
-                                control.find('implementations').iter('implementation')])),
-                ]
-                )
-
-    return findErrors(itemList, tags)
-
-
-def checkInconsistentControlNames(roots):
+    return findErrors(_groupByRef(row for library in index.values() for row in library.controls), tags)
+
+
+def _findInconsistentNames(pairs, element_type):
     errors = []
 
-    controls = dict()
-    for root in roots.values():
-        for component in root.find("riskPatterns").iter("riskPattern"):
-            for control in component.find("countermeasures").iter("countermeasure"):
-                ref = control.attrib['ref']
-                name = control.attrib['name']
-
-                if ref not in controls.keys():
-                    controls[ref] = [name]
-                else:
-                    if name not in controls[ref]:
-                        controls[ref].append(name)
-
-    for control, l in controls.items():
+    names = dict()
+    for ref, name in pairs:
+        if ref not in names.keys():
+            names[ref] = [name]
+        else:
+            if name not in names[ref]:
+                names[ref].append(name)
+
+    for ref, l in names.items():
         if len(l) > 1:
             for e in l:
-                errors.append(f"Control {control} has different names: {e}")
+                errors.append(f"{element_type} {ref} has different names: {e}")
 
     return errors
 
 
-def checkDuplicatedRiskPatternRefs(roots):
+def checkInconsistentControlNames(index):
+    return _findInconsistentNames((pair for library in index.values() for pair in library.control_names), "Control")
+
+
+def checkDuplicatedRiskPatternRefs(index):
     errors = []
 
     riskPatternFound = dict()
-    for root in roots.values():
-        library = root.getroot().attrib['ref']
-        for component in root.find("riskPatterns").iter("riskPattern"):
-            ref = component.attrib['ref']
+    for library in index.values():
+        for ref in library.risk_patterns:
             if ref not in riskPatternFound.keys():
-                riskPatternFound[ref] = library
+                riskPatternFound[ref] = library.ref
             else:
                 errors.append(
-                    f"Risk pattern {ref} in {library} appears to be duplicated in {riskPatternFound[ref]}")
+                    f"Risk pattern {ref} in {library.ref} appears to be duplicated in {riskPatternFound[ref]}")
 
     return errors
 
-def checkIncorrectLibraryRefOnRule(roots):
+def checkIncorrectLibraryRefOnRule(index):
     errors = []
 
     libraryRPMap = dict()
 
-    for root in roots.values():
-        libRef = root.getroot().attrib['ref']
-        rpList = list()
-        for component in root.find('riskPatterns').iter('riskPattern'):
-            rpList.append(component.attrib['ref'])
+    for library in index.values():
+        libraryRPMap[library.ref] = set(library.risk_patterns)
 
-        libraryRPMap[libRef] = rpList
-
-    for root in roots.values():
-        for rule in root.iter('rule'):
-            for condition in rule.iter('condition'):
-                if condition.attrib['name'] == "CONDITION_RISK_PATTERN_EXISTS":
-                    value = condition.attrib['value'].split("_::_")
+    for library in index.values():
+        for rule in library.rules:
+            for name, value in rule.conditions:
+                if name == "CONDITION_RISK_PATTERN_EXISTS":
+                    value = value.split("_::_")
                     if value[1] not in libraryRPMap[value[0]]:
                         errors.append(
-                            f"Rule [{rule.attrib['name']}] has a risk pattern that doesn't exists: {value}")
+                            f"Rule [{rule.name}] has a risk pattern that doesn't exists: {value}")
 
-            for action in rule.iter('action'):
-                if action.attrib['name'] in ["IMPORT_RISK_PATTERN", "EXTEND_RISK_PATTERN"]:
-                    value = action.attrib['value'].split("_::_")
+            for project, name, value in rule.actions:
+                if name in ["IMPORT_RISK_PATTERN", "EXTEND_RISK_PATTERN"]:
+                    value = value.split("_::_")
                     if value[1] not in libraryRPMap[value[0]]:
                         errors.append(
-                            f"Rule [{rule.attrib['name']}] has a risk pattern that doesn't exists: {value}")
-                    if action.attrib['project'] not in ["", value[0]] and action.attrib[
-                        'project'] not in libraryRPMap.keys():
+                            f"Rule [{rule.name}] has a risk pattern that doesn't exists: {value}")
+                    if project not in ["", value[0]] and project not in libraryRPMap.keys():
                         errors.append(
-                            f"Rule [{rule.attrib['name']}] references a library that doesn't match with the action: {value[0]} != {action.attrib['project']}")
-                if action.attrib['name'] in ["APPLY_CONTROL"]:
-                    if action.attrib['project'] not in libraryRPMap.keys():
+                            f"Rule [{rule.name}] references a library that doesn't match with the action: {value[0]} != {project}")
+                if name in ["APPLY_CONTROL"]:
+                    if project not in libraryRPMap.keys():
                         errors.append(
-                            f"Rule [{rule.attrib['name']}] references a library that doesn't match any existing library: {action.attrib['project']} not in {libraryRPMap.keys()}")
+                            f"Rule [{rule.name}] references a library that doesn't match any existing library: {project} not in {libraryRPMap.keys()}")
 
     return errors
 
 
-def checkInconsistentThreatNames(roots):
-    errors = []
+def checkInconsistentThreatNames(index):
+    return _findInconsistentNames((pair for library in index.values() for pair in library.threat_names), "Threat")
 
-    threats = dict()
-    for root in roots.values():
-        for component in root.find("riskPatterns").iter("riskPattern"):
-            for threat in component.iter("threat"):
-                ref = threat.attrib['ref']
-                name = threat.attrib['name']
-
-                if ref not in threats.keys():
-                    threats[ref] = [name]
-                else:
-                    if name not in threats[ref]:
-                        threats[ref].append(name)
-
-    for threat, l in threats.items():
-        if len(l) > 1:
-            for e in l:
-                errors.append(f"Threat {threat} has different names: {e}")
 
-    return errors
+def checkInconsistentWeaknessNames(index):
+    return _findInconsistentNames((pair for library in index.values() for pair in library.weakness_names), "Weakness")
 
 
-def checkInconsistentWeaknessNames(roots):
+def checkDisabledLibrariesAreDisabled(index, disabled):
     errors = []
 
-    weaknesses = dict()
-    for root in roots.values():
-        for component in root.find("riskPatterns").iter("riskPattern"):
-            for weakness in component.find("weaknesses").iter("weakness"):
-                ref = weakness.attrib['ref']
-                name = weakness.attrib['name']
-
-                if ref not in weaknesses.keys():
-                    weaknesses[ref] = [name]
-                else:
-                    if name not in weaknesses[ref]:
-                        weaknesses[ref].append(name)
-
-    for weakness, l in weaknesses.items():
-        if len(l) > 1:
-            for e in l:
-                errors.append(f"Weakness {weakness} has different names: {e}")
-
-    return errors
-
-
-def checkDisabledLibrariesAreDisabled(roots, disabled):
-    errors = []
-
-    for root in roots.values():
-        r = root.getroot()
-        if "enabled" in r.attrib:
-            if r.attrib["enabled"] == "true":
-                if r.attrib["ref"] in disabled:
-                    errors.append(f"Library {r.attrib['ref']} is marked as enabled but it should be disabled")
+    for library in index.values():
+        if library.enabled is not None:
+            if library.enabled == "true":
+                if library.ref in disabled:
+                    errors.append(f"Library {library.ref} is marked as enabled but it should be disabled")
             else:
-                if r.attrib["ref"] not in disabled:
+                if library.ref not in disabled:
                     errors.append(
-                        f"Library {r.attrib['ref']} is marked as disabled but is not in the list of disabled libraries")
+                        f"Library {library.ref} is marked as disabled but is not in the list of disabled libraries")
         else:
-            if r.attrib["ref"] in disabled:
-                errors.append(f"Library {r.attrib['ref']} is marked as enabled but it should be disabled")
+            if library.ref in disabled:
+                errors.append(f"Library {library.ref} is marked as enabled but it should be disabled")
 
     return errors
 
 
-def checkDuplicatedRules(roots, disabled):
+def checkDuplicatedRules(index, disabled):
     errors = []
 
-    rules = dict()
-
-    for root in roots.values():
-        r = root.getroot()
-
-        for rule in r.find("rules").iter("rule"):
-            if rule.attrib["name"] not in rules:
-                rules[rule.attrib["name"]] = 0
-            rules[rule.attrib["name"]] +=1
+    rules = Counter(rule.name for library in index.values() for rule in library.rules)
 
     for k,v in rules.items():
         if v>1:
@@ -391,53 +456,38 @@ def checkDuplicatedRules(roots, disabled):
     return errors
 
 
-def checkPlaceholderComponentsAreDisabled(roots, disabled):
+def checkPlaceholderComponentsAreDisabled(index, disabled):
     errors = []
 
-    rules = dict()
-
-    for root in roots.values():
-        for componentDefinition in root.find("componentDefinitions").iter("componentDefinition"):
-            cd_name = componentDefinition.attrib['name']
-            cd_ref = componentDefinition.attrib["ref"]
-            if "placeholder" in cd_name.lower() and componentDefinition.attrib["visible"] != "false":
+    for library in index.values():
+        for cd_ref, cd_name, visible in library.component_definitions:
+            if "placeholder" in cd_name.lower() and visible != "false":
                 errors.append(f"Component definition '{cd_ref}' is a placeholder component but is visible")
 
 
     return errors
 
-def checkRuleReferencesAreNotBroken(roots, disabled):
+def checkRuleReferencesAreNotBroken(index, disabled):
     errors = []
 
     countermeasures_in_libs = dict()
 
-    for root in roots.values():
-        r = root.getroot()
-        rootref = r.attrib["ref"]
-        if rootref not in countermeasures_in_libs:
-            countermeasures_in_libs[rootref] = set()
-
-        for component in r.find("riskPatterns").iter("riskPattern"):
-            for control in component.find("countermeasures").iter("countermeasure"):
-                ref = control.attrib['ref']
-                countermeasures_in_libs[rootref].add(ref)
-
-    for root in roots.values():
-        r = root.getroot()
-        for rule in r.iter('rule'):
-            for action in rule.iter('action'):
+    for library in index.values():
+        countermeasures_in_libs.setdefault(library.ref, set()).update(library.countermeasures)
 
-                action_project = action.attrib['project']
+    for library in index.values():
+        for rule in library.rules:
+            for action_project, name, value in rule.actions:
 
-                if action.attrib['name'] in ["IMPORT_SPECIFIC_RISK"]:
-                    value = action.attrib['value'].split("_::_")
+                if name in ["IMPORT_SPECIFIC_RISK"]:
+                    value = value.split("_::_")
                     if action_project != value[0]:
-                        errors.append(f"Rule <{rule.attrib['name']}> has a wrong library reference (IMPORT_SPECIFIC_RISK): {action_project} != {value[0]}")
+                        errors.append(f"Rule <{rule.name}> has a wrong library reference (IMPORT_SPECIFIC_RISK): {action_project} != {value[0]}")
 
-                if action.attrib['name'] in ["MARK_CONTROL_AS"]:
-                    value = action.attrib['value'].split("_::_")
+                if name in ["MARK_CONTROL_AS"]:
+                    value = value.split("_::_")
                     if value[0] not in countermeasures_in_libs[action_project]:
-                        errors.append(f"Rule <{rule.attrib['name']}> has a wrong library reference (MARK_CONTROL_AS): {value[0]} not in countermeasures of {action_project}")
+                        errors.append(f"Rule <{rule.name}> has a wrong library reference (MARK_CONTROL_AS): {value[0]} not in countermeasures of {action_project}")
 
 
     return errors
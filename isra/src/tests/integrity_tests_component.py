@@ -1,4 +1,5 @@
 from collections import Counter
+from functools import lru_cache
 import re
 
 import jsonschema
@@ -19,11 +20,30 @@ def read_yaml(file_path):
         return None
 
 
-def yaml_validator(yaml_component_path):
-    errors = []
-    yaml_component_data = read_yaml(yaml_component_path)
+@lru_cache(maxsize=None)
+def get_yaml_validator():
+    """Returns the JSON schema validator for YAML components, compiled only once"""
     schema = get_resource(YSC_SCHEMA, filetype="json")
-    validator = jsonschema.Draft7Validator(schema)
+    return jsonschema.Draft7Validator(schema)
+
+
+@lru_cache(maxsize=None)
+def get_scoring_rules():
+    """Returns the risk scoring rules, parsed only once"""
+    return get_resource(SCORING_RULES)
+
+
+@lru_cache(maxsize=None)
+def get_system_field_values():
+    """Returns the valid system field values, parsed only once"""
+    return get_resource(SYSTEM_FIELD_VALUES, filetype="yaml")
+
+
+def yaml_validator(yaml_component_path, yaml_component_data=None):
+    errors = []
+    if yaml_component_data is None:
+        yaml_component_data = read_yaml(yaml_component_path)
+    validator = get_yaml_validator()
     if not validator.is_valid(yaml_component_data):
         errors.append(f"Component {yaml_component_path} doesn't fit the JSON schema: ")
         for error in sorted(validator.iter_errors(yaml_component_data), key=str):
@@ -215,7 +235,7 @@ def check_empty_threat_descriptions(root):
 
 def check_risk_scoring_values_for_threats(root):
     errors = []
-    rules_file = get_resource(SCORING_RULES)
+    rules_file = get_scoring_rules()
     rules = [r for r in rules_file if not r.get("disabled", False)]
 
     yaml_fields = ["threats"]
@@ -385,7 +405,7 @@ def aux(ref, cf_values_list, valid_values):
 
 
 def check_custom_fields_are_valid(root):
-    cfs = get_resource(SYSTEM_FIELD_VALUES, filetype="yaml")
+    cfs = get_system_field_values()
     errors = []
 
     for threat in root['component']['risk_pattern']['threats']:
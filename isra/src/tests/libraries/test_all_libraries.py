@@ -3,7 +3,6 @@ import unittest
 import pytest
 import os
 from pathlib import Path
-from lxml import etree
 
 from isra.src.config.config import get_property
 from isra.src.config.constants import get_app_dir
@@ -11,8 +10,9 @@ from isra.src.tests.integrity_tests_all_libraries import *
 
 
 class TestAllLibraries(unittest.TestCase):
-    """This class initializes by retrieving all weaknesses, controls and the folder path"""
-    roots = dict()
+    """This class initializes by parsing every library once into the index that all the checks use"""
+    index = dict()
+    detailed_index = None
     libraries = list()
     path = None
     maxDiff = None
@@ -24,88 +24,94 @@ class TestAllLibraries(unittest.TestCase):
         for x in cls.path.iterdir():
             if ".xml" in str(x):
                 cls.libraries.append(x)
-        for x in cls.libraries:
-            cls.roots[x] = etree.parse(str(x))
+        cls.index = buildLibraryIndex(cls.libraries)
+
+    @classmethod
+    def getDetailedIndex(cls):
+        """Returns the index with element details, which only some checks need, building it the first time"""
+        if cls.detailed_index is None:
+            cls.detailed_index = buildLibraryIndex(cls.libraries, details=True)
+        return cls.detailed_index
 
     def test_duplicated_components(self):
         """Check that there are no duplicated risk patterns"""
-        errors = checkDuplicatedComponentsFromLibrary(self.path)
+        errors = checkDuplicatedComponentsFromLibrary(self.index)
         self.assertCountEqual(errors, [])
 
     @pytest.mark.skip(reason="not needed anymore")
     def test_duplicated_threats_different_data(self):
         """Check if a weakness is duplicated in another threat but with different data"""
-        errors = checkDuplicatedThreatsWithDifferentData(self.roots)
+        errors = checkDuplicatedThreatsWithDifferentData(self.getDetailedIndex())
         self.assertCountEqual(errors, [])
 
     @pytest.mark.skip(reason="not needed anymore")
     def test_duplicated_weaknesses_different_data(self):
         """Check if a weakness is duplicated in another threat but with different data"""
-        errors = checkDuplicatedWeaknessesWithDifferentData(self.roots)
+        errors = checkDuplicatedWeaknessesWithDifferentData(self.getDetailedIndex())
         self.assertCountEqual(errors, [])
 
     @pytest.mark.skip(reason="not needed anymore")
     def test_duplicated_controls_different_data(self):
         """Check if a weakness is duplicated in another threat but with different data"""
-        errors = checkDuplicatedControlsWithDifferentData(self.roots)
+        errors = checkDuplicatedControlsWithDifferentData(self.getDetailedIndex())
         self.assertCountEqual(errors, [])
 
     @pytest.mark.skip(reason="Deprecated test")
     def test_check_ascii(self):
         """Check that the countermeasure descriptions don't have non-ASCII characters"""
-        errors = checkAscii(self.roots)
+        errors = checkAscii(self.getDetailedIndex())
         self.assertCountEqual(errors, [])
 
     @pytest.mark.skip(reason="Deprecated test")
     def test_check_inconsistent_control_names(self):
         """Check that countermeasures with the same ref also have the same name"""
-        errors = checkInconsistentControlNames(self.roots)
+        errors = checkInconsistentControlNames(self.index)
         self.assertCountEqual(errors, [])
 
     def test_duplicated_risk_pattern_refs(self):
         """Check that a risk pattern ref cannot be duplicated"""
-        errors = checkDuplicatedRiskPatternRefs(self.roots)
+        errors = checkDuplicatedRiskPatternRefs(self.index)
         self.assertCountEqual(errors, [])
 
     def test_check_incorrect_library_ref_on_rule(self):
         """Check that the library referenced in a rule is correct and that the risk pattern exists in that library"""
-        errors = checkIncorrectLibraryRefOnRule(self.roots)
+        errors = checkIncorrectLibraryRefOnRule(self.index)
         self.assertCountEqual(errors, [])
 
     def test_check_disabled_libraries_are_disabled(self):
         """Check that there is no component missing in the libraries and that those new are listed"""
         disabled = []
-        errors = checkDisabledLibrariesAreDisabled(self.roots, disabled)
+        errors = checkDisabledLibrariesAreDisabled(self.index, disabled)
         self.assertCountEqual(errors, [])
 
     def test_check_duplicated_rules(self):
         """Check that there is no component missing in the libraries and that those new are listed"""
         disabled = []
-        errors = checkDuplicatedRules(self.roots, disabled)
+        errors = checkDuplicatedRules(self.index, disabled)
         self.assertCountEqual(errors, [])
 
     def test_check_placeholder_components_are_disabled(self):
         """Check that there is no component missing in the libraries and that those new are listed"""
         disabled = []
-        errors = checkPlaceholderComponentsAreDisabled(self.roots, disabled)
+        errors = checkPlaceholderComponentsAreDisabled(self.index, disabled)
         self.assertCountEqual(errors, [])
 
     def test_check_rule_references_are_not_broken(self):
         """Check that there is no component missing in the libraries and that those new are listed"""
         disabled = []
-        errors = checkRuleReferencesAreNotBroken(self.roots, disabled)
+        errors = checkRuleReferencesAreNotBroken(self.index, disabled)
         self.assertCountEqual(errors, [])
 
     @pytest.mark.skip(reason="element refs and names pending to be fixed in the future")
     def test_check_inconsistent_threat_names(self):
         """Check that the threats and weaknesses with the same ref don't have different names"""
-        errors = checkInconsistentThreatNames(self.roots)
+        errors = checkInconsistentThreatNames(self.index)
         self.assertCountEqual(errors, [])
 
     @pytest.mark.skip(reason="element refs and names pending to be fixed in the future")
     def test_check_inconsistent_weakness_names(self):
         """Check that the threats and weaknesses with the same ref don't have different names"""
-        errors = checkInconsistentWeaknessNames(self.roots)
+        errors = checkInconsistentWeaknessNames(self.index)
         self.assertCountEqual(errors, [])
 
 
@@ -1,4 +1,5 @@
 import os
+from typing import Annotated
 
 import pytest
 import typer
@@ -26,28 +27,32 @@ def yaml_components_callback():
     """Tests that run for YAML components"""
 
 
+def run_component_tests(path, workers):
+    exit(pytest.main(['-v', '-p no:warnings', f'--component-workers={workers}', path]))
+
+
 @yaml_components.command()
-def all():
+def all(workers: Annotated[int, typer.Option(help="Number of processes used to parse and check the components")] = 1):
     """
     Run all tests
     """
-    exit(pytest.main(['-v', '-p no:warnings', f'{rootdir}/components']))
+    run_component_tests(f'{rootdir}/components', workers)
 
 
 @yaml_components.command()
-def component():
+def component(workers: Annotated[int, typer.Option(help="Number of processes used to parse and check the components")] = 1):
     """
     Run pytest with tests that affect each component separately
     """
-    exit(pytest.main(['-v', '-p no:warnings', f'{rootdir}/components/test_component.py']))
+    run_component_tests(f'{rootdir}/components/test_component.py', workers)
 
 
 @yaml_components.command()
-def components():
+def components(workers: Annotated[int, typer.Option(help="Number of processes used to parse the components")] = 1):
     """
     Run pytest with tests that affect all components at the same time
     """
-    exit(pytest.main(['-v', '-p no:warnings', f'{rootdir}/components/test_all_components.py']))
+    run_component_tests(f'{rootdir}/components/test_all_components.py', workers)
 
 
 @xml_libraries.callback()
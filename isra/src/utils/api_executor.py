@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, List, Optional
+
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, MofNCompleteColumn, TimeElapsedColumn
+
+from isra.src.config.config import get_number_property
+
+DEFAULT_API_MAX_CONCURRENCY = 4
+
+
+class APIOperation:
+    """An IriusRisk API call waiting to run. Its result can be passed as an argument of other operations"""
+
+    def __init__(self, function: Callable, args, kwargs, depends_on):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        # Operations passed as arguments have to finish first, since their results are needed
+        self.depends_on: List["APIOperation"] = list(depends_on) + [a for a in list(args) + list(kwargs.values())
+                                                                    if isinstance(a, APIOperation)]
+        self.dependants: List["APIOperation"] = list()
+        self.result: Any = None
+        self.done = False
+
+    def run(self):
+        args = [a.result if isinstance(a, APIOperation) else a for a in self.args]
+        kwargs = {k: v.result if isinstance(v, APIOperation) else v for k, v in self.kwargs.items()}
+        return self.function(*args, **kwargs)
+
+
+def resolve(value):
+    """Returns the result of an operation, or the value itself if it isn't one"""
+    return value.result if isinstance(value, APIOperation) else value
+
+
+class APIExecutor:
+    """Runs IriusRisk API operations concurrently, but each one only after the ones it depends on
+
+    Operations are added with submit and run all together with run. Independent operations are sent at once, up to
+    iriusrisk_max_concurrency in flight. The calls per second are limited by make_api_call itself. If an operation
+    fails, the ones not started yet are cancelled and the error is raised once the running ones finish.
+    """
+
+    def __init__(self, max_concurrency=None):
+        self.max_concurrency = int(max_concurrency or get_number_property("iriusrisk_max_concurrency",
+                                                                          DEFAULT_API_MAX_CONCURRENCY))
+        self.operations: List[APIOperation] = list()
+
+    def submit(self, function: Callable, *args, depends_on=(), **kwargs) -> APIOperation:
+        operation = APIOperation(function, args, kwargs, depends_on)
+        self.operations.append(operation)
+        return operation
+
+    def run(self, description="Sending changes to IriusRisk..."):
+        """Runs every operation submitted since the last run"""
+        operations, self.operations = self.operations, list()
+        pending = dict()
+        for operation in operations:
+            pending[operation] = 0
+            for dependency in operation.depends_on:
+                if not dependency.done:
+                    pending[operation] += 1
+                    dependency.dependants.append(operation)
+        if not operations:
+            return
+
+        error: Optional[BaseException] = None
+        with Progress(SpinnerColumn(), TextColumn(description), BarColumn(), MofNCompleteColumn(),
+                      TimeElapsedColumn(), transient=True) as progress:
+            progress_task = progress.add_task(description, total=len(operations))
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = {executor.submit(o.run): o for o, count in pending.items() if count == 0}
+                try:
+                    while futures:
+                        finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            operation = futures.pop(future)
+                            if future.exception() is not None:
+                                error = error or future.exception()
+                                continue
+                            operation.result = future.result()
+                            operation.done = True
+                            progress.advance(progress_task)
+                            if error is not None:
+                                continue
+                            for dependant in operation.dependants:
+                                pending[dependant] -= 1
+                                if pending[dependant] == 0:
+                                    futures[executor.submit(dependant.run)] = dependant
+                except BaseException:
+                    # Ctrl+C stops the whole run
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+        if error is not None:
+            raise error
@@ -1,21 +1,59 @@
+import contextlib
+import hashlib
+import json
 import os
+import threading
 
 import requests
 import time
 import typer
 from requests import HTTPError
+from requests.adapters import HTTPAdapter
 from rich import print
 from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich.table import Table
 from urllib3.exceptions import NewConnectionError
+from urllib3.util.retry import Retry
 
-from isra.src.config.config import get_property
-from isra.src.config.constants import IRIUSRISK_API_HEADERS, get_app_dir
+from isra.src.config.config import get_property, get_number_property
+from isra.src.config.constants import IRIUSRISK_API_HEADERS, UPLOAD_STATE_FOLDER, get_app_dir
+from isra.src.utils.api_executor import APIExecutor, APIOperation, resolve, DEFAULT_API_MAX_CONCURRENCY
+from isra.src.utils.rate_limiter import TokenBucket
 from isra.src.utils.text_functions import clean_and_capitalize, convert_cost_value, get_company_name_prefix, \
     set_category_suffix
 from isra.src.utils.xml_functions import export_rules_into_rules_library, export_content_into_category_library, \
-    import_content_into_template, import_rules_into_template, create_local_library, get_library_name_from_file
+    import_content_into_template, import_rules_into_template, create_local_library, get_library_name_from_file, \
+    get_library_content_hash
 from isra.src.utils.yaml_functions import build_tree_hierarchy
 
+DEFAULT_API_TIMEOUT = 60
+DEFAULT_API_MAX_RETRIES = 4
+DEFAULT_API_REQUESTS_PER_SECOND = 10
+API_CONNECT_TIMEOUT = 10
+
+# Statuses worth retrying after a while: rate limiting and server errors
+API_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Sessions are shared by the whole process, so connections to the instance are kept alive and reused between calls
+_sessions = dict()
+_sessions_lock = threading.Lock()
+
+# Rate limiters by calls per second, shared by every thread calling the API
+_rate_limiters = dict()
+
+# Calls, errors, retries and seconds spent by HTTP method, since the last reset
+_api_stats = dict()
+_api_stats_lock = threading.Lock()
+
+
+class APIRetry(Retry):
+    """Retry policy that also retries rate limited POST requests, since the instance didn't process them"""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
 
 # Categories
 def get_category(template):
@@ -57,8 +95,8 @@ def post_component_definition(template, category):
     return make_api_call("post", "/api/v2/components", request_body=data)
 
 
-def put_component_definition(template, component, category):
-    data = {
+def get_component_definition_data(template, category):
+    return {
         "name": template["component"]["name"],
         "description": template["component"]["desc"],
         "category": {
@@ -67,6 +105,10 @@ def put_component_definition(template, component, category):
         "visible": bool(template["component"]["visible"])
     }
 
+
+def put_component_definition(template, component, category):
+    data = get_component_definition_data(template, category)
+
     return make_api_call("put", f"/api/v2/components/{component['id']}", request_body=data)
 
 
@@ -135,11 +177,17 @@ def get_risk_pattern(template, library):
     return get_response_object([answer])
 
 
-def post_risk_pattern(template, library):
-    data = {
+def get_risk_pattern_data(template):
+    return {
         "referenceId": template["riskPattern"]["ref"],
         "name": template["riskPattern"]["name"],
         "description": template["riskPattern"]["desc"],
+    }
+
+
+def post_risk_pattern(template, library):
+    data = {
+        **get_risk_pattern_data(template),
         "library": {
             "id": library["id"]
         }
@@ -149,11 +197,7 @@ def post_risk_pattern(template, library):
 
 
 def put_risk_pattern(template, risk_pattern):
-    data = {
-        "referenceId": template["riskPattern"]["ref"],
-        "name": template["riskPattern"]["name"],
-        "description": template["riskPattern"]["desc"],
-    }
+    data = get_risk_pattern_data(template)
 
     return make_api_call("put", f"/api/v2/libraries/risk-patterns/{risk_pattern['id']}",
                          request_body=data)
@@ -187,11 +231,17 @@ def get_use_case(usecase_ref, risk_pattern):
     return get_response_object([answer])
 
 
+def get_use_case_data(template, usecase_ref):
+    return {
+        "name": template["usecases"][usecase_ref]["name"],
+        "description": template["usecases"][usecase_ref]["desc"]
+    }
+
+
 def post_use_case(template, usecase_ref, risk_pattern):
     data = {
         "referenceId": template["usecases"][usecase_ref]["ref"],
-        "name": template["usecases"][usecase_ref]["name"],
-        "description": template["usecases"][usecase_ref]["desc"],
+        **get_use_case_data(template, usecase_ref),
         "riskPattern": {
             "id": risk_pattern["id"]
         }
@@ -201,10 +251,7 @@ def post_use_case(template, usecase_ref, risk_pattern):
 
 
 def put_use_case(template, usecase_ref, usecase):
-    data = {
-        "name": template["usecases"][usecase_ref]["name"],
-        "description": template["usecases"][usecase_ref]["desc"]
-    }
+    data = get_use_case_data(template, usecase_ref)
 
     return make_api_call("put", f"/api/v2/libraries/use-cases/{usecase['id']}",
                          request_body=data, color="blue")
@@ -232,45 +279,41 @@ def get_threat(th_key, uc):
     return get_response_object([answer])
 
 
-def post_threat(template, th_key, uc, customfields):
+def get_custom_field_values(values, customfields):
     custom_fields = list()
-    for k, v in template["threats"][th_key]["customFields"].items():
+    for k, v in values.items():
         if k in customfields:
             cfid = customfields[k]
             custom_fields.append({"value": v, "customField": {"id": cfid}})
-    data = {
+    return custom_fields
+
+
+def get_threat_data(template, th_key, customfields):
+    return {
         "availability": int(template["threats"][th_key]["riskRating"]["A"]),
         "confidentiality": int(template["threats"][th_key]["riskRating"]["C"]),
         "easeOfExploitation": int(template["threats"][th_key]["riskRating"]["EE"]),
         "integrity": int(template["threats"][th_key]["riskRating"]["I"]),
         "name": template["threats"][th_key]["name"],
         "referenceId": template["threats"][th_key]["ref"],
+        "description": template["threats"][th_key]["desc"],
+        "customFields": get_custom_field_values(template["threats"][th_key]["customFields"], customfields)
+    }
+
+
+def post_threat(template, th_key, uc, customfields):
+    data = {
+        **get_threat_data(template, th_key, customfields),
         "useCase": {
             "id": uc["id"]
-        },
-        "description": template["threats"][th_key]["desc"],
-        "customFields": custom_fields
+        }
     }
 
     return make_api_call("post", "/api/v2/libraries/threats", request_body=data, color="red")
 
 
 def put_threat(template, th_key, th, customfields):
-    custom_fields = list()
-    for k, v in template["threats"][th_key]["customFields"].items():
-        if k in customfields:
-            cfid = customfields[k]
-            custom_fields.append({"value": v, "customField": {"id": cfid}})
-    data = {
-        "availability": int(template["threats"][th_key]["riskRating"]["A"]),
-        "confidentiality": int(template["threats"][th_key]["riskRating"]["C"]),
-        "easeOfExploitation": int(template["threats"][th_key]["riskRating"]["EE"]),
-        "integrity": int(template["threats"][th_key]["riskRating"]["I"]),
-        "name": template["threats"][th_key]["name"],
-        "referenceId": template["threats"][th_key]["ref"],
-        "description": template["threats"][th_key]["desc"],
-        "customFields": custom_fields
-    }
+    data = get_threat_data(template, th_key, customfields)
 
     return make_api_call("put", f"/api/v2/libraries/threats/{th['id']}",
                          request_body=data, color="red")
@@ -284,7 +327,7 @@ def delete_threat(th):
 
 def get_all_threats(uc):
     answer = make_api_call("get",
-                           f"/api/v2/libraries/threats?filter='useCase.id'='{uc['id']}'",
+                           f"/api/v2/libraries/threats?filter='useCase.id'='{uc['id']}'&size=1000",
                            color="red")
     return get_response_array([answer])
 
@@ -299,12 +342,18 @@ def get_weakness(w_key, risk_pattern):
     return get_response_object([answer])
 
 
-def post_weakness(template, w_key, risk_pattern):
-    data = {
+def get_weakness_data(template, w_key):
+    return {
         "name": template["weaknesses"][w_key]["name"],
         "referenceId": template["weaknesses"][w_key]["ref"],
-        "impact": int(template["weaknesses"][w_key]["impact"]),
         "description": template["weaknesses"][w_key]["desc"],
+        "impact": int(template["weaknesses"][w_key]["impact"])
+    }
+
+
+def post_weakness(template, w_key, risk_pattern):
+    data = {
+        **get_weakness_data(template, w_key),
         "riskPattern": {
             "id": risk_pattern["id"]
         }
@@ -316,12 +365,7 @@ def post_weakness(template, w_key, risk_pattern):
 
 
 def put_weakness(template, w_key, ww):
-    data = {
-        "name": template["weaknesses"][w_key]["name"],
-        "referenceId": template["weaknesses"][w_key]["ref"],
-        "description": template["weaknesses"][w_key]["desc"],
-        "impact": int(template["weaknesses"][w_key]["impact"])
-    }
+    data = get_weakness_data(template, w_key)
 
     return make_api_call("put", f"/api/v2/libraries/weaknesses/{ww['id']}",
                          request_body=data, color="green")
@@ -335,7 +379,7 @@ def delete_weakness(w):
 
 def get_all_weaknesses(risk_pattern):
     answer = make_api_call("get",
-                           f"/api/v2/libraries/weaknesses?filter='riskPattern.id'='{risk_pattern['id']}'",
+                           f"/api/v2/libraries/weaknesses?filter='riskPattern.id'='{risk_pattern['id']}'&size=1000",
                            color="green")
     return get_response_array([answer])
 
@@ -379,43 +423,30 @@ def get_customfields():
     return customfields
 
 
-def post_countermeasure(template, c_key, risk_pattern, customfields):
-    custom_fields = list()
-    for k, v in template["controls"][c_key]["customFields"].items():
-        if k in customfields:
-            cfid = customfields[k]
-            custom_fields.append({"value": v, "customField": {"id": cfid}})
-
-    data = {
+def get_countermeasure_data(template, c_key, customfields):
+    return {
         "referenceId": template["controls"][c_key]["ref"],
         "name": template["controls"][c_key]["name"],
         "description": template["controls"][c_key]["desc"],
-        "riskPattern": {
-            "id": risk_pattern["id"]
-        },
         "cost": convert_cost_value(template["controls"][c_key]["cost"]),
         "state": "recommended",
-        "customFields": custom_fields
+        "customFields": get_custom_field_values(template["controls"][c_key]["customFields"], customfields)
+    }
+
+
+def post_countermeasure(template, c_key, risk_pattern, customfields):
+    data = {
+        **get_countermeasure_data(template, c_key, customfields),
+        "riskPattern": {
+            "id": risk_pattern["id"]
+        }
     }
 
     return make_api_call("post", "/api/v2/libraries/countermeasures", request_body=data, color="yellow")
 
 
 def put_countermeasure(template, c_key, cc, customfields):
-    custom_fields = list()
-    for k, v in template["controls"][c_key]["customFields"].items():
-        if k in customfields:
-            cfid = customfields[k]
-            custom_fields.append({"value": v, "customField": {"id": cfid}})
-
-    data = {
-        "referenceId": template["controls"][c_key]["ref"],
-        "name": template["controls"][c_key]["name"],
-        "description": template["controls"][c_key]["desc"],
-        "cost": convert_cost_value(template["controls"][c_key]["cost"]),
-        "state": "recommended",
-        "customFields": custom_fields
-    }
+    data = get_countermeasure_data(template, c_key, customfields)
 
     return make_api_call("put", f"/api/v2/libraries/countermeasures/{cc['id']}", request_body=data, color="yellow")
 
@@ -449,7 +480,8 @@ def delete_countermeasure(c):
 
 def get_all_countermeasures(risk_pattern):
     answer = make_api_call("get",
-                           f"/api/v2/libraries/countermeasures?filter='riskPattern.id'='{risk_pattern['id']}'",
+                           f"/api/v2/libraries/countermeasures"
+                           f"?filter='riskPattern.id'='{risk_pattern['id']}'&size=1000",
                            color="yellow")
     return get_response_array([answer])
 
@@ -505,33 +537,121 @@ def get_response_array(answers):
     return []
 
 
+def get_api_session():
+    """
+    Returns the session used to call the IriusRisk API.
+    Failed calls are retried with exponential backoff up to iriusrisk_max_retries times when the instance is rate
+    limiting or returns a server error. Only GET, PUT and DELETE calls are retried after a server error
+    """
+    max_retries = int(get_number_property("iriusrisk_max_retries", DEFAULT_API_MAX_RETRIES))
+    key = (get_property("iriusrisk_url"), max_retries)
+    with _sessions_lock:
+        if key not in _sessions:
+            retry = APIRetry(total=max_retries, backoff_factor=0.5, status_forcelist=API_RETRY_STATUSES,
+                             allowed_methods=frozenset({"GET", "PUT", "DELETE"}), raise_on_status=False)
+            # Enough pooled connections for every concurrent upload call
+            connections = int(get_number_property("iriusrisk_max_concurrency", DEFAULT_API_MAX_CONCURRENCY)) + 2
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=connections, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+        return _sessions[key]
+
+
+def get_api_rate_limiter():
+    rate = get_number_property("iriusrisk_requests_per_second", DEFAULT_API_REQUESTS_PER_SECOND)
+    with _sessions_lock:
+        if rate not in _rate_limiters:
+            # Calls can be sent in a burst as long as there is a free worker for them
+            burst = int(get_number_property("iriusrisk_max_concurrency", DEFAULT_API_MAX_CONCURRENCY))
+            _rate_limiters[rate] = TokenBucket(rate, burst)
+        return _rate_limiters[rate]
+
+
+def get_api_timeout():
+    return API_CONNECT_TIMEOUT, get_number_property("iriusrisk_timeout_seconds", DEFAULT_API_TIMEOUT)
+
+
+def get_api_spinner():
+    # Only one live display can be active at once, so calls made from worker threads don't show a spinner
+    if threading.current_thread() is not threading.main_thread() or \
+            str(get_property("iriusrisk_api_spinner") or "ENABLED").upper() == "DISABLED":
+        return contextlib.nullcontext()
+
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn(f"Querying IriusRisk API, wait a moment..."),
+        transient=True,
+    )
+    progress.add_task(description="Processing...", total=None)
+    return progress
+
+
+def record_api_call(http_method, latency, retries, failed):
+    with _api_stats_lock:
+        stats = _api_stats.setdefault(http_method.upper(), {"calls": 0, "errors": 0, "retries": 0, "latency": 0.0,
+                                                            "max_latency": 0.0})
+        stats["calls"] += 1
+        stats["errors"] += 1 if failed else 0
+        stats["retries"] += retries
+        stats["latency"] += latency
+        stats["max_latency"] = max(stats["max_latency"], latency)
+
+
+def get_api_call_stats():
+    with _api_stats_lock:
+        return {k: dict(v) for k, v in _api_stats.items()}
+
+
+def reset_api_call_stats():
+    with _api_stats_lock:
+        _api_stats.clear()
+
+
+def print_api_call_stats():
+    stats = get_api_call_stats()
+    if len(stats) == 0:
+        return
+
+    table = Table("Method", "Calls", "Errors", "Retries", "Total (s)", "Avg (ms)", "Max (ms)",
+                  title="IriusRisk API calls")
+    for method, s in sorted(stats.items()):
+        table.add_row(method, str(s["calls"]), str(s["errors"]), str(s["retries"]), f"{s['latency']:.2f}",
+                      f"{1000 * s['latency'] / s['calls']:.0f}", f"{1000 * s['max_latency']:.0f}")
+    print(table)
+    calls = sum(s["calls"] for s in stats.values())
+    latency = sum(s["latency"] for s in stats.values())
+    print(f"Total: {calls} calls in {latency:.2f}s")
+
+
 def make_api_call(http_method, api_endpoint, request_body=None, api_version="v2", color=None, no_response=False,
                   files=None, response_format="json"):
     message = (f"[{color}]" if color else "") + f"Calling {http_method} {api_endpoint}"
     print(message)
 
-    headers = IRIUSRISK_API_HEADERS[api_version]
+    headers = dict(IRIUSRISK_API_HEADERS[api_version])
     headers["api-token"] = get_property("iriusrisk_api_token")
 
-    with Progress(
-            SpinnerColumn(),
-            TextColumn(f"Querying IriusRisk API, wait a moment..."),
-            transient=True,
-    ) as progress:
-        progress.add_task(description="Processing...", total=None)
+    with get_api_spinner():
         url = get_property("iriusrisk_url")
+        session = get_api_session()
+        timeout = get_api_timeout()
+        get_api_rate_limiter().acquire()
+        start = time.perf_counter()
+        response = None
         try:
             if http_method == 'get':
-                response = requests.get(url + api_endpoint, headers=headers)
+                response = session.get(url + api_endpoint, headers=headers, timeout=timeout)
             elif http_method == 'post' and files is None:
-                response = requests.post(url + api_endpoint, headers=headers, json=request_body)
+                response = session.post(url + api_endpoint, headers=headers, json=request_body, timeout=timeout)
             elif http_method == 'post' and files is not None:
                 headers["X-Irius-Async"] = "true"
-                response = requests.post(url + api_endpoint, headers=headers, files=files)
+                response = session.post(url + api_endpoint, headers=headers, files=files, timeout=timeout)
             elif http_method == 'put':
-                response = requests.put(url + api_endpoint, headers=headers, json=request_body)
+                response = session.put(url + api_endpoint, headers=headers, json=request_body, timeout=timeout)
             elif http_method == 'delete':
-                response = requests.delete(url + api_endpoint, headers=headers)
+                response = session.delete(url + api_endpoint, headers=headers, timeout=timeout)
             else:
                 raise Exception("HTTP method not allowed")
 
@@ -548,6 +668,11 @@ def make_api_call(http_method, api_endpoint, request_body=None, api_version="v2"
         except Exception as e:
             print(e)
             raise typer.Exit(-1)
+        finally:
+            retries = getattr(getattr(response, "raw", None), "retries", None)
+            record_api_call(http_method, time.perf_counter() - start,
+                            len(retries.history) if retries is not None else 0,
+                            response is None or not response.ok)
 
         if no_response:
             return {"message": response.status_code}
@@ -560,8 +685,139 @@ def make_api_call(http_method, api_endpoint, request_body=None, api_version="v2"
                 return response.text
 
 
+def get_data_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def normalize_api_value(value):
+    """Returns a value of a request or a response in a form that can be compared with the other"""
+    if isinstance(value, dict):
+        # Related objects, like the category of a component, are compared by ID
+        return str(value.get("id"))
+    if isinstance(value, list):
+        return sorted((str((cf.get("customField") or {}).get("id")), str(cf.get("value") or ""))
+                      for cf in value if isinstance(cf, dict))
+    return "" if value is None else str(value)
+
+
+def is_outdated(data, remote_item, previous_hash):
+    """
+    Returns whether a remote element has to be updated with the data of the template.
+    Fields included in the remote element are compared directly. If some aren't, like the custom fields in some list
+    responses, the data is compared with the one sent in the last upload instead
+    """
+    confirmed = True
+    for key, value in data.items():
+        if key not in remote_item:
+            confirmed = False
+        elif normalize_api_value(value) != normalize_api_value(remote_item[key]):
+            return True
+    return not confirmed and get_data_hash(data) != previous_hash
+
+
+def get_upload_state_key(element_type, key):
+    return f"{element_type}:{'/'.join(key) if isinstance(key, tuple) else key}"
+
+
+def get_relation_key(elements):
+    """Returns the key of a relation from its elements, once they exist in the instance"""
+    return "/".join(e if isinstance(e, str) else resolve(e)["id"] for e in elements)
+
+
+def get_relation_dependencies(elements, previous):
+    """Returns the operations a relation has to wait for: the ones creating its elements and the previous relation"""
+    return [e for e in elements if isinstance(e, APIOperation)] + ([previous] if previous else [])
+
+
+def get_upload_state_path(template):
+    return os.path.join(UPLOAD_STATE_FOLDER, f"{template['component']['ref']}.json")
+
+
+def load_upload_state(template):
+    """Returns what was sent in the last upload of the component to the configured instance"""
+    try:
+        with open(get_upload_state_path(template), "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {"hashes": dict(), "relations": list()}
+    if state.get("url") != get_property("iriusrisk_url"):
+        return {"hashes": dict(), "relations": list()}
+    return state
+
+
+def save_upload_state(template, state):
+    os.makedirs(UPLOAD_STATE_FOLDER, exist_ok=True)
+    path = get_upload_state_path(template)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"url": get_property("iriusrisk_url"), **state}, f)
+    os.replace(temp_path, path)
+
+
+def get_remote_content(risk_pattern):
+    """Fetches the use cases, threats, weaknesses and countermeasures of a risk pattern with a few list calls"""
+    usecases = {uc["referenceId"]: uc for uc in get_all_use_cases(risk_pattern)}
+    threats = dict()
+    for uc_ref, uc in usecases.items():
+        for th in get_all_threats(uc):
+            threats[(uc_ref, th["referenceId"])] = th
+    return {
+        "usecases": usecases,
+        "threats": threats,
+        "weaknesses": {w["referenceId"]: w for w in get_all_weaknesses(risk_pattern)},
+        "countermeasures": {c["referenceId"]: c for c in get_all_countermeasures(risk_pattern)}
+    }
+
+
+def get_upload_diff(template, tree, remote, previous, customfields):
+    """
+    Compares the template with the remote content of its risk pattern.
+    Returns, by element type, the keys of the elements to create and to update, and the remote elements to delete.
+    Threats are keyed by use case and threat, since the same threat can be in several use cases
+    """
+    local = {
+        "usecases": {uc_key: get_use_case_data(template, uc_key)
+                     for rp_value in tree.values() for uc_key in rp_value},
+        "threats": {(uc_key, th_key): get_threat_data(template, th_key, customfields)
+                    for rp_value in tree.values() for uc_key, uc_value in rp_value.items() for th_key in uc_value},
+        "weaknesses": {w_key: get_weakness_data(template, w_key)
+                       for rp_value in tree.values() for uc_value in rp_value.values()
+                       for th_value in uc_value.values() for w_key in th_value if w_key != ""},
+        "countermeasures": {c_key: get_countermeasure_data(template, c_key, customfields)
+                            for rp_value in tree.values() for uc_value in rp_value.values()
+                            for th_value in uc_value.values() for w_value in th_value.values() for c_key in w_value}
+    }
+
+    diff = dict()
+    for element_type, elements in local.items():
+        diff[element_type] = {"create": list(), "update": list(), "delete": list(), "data": elements}
+        for key, data in elements.items():
+            remote_item = remote[element_type].get(key)
+            if remote_item is None:
+                diff[element_type]["create"].append(key)
+            elif is_outdated(data, remote_item, previous["hashes"].get(get_upload_state_key(element_type, key))):
+                diff[element_type]["update"].append(key)
+
+    # Elements that aren't in the template anymore. Threats of deleted use cases are removed along with them
+    diff["usecases"]["delete"] = [uc for ref, uc in remote["usecases"].items() if ref not in template["usecases"]]
+    diff["threats"]["delete"] = [th for key, th in remote["threats"].items()
+                                 if key not in local["threats"] and key[0] in template["usecases"]]
+    diff["weaknesses"]["delete"] = [w for ref, w in remote["weaknesses"].items() if ref not in template["weaknesses"]]
+    diff["countermeasures"]["delete"] = [c for ref, c in remote["countermeasures"].items()
+                                         if ref not in template["controls"]]
+    return diff
+
+
 def upload_component_to_iriusrisk(template):
-    # Create component
+    """
+    Uploads the component in three stages: the remote content of its risk pattern is fetched with a few list calls,
+    compared with the template, and only the elements that changed are created, updated or deleted. Those calls are
+    sent concurrently when they don't depend on each other.
+    Relations can't be listed, so they are associated again only if they weren't in the last upload to the instance
+    or any of their elements was created again
+    """
+    previous = load_upload_state(template)
+    state = {"hashes": dict(), "relations": list()}
 
     # Check if the category of the component exists
     category = get_category(template)
@@ -569,115 +825,130 @@ def upload_component_to_iriusrisk(template):
         print("No category found in instance")
         # If no category has been found we need to create it in the instance
         category = post_category(template)
-    else:
-        # Otherwise we will have to update it if needed. Let's assume that we will always update it
-        pass
 
     # Check if component already exists
     component = get_component_definition(template)
+    component_data = get_component_definition_data(template, category)
     if component is None:
         # If no component has been found we need to create it in the instance
         component = post_component_definition(template, category)
-    else:
-        # Otherwise we will have to update it if needed. Let's assume that we will always update it
+    elif is_outdated(component_data, component, previous["hashes"].get("component")):
         put_component_definition(template, component, category)
-        # TODO: All risk patterns from this component definition should be updated
-
-    # If we reach this point it's because we ensured that the component exists in the instance and it's empty (no rps)
-    # Now we need to update the content. We need to find the library where the risk pattern for the component exists
+    state["hashes"]["component"] = get_data_hash(component_data)
 
     library = get_library(template)
     if library is None:
-        # If no risk pattern has been found we need to create it in the instance
+        # If no library has been found we need to create it in the instance
         library = post_library(template)
-    else:
-        pass
 
-    # Create content tree
-    tree = build_tree_hierarchy(template["relations"])
-    customfields = get_customfields()
-
-    for rp_key, rp_value in tree.items():
-        risk_pattern = get_risk_pattern(template, library)
-        if risk_pattern is None:
-            # If no risk pattern has been found we need to create it in the instance
-            risk_pattern = post_risk_pattern(template, library)
-        else:
-            # Otherwise we will have to update it if needed. Let's assume that we will always update it
+    risk_pattern = get_risk_pattern(template, library)
+    risk_pattern_data = get_risk_pattern_data(template)
+    if risk_pattern is None:
+        risk_pattern = post_risk_pattern(template, library)
+        associate_risk_pattern_to_component(component, risk_pattern)
+    else:
+        if is_outdated(risk_pattern_data, risk_pattern, previous["hashes"].get("riskPattern")):
             put_risk_pattern(template, risk_pattern)
-
-        associated_rp = get_associated_risk_patterns(component, risk_pattern)
-        if associated_rp is None:
+        if get_associated_risk_patterns(component, risk_pattern) is None:
             associate_risk_pattern_to_component(component, risk_pattern)
-        else:
-            pass
+    state["hashes"]["riskPattern"] = get_data_hash(risk_pattern_data)
 
-        for uc_key, uc_value in rp_value.items():
-            uc = get_use_case(uc_key, risk_pattern)
-            if uc is None:
-                uc = post_use_case(template, uc_key, risk_pattern)
-            else:
-                put_use_case(template, uc_key, uc)
+    # Stage 1: fetch the remote content in bulk
+    remote = get_remote_content(risk_pattern)
+    customfields = get_customfields()
 
+    # Stage 2: compare it with the template
+    tree = build_tree_hierarchy(template["relations"])
+    diff = get_upload_diff(template, tree, remote, previous, customfields)
+    for element_type, element_diff in diff.items():
+        unchanged = len(element_diff["data"]) - len(element_diff["create"]) - len(element_diff["update"])
+        print(f"{element_type.capitalize()}: {len(element_diff['create'])} to create, "
+              f"{len(element_diff['update'])} to update, {len(element_diff['delete'])} to delete, "
+              f"{unchanged} unchanged")
+
+    # Stage 3: send only the changes. Independent calls are sent concurrently, the ones that need the result of
+    # another call wait for it
+    executor = APIExecutor()
+    elements = {element_type: dict(remote[element_type]) for element_type in remote}
+    for uc_key in diff["usecases"]["create"]:
+        elements["usecases"][uc_key] = executor.submit(post_use_case, template, uc_key, risk_pattern)
+    for uc_key in diff["usecases"]["update"]:
+        executor.submit(put_use_case, template, uc_key, elements["usecases"][uc_key])
+
+    for uc_key, th_key in diff["threats"]["create"]:
+        elements["threats"][(uc_key, th_key)] = executor.submit(post_threat, template, th_key,
+                                                                elements["usecases"][uc_key], customfields)
+    for uc_key, th_key in diff["threats"]["update"]:
+        executor.submit(put_threat, template, th_key, elements["threats"][(uc_key, th_key)], customfields)
+
+    for w_key in diff["weaknesses"]["create"]:
+        elements["weaknesses"][w_key] = executor.submit(post_weakness, template, w_key, risk_pattern)
+    for w_key in diff["weaknesses"]["update"]:
+        executor.submit(put_weakness, template, w_key, elements["weaknesses"][w_key])
+
+    for c_key in diff["countermeasures"]["create"]:
+        elements["countermeasures"][c_key] = executor.submit(post_countermeasure, template, c_key, risk_pattern,
+                                                             customfields)
+    for c_key in diff["countermeasures"]["update"]:
+        executor.submit(put_countermeasure, template, c_key, elements["countermeasures"][c_key], customfields)
+    for c_key in diff["countermeasures"]["create"] + diff["countermeasures"]["update"]:
+        executor.submit(post_countermeasure_standards, template, c_key, elements["countermeasures"][c_key])
+        executor.submit(put_countermeasure_references, template, c_key, elements["countermeasures"][c_key])
+
+    for element_type, element_diff in diff.items():
+        for key, data in element_diff["data"].items():
+            state["hashes"][get_upload_state_key(element_type, key)] = get_data_hash(data)
+
+    # Relations of elements created now are always new. The rest are identified by the IDs of their elements.
+    # The relations of a threat are sent one after the other, since they all change the same threat, and only once
+    # the elements they link exist: the weakness and countermeasure are only passed by reference
+    previous_relations = set(previous["relations"])
+    relations = list()
+    for rp_value in tree.values():
+        for uc_key, uc_value in rp_value.items():
+            uc = elements["usecases"][uc_key]
             for th_key, th_value in uc_value.items():
-                th = get_threat(th_key, uc)
-                if th is None:
-                    th = post_threat(template, th_key, uc, customfields)
-                else:
-                    put_threat(template, th_key, th, customfields)
-                # TODO: put_threat_references(template, th_key, library, risk_pattern, uc, th)
-
+                th = elements["threats"][(uc_key, th_key)]
+                last = None
                 for w_key, w_value in th_value.items():
-                    ww = ""
+                    ww = elements["weaknesses"].get(w_key)
                     if w_key != "":
-                        ww = get_weakness(w_key, risk_pattern)
-                        if ww is None:
-                            ww = post_weakness(template, w_key, risk_pattern)
-                        else:
-                            put_weakness(template, w_key, ww)
-                        associate_weakness_to_threat(w_key, library, risk_pattern, uc, th)
-                        # TODO: put_weakness_references(template, w_key, library, risk_pattern, uc, th, ww)
+                        relation = [uc, th, ww]
+                        if any(isinstance(e, APIOperation) for e in relation) or \
+                                get_relation_key(relation) not in previous_relations:
+                            last = executor.submit(associate_weakness_to_threat, w_key, library, risk_pattern, uc, th,
+                                                   depends_on=get_relation_dependencies(relation, last))
+                        relations.append(relation)
 
                     for c_key, c_value in w_value.items():
-                        cc = get_countermeasure(c_key, risk_pattern)
-                        if cc is None:
-                            cc = post_countermeasure(template, c_key, risk_pattern, customfields)
-                        else:
-                            put_countermeasure(template, c_key, cc, customfields)
-                        post_countermeasure_standards(template, c_key, cc)
-                        put_countermeasure_references(template, c_key, cc)
-
+                        cc = elements["countermeasures"][c_key]
                         if w_key != "":
-                            associate_countermeasure_to_weakness(c_key, library, risk_pattern, uc, th, ww)
+                            relation = [uc, th, ww, cc]
+                            function, args = associate_countermeasure_to_weakness, (c_key, library, risk_pattern, uc,
+                                                                                    th, ww)
                         else:
-                            associate_countermeasure_to_threat(template, c_key, library, risk_pattern, uc, th)
+                            relation = [uc, th, "", cc, *c_value]
+                            function, args = associate_countermeasure_to_threat, (template, c_key, library,
+                                                                                  risk_pattern, uc, th)
+                        if any(isinstance(e, APIOperation) for e in relation) or \
+                                get_relation_key(relation) not in previous_relations:
+                            last = executor.submit(function, *args,
+                                                   depends_on=get_relation_dependencies(relation, last))
+                        relations.append(relation)
 
     # Cleaning elements that are not present anymore
-    # e.g. use cases that are not present in the template file
-    #
     # TODO: Remove risk patterns not related anymore with the component from the component definition, if any
-    risk_pattern = get_risk_pattern(template, library)
-    usecases = get_all_use_cases(risk_pattern)
-    for uc in usecases:
-        if uc["referenceId"] not in template["usecases"]:
-            delete_use_case(uc)
-
-    usecases = get_all_use_cases(risk_pattern)
-    for uc in usecases:
-        threats = get_all_threats(uc)
-        for th in threats:
-            if th["referenceId"] not in template["threats"]:
-                delete_threat(th)
-
-    weaknesses = get_all_weaknesses(risk_pattern)
-    for w in weaknesses:
-        if w["referenceId"] not in template["weaknesses"]:
-            delete_weakness(w)
-
-    countermeasures = get_all_countermeasures(risk_pattern)
-    for c in countermeasures:
-        if c["referenceId"] not in template["controls"]:
-            delete_countermeasure(c)
+    for uc in diff["usecases"]["delete"]:
+        executor.submit(delete_use_case, uc)
+    for th in diff["threats"]["delete"]:
+        executor.submit(delete_threat, th)
+    for w in diff["weaknesses"]["delete"]:
+        executor.submit(delete_weakness, w)
+    for c in diff["countermeasures"]["delete"]:
+        executor.submit(delete_countermeasure, c)
+
+    executor.run()
+    state["relations"] = [get_relation_key(relation) for relation in relations]
 
     # Rules: we need to import the rules through XML. This means that we need to push the rules to a different
     # library We also have to remove any other rule related with the component that might get deprecated,
@@ -691,10 +962,16 @@ def upload_component_to_iriusrisk(template):
         rules_library = post_rules_library(template)
 
     xml = get_export_library_xml(rules_library)
-    export_rules_into_rules_library(template, xml)
+    export_rules_into_rules_library(template, xml_text=xml)
     output_folder = get_property("component_output_path") or get_app_dir()
     xml_rules_library_path = os.path.join(output_folder, f"{template['component']['categoryRef']}-rules.xml")
-    post_library_xml(template, rules_library, xml_rules_library_path)
+    # The rules library is built from the remote one, so if it didn't change since the last upload neither did the
+    # remote one
+    state["rules"] = get_library_content_hash(xml_rules_library_path)
+    if state["rules"] != previous.get("rules"):
+        post_library_xml(template, rules_library, xml_rules_library_path)
+
+    save_upload_state(template, state)
 
 
 def upload_xml(template):
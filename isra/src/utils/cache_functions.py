@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from isra.src.config.config import get_property, get_number_property
+from isra.src.config.constants import CACHE_FOLDER, LLM_CACHE_FILE
+
+DEFAULT_LLM_CACHE_TTL_HOURS = 720
+DEFAULT_LLM_CACHE_MAX_MB = 100
+
+# Environment variable to skip the LLM answer cache for a single run
+LLM_CACHE_BYPASS_ENV = "ISRA_LLM_CACHE_BYPASS"
+
+
+def is_response_cache_enabled():
+    if os.getenv(LLM_CACHE_BYPASS_ENV) == "1":
+        return False
+    return str(get_property("llm_cache") or "ENABLED").upper() != "DISABLED"
+
+
+def get_response_cache_key(client, model, assistant_id, messages):
+    """
+    Returns the key of an LLM request. Messages are normalized so that irrelevant whitespace and line ending
+    differences don't produce different keys
+    """
+    normalized_messages = [
+        [m.get("role", ""), "\n".join(line.rstrip() for line in str(m.get("content", "")).strip().splitlines())]
+        for m in messages
+    ]
+    key = json.dumps([client or "", model or "", assistant_id or "", normalized_messages], ensure_ascii=False)
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=20).hexdigest()
+
+
+@contextmanager
+def _connect():
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    # A connection per operation, so the cache can be used from several threads and processes at the same time
+    connection = sqlite3.connect(str(LLM_CACHE_FILE), timeout=30)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            yield connection
+    finally:
+        connection.close()
+
+
+def get_cached_response(key):
+    """Returns the cached answer of a request, or None if there isn't a valid one"""
+    ttl = get_number_property("llm_cache_ttl_hours", DEFAULT_LLM_CACHE_TTL_HOURS) * 3600
+    now = time.time()
+    try:
+        with _connect() as connection:
+            row = connection.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now - ttl:
+                connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+    except sqlite3.Error as e:
+        print(f"LLM cache couldn't be read: {e}")
+        return None
+
+
+def save_cached_response(key, response):
+    """Caches the answer of a request, evicting the least recently used answers if the cache gets too big"""
+    max_size = get_number_property("llm_cache_max_mb", DEFAULT_LLM_CACHE_MAX_MB) * 1024 * 1024
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    try:
+        with _connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                               (key, response, size, now, now))
+            total_size = connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > max_size:
+                kept_size = 0
+                evicted = []
+                for cached_key, cached_size in connection.execute(
+                        "SELECT key, size FROM responses ORDER BY last_used DESC"):
+                    kept_size += cached_size
+                    if kept_size > max_size:
+                        evicted.append((cached_key,))
+                connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+    except sqlite3.Error as e:
+        print(f"LLM cache couldn't be updated: {e}")
+
+
+def get_response_cache_stats():
+    """Returns the number of cached answers and their size in bytes"""
+    try:
+        with _connect() as connection:
+            entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return entries, size
+    except sqlite3.Error as e:
+        print(f"LLM cache couldn't be read: {e}")
+        return 0, 0
+
+
+def clear_response_cache():
+    """Removes every cached answer. Returns whether the cache could be cleared"""
+    try:
+        with _connect() as connection:
+            connection.execute("DELETE FROM responses")
+        # Deleted rows leave free pages behind, so the file is compacted afterwards
+        with _connect() as connection:
+            connection.commit()
+            connection.execute("VACUUM")
+        return True
+    except sqlite3.Error as e:
+        print(f"LLM cache couldn't be cleared: {e}")
+        return False
@@ -1,10 +1,38 @@
 """
 This script holds all the function that are related with data extraction from CWE
 """
+import os
+import pickle
+import threading
+from typing import NamedTuple, Optional
+
 from lxml import etree
 
 from isra.src.config.config import get_resource
-from isra.src.config.constants import CWE_SOURCE_FILE
+from isra.src.config.constants import CWE_SOURCE_FILE, CACHE_FOLDER, CWE_INDEX_CACHE_FILE
+
+# Bump it whenever the indexed fields change, so old index files are discarded
+CWE_INDEX_VERSION = 1
+
+CWE_IMPACT = {
+    "High": "75",
+    "Medium": "50",
+    "Low": "25"
+}
+
+# Index of the CWE catalogue currently loaded, with the stamp of the XML file it was built from
+_cwe_index = {"stamp": None, "weaknesses": None, "active": None}
+_cwe_index_lock = threading.Lock()
+
+
+class CWEWeakness(NamedTuple):
+    id: str
+    name: str
+    description: Optional[str]
+    extended_description: Optional[str]
+    impact: str
+    status: str
+    abstraction: str
 
 
 def ns(element):
@@ -12,19 +40,7 @@ def ns(element):
 
 
 def get_cwe_impact(original_cwe_weaknesses, cwe_id):
-    impact = "100"
-    likelihood = original_cwe_weaknesses[cwe_id].find(ns("Likelihood_Of_Exploit"))
-    if likelihood is not None:
-        likelihood_value = likelihood.text
-        calculated_impact = {
-            "High": "75",
-            "Medium": "50",
-            "Low": "25"
-        }
-
-        impact = calculated_impact[likelihood_value]
-
-    return impact
+    return original_cwe_weaknesses[cwe_id].impact
 
 
 def get_cwe_description(weaknesses, ids):
@@ -36,29 +52,94 @@ def get_cwe_description(weaknesses, ids):
         id_number = cwe_id.split("-")[1]
         if id_number in weaknesses:
             weakness = weaknesses[id_number]
-            description, extended_desc = "", ""
-            if weakness.find(ns("Description")) is not None:
-                description = weakness.find(ns("Description")).text
-            if weakness.find(ns("Extended_Description")) is not None:
-                extended_desc = weakness.find(ns("Extended_Description")).text
-            final_desc = f"{final_desc}\n{cwe_id}: {weakness.attrib['Name']}\n{description}\n{extended_desc}"
+            description = weakness.description if weakness.description is not None else ""
+            extended_desc = weakness.extended_description if weakness.extended_description is not None else ""
+            final_desc = f"{final_desc}\n{cwe_id}: {weakness.name}\n{description}\n{extended_desc}"
         else:
             print(f"{cwe_id} is not a valid CWE. Try to avoid using CWE categories and pillars")
 
     return final_desc
 
 
-def get_original_cwe_weaknesses():
-    cwe_xml_path = get_resource(CWE_SOURCE_FILE, filetype="path")
-    tree = etree.parse(cwe_xml_path)
-    root = tree.getroot()
+def parse_cwe_catalogue(cwe_xml_path):
+    """Returns every weakness of the CWE XML catalogue by ID"""
+    root = etree.parse(str(cwe_xml_path)).getroot()
 
-    class_base_weaknesses = dict()
+    weaknesses = dict()
     for weakness in root.find(ns("Weaknesses")).iter(ns("Weakness")):
-        if weakness.attrib["Status"] != "Obsolete":
-            class_base_weaknesses[weakness.attrib["ID"]] = weakness
+        description = weakness.find(ns("Description"))
+        extended_desc = weakness.find(ns("Extended_Description"))
+        likelihood = weakness.find(ns("Likelihood_Of_Exploit"))
+        weaknesses[weakness.attrib["ID"]] = CWEWeakness(
+            id=weakness.attrib["ID"],
+            name=weakness.attrib["Name"],
+            description=description.text if description is not None else None,
+            extended_description=extended_desc.text if extended_desc is not None else None,
+            impact=CWE_IMPACT.get(likelihood.text, "100") if likelihood is not None else "100",
+            status=weakness.attrib["Status"],
+            abstraction=weakness.attrib["Abstraction"]
+        )
+
+    return weaknesses
+
+
+def _get_cwe_source_stamp(cwe_xml_path):
+    stat = os.stat(str(cwe_xml_path))
+    return [CWE_INDEX_VERSION, str(cwe_xml_path), stat.st_size, stat.st_mtime_ns]
+
+
+def _load_cwe_index_file(stamp):
+    try:
+        with open(CWE_INDEX_CACHE_FILE, "rb") as f:
+            index = pickle.load(f)
+        if index.get("stamp") == stamp:
+            return {k: CWEWeakness(*v) for k, v in index["weaknesses"].items()}
+    except Exception:
+        # A missing or unreadable index only means that the catalogue has to be parsed again
+        pass
+    return None
+
+
+def _save_cwe_index_file(stamp, weaknesses):
+    # Plain tuples, so the file can be loaded even if the class moves
+    index = {"stamp": stamp, "weaknesses": {k: tuple(v) for k, v in weaknesses.items()}}
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        temp_file = f"{CWE_INDEX_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, CWE_INDEX_CACHE_FILE)
+    except OSError as e:
+        print(f"CWE index couldn't be saved: {e}")
+
+
+def _load_cwe_index():
+    # The XML catalogue is only parsed when it changes, the result is kept in memory and in an index file
+    cwe_xml_path = get_resource(CWE_SOURCE_FILE, filetype="path")
+    stamp = _get_cwe_source_stamp(cwe_xml_path)
+    with _cwe_index_lock:
+        if _cwe_index["stamp"] != stamp:
+            weaknesses = _load_cwe_index_file(stamp)
+            if weaknesses is None:
+                weaknesses = parse_cwe_catalogue(cwe_xml_path)
+                _save_cwe_index_file(stamp, weaknesses)
+            _cwe_index["stamp"] = stamp
+            _cwe_index["weaknesses"] = weaknesses
+            _cwe_index["active"] = {k: v for k, v in weaknesses.items() if v.status != "Obsolete"}
+        return _cwe_index
+
+
+def get_cwe_index():
+    """
+    Returns every weakness of the CWE catalogue by ID, including the obsolete ones.
+    The returned dict is shared, so it mustn't be modified
+    """
+    return _load_cwe_index()["weaknesses"]
 
-    return class_base_weaknesses
+
+def get_original_cwe_weaknesses():
+    """Returns the weaknesses of the CWE catalogue by ID that are not obsolete"""
+    return _load_cwe_index()["active"]
 
 
 def set_weakness(template, control_ref, cwe_id, action="init"):
@@ -98,23 +179,15 @@ def set_weakness(template, control_ref, cwe_id, action="init"):
 
 
 def generate_cwe_jsonl():
-    cwe_xml_path = get_resource(CWE_SOURCE_FILE, filetype="path")
-    tree = etree.parse(cwe_xml_path)
-    root = tree.getroot()
-
     with open("cwe.jsonl", "w") as f:
-        for weakness in root.find(ns("Weaknesses")).iter(ns("Weakness")):
-            if weakness.attrib["Abstraction"] in ["Class", "Base"]:
-                description, extended_desc = "", ""
-
-                if weakness.find(ns("Description")) is not None:
-                    description = weakness.find(ns("Description")).text
-                if weakness.find(ns("Extended_Description")) is not None:
-                    extended_desc = weakness.find(ns("Extended_Description")).text
+        for weakness in get_cwe_index().values():
+            if weakness.abstraction in ["Class", "Base"]:
+                description = weakness.description if weakness.description is not None else ""
+                extended_desc = weakness.extended_description if weakness.extended_description is not None else ""
                 final_desc = description + "\n" + extended_desc
 
                 f.write(
-                    '{"id":"' + weakness.attrib["ID"] + '", "name":"' + weakness.attrib["Name"] + '", "description":"' +
+                    '{"id":"' + weakness.id + '", "name":"' + weakness.name + '", "description":"' +
                     final_desc
                     .replace("\n", "")
                     .replace("\t", "")
@@ -128,7 +201,7 @@ def get_allowed_cwe_ids():
 
     allowed_values = list()
     for k, v in original_cwe_weaknesses.items():
-        if v.attrib["Status"] != "Obsolete":
+        if v.status != "Obsolete":
             allowed_values.append(k)
 
     print(len(allowed_values))
@@ -1,38 +1,100 @@
 import base64
+import contextlib
 import inspect
 import os
 import random
+import threading
+import time
 
 import httpx
 import typer
-from openai import OpenAI, AzureOpenAI
+from openai import OpenAI, AzureOpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
 from rich import print
 from rich.progress import Progress, TextColumn, SpinnerColumn
 
-from isra.src.config.config import get_property, get_resource
+from isra.src.config.config import get_property, get_resource, get_number_property
 from isra.src.config.constants import TEST_ANSWERS_FILE, HINTS, PROMPTS_DIR
+from isra.src.utils.cache_functions import is_response_cache_enabled, get_response_cache_key, \
+    get_cached_response, save_cached_response
+from isra.src.utils.metrics_functions import get_request_cost, record_llm_request
 from isra.src.utils.text_functions import replace_non_ascii
 
 
+# Clients are shared by the whole process, so connections are kept alive and reused between requests
+_clients = dict()
+_clients_lock = threading.Lock()
+
+# Models of the assistants already retrieved, by assistant ID
+_assistant_models = dict()
+
+DEFAULT_LLM_RUN_TIMEOUT = 300
+
+# Statuses after which an assistant run won't change anymore
+RUN_FINAL_STATUSES = {"completed", "failed", "cancelled", "expired", "incomplete", "requires_action"}
+
+
+def get_http_client(**kwargs):
+    # Enough pooled connections for every concurrent screening request
+    connections = int(get_number_property("llm_max_concurrency", 4)) + 2
+    return httpx.Client(limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections,
+                                            keepalive_expiry=60), **kwargs)
+
+
 def get_client():
     client_to_use = get_property("openai_client")
-    if client_to_use == "OPENAI":
-        client = OpenAI(timeout=httpx.Timeout(15.0, read=5.0, write=10.0, connect=3.0))
-    elif client_to_use == "AZURE":
-        azure_openai_api_key = os.environ["AZURE_OPENAI_API_KEY"]
-        azure_openai_endpoint = os.environ["AZURE_OPENAI_ENDPOINT"]
-        client = AzureOpenAI(
-            api_version="2025-01-01-preview",
-            api_key=azure_openai_api_key,
-            azure_endpoint=azure_openai_endpoint,
-            http_client=httpx.Client(verify=False)
-        )
+    # The environment is part of the key, so a client is created again if the credentials or the endpoint change
+    key = (client_to_use, os.getenv("OPENAI_API_KEY"), os.getenv("OPENAI_BASE_URL"),
+           os.getenv("AZURE_OPENAI_API_KEY"), os.getenv("AZURE_OPENAI_ENDPOINT"))
+    with _clients_lock:
+        if key in _clients:
+            return _clients[key]
 
-    else:
-        print("No client has been defined. Use 'isra config update' to set the openai_client first")
-        client = None
+        if client_to_use == "OPENAI":
+            timeout = httpx.Timeout(15.0, read=5.0, write=10.0, connect=3.0)
+            client = OpenAI(timeout=timeout, http_client=get_http_client(timeout=timeout))
+        elif client_to_use == "AZURE":
+            azure_openai_api_key = os.environ["AZURE_OPENAI_API_KEY"]
+            azure_openai_endpoint = os.environ["AZURE_OPENAI_ENDPOINT"]
+            client = AzureOpenAI(
+                api_version="2025-01-01-preview",
+                api_key=azure_openai_api_key,
+                azure_endpoint=azure_openai_endpoint,
+                http_client=get_http_client(verify=False)
+            )
+
+        else:
+            print("No client has been defined. Use 'isra config update' to set the openai_client first")
+            return None
+
+        _clients[key] = client
+        return client
 
-    return client
+
+def wait_for_run(client, thread_id, run):
+    """
+    Polls an assistant run until it finishes, waiting longer between polls the longer it takes.
+    The run is cancelled if it doesn't finish before llm_run_timeout_seconds
+    """
+    timeout = get_number_property("llm_run_timeout_seconds", DEFAULT_LLM_RUN_TIMEOUT)
+    deadline = time.monotonic() + timeout
+    wait = 0.25
+    while run.status not in RUN_FINAL_STATUSES:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            try:
+                client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+            except Exception:
+                # The run may have finished in the meantime, it's not going to be used anyway
+                pass
+            raise TimeoutError(f"Assistant run {run.id} didn't finish after {round(timeout)} seconds")
+        time.sleep(min(wait, remaining))
+        wait = min(wait * 2, 5.0)
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+
+    if run.status != "completed":
+        error = f": {run.last_error.message}" if getattr(run, "last_error", None) else ""
+        raise RuntimeError(f"Assistant run {run.id} finished with status {run.status}{error}")
+    return run
 
 
 def get_hint():
@@ -40,27 +102,121 @@ def get_hint():
 
 
 def calculate_message_cost(gpt_model, prompt_tokens, answer_tokens):
-    model_cost = {
-        "gpt-3.5-turbo-0613": {"prompt_tokens": 0.000010, "answer_tokens": 0.000020},
-        "gpt-3.5-turbo-1106": {"prompt_tokens": 0.000010, "answer_tokens": 0.000020},
-        "gpt-3.5-turbo-16k": {"prompt_tokens": 0.000010, "answer_tokens": 0.000020},
-        "gpt-4": {"prompt_tokens": 0.00003, "answer_tokens": 0.00006},
-        "gpt-4-32k": {"prompt_tokens": 0.00006, "answer_tokens": 0.00012}
-    }
-
-    cost = model_cost[gpt_model]["prompt_tokens"] * prompt_tokens + model_cost[gpt_model][
-        "answer_tokens"] * answer_tokens
+    cost = get_request_cost(gpt_model, prompt_tokens, answer_tokens)
     print(f"Prompt tokens: {prompt_tokens}")
     print(f"Answer tokens: {answer_tokens}")
-    print(f"💸💸💸[green]That'll be [bold green]${round(cost, 6)}[/bold green][green], please💸💸💸")
+    if cost is None:
+        print(f"No price is known for model {gpt_model}")
+    else:
+        print(f"💸💸💸[green]That'll be [bold green]${round(cost, 6)}[/bold green][green], please💸💸💸")
+
+
+# Errors worth retrying after a while. Requests sent from worker threads raise them so that the caller can retry
+TRANSIENT_ERRORS = (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, TimeoutError)
+
+
+def in_worker_thread():
+    return threading.current_thread() is not threading.main_thread()
+
+
+def get_spinner():
+    # Only one live display can be active at once, so requests sent from worker threads don't show a spinner
+    if in_worker_thread():
+        return contextlib.nullcontext()
+
+    progress = Progress(
+        SpinnerColumn(),
+        TextColumn(get_hint()),
+        transient=True,
+    )
+    progress.add_task(description="Processing...", total=None)
+    return progress
 
 
-def query_chatgpt(messages):
+def query_assistant(messages, assistant_id):
+    with get_spinner():
+        try:
+            if get_property("openai_client") == "AZURE":
+                print(
+                    "Assistants cannot be used with Azure OpenAI. "
+                    "Either change the openai_client to OPENAI or remove the openai_assistant_id")
+                raise typer.Exit(-1)
+            else:
+                client = get_client()
+                if assistant_id not in _assistant_models:
+                    _assistant_models[assistant_id] = client.beta.assistants.retrieve(assistant_id).model
+                my_thread = client.beta.threads.create()
+
+                for m in messages:
+                    client.beta.threads.messages.create(thread_id=my_thread.id, role="user",
+                                                        content=m["content"])
+
+                run = client.beta.threads.runs.create(thread_id=my_thread.id, assistant_id=assistant_id)
+                run = wait_for_run(client, my_thread.id, run)
+
+                assistant_result = client.beta.threads.messages.list(thread_id=my_thread.id)
+
+                return assistant_result.data[0].content[0].text.value, _assistant_models[assistant_id], run.usage
+        except Exception as e:
+            if isinstance(e, TRANSIENT_ERRORS) and in_worker_thread():
+                raise
+            print(
+                "Something happened when calling ChatGPT API. Make sure you defined the environment variable "
+                "OPENAI_API_KEY and that an OpenAI Assistant ID has been selected in the configuration."
+            )
+            print(e)
+            raise typer.Exit(-1)
+
+
+def query_chat_completion(messages, gpt_model):
+    with get_spinner():
+        try:
+
+            client = get_client()
+
+            completion = client.chat.completions.create(
+                model=gpt_model,
+                messages=messages
+            )
+
+            # Enable this for the lolz
+            # calculate_message_cost(completion.model, completion.usage.prompt_tokens,
+            #                      completion.usage.completion_tokens)
+
+            return completion.choices[0].message.content, completion.model, completion.usage
+        except Exception as e:
+            if isinstance(e, TRANSIENT_ERRORS) and in_worker_thread():
+                raise
+            print(
+                f"Something happened when calling {get_property('openai_client')} API. "
+                f"If you're using OPENAI ensure that you defined the OPENAI_API_KEY environment variable in your system as well as a valid gpt model in the configuration. "
+                f"If you're using AZURE ensure that you defined the AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT environment variableS in your system as well as a valid gpt model in the configuration. ")
+            print(e)
+            raise typer.Exit(-1)
+
+
+def get_prompt_name(messages, default):
+    for m in messages:
+        content = m.get("content")
+        if isinstance(content, str) and content in _prompt_names:
+            return _prompt_names[content]
+    return default
+
+
+def query_chatgpt(messages, use_cache=True, caller=None):
+    """
+    Sends the messages to the configured LLM and returns its answer.
+    Answers are cached by client, model, assistant and messages, so identical requests are only sent once.
+    Set use_cache to False to always send the request, for instance to retry an answer that couldn't be used.
+    The new answer still replaces the cached one.
+    Every request is recorded in the metrics file with its tokens, latency, cost and cache status.
+    The caller is the function the answer is for, by default the one calling this function
+    """
     result = ""
+    caller_name = caller or inspect.currentframe().f_back.f_code.co_name
     test_mode = os.getenv("ISRA_TEST_MODE") == "1"
     if test_mode:
         print("[red]Test mode!")
-        caller_name = inspect.stack()[1][3]
         print(f"Generating mock ChatGPT answer for function {caller_name}")
         test_answers_yaml = get_resource(TEST_ANSWERS_FILE)
 
@@ -74,80 +230,46 @@ def query_chatgpt(messages):
             result = input()
 
     else:
-        if get_property("openai_assistant_id") != "":
-            with Progress(
-                    SpinnerColumn(),
-                    TextColumn(get_hint()),
-                    transient=True,
-            ) as progress:
-                progress.add_task(description="Processing...", total=None)
-
-                try:
-                    if get_property("openai_client") == "AZURE":
-                        print(
-                            "Assistants cannot be used with Azure OpenAI. "
-                            "Either change the openai_client to OPENAI or remove the openai_assistant_id")
-                        raise typer.Exit(-1)
-                    else:
-                        client = get_client()
-                        assistant = client.beta.assistants.retrieve(get_property("openai_assistant_id"))
-                        my_thread = client.beta.threads.create()
-
-                        for m in messages:
-                            client.beta.threads.messages.create(thread_id=my_thread.id, role="user",
-                                                                content=m["content"])
-
-                        run = client.beta.threads.runs.create(thread_id=my_thread.id, assistant_id=assistant.id)
-
-                        while run.status != "completed":
-                            keep_retrieving_run = client.beta.threads.runs.retrieve(thread_id=my_thread.id,
-                                                                                    run_id=run.id)
-                            if keep_retrieving_run.status == "completed":
-                                break
-
-                        assistant_result = client.beta.threads.messages.list(thread_id=my_thread.id)
-
-                        result = assistant_result.data[0].content[0].text.value
-                except Exception as e:
-                    print(
-                        "Something happened when calling ChatGPT API. Make sure you defined the environment variable "
-                        "OPENAI_API_KEY and that an OpenAI Assistant ID has been selected in the configuration."
-                    )
-                    print(e)
-                    raise typer.Exit(-1)
-        else:
-            with Progress(
-                    SpinnerColumn(),
-                    TextColumn(get_hint()),
-                    transient=True,
-            ) as progress:
-                progress.add_task(description="Processing...", total=None)
-
-                try:
-
-                    client = get_client()
-
-                    completion = client.chat.completions.create(
-                        model=get_property("gpt_model"),
-                        messages=messages
-                    )
-
-                    result = completion.choices[0].message.content
-
-                    # Enable this for the lolz
-                    # calculate_message_cost(get_property("gpt_model"), completion.usage.prompt_tokens,
-                    #                      completion.usage.completion_tokens)
-                except Exception as e:
-                    print(
-                        f"Something happened when calling {get_property('openai_client')} API. "
-                        f"If you're using OPENAI ensure that you defined the OPENAI_API_KEY environment variable in your system as well as a valid gpt model in the configuration. "
-                        f"If you're using AZURE ensure that you defined the AZURE_OPENAI_API_KEY and AZURE_OPENAI_ENDPOINT environment variableS in your system as well as a valid gpt model in the configuration. ")
-                    print(e)
-                    raise typer.Exit(-1)
+        start = time.perf_counter()
+        assistant_id = get_property("openai_assistant_id")
+        # The model of an assistant is part of the assistant itself
+        gpt_model = get_property("gpt_model") if assistant_id == "" else ""
+        model = gpt_model or assistant_id
+        usage = None
+
+        cache_key = None
+        cache_status = "disabled"
+        result = None
+        if is_response_cache_enabled():
+            cache_key = get_response_cache_key(get_property("openai_client"), gpt_model, assistant_id, messages)
+            if use_cache:
+                result = get_cached_response(cache_key)
+                cache_status = "miss" if result is None else "hit"
+            else:
+                cache_status = "bypass"
+
+        if result is None:
+            if assistant_id != "":
+                result, model, usage = query_assistant(messages, assistant_id)
+            else:
+                result, model, usage = query_chat_completion(messages, gpt_model)
+
+            if cache_key is not None and result:
+                save_cached_response(cache_key, result)
+
+        record_llm_request(caller_name, get_prompt_name(messages, caller_name), model, cache_status,
+                           time.perf_counter() - start,
+                           prompt_tokens=getattr(usage, "prompt_tokens", None),
+                           completion_tokens=getattr(usage, "completion_tokens", None))
 
     return replace_non_ascii(result)
 
 
+# Name of every prompt by its text, so requests can be attributed to the prompt they were built from
+_prompt_names = dict()
+
+
 def get_prompt(prompt):
     prompts_text = get_resource(os.path.join(PROMPTS_DIR, prompt), filetype="text")
+    _prompt_names[prompts_text] = prompt
     return prompts_text
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from isra.src.config.config import get_property
+from isra.src.config.constants import METRICS_FOLDER, LLM_METRICS_FILE, TEMPLATE_FILE
+
+# Dollars per token. Models are matched by prefix, so dated versions like gpt-4o-2024-08-06 use the base price
+MODEL_COSTS = {
+    "gpt-3.5-turbo": {"prompt_tokens": 0.0000005, "completion_tokens": 0.0000015},
+    "gpt-3.5-turbo-0613": {"prompt_tokens": 0.000010, "completion_tokens": 0.000020},
+    "gpt-3.5-turbo-1106": {"prompt_tokens": 0.000010, "completion_tokens": 0.000020},
+    "gpt-3.5-turbo-16k": {"prompt_tokens": 0.000010, "completion_tokens": 0.000020},
+    "gpt-4": {"prompt_tokens": 0.00003, "completion_tokens": 0.00006},
+    "gpt-4-32k": {"prompt_tokens": 0.00006, "completion_tokens": 0.00012},
+    "gpt-4-turbo": {"prompt_tokens": 0.00001, "completion_tokens": 0.00003},
+    "gpt-4o": {"prompt_tokens": 0.0000025, "completion_tokens": 0.00001},
+    "gpt-4o-mini": {"prompt_tokens": 0.00000015, "completion_tokens": 0.0000006},
+    "gpt-4.1": {"prompt_tokens": 0.000002, "completion_tokens": 0.000008},
+    "gpt-4.1-mini": {"prompt_tokens": 0.0000004, "completion_tokens": 0.0000016},
+    "gpt-4.1-nano": {"prompt_tokens": 0.0000001, "completion_tokens": 0.0000004},
+    "o3-mini": {"prompt_tokens": 0.0000011, "completion_tokens": 0.0000044},
+}
+
+# Requests can be recorded from several screening threads at once
+_metrics_lock = threading.Lock()
+
+# Ref of the current component, read again only when the component file changes
+_component_ref = {"mtime": None, "ref": ""}
+
+
+def is_metrics_enabled():
+    return str(get_property("llm_metrics") or "ENABLED").upper() != "DISABLED"
+
+
+def get_request_cost(model, prompt_tokens, completion_tokens):
+    """Returns the cost of a request in dollars, or None if the price of the model is unknown"""
+    matches = [m for m in MODEL_COSTS if model == m or model.startswith(m + "-")]
+    if not matches or prompt_tokens is None or completion_tokens is None:
+        return None
+    costs = MODEL_COSTS[max(matches, key=len)]
+    return costs["prompt_tokens"] * prompt_tokens + costs["completion_tokens"] * completion_tokens
+
+
+def get_current_component_ref():
+    try:
+        mtime = os.path.getmtime(TEMPLATE_FILE)
+        if mtime != _component_ref["mtime"]:
+            with open(TEMPLATE_FILE, "r") as f:
+                _component_ref["ref"] = json.load(f)["component"]["ref"]
+            _component_ref["mtime"] = mtime
+        return _component_ref["ref"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return ""
+
+
+def record_llm_request(caller, prompt, model, cache, latency, prompt_tokens=None, completion_tokens=None):
+    """
+    Appends a record of an LLM request to the metrics file.
+    The cache status is "hit" if the answer came from the cache, "miss" if the request was sent because there wasn't a
+    cached answer, "bypass" if the caller asked to skip the cached answer and "disabled" if the cache is turned off
+    """
+    if not is_metrics_enabled():
+        return
+
+    record = {
+        "timestamp": round(time.time(), 3),
+        "component": get_current_component_ref(),
+        "caller": caller,
+        "prompt": prompt,
+        "client": get_property("openai_client"),
+        "model": model,
+        "cache": cache,
+        "latency": round(latency, 4),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": get_request_cost(model, prompt_tokens, completion_tokens) if cache != "hit" else 0.0
+    }
+    try:
+        with _metrics_lock:
+            os.makedirs(METRICS_FOLDER, exist_ok=True)
+            with open(LLM_METRICS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"LLM metrics couldn't be saved: {e}")
+
+
+def read_llm_requests(since=None):
+    """Returns the recorded LLM requests, only the ones made after the given timestamp if any"""
+    records = list()
+    if not os.path.exists(LLM_METRICS_FILE):
+        return records
+    with open(LLM_METRICS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line can be cut if the process was killed while writing it
+                continue
+            if since is None or record.get("timestamp", 0) >= since:
+                records.append(record)
+    return records
+
+
+def aggregate_llm_requests(records, key):
+    """Returns the totals of the requests grouped by one of the fields of the records, sorted by cost"""
+    groups = defaultdict(lambda: {"requests": 0, "hits": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                  "latency": 0.0, "cost": 0.0, "unknown_cost": 0})
+    for record in records:
+        group = groups[record.get(key) or "-"]
+        group["requests"] += 1
+        group["latency"] += record.get("latency") or 0.0
+        if record.get("cache") == "hit":
+            group["hits"] += 1
+            continue
+        group["prompt_tokens"] += record.get("prompt_tokens") or 0
+        group["completion_tokens"] += record.get("completion_tokens") or 0
+        if record.get("cost") is None:
+            group["unknown_cost"] += 1
+        else:
+            group["cost"] += record["cost"]
+
+    return dict(sorted(groups.items(), key=lambda item: (-item[1]["cost"], -item[1]["requests"], item[0])))
+
+
+def clear_llm_requests():
+    if os.path.exists(LLM_METRICS_FILE):
+        os.remove(LLM_METRICS_FILE)
@@ -0,0 +1,219 @@
+"""
+This script holds the inverted index of the OpenCRE+ mappings, used to expand the standards of the countermeasures
+"""
+import os
+import pickle
+import threading
+from typing import NamedTuple, Any, Dict, FrozenSet, Tuple
+
+from rich import print
+
+from isra.src.config.config import get_resource
+from isra.src.config.constants import OPENCRE_PLUS, CACHE_FOLDER, OPENCRE_INDEX_CACHE_FILE, CRE_MAPPING_NAME
+from isra.src.utils.text_functions import get_trigrams
+
+# Bump it whenever the indexed structures change, so old index files are discarded
+OPENCRE_INDEX_VERSION = 2
+
+# Index currently loaded, with the stamp of the mapping file it was built from
+_opencre_index = {"stamp": None, "index": None}
+_opencre_index_lock = threading.Lock()
+
+
+class OpenCREIndex(NamedTuple):
+    # (standard name, section) -> CRE IDs that contain that section, in the order of the mapping file
+    sections: Dict[Tuple[str, str], Tuple[str, ...]]
+    # CRE ID -> standard name -> sections
+    cres: Dict[str, Dict[str, Tuple[str, ...]]]
+    # Every standard name that appears in the mapping file
+    standards: FrozenSet[str]
+    # Standard name -> sorted lowercase sections, the sections they come from and the trigram postings of the
+    # lowercase sections, to search them by substring
+    search: Dict[str, Dict[str, Any]]
+    # (CRE ID, standard name) -> position in the mapping file
+    order: Dict[Tuple[str, str], int]
+
+
+def build_opencre_index(mappings_yaml):
+    """Builds the inverted index from the parsed OpenCRE+ mappings"""
+    sections = dict()
+    cres = dict()
+    standards = set()
+    for cre_id, cre_values in mappings_yaml.items():
+        cres[cre_id] = {standard: tuple(values) for standard, values in cre_values.items()}
+        standards.update(cre_values.keys())
+        for standard, values in cre_values.items():
+            # A section listed twice in the same CRE must only point to it once
+            for section in dict.fromkeys(values):
+                sections.setdefault((standard, section), list()).append(cre_id)
+
+    search = dict()
+    for standard, section in sections:
+        search.setdefault(standard, {"sections": [], "originals": dict(), "postings": dict()})
+        search[standard]["originals"].setdefault(section.lower(), []).append(section)
+    for standard_search in search.values():
+        standard_search["sections"] = sorted(standard_search["originals"])
+        for i, section in enumerate(standard_search["sections"]):
+            for trigram in set(get_trigrams(section)):
+                standard_search["postings"].setdefault(trigram, []).append(i)
+
+    order = {(cre_id, standard): i for i, (cre_id, standard) in
+             enumerate((cre_id, standard) for cre_id, cre_values in cres.items() for standard in cre_values)}
+
+    return OpenCREIndex(sections={k: tuple(v) for k, v in sections.items()}, cres=cres,
+                        standards=frozenset(standards), search=search, order=order)
+
+
+def _get_opencre_source_stamp(mappings_path):
+    stat = os.stat(str(mappings_path))
+    return [OPENCRE_INDEX_VERSION, str(mappings_path), stat.st_size, stat.st_mtime_ns]
+
+
+def _load_opencre_index_file(stamp):
+    try:
+        with open(OPENCRE_INDEX_CACHE_FILE, "rb") as f:
+            index = pickle.load(f)
+        if index.get("stamp") == stamp:
+            return OpenCREIndex(*index["index"])
+    except Exception:
+        # A missing or unreadable index only means that the mappings have to be parsed again
+        pass
+    return None
+
+
+def _save_opencre_index_file(stamp, index):
+    # A plain tuple, so the file can be loaded even if the class moves
+    data = {"stamp": stamp, "index": tuple(index)}
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        temp_file = f"{OPENCRE_INDEX_CACHE_FILE}.{os.getpid()}.tmp"
+        with open(temp_file, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file, OPENCRE_INDEX_CACHE_FILE)
+    except OSError as e:
+        print(f"OpenCRE index couldn't be saved: {e}")
+
+
+def get_opencre_index():
+    """
+    Returns the inverted index of the OpenCRE+ mappings.
+    The mapping file is only parsed when it changes, the index is kept in memory and in an index file in the cache
+    folder. The returned index is shared, so it mustn't be modified
+    """
+    mappings_path = get_resource(OPENCRE_PLUS, filetype="path")
+    stamp = _get_opencre_source_stamp(mappings_path)
+    with _opencre_index_lock:
+        if _opencre_index["stamp"] != stamp:
+            index = _load_opencre_index_file(stamp)
+            if index is None:
+                index = build_opencre_index(get_resource(OPENCRE_PLUS))
+                _save_opencre_index_file(stamp, index)
+            _opencre_index["stamp"] = stamp
+            _opencre_index["index"] = index
+        return _opencre_index["index"]
+
+
+def get_opencre_standards():
+    """Returns the name of every standard that appears in OpenCRE+"""
+    return get_opencre_index().standards
+
+
+def get_cre_ids(opencre_standard_name, section):
+    """Returns the CRE IDs that contain the section of the standard"""
+    return get_opencre_index().sections.get((opencre_standard_name, section), ())
+
+
+def find_sections(standard_search, text):
+    """Returns the lowercase sections of a standard that contain the text"""
+    sections = standard_search["sections"]
+    if len(text) < 3:
+        # Too short to have trigrams, but the sections of a single standard are few
+        return [s for s in sections if text in s]
+
+    # A section can only contain the text if it has every trigram of the text, the shortest postings go first
+    postings = sorted((standard_search["postings"].get(t, []) for t in set(get_trigrams(text))), key=len)
+    candidates = set(postings[0])
+    for positions in postings[1:]:
+        candidates.intersection_update(positions)
+        if not candidates:
+            break
+    return [sections[i] for i in sorted(candidates) if text in sections[i]]
+
+
+def search_opencre(standard_name="", standard_section=""):
+    """
+    Returns the OpenCRE+ mappings whose standard name contains standard_name and that have a section containing
+    standard_section, ignoring case, as a list of (CRE ID, standard name, sorted sections) in the order of the
+    mapping file
+    """
+    index = get_opencre_index()
+    standard_name = standard_name.lower()
+    standard_section = standard_section.lower()
+
+    rows = set()
+    for standard, standard_search in index.search.items():
+        if standard_name not in standard.lower():
+            continue
+        for section in find_sections(standard_search, standard_section):
+            for original in standard_search["originals"][section]:
+                for cre_id in index.sections[(standard, original)]:
+                    rows.add((cre_id, standard))
+
+    return [(cre_id, standard, sorted(index.cres[cre_id][standard]))
+            for cre_id, standard in sorted(rows, key=index.order.get)]
+
+
+def get_opencre_expansion(opencre_standard_name, section):
+    """
+    Returns the standards related with the section of the standard through OpenCRE+, as a dictionary of standard names
+    and sets of sections. The CRE IDs are included under the "CRE" key. It is empty if the section isn't in OpenCRE+
+    """
+    index = get_opencre_index()
+    standards_to_add = dict()
+    for cre_id in index.sections.get((opencre_standard_name, section), ()):
+        # A standard that appears in several CREs keeps the sections of the last one, as the mappings have always
+        # been merged this way
+        standards_to_add.update(index.cres[cre_id])
+        if "CRE" not in standards_to_add:
+            standards_to_add["CRE"] = set()
+        standards_to_add["CRE"].add(cre_id)
+
+    return {key: set(value) for key, value in standards_to_add.items()}
+
+
+def expand_standards(standards, baseline_ref, baseline_sections, verbose=False):
+    """
+    Adds the standards related with the base standard sections of a countermeasure to its list of standards.
+    Standards already in the list are not added again
+    """
+    current = {(std["standard-ref"], std["standard-section"]) for std in standards}
+
+    for base_standard_sections in baseline_sections:
+
+        standards_to_add = get_opencre_expansion(CRE_MAPPING_NAME[baseline_ref], base_standard_sections)
+
+        # If no standards have been found we add the base standard by default
+        if len(standards_to_add) == 0:
+            for section in base_standard_sections.split("||"):
+                # In case the same base standard section is added twice
+                if (CRE_MAPPING_NAME[baseline_ref], section) not in current:
+                    current.add((CRE_MAPPING_NAME[baseline_ref], section))
+                    standards.append({
+                        "standard-ref": CRE_MAPPING_NAME[baseline_ref],
+                        "standard-section": section
+                    })
+            if verbose:
+                print(f"[red]Nothing found in OpenCRE+. Added base standard")
+        else:
+            for standard_ref, sections in standards_to_add.items():
+                for section in sections:
+                    if (standard_ref, section) not in current:
+                        current.add((standard_ref, section))
+                        standards.append({
+                            "standard-ref": standard_ref,
+                            "standard-section": section
+                        })
+                        if verbose:
+                            print(f"Added [green]{standard_ref}[/green] -> [blue]{section}")
+
+    return standards
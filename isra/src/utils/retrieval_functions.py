@@ -0,0 +1,190 @@
+"""This file provides the lexical retrieval of the candidates that are sent to the LLM instead of the whole catalogue"""
+import heapq
+import inspect
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from isra.src.config.config import get_property, get_resource, get_number_property
+from isra.src.config.constants import CWE_CANDIDATES, ASVS_CANDIDATES, METRICS_FOLDER, RETRIEVAL_METRICS_FILE
+from isra.src.utils.gpt_functions import query_chatgpt
+from isra.src.utils.metrics_functions import get_current_component_ref
+
+# Resource, ID field, name field and description field of every catalogue
+CANDIDATE_SOURCES = {
+    "cwe": (CWE_CANDIDATES, "id", "name", "description"),
+    "asvs": (ASVS_CANDIDATES, "SectionID", "SectionName", None),
+}
+
+DEFAULT_TOP_K = 20
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "for", "from", "has", "have", "if", "in", "into", "is",
+    "it", "its", "may", "not", "of", "on", "or", "such", "that", "the", "their", "this", "to", "was", "when",
+    "which", "with", "verify", "product", "application", "system"
+}
+
+# Indexes by source, with the parsed catalogue they were built from
+_candidate_indexes = dict()
+_candidate_indexes_lock = threading.Lock()
+
+# Comparisons can be recorded from several screening threads at once
+_comparisons_lock = threading.Lock()
+
+
+def tokenize(text):
+    """Returns the terms of a text, lowercased and without stopwords nor the most common English suffixes"""
+    terms = list()
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        for suffix in ("ing", "ed", "es", "s"):
+            if len(word) > len(suffix) + 3 and word.endswith(suffix):
+                word = word[:-len(suffix)]
+                break
+        terms.append(word)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 index of a list of texts"""
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.postings = defaultdict(list)
+        lengths = list()
+        for i, text in enumerate(texts):
+            terms = tokenize(text)
+            lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((i, frequency))
+
+        size = len(lengths)
+        average_length = sum(lengths) / size if size else 0
+        # The part of the term weight that only depends on the length of the document
+        self.norms = [k1 * (1 - b + b * length / average_length) if average_length else k1 for length in lengths]
+        self.idf = {term: math.log(1 + (size - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+
+    def search(self, text, k):
+        """Returns the positions of the k texts that score best for the query, best first"""
+        scores = defaultdict(float)
+        for term in set(tokenize(text)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, frequency in self.postings[term]:
+                scores[i] += idf * frequency * (self.k1 + 1) / (frequency + self.norms[i])
+        return [i for i, _ in heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))]
+
+
+def get_candidate_index(source):
+    """Returns the catalogue of a source and its index, built again only if the catalogue file changes"""
+    resource, _, name_field, description_field = CANDIDATE_SOURCES[source]
+    documents = get_resource(resource, filetype="jsonl")
+    with _candidate_indexes_lock:
+        cached = _candidate_indexes.get(source)
+        if cached is not None and cached[0] is documents:
+            return cached
+
+        # The name is repeated so that it weighs more than the description
+        texts = [f"{d[name_field]} {d[name_field]} {d.get(description_field, '') if description_field else ''}"
+                 for d in documents]
+        _candidate_indexes[source] = (documents, BM25Index(texts))
+        return _candidate_indexes[source]
+
+
+def get_candidates(source, text, top_k=None):
+    """Returns the (ID, name) of the entries of the catalogue closest to the text, best first"""
+    _, id_field, name_field, _ = CANDIDATE_SOURCES[source]
+    documents, index = get_candidate_index(source)
+    return [(documents[i][id_field], documents[i][name_field])
+            for i in index.search(text, top_k or get_candidate_top_k())]
+
+
+def get_candidate_retrieval_mode():
+    return str(get_property("llm_candidate_retrieval") or "ENABLED").upper()
+
+
+def get_candidate_top_k():
+    return int(get_number_property("llm_candidate_top_k", DEFAULT_TOP_K))
+
+
+def query_chatgpt_with_candidates(messages, candidates_messages, candidate_ids, get_answer_id, caller=None):
+    """
+    Sends the prompt that only lists the retrieved candidates, or the full prompt if retrieval is disabled or nothing
+    was retrieved.
+    In COMPARE mode both prompts are sent, the answer to the full prompt is returned and whether both answers agree is
+    recorded, along with whether the full answer was among the candidates.
+    The caller is the function the answer is for, by default the one calling this function
+    """
+    caller_name = caller or inspect.currentframe().f_back.f_code.co_name
+    mode = get_candidate_retrieval_mode()
+    if mode == "DISABLED" or len(candidate_ids) == 0:
+        return query_chatgpt(messages, caller=caller_name)
+    if mode != "COMPARE":
+        return query_chatgpt(candidates_messages, caller=caller_name)
+
+    full_answer = query_chatgpt(messages, caller=caller_name)
+    candidates_answer = query_chatgpt(candidates_messages, caller=caller_name)
+    full_id = get_answer_id(full_answer)
+    record_retrieval_comparison(caller_name, full_id, get_answer_id(candidates_answer), full_id in candidate_ids,
+                                len(candidate_ids))
+    return full_answer
+
+
+def record_retrieval_comparison(caller, full_answer, candidates_answer, retrieved, candidates):
+    record = {
+        "timestamp": round(time.time(), 3),
+        "component": get_current_component_ref(),
+        "caller": caller,
+        "full_answer": full_answer,
+        "candidates_answer": candidates_answer,
+        "agree": full_answer == candidates_answer,
+        "retrieved": retrieved,
+        "candidates": candidates
+    }
+    try:
+        with _comparisons_lock:
+            os.makedirs(METRICS_FOLDER, exist_ok=True)
+            with open(RETRIEVAL_METRICS_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Retrieval comparison couldn't be saved: {e}")
+
+
+def read_retrieval_comparisons(since=None):
+    """Returns the recorded comparisons between full and retrieved prompts, only the ones made after the given
+    timestamp if any"""
+    records = list()
+    if not os.path.exists(RETRIEVAL_METRICS_FILE):
+        return records
+    with open(RETRIEVAL_METRICS_FILE, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if since is None or record.get("timestamp", 0) >= since:
+                records.append(record)
+    return records
+
+
+def aggregate_retrieval_comparisons(records):
+    """Returns how many answers agreed, and how many full answers were among the candidates, by caller"""
+    groups = defaultdict(lambda: {"comparisons": 0, "agree": 0, "retrieved": 0})
+    for record in records:
+        group = groups[record.get("caller") or "-"]
+        group["comparisons"] += 1
+        group["agree"] += 1 if record.get("agree") else 0
+        group["retrieved"] += 1 if record.get("retrieved") else 0
+    return dict(sorted(groups.items()))
+
+
+def clear_retrieval_comparisons():
+    if os.path.exists(RETRIEVAL_METRICS_FILE):
+        os.remove(RETRIEVAL_METRICS_FILE)
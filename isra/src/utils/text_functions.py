@@ -1,6 +1,9 @@
 import difflib
+import heapq
 import json
 import re
+from collections import Counter, defaultdict
+from functools import lru_cache
 from json import JSONDecodeError
 
 import itertools
@@ -16,7 +19,7 @@ from isra.src.config.constants import NON_ASCII_CODES, CUSTOM_FIELD_ATTACK_ENTER
 from isra.src.utils.questionary_wrapper import qselect, qtext
 
 
-def extract_json(json_string):
+def extract_json(json_string, verbose=True):
     # Find the first occurrence of a valid JSON object
     start_index = json_string.find('{')
     end_index = json_string.rfind('}')
@@ -25,7 +28,8 @@ def extract_json(json_string):
     json_object = json_string[start_index:end_index + 1]
 
     # Parse the JSON object and return it
-    print(json_object)
+    if verbose:
+        print(json_object)
 
     try:
         result = json.loads(json_object)
@@ -35,8 +39,9 @@ def extract_json(json_string):
             result = json.loads(json_object.replace("'", "\""))
         except JSONDecodeError as e:
             # print(f"Plain answer: ---{json_string}---")
-            print(f"Couldn't convert JSON answer: {json_object}")
-            print(e)
+            if verbose:
+                print(f"Couldn't convert JSON answer: {json_object}")
+                print(e)
             raise e
 
     return result
@@ -52,17 +57,121 @@ def replace_non_ascii(text):
     return replaced_text
 
 
+class FuzzyMatchIndex:
+    """Finds the closest matches of a word in a fixed list of values, with the same results as difflib
+
+    difflib.get_close_matches computes the similarity ratio against every value. Here the values that share most
+    character trigrams with the word are scored first, and the rest are only scored if their length, characters and
+    longest common subsequence allow a ratio high enough to enter the best matches found so far.
+    """
+
+    def __init__(self, word_list):
+        # Lowercase values and the original values they come from
+        self.lpos = dict()
+        for p in word_list:
+            self.lpos.setdefault(p.lower(), []).append(p)
+        self.keys = list(self.lpos.keys())
+        self.counts = [Counter(k) for k in self.keys]
+        self.postings = defaultdict(list)
+        for i, k in enumerate(self.keys):
+            for trigram in set(get_trigrams(k)):
+                self.postings[trigram].append(i)
+        # The same wrong value usually appears in many threats and countermeasures
+        self.matches = dict()
+
+    def get_close_matches(self, word, n=6, cutoff=0.6):
+        key = (word.lower(), n, cutoff)
+        if key not in self.matches:
+            self.matches[key] = self._get_close_matches(key[0], n, cutoff)
+        return list(self.matches[key])
+
+    def _get_close_matches(self, lword, n, cutoff):
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(lword)
+        word_counts = Counter(lword)
+        word_masks = get_character_masks(lword)
+
+        best = list()
+        results = list()
+        scored = set()
+
+        def score(i):
+            scored.add(i)
+            matcher.set_seq1(self.keys[i])
+            ratio = matcher.ratio()
+            if ratio >= cutoff:
+                results.append((ratio, self.keys[i]))
+                if len(best) < n:
+                    heapq.heappush(best, ratio)
+                elif ratio > best[0]:
+                    heapq.heapreplace(best, ratio)
+
+        # Values sharing most trigrams with the word are likely the best matches, so they raise the bar early
+        shared = Counter()
+        for trigram in set(get_trigrams(lword)):
+            for i in self.postings.get(trigram, ()):
+                shared[i] += 1
+        for i, _ in shared.most_common(n * 4):
+            score(i)
+
+        for i, k in enumerate(self.keys):
+            if i in scored:
+                continue
+            # A value can't reach the bar if even all its characters matching wouldn't be enough. Values with the
+            # same ratio as the last best match are scored anyway, because they can win the tie
+            bar = cutoff if len(best) < n else max(cutoff, best[0])
+            length = len(k) + len(lword)
+            if length == 0:
+                score(i)
+                continue
+            if 2.0 * min(len(k), len(lword)) / length < bar:
+                continue
+            common = sum(min(count, word_counts[c]) for c, count in self.counts[i].items())
+            if 2.0 * common / length < bar:
+                continue
+            # Nor if their longest common subsequence isn't, which is cheaper to get than the ratio
+            if 2.0 * get_lcs_length(k, word_masks, len(lword)) / length < bar:
+                continue
+            score(i)
+
+        return [k for _, k in heapq.nlargest(n, results)]
+
+
+def get_character_masks(text):
+    """Returns the positions of each character of the text as a bit mask"""
+    masks = dict()
+    for i, c in enumerate(text):
+        masks[c] = masks.get(c, 0) | (1 << i)
+    return masks
+
+
+def get_lcs_length(text, masks, length):
+    """
+    Returns the length of the longest common subsequence between the text and the one the masks come from, with the
+    bit-parallel algorithm. The characters matched by difflib are a common subsequence, so it is never below them
+    """
+    full = (1 << length) - 1
+    v = full
+    for c in text:
+        u = v & masks.get(c, 0)
+        v = ((v + u) | (v - u)) & full
+    return length - bin(v).count("1")
+
+
+def get_trigrams(text):
+    return [text[i:i + 3] for i in range(max(1, len(text) - 2))]
+
+
+@lru_cache(maxsize=32)
+def get_fuzzy_match_index(word_list):
+    return FuzzyMatchIndex(word_list)
+
+
 def find_closest_match(input_word, word_list):
-    # Find the closest matching word in the list using difflib
-    lword = input_word.lower()
-    lpos = {}
-    for p in word_list:
-        if p.lower() not in lpos:
-            lpos[p.lower()] = [p]
-        else:
-            lpos[p.lower()].append(p)
-    lmatches = difflib.get_close_matches(lword, lpos.keys(), n=6, cutoff=0.6)
-    ret = [lpos[m] for m in lmatches]
+    # Find the closest matching word in the list, the index of each list is only built once
+    index = get_fuzzy_match_index(tuple(word_list))
+    lmatches = index.get_close_matches(input_word, n=6, cutoff=0.6)
+    ret = [index.lpos[m] for m in lmatches]
     ret = itertools.chain.from_iterable(ret)
     return list(set(ret))
 
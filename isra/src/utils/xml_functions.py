@@ -1,3 +1,4 @@
+import hashlib
 import json
 import os
 import uuid
@@ -976,3 +977,13 @@ def get_library_name_from_file(file):
     tree = etree.parse(file)
     root = tree.getroot()
     return root.attrib["ref"]
+
+
+def get_library_content_hash(file):
+    """
+    Returns a hash of the content of a library file. The revision and the indentation are left out, since every export
+    changes them
+    """
+    root = etree.parse(file, etree.XMLParser(remove_blank_text=True)).getroot()
+    root.attrib.pop("revision", None)
+    return hashlib.sha256(etree.tostring(root, method="c14n")).hexdigest()
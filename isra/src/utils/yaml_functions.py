@@ -1,4 +1,6 @@
+import hashlib
 import json
+import os
 from collections import defaultdict
 from datetime import datetime
 
@@ -21,6 +23,23 @@ from isra.src.utils.structure_functions import build_tree_hierarchy
 from isra.src.utils.xml_functions import get_cwe_description, get_original_cwe_weaknesses
 
 
+def find_components(components_dir, name_filter=None):
+    """Returns the sorted paths of every YAML component in the folder, only the ones whose file name contains the
+    filter if any"""
+    components = list()
+    for root, dirs, files in os.walk(components_dir):
+        for file in files:
+            if file.endswith(".yaml") and "to_review" not in root and ".git" not in root:
+                if name_filter is None or name_filter.lower() in file.lower():
+                    components.append(os.path.join(root, file))
+    return sorted(components)
+
+
+def get_file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
 def load_yaml_file(component):
     template = json.loads(EMPTY_TEMPLATE)
     with open(component, "r") as f:
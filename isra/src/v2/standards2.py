@@ -5,8 +5,8 @@ from rich import print
 from rich.table import Table
 
 from isra.src.v2.component2 import read_current_component, write_current_component
-from isra.src.config.config import get_resource
-from isra.src.v2.constants2 import OPENCRE_PLUS, CRE_MAPPING_NAME
+from isra.src.utils.opencre_functions import get_opencre_index, search_opencre
+from isra.src.v2.constants2 import CRE_MAPPING_NAME
 
 app = typer.Typer(no_args_is_help=True, add_help_option=False)
 
@@ -14,7 +14,7 @@ app = typer.Typer(no_args_is_help=True, add_help_option=False)
 def expand_init():
     template = read_current_component()
 
-    mappings_yaml = get_resource(OPENCRE_PLUS)
+    opencre_index = get_opencre_index()
 
     for control in template.get_controls():
         control_ref = control.get_ref()
@@ -37,18 +37,13 @@ def expand_init():
             print(f"{control_ref}: [yellow]Looking for {baseline_ref_opencre} - {baseline_section}")
 
             # If OpenCRE+ contains the base standard and section we'll include the other standards related
-            # Now we iterate over the OpenCRE+ keys searching for the standard
-            for cre_id, cre_values in mappings_yaml.items():
-                if baseline_ref_opencre in cre_values:
-                    # Now it may happen that the section doesn't appear exactly as it is in the OpenCRE+, so we
-                    # apply special techniques to look for the best match
-                    if baseline_section in cre_values[baseline_ref_opencre]:
-                        control.add_standard("CRE", cre_id)
-                        print(f"Added [green]CRE[/green] -> [blue]{cre_id}")
-                        for k, v in cre_values.items():
-                            for elem in v:
-                                control.add_standard(k, elem)
-                                print(f"Added [green]{k}[/green] -> [blue]{elem}")
+            for cre_id in opencre_index.sections.get((baseline_ref_opencre, baseline_section), ()):
+                control.add_standard("CRE", cre_id)
+                print(f"Added [green]CRE[/green] -> [blue]{cre_id}")
+                for k, v in opencre_index.cres[cre_id].items():
+                    for elem in v:
+                        control.add_standard(k, elem)
+                        print(f"Added [green]{k}[/green] -> [blue]{elem}")
 
         if len(control.get_standards()) == 0:
             print(f"[red]Nothing found in OpenCRE+. Added base standard")
@@ -62,13 +57,8 @@ def expand_init():
 def show_init(standard_name, standard_section):
     table = Table("OpenCRE ID", "Standard", "Section")
 
-    mappings_yaml = get_resource(OPENCRE_PLUS)
-    for k, v in mappings_yaml.items():
-        for k2, v2 in v.items():
-            if standard_name.lower() in k2.lower():
-                li = [x.lower() for x in v2]
-                if any(standard_section.lower() in s for s in li):
-                    table.add_row(k, k2, str(sorted(v2)))
+    for k, k2, v2 in search_opencre(standard_name, standard_section):
+        table.add_row(k, k2, str(v2))
     print(table)
 
 
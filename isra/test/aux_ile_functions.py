@@ -0,0 +1,76 @@
+import copy
+
+import isra.src.ile.backend.main  # noqa: F401 (loads the services in the same order as the app)
+from isra.src.ile.backend.app.models import (
+    ILEProject, ILEVersion, IRCategoryComponent, IRComponentDefinition, IRControl, IRLibrary, IRReference,
+    IRRelation, IRRiskPattern, IRRule, IRRuleAction, IRRuleCondition, IRStandard, IRSupportedStandard, IRTest,
+    IRThreat, IRUseCase, IRWeakness
+)
+from isra.src.ile.backend.app.services.data_service import DataService
+
+
+def make_version(version_ref, libraries=3):
+    """Returns a version with a few libraries that share use cases, references and standards"""
+    v = ILEVersion(version=version_ref)
+    for i in range(2):
+        v.supported_standards[f"ss{i}"] = IRSupportedStandard(supported_standard_ref=f"ss{i}",
+                                                              supported_standard_name=f"Standard {i}",
+                                                              uuid=f"ss{i}")
+    for i in range(4):
+        v.standards[f"st{i}"] = IRStandard(supported_standard_ref=f"ss{i % 2}", standard_ref=f"section-{i}",
+                                           uuid=f"st{i}")
+        v.references[f"ref{i}"] = IRReference(name=f"Reference {i}", url=f"https://example.com/{i}", uuid=f"ref{i}")
+    for i in range(2):
+        v.categories[f"cat{i}"] = IRCategoryComponent(ref=f"category-{i}", name=f"Category {i}", uuid=f"cat{i}")
+        v.usecases[f"uc{i}"] = IRUseCase(ref=f"usecase-{i}", name=f"Use case {i}", uuid=f"uc{i}")
+
+    for lib_index in range(libraries):
+        lib = IRLibrary(ref=f"lib{lib_index}", name=f"Library {lib_index}", uuid=f"lib{lib_index}",
+                        filename=f"lib{lib_index}.xml")
+        for rp_index in range(2):
+            # The changelog finds the relations of a risk pattern by its ref, so it is the same as the UUID
+            rp_uuid = f"rp{lib_index}-{rp_index}"
+            lib.risk_patterns[rp_uuid] = IRRiskPattern(ref=rp_uuid, name=f"Risk pattern {rp_index}", uuid=rp_uuid)
+            component = IRComponentDefinition(ref=f"component-{lib_index}-{rp_index}",
+                                              name=f"Component {rp_index}", uuid=f"cd{lib_index}-{rp_index}",
+                                              category_ref=f"category-{rp_index}",
+                                              risk_pattern_refs=[rp_uuid])
+            lib.component_definitions[component.uuid] = component
+            lib.rules.append(IRRule(
+                name=f"Rule {lib_index}-{rp_index}", module="component", gui="",
+                conditions=[IRRuleCondition(name="CONDITION_COMPONENT_DEFINITION", field="id", value=component.ref)],
+                actions=[IRRuleAction(name="IMPORT_RISK_PATTERN", value=f"{lib.ref}_::_{rp_uuid}",
+                                      project=lib.ref)]))
+            for t_index in range(2):
+                suffix = f"{lib_index}-{rp_index}-{t_index}"
+                v.threats[f"t{suffix}"] = IRThreat(ref=f"threat-{suffix}", name=f"Threat {suffix}", uuid=f"t{suffix}",
+                                                   mitre=["T1190"], stride=["S"], references={"ref0": "ref0"})
+                v.weaknesses[f"w{suffix}"] = IRWeakness(ref=f"weakness-{suffix}", name=f"Weakness {suffix}",
+                                                        uuid=f"w{suffix}",
+                                                        test=IRTest(uuid=f"wt{suffix}", steps="Steps",
+                                                                    references={"ref1": "ref1"}))
+                v.controls[f"c{suffix}"] = IRControl(ref=f"control-{suffix}", name=f"Control {suffix}",
+                                                     uuid=f"c{suffix}", standards={"st0": "st0"},
+                                                     references={"ref2": "ref2"}, base_standard=["Standard 0"],
+                                                     test=IRTest(uuid=f"ct{suffix}"))
+                relation = IRRelation(risk_pattern_uuid=rp_uuid, usecase_uuid=f"uc{t_index}",
+                                      threat_uuid=f"t{suffix}", weakness_uuid=f"w{suffix}",
+                                      control_uuid=f"c{suffix}", mitigation="100", uuid=f"rel{suffix}")
+                lib.relations[relation.uuid] = relation
+        v.libraries[lib.ref] = lib
+    return v
+
+
+def set_project(*versions):
+    """Loads a project with the given versions"""
+    project = ILEProject(ref="test", name="Test")
+    project.versions = {v.version: v for v in versions}
+    DataService().set_project(project)
+    return project
+
+
+def copy_version(v, version_ref):
+    """Returns a deep copy of the version with another reference"""
+    new_version = copy.deepcopy(v)
+    new_version.version = version_ref
+    return new_version
@@ -0,0 +1,70 @@
+import itertools
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import isra.src.config.config as config
+import isra.src.utils.cache_functions as cache_functions
+from isra.src.utils.cache_functions import (
+    clear_response_cache, get_cached_response, get_response_cache_stats, save_cached_response
+)
+
+MB = 1024 * 1024
+
+
+class ResponseCacheTests(unittest.TestCase):
+    """Cached answers expire after the TTL and the least recently used ones are evicted when the cache is full"""
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        # Every operation happens one second after the previous one
+        self.clock = itertools.count(1000)
+        properties = {"llm_cache_ttl_hours": str(10 / 3600), "llm_cache_max_mb": str(1000 / MB)}
+        for patcher in (mock.patch.object(cache_functions, "CACHE_FOLDER", folder.name),
+                        mock.patch.object(cache_functions, "LLM_CACHE_FILE",
+                                          os.path.join(folder.name, "llm_responses.sqlite")),
+                        mock.patch.object(cache_functions.time, "time", lambda: next(self.clock)),
+                        mock.patch.object(config, "properties_s", properties)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_expired_answers_are_removed(self):
+        save_cached_response("key", "answer")
+        self.assertEqual("answer", get_cached_response("key"))
+
+        self.clock = itertools.count(next(self.clock) + 10)
+        self.assertIsNone(get_cached_response("key"))
+        self.assertEqual((0, 0), get_response_cache_stats())
+
+    def test_least_recently_used_answers_are_evicted(self):
+        save_cached_response("first", "a" * 400)
+        save_cached_response("second", "b" * 400)
+        self.assertEqual((2, 800), get_response_cache_stats())
+
+        # Reading the first answer makes the second one the least recently used
+        self.assertIsNotNone(get_cached_response("first"))
+        save_cached_response("third", "c" * 400)
+
+        self.assertEqual((2, 800), get_response_cache_stats())
+        self.assertIsNone(get_cached_response("second"))
+        self.assertIsNotNone(get_cached_response("first"))
+        self.assertIsNotNone(get_cached_response("third"))
+
+    def test_clear(self):
+        save_cached_response("key", "answer")
+        self.assertTrue(clear_response_cache())
+        self.assertEqual((0, 0), get_response_cache_stats())
+        self.assertIsNone(get_cached_response("key"))
+
+    def test_database_errors_are_not_raised(self):
+        def broken_connect(*args, **kwargs):
+            raise sqlite3.OperationalError("database is locked")
+
+        with mock.patch.object(cache_functions.sqlite3, "connect", broken_connect), mock.patch("builtins.print"):
+            save_cached_response("key", "answer")
+            self.assertIsNone(get_cached_response("key"))
+            self.assertEqual((0, 0), get_response_cache_stats())
+            self.assertFalse(clear_response_cache())
@@ -0,0 +1,267 @@
+import contextlib
+import itertools
+import json
+import unittest
+from unittest import mock
+
+from isra.test.aux_ile_functions import copy_version, make_version, set_project
+from isra.src.ile.backend.app.facades.project_facade import ProjectFacade
+from isra.src.ile.backend.app.models import ChangelogRequest, IRExtendedRelation, IRRelation
+from isra.src.ile.backend.app.services import changelog_service, digest_service
+from isra.src.ile.backend.app.services.changelog_cache import ChangelogCache
+from isra.src.ile.backend.app.services.changelog_service import ChangelogService
+
+
+def normalize_graph(data):
+    """Returns the graph as plain values, with the generated node IDs replaced by the node names and types"""
+    if not isinstance(data, dict):
+        data = data.model_dump()
+    names = {node["id"]: [node.get("name"), node.get("type")] for node in data["nodes"]}
+    for node in data["nodes"]:
+        node.pop("id")
+    for link in data["links"]:
+        link["source"] = names.get(link["source"])
+        link["target"] = names.get(link["target"])
+    return data
+
+
+def normalize_streamed(record):
+    """Returns a streamed library record as plain values, normalizing its graph"""
+    data = json.loads(record)
+    if "graph" in data:
+        data["graph"] = normalize_graph(data["graph"])
+    return data
+
+
+def get_changelog():
+    """Returns the output of every changelog endpoint between the versions v1 and v2"""
+    facade = ProjectFacade()
+    request = ChangelogRequest(from_version="v1", to_version="v2")
+    graphs = facade.create_changelog_between_versions(request)
+    relations = facade.generate_relations_changelog(request)
+    output = {
+        "graphs": {ref: normalize_graph(graph) for ref, graph in graphs.graphs.items()},
+        "added": graphs.added_libraries,
+        "deleted": graphs.deleted_libraries,
+        "simple": json.loads(facade.create_changelog_between_versions_simple(request)),
+        "summaries": facade.get_library_summaries(request).model_dump(),
+        "relations": [sorted(relations.added, key=repr), sorted(relations.deleted, key=repr),
+                      {k: sorted(v, key=repr) for k, v in relations.new_countermeasures.items()}],
+    }
+    for library_ref in graphs.graphs:
+        output[f"library {library_ref}"] = normalize_graph(facade.get_library_specific_changes(
+            ChangelogRequest(from_version="v1", to_version="v2", library_ref=library_ref)))
+    return output
+
+
+@contextlib.contextmanager
+def full_walk():
+    """Makes every digest different, so that nothing is skipped and nothing is taken from the cache"""
+    counter = itertools.count()
+    unique_digest = lambda value: f"unique-{next(counter)}"
+    ChangelogCache().clear()
+    with mock.patch.object(digest_service, "get_digest", unique_digest), \
+            mock.patch.object(changelog_service, "get_digest", unique_digest):
+        yield
+    ChangelogCache().clear()
+
+
+class ChangelogDigestTests(unittest.TestCase):
+    """Skipping the parts with the same digest must give the same changelog as walking both versions entirely"""
+
+    def setUp(self):
+        ChangelogCache().clear()
+        self.v1 = make_version("v1")
+        self.v2 = copy_version(self.v1, "v2")
+        set_project(self.v1, self.v2)
+
+    def assert_same_as_full_walk(self):
+        changelog = get_changelog()
+        with full_walk():
+            expected = get_changelog()
+        self.assertEqual(expected, changelog)
+        return changelog
+
+    def test_unchanged_versions(self):
+        changelog = self.assert_same_as_full_walk()
+        self.assertFalse(any(s["has_changes"] for s in changelog["summaries"]["modified_libraries"]))
+
+    def test_deep_field_changes(self):
+        self.v2.libraries["lib1"].risk_patterns["rp1-0"].desc = "New description"
+        self.v2.usecases["uc1"].desc = "New description"
+        self.v2.threats["t1-1-0"].risk_rating.integrity = "25"
+        self.v2.weaknesses["w1-0-1"].test.steps = "New steps"
+        self.v2.controls["c1-1-1"].test.references["ref3"] = "ref3"
+
+        changelog = self.assert_same_as_full_walk()
+        changed = {s["ref"] for s in changelog["summaries"]["modified_libraries"] if s["has_changes"]}
+        # The use case is shared by every library
+        self.assertEqual({"lib0", "lib1", "lib2"}, changed)
+
+    def test_changed_relations(self):
+        self.v2.libraries["lib0"].relations["rel0-0-0"].mitigation = "50"
+        self.v2.libraries["lib1"].relations["rel1-0-1"].weakness_uuid = "w1-1-1"
+        del self.v2.libraries["lib2"].relations["rel2-1-1"]
+        relation = IRRelation(risk_pattern_uuid="rp2-0", usecase_uuid="uc1", threat_uuid="t2-0-0",
+                              weakness_uuid="w2-1-1", control_uuid="c2-1-1", mitigation="100", uuid="new")
+        self.v2.libraries["lib2"].relations[relation.uuid] = relation
+
+        changelog = self.assert_same_as_full_walk()
+        changed = {s["ref"] for s in changelog["summaries"]["modified_libraries"] if s["has_changes"]}
+        # Mitigation changes are only shown in the graphs when asked for, but they are in the relations report
+        self.assertEqual({"lib1", "lib2"}, changed)
+        self.assertEqual({"lib0", "lib1", "lib2"}, {relation.library_ref for relation in changelog["relations"][0]})
+
+    def test_changed_references_and_standards(self):
+        self.v2.references["ref1"].url = "https://example.com/new"
+        self.v2.standards["st0"].standard_ref = "new-section"
+        self.v2.controls["c0-0-0"].standards["st3"] = "st3"
+        self.v2.threats["t2-0-1"].references["ref3"] = "ref3"
+
+        self.assert_same_as_full_walk()
+
+    def test_added_and_deleted_libraries(self):
+        self.v1 = make_version("v1", libraries=4)
+        self.v2 = copy_version(self.v1, "v2")
+        del self.v1.libraries["lib3"]
+        del self.v2.libraries["lib0"]
+        set_project(self.v1, self.v2)
+
+        changelog = self.assert_same_as_full_walk()
+        self.assertEqual(["Library 3"], changelog["added"])
+        self.assertEqual(["Library 0"], changelog["deleted"])
+
+
+class ChangelogWorkersTests(unittest.TestCase):
+    """Diffing the libraries in several threads must give the same changelog, in the same order"""
+
+    def setUp(self):
+        v1 = make_version("v1", libraries=8)
+        v2 = copy_version(v1, "v2")
+        for i in range(0, 8, 2):
+            v2.libraries[f"lib{i}"].risk_patterns[f"rp{i}-1"].name = "Renamed"
+            v2.threats[f"t{i}-0-1"].desc = "New description"
+            del v2.libraries[f"lib{i}"].relations[f"rel{i}-1-0"]
+        del v2.libraries["lib7"]
+        set_project(v1, v2)
+
+    def get_changelog(self, workers):
+        ChangelogCache().clear()
+        with mock.patch.object(ChangelogService, "_get_workers", return_value=workers):
+            changelog = get_changelog()
+            streamed = list(ProjectFacade().stream_changelog_between_versions(
+                ChangelogRequest(from_version="v1", to_version="v2")))
+        return changelog, streamed
+
+    def test_same_changelog_with_several_workers(self):
+        changelog, streamed = self.get_changelog(1)
+        concurrent_changelog, concurrent_streamed = self.get_changelog(4)
+
+        self.assertEqual(json.dumps(changelog, default=repr), json.dumps(concurrent_changelog, default=repr))
+        # Streamed records come in completion order, the last one has the added and deleted libraries
+        self.assertEqual(streamed[-1], concurrent_streamed[-1])
+        self.assertCountEqual([normalize_streamed(record) for record in streamed],
+                              [normalize_streamed(record) for record in concurrent_streamed])
+
+
+class ChangelogCacheTests(unittest.TestCase):
+    """Changelogs are reused until the compared contents change"""
+
+    def setUp(self):
+        self.cache = ChangelogCache()
+        self.cache.clear()
+        self.addCleanup(self.cache.clear)
+        self.v1 = make_version("v1")
+        self.v2 = copy_version(self.v1, "v2")
+        self.v2.threats["t1-0-0"].desc = "New description"
+        set_project(self.v1, self.v2)
+        self.request = ChangelogRequest(from_version="v1", to_version="v2")
+
+    def get_library_graph(self, library_ref):
+        return normalize_graph(ProjectFacade().get_library_specific_changes(
+            ChangelogRequest(from_version="v1", to_version="v2", library_ref=library_ref)))
+
+    def test_repeated_changelog_is_cached(self):
+        first = ProjectFacade().create_changelog_between_versions(self.request)
+        misses = self.cache.misses
+        second = ProjectFacade().create_changelog_between_versions(self.request)
+
+        self.assertEqual(misses, self.cache.misses)
+        self.assertEqual(3, self.cache.hits)
+        self.assertIs(first.graphs["lib1"], second.graphs["lib1"])
+
+    def test_changed_relation_is_not_cached(self):
+        report = ProjectFacade().generate_relations_changelog(self.request)
+        self.assertEqual(set(), report.added)
+        self.assertEqual(report, ProjectFacade().generate_relations_changelog(self.request))
+        self.assertEqual(1, self.cache.hits)
+
+        self.v2.libraries["lib2"].relations["rel2-0-1"].mitigation = "50"
+        report = ProjectFacade().generate_relations_changelog(self.request)
+        self.assertEqual(1, self.cache.hits)
+        self.assertEqual({("lib2", "50")}, {(r.library_ref, r.mitigation) for r in report.added})
+
+        # The library graphs only show mitigations when asked for, but the relation tree of the library changed
+        self.get_library_graph("lib2")
+        self.v2.libraries["lib2"].relations["rel2-0-1"].mitigation = "25"
+        hits = self.cache.hits
+        self.get_library_graph("lib2")
+        self.assertEqual(hits, self.cache.hits)
+
+    def test_changed_element_ref_is_not_cached(self):
+        graph = self.get_library_graph("lib0")
+        self.assertEqual(graph, self.get_library_graph("lib0"))
+        self.assertEqual(1, self.cache.hits)
+
+        self.v2.threats["t0-1-0"].ref = "new-threat-ref"
+        self.v2.controls["c0-0-1"].ref = "new-control-ref"
+        graph = self.get_library_graph("lib0")
+        self.assertEqual(1, self.cache.hits)
+        with full_walk():
+            self.assertEqual(self.get_library_graph("lib0"), graph)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with mock.patch.object(self.cache, "max_size", 2):
+            for library_ref in ("lib0", "lib1", "lib2"):
+                self.get_library_graph(library_ref)
+            self.assertEqual(2, len(self.cache))
+            self.assertEqual(0, self.cache.hits)
+
+            self.get_library_graph("lib2")
+            self.assertEqual(1, self.cache.hits)
+            self.get_library_graph("lib0")
+            self.assertEqual(1, self.cache.hits)
+            # lib0 took the place of lib1, which was used less recently than lib2
+            self.get_library_graph("lib2")
+            self.assertEqual(2, self.cache.hits)
+            self.get_library_graph("lib1")
+            self.assertEqual(2, self.cache.hits)
+
+
+class ExtendedRelationTests(unittest.TestCase):
+    """Extended relations are compared by value, so the relations changelog can use sets"""
+
+    def setUp(self):
+        self.relation = IRRelation(risk_pattern_uuid="rp", usecase_uuid="uc", threat_uuid="t", weakness_uuid="w",
+                                   control_uuid="c", mitigation="100", uuid="rel")
+
+    def test_same_values_are_equal(self):
+        first = IRExtendedRelation.from_relation("lib", "", self.relation)
+        second = IRExtendedRelation.from_relation("lib", "", self.relation.model_copy(update={"uuid": "other"}))
+
+        self.assertEqual(first, second)
+        self.assertEqual(hash(first), hash(second))
+        self.assertEqual(1, len({first, second}))
+
+    def test_different_values_are_not_equal(self):
+        first = IRExtendedRelation.from_relation("lib", "", self.relation)
+        others = [
+            IRExtendedRelation.from_relation("other", "", self.relation),
+            IRExtendedRelation.from_relation("lib", "", self.relation.model_copy(update={"mitigation": "50"})),
+            IRExtendedRelation.from_relation("lib", "", self.relation.model_copy(update={"control_uuid": "c2"})),
+            first.model_copy(update={"risk_pattern_ref": "rp"}),
+        ]
+        for other in others:
+            self.assertNotEqual(first, other)
+        self.assertEqual(5, len({first, *others}))
+        self.assertNotEqual(first, first.model_dump())
@@ -0,0 +1,112 @@
+import copy
+import json
+import os
+import pickle
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+import isra.src.config.config as config
+from isra.src.config.config import FrozenDict, FrozenList, get_resource, get_resource_cache_stats
+
+RESOURCE = {"name": "Resource", "items": [{"id": 1, "tags": ["a", "b"]}, {"id": 2, "tags": []}], "empty": None}
+
+
+class ResourceCacheTests(unittest.TestCase):
+    """Resources are parsed once and parsed again only when their file changes"""
+
+    def setUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, "resource.yaml")
+        self.write(RESOURCE)
+        patcher = mock.patch.dict(config._resource_paths, {"test_resource.yaml": self.path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.forget)
+
+    def forget(self):
+        for key in [key for key in config._resource_cache if key[0] == "test_resource.yaml"]:
+            del config._resource_cache[key]
+
+    def write(self, data, mtime_ns=None):
+        with open(self.path, "w") as f:
+            yaml.safe_dump(data, f)
+        if mtime_ns is not None:
+            # Some file systems only keep the modification time in seconds, so it is set explicitly
+            os.utime(self.path, ns=(mtime_ns, mtime_ns))
+
+    def get_counts(self):
+        stats = get_resource_cache_stats()
+        return stats["hits"], stats["misses"]
+
+    def test_hits_and_misses(self):
+        hits, misses = self.get_counts()
+        first = get_resource("test_resource.yaml")
+        self.assertEqual((hits, misses + 1), self.get_counts())
+
+        second = get_resource("test_resource.yaml")
+        self.assertEqual((hits + 1, misses + 1), self.get_counts())
+        self.assertIs(first, second)
+        self.assertEqual(RESOURCE, second)
+
+        # Every file type is cached apart
+        self.assertEqual(yaml.safe_dump(RESOURCE), get_resource("test_resource.yaml", filetype="text"))
+        self.assertEqual((hits + 1, misses + 2), self.get_counts())
+
+    def test_changed_file_is_parsed_again(self):
+        self.write(RESOURCE, mtime_ns=1_000_000_000_000_000_000)
+        first = get_resource("test_resource.yaml")
+
+        changed = dict(RESOURCE, name="Changed")
+        self.write(changed, mtime_ns=1_000_000_001_000_000_000)
+        hits, misses = self.get_counts()
+        second = get_resource("test_resource.yaml")
+
+        self.assertEqual((hits, misses + 1), self.get_counts())
+        self.assertIsNot(first, second)
+        self.assertEqual(changed, second)
+        self.assertEqual("Resource", first["name"])
+        self.assertIs(second, get_resource("test_resource.yaml"))
+
+    def test_resources_are_read_only(self):
+        resource = get_resource("test_resource.yaml")
+        self.assertIsInstance(resource, FrozenDict)
+        self.assertIsInstance(resource["items"], FrozenList)
+        self.assertIsInstance(resource["items"][0], FrozenDict)
+
+        with self.assertRaises(TypeError):
+            resource["name"] = "Changed"
+        with self.assertRaises(TypeError):
+            resource.update({"name": "Changed"})
+        with self.assertRaises(TypeError):
+            resource["items"].append({"id": 3})
+        with self.assertRaises(TypeError):
+            resource["items"][0]["tags"].sort()
+        self.assertEqual(RESOURCE, get_resource("test_resource.yaml"))
+
+    def test_deepcopy_returns_plain_types(self):
+        resource = get_resource("test_resource.yaml")
+        resource_copy = copy.deepcopy(resource)
+
+        self.assertEqual(RESOURCE, resource_copy)
+        self.assertIs(dict, type(resource_copy))
+        self.assertIs(list, type(resource_copy["items"]))
+        self.assertIs(dict, type(resource_copy["items"][0]))
+        self.assertIs(list, type(resource_copy["items"][0]["tags"]))
+
+        resource_copy["items"][0]["tags"].append("c")
+        resource_copy["name"] = "Changed"
+        self.assertEqual(RESOURCE, get_resource("test_resource.yaml"))
+
+        self.assertIs(dict, type(pickle.loads(pickle.dumps(resource))))
+
+    def test_frozen_values_are_dumped_as_plain_values(self):
+        resource = get_resource("test_resource.yaml")
+
+        self.assertEqual(yaml.safe_dump(RESOURCE), yaml.safe_dump(resource))
+        self.assertEqual(yaml.dump(RESOURCE), yaml.dump(resource))
+        self.assertEqual(RESOURCE, yaml.safe_load(yaml.safe_dump({"resource": resource}))["resource"])
+        self.assertEqual(json.dumps(RESOURCE, sort_keys=True), json.dumps(resource, sort_keys=True))
@@ -0,0 +1,85 @@
+import unittest
+
+from isra.test.aux_ile_functions import make_version, set_project
+from isra.src.ile.backend.app.models import Graph, IRComponentDefinition, IRNode, Link
+from isra.src.ile.backend.app.services.changelog_cache import ChangelogCache
+from isra.src.ile.backend.app.services.library_service import LibraryService
+
+
+class GraphIndexTests(unittest.TestCase):
+    """The node and link lookups must follow the lists of the graph"""
+
+    def test_add_node_and_link(self):
+        graph = Graph()
+        node = IRNode("node", "N")
+        self.assertTrue(graph.add_node(node))
+        self.assertFalse(graph.add_node(node))
+        self.assertTrue(graph.add_link("a", node.id))
+        self.assertFalse(graph.add_link("a", node.id))
+
+        self.assertEqual([node], graph.nodes)
+        self.assertEqual(1, len(graph.links))
+        self.assertTrue(graph.has_node_value(node.id))
+        self.assertTrue(graph.has_link("a", node.id))
+        self.assertFalse(graph.has_link(node.id, "a"))
+
+    def test_replaced_lists_are_indexed(self):
+        first, second = IRNode("first", "N"), IRNode("second", "N")
+        graph = Graph(nodes=[first], links=[Link(source="a", target=first.id)])
+        self.assertTrue(graph.has_node_value(first.id))
+        self.assertTrue(graph.has_link("a", first.id))
+
+        graph.nodes = [second]
+        graph.links = []
+        self.assertFalse(graph.has_node_value(first.id))
+        self.assertTrue(graph.has_node_value(second.id))
+        self.assertFalse(graph.has_link("a", first.id))
+
+    def test_copies_are_independent(self):
+        graph = Graph()
+        graph.add_node(IRNode("first", "N"))
+        copy = graph.model_copy(deep=True)
+        node = IRNode("second", "N")
+        copy.add_node(node)
+
+        self.assertTrue(copy.has_node_value(node.id))
+        self.assertFalse(graph.has_node_value(node.id))
+        self.assertEqual(1, len(graph.nodes))
+
+
+class RulesGraphTests(unittest.TestCase):
+    """The rules graph is reused until the library is touched, and every caller gets its own copy"""
+
+    def setUp(self):
+        ChangelogCache().clear()
+        self.addCleanup(ChangelogCache().clear)
+        set_project(make_version("v1"))
+        self.service = LibraryService()
+
+    def test_rules_graph_is_cached_until_the_library_is_touched(self):
+        first = self.service.create_rules_graph("v1", "lib0")
+        second = self.service.create_rules_graph("v1", "lib0")
+        self.assertEqual(1, ChangelogCache().hits)
+        self.assertEqual(first.model_dump(), second.model_dump())
+
+        component = IRComponentDefinition(ref="component-0-0", name="Renamed", uuid="cd0-0",
+                                          category_ref="category-0", risk_pattern_refs=["rp0-0"])
+        self.service.update_component("v1", "lib0", component)
+        third = self.service.create_rules_graph("v1", "lib0")
+        self.assertEqual(1, ChangelogCache().hits)
+        self.assertIn("Renamed", third.model_dump_json())
+
+        # Other libraries weren't touched
+        self.service.create_rules_graph("v1", "lib1")
+        self.service.create_rules_graph("v1", "lib1")
+        self.assertEqual(2, ChangelogCache().hits)
+
+    def test_rules_graph_copies_are_not_shared(self):
+        first = self.service.create_rules_graph("v1", "lib0")
+        first.add_node(IRNode("added", "N"))
+        first.nodes[0] = IRNode("replaced", "N")
+
+        second = self.service.create_rules_graph("v1", "lib0")
+        self.assertEqual(1, ChangelogCache().hits)
+        self.assertNotIn("added", second.model_dump_json())
+        self.assertNotIn("replaced", second.model_dump_json())
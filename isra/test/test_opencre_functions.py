@@ -0,0 +1,45 @@
+import unittest
+
+from isra.src.config.config import get_resource
+from isra.src.config.constants import OPENCRE_PLUS
+from isra.src.utils.opencre_functions import search_opencre
+
+
+def scan_opencre(standard_name, standard_section):
+    """The search that standards show used to do, walking every section of every mapping"""
+    rows = list()
+    mappings_yaml = get_resource(OPENCRE_PLUS)
+    for k, v in mappings_yaml.items():
+        for k2, v2 in v.items():
+            if standard_name.lower() in k2.lower():
+                li = [x.lower() for x in v2]
+                if any(standard_section.lower() in s for s in li):
+                    rows.append((k, k2, sorted(v2)))
+    return rows
+
+
+class SearchOpenCRETests(unittest.TestCase):
+    """search_opencre must return the same rows as the scan over the mapping file, in the same order"""
+
+    def assert_same_rows(self, standard_name, standard_section):
+        self.assertEqual(scan_opencre(standard_name, standard_section),
+                         search_opencre(standard_name, standard_section),
+                         f"standard_name={standard_name!r} standard_section={standard_section!r}")
+
+    def test_same_rows_as_scan(self):
+        queries = [
+            ("", ""), ("asvs", ""), ("ASVS", "V3.2.1"), ("asvs", "v1.2"), ("asvs", "v5."), ("nist", "ac-"),
+            ("NIST 800-53 v5", "SC-23(3)"), ("cwe", "79"), ("cwe", "1"), ("", "injection"), ("", "a"),
+            ("", "ac"), ("attack", "t1"), ("iso", "5.1"), ("unknown standard", ""), ("asvs", "not a section"),
+        ]
+        for standard_name, standard_section in queries:
+            self.assert_same_rows(standard_name, standard_section)
+
+    def test_same_rows_as_scan_for_every_section(self):
+        # Every section is searched for with its own standard, which covers both the trigram and the short lookups
+        mappings_yaml = get_resource(OPENCRE_PLUS)
+        sections = sorted({(standard, section) for v in mappings_yaml.values() for standard, v2 in v.items()
+                           for section in v2})
+        for standard, section in sections[::25]:
+            self.assert_same_rows(standard, section)
+            self.assert_same_rows("", section[:2])
@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+
+import isra.src.config.config as config
+from isra.src.config.config import get_resource
+from isra.src.config.constants import ASVS_CANDIDATES, CWE_CANDIDATES
+from isra.src.utils.retrieval_functions import BM25Index, get_candidates, tokenize
+
+
+class BM25IndexTests(unittest.TestCase):
+    """The index ranks the texts that share the rarest terms with the query first"""
+
+    def setUp(self):
+        self.index = BM25Index([
+            "Validate every input before it is processed",
+            "Encrypt data in transit with TLS",
+            "Encrypt data at rest",
+            "Log every failed login and lock the account",
+            "Use parameterized queries to prevent SQL injection",
+        ])
+
+    def test_tokenize(self):
+        self.assertEqual(["encrypt", "password", "stor", "database"],
+                         tokenize("Encrypting the passwords stored in a database"))
+        self.assertEqual([], tokenize("a is the"))
+
+    def test_best_matches_first(self):
+        self.assertEqual([4], self.index.search("SQL injection", 5))
+        self.assertEqual([1, 2], self.index.search("encrypt data in transit", 5))
+        self.assertEqual([2, 1], self.index.search("data at rest encryption", 5))
+        self.assertEqual([3], self.index.search("account lockout after failed logins", 1))
+
+    def test_no_matches(self):
+        self.assertEqual([], self.index.search("unrelated words", 5))
+        self.assertEqual([], self.index.search("", 5))
+        self.assertEqual([], BM25Index([]).search("anything", 5))
+
+    def test_ties_keep_the_order_of_the_texts(self):
+        index = BM25Index(["same text", "other", "same text"])
+        self.assertEqual([0, 2], index.search("same text", 5))
+
+
+class CandidateTests(unittest.TestCase):
+    """The catalogue entry named in the query comes first"""
+
+    def setUp(self):
+        patcher = mock.patch.object(config, "properties_s", {"llm_candidate_top_k": ""})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cwe_name_returns_that_cwe_first(self):
+        for cwe_id in ("20", "79", "89", "798"):
+            name = next(d["name"] for d in get_resource(CWE_CANDIDATES, filetype="jsonl") if d["id"] == cwe_id)
+            candidates = get_candidates("cwe", name)
+            self.assertEqual((cwe_id, name), candidates[0])
+            self.assertEqual(20, len(candidates))
+
+    def test_description_of_a_countermeasure(self):
+        candidates = get_candidates("cwe", "Use prepared statements so that user input can't change the SQL "
+                                           "commands sent to the database", top_k=5)
+        self.assertIn("89", [cwe_id for cwe_id, _ in candidates])
+        self.assertEqual(5, len(candidates))
+
+    def test_asvs_section_returns_that_section_first(self):
+        sections = get_resource(ASVS_CANDIDATES, filetype="jsonl")
+        for section in sections[::40]:
+            candidates = get_candidates("asvs", section["SectionName"], top_k=3)
+            self.assertIn(section["SectionID"], [section_id for section_id, _ in candidates], section["SectionName"])
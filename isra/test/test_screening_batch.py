@@ -0,0 +1,218 @@
+import contextlib
+import functools
+import io
+import json
+import os
+import random
+import re
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+import isra.src.config.config as config
+import isra.src.screening.screening_batch as screening_batch
+import isra.src.utils.cwe_functions as cwe_functions
+from isra.src.config.constants import CWE_SOURCE_FILE
+from isra.src.screening.mock_llm import MockLLMServer
+from isra.src.screening.screening_executor import ScreeningExecutor
+from isra.src.utils.yaml_functions import save_yaml_file
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), "test_files", "test1.irius")
+COMPONENTS = ["first", "second"]
+# Every component has 6 threats and 7 countermeasures
+REQUESTS_PER_COMPONENT = 13
+
+
+def write_cwe_catalogue(path):
+    """Writes a CWE catalogue with the weaknesses of the test component and of the mock answers"""
+    weaknesses = "".join(f'<Weakness ID="{cwe_id}" Name="Weakness {cwe_id}" Abstraction="Base" Status="Stable">'
+                         f'<Description>Description of weakness {cwe_id}</Description></Weakness>'
+                         for cwe_id in ("20", "74", "284", "502", "668", "755", "770", "923"))
+    with open(path, "w") as f:
+        f.write(f'<Weakness_Catalog xmlns="http://cwe.mitre.org/cwe-7"><Weaknesses>{weaknesses}</Weaknesses>'
+                f'</Weakness_Catalog>')
+
+
+def interrupt_after(function, calls):
+    """Returns the function interrupted like with Ctrl+C once it has been called the given number of times"""
+    counter = iter(range(calls))
+
+    def wrapper(*args, **kwargs):
+        if next(counter, None) is None:
+            raise KeyboardInterrupt()
+        return function(*args, **kwargs)
+    return wrapper
+
+
+class BatchScreeningTests(unittest.TestCase):
+    """Screens a folder of components against a local mock of the OpenAI API"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.components_dir = os.path.join(self.folder.name, "components")
+        os.makedirs(self.components_dir)
+        cwe_catalogue = os.path.join(self.folder.name, "cwec.xml")
+        write_cwe_catalogue(cwe_catalogue)
+
+        self.properties = {
+            "components_dir": self.components_dir, "gpt_model": "gpt-4o", "openai_assistant_id": "",
+            "openai_client": "OPENAI", "llm_cache": "DISABLED", "llm_metrics": "DISABLED",
+            "llm_candidate_retrieval": "ENABLED", "llm_candidate_top_k": "", "llm_max_concurrency": "8",
+            "llm_requests_per_minute": "60000", "llm_max_retries": "8", "llm_run_timeout_seconds": "",
+            "company_name": ""
+        }
+        self.stack = contextlib.ExitStack()
+        self.addCleanup(self.stack.close)
+        self.stack.enter_context(mock.patch.object(config, "properties_s", self.properties))
+        self.stack.enter_context(mock.patch.dict(config._resource_paths, {CWE_SOURCE_FILE: cwe_catalogue}))
+        self.stack.enter_context(mock.patch.object(cwe_functions, "CACHE_FOLDER", self.folder.name))
+        self.stack.enter_context(mock.patch.object(cwe_functions, "CWE_INDEX_CACHE_FILE",
+                                                   os.path.join(self.folder.name, "cwe_index.pickle")))
+        self.stack.enter_context(mock.patch.object(screening_batch, "BATCH_CHECKPOINT_FILE",
+                                                   os.path.join(self.folder.name, "batch", "checkpoint.jsonl")))
+        self.stack.enter_context(mock.patch.object(screening_batch, "ScreeningExecutor",
+                                                   functools.partial(ScreeningExecutor, backoff=0)))
+        self.stack.enter_context(mock.patch.dict(os.environ, {"OPENAI_API_KEY": "key"}))
+        self.stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+
+        with open(TEMPLATE, "r") as f:
+            template = json.load(f)
+        yaml_dump = yaml.dump(save_yaml_file(template), default_flow_style=False, sort_keys=False)
+        for name in COMPONENTS:
+            with open(self.get_path(name), "w") as f:
+                f.write(yaml_dump)
+        self.yaml_dump = yaml_dump
+        self.original = self.read_components()
+
+    def get_path(self, name):
+        return os.path.join(self.components_dir, f"{name}.yaml")
+
+    def read_components(self):
+        """Returns the contents of the components, without the time they were written"""
+        components = dict()
+        for name in COMPONENTS:
+            with open(self.get_path(name), "r") as f:
+                components[name] = re.sub(r"last_review: .*", "last_review:", f.read())
+        return components
+
+    def start_server(self, failure_rate=0.0):
+        server = MockLLMServer(latency=0.01, failure_rate=failure_rate).start()
+        self.addCleanup(server.stop)
+        self.stack.enter_context(mock.patch.dict(os.environ, {"OPENAI_BASE_URL": server.base_url}))
+        return server
+
+    def screen(self, backend, server=None):
+        """Screens every component with the given backend, against a new server if none is given"""
+        if server is None:
+            self.start_server()
+        screening_batch.batch_screening(backend=backend)
+        return self.read_components()
+
+    def get_checkpoint(self):
+        checkpoint = screening_batch.BatchCheckpoint()
+        if checkpoint.exists():
+            checkpoint.load()
+        return checkpoint
+
+    def assert_screened(self, components):
+        self.assertFalse(self.get_checkpoint().exists())
+        for name in COMPONENTS:
+            self.assertNotEqual(self.original[name], components[name])
+            # The mock answers set the same CWE to every countermeasure
+            self.assertIn("CWE-20", components[name])
+
+    def test_executor_backend(self):
+        server = self.start_server()
+        components = self.screen("executor", server)
+
+        self.assert_screened(components)
+        self.assertEqual(len(COMPONENTS) * REQUESTS_PER_COMPONENT, server.requests)
+        self.assertEqual(components["first"], components["second"])
+
+    def test_openai_backend(self):
+        server = self.start_server()
+        components = self.screen("openai", server)
+
+        self.assert_screened(components)
+        self.assertEqual(1, len(server.httpd.batches))
+        self.assertEqual(len(COMPONENTS) * REQUESTS_PER_COMPONENT, server.requests)
+
+    def test_both_backends_write_the_same_components(self):
+        executor = self.screen("executor")
+        for name in COMPONENTS:
+            with open(self.get_path(name), "w") as f:
+                f.write(self.yaml_dump)
+        self.assertEqual(executor, self.screen("openai"))
+
+    def test_invalid_answers_are_retried(self):
+        expected = self.screen("executor")
+        random.seed(3)
+        for backend in ("executor", "openai"):
+            for name in COMPONENTS:
+                with open(self.get_path(name), "w") as f:
+                    f.write(self.yaml_dump)
+            server = self.start_server(failure_rate=0.3)
+            components = self.screen(backend, server)
+
+            # The same components are written, so no answer that couldn't be used made it into them
+            self.assertEqual(expected, components, backend)
+            self.assertGreater(server.requests, len(COMPONENTS) * REQUESTS_PER_COMPONENT, backend)
+            if backend == "openai":
+                self.assertGreater(len(server.httpd.batches), 1)
+
+    def test_interrupted_batch_is_resumed_without_resubmitting(self):
+        server = self.start_server()
+        with mock.patch.object(screening_batch, "wait_for_openai_batch",
+                               interrupt_after(screening_batch.wait_for_openai_batch, 0)):
+            with self.assertRaises(KeyboardInterrupt):
+                screening_batch.batch_screening(backend="openai")
+        checkpoint = self.get_checkpoint()
+        self.assertIsNotNone(checkpoint.pending_batch)
+        self.assertEqual(self.original, self.read_components())
+
+        # The backend is taken from the checkpoint
+        components = self.screen("executor", server)
+        self.assert_screened(components)
+        self.assertEqual(1, len(server.httpd.batches))
+        self.assertEqual(len(COMPONENTS) * REQUESTS_PER_COMPONENT, server.requests)
+
+    def test_component_edited_between_runs(self):
+        self.properties["llm_max_concurrency"] = "1"
+        server = self.start_server()
+        # The requests are sent in order, so the first component is answered entirely and the second one partly
+        with mock.patch.object(screening_batch, "query_chatgpt",
+                               interrupt_after(screening_batch.query_chatgpt, REQUESTS_PER_COMPONENT + 5)):
+            with self.assertRaises(KeyboardInterrupt):
+                screening_batch.batch_screening(backend="executor")
+        self.assertEqual(REQUESTS_PER_COMPONENT + 5, len(self.get_checkpoint().answers))
+
+        edited = self.yaml_dump.replace("A TEST COMPONENT CREATED BY ISRA", "An edited component")
+        with open(self.get_path("first"), "w") as f:
+            f.write(edited)
+        components = self.screen("executor", server)
+
+        self.assert_screened(components)
+        self.assertIn("An edited component", components["first"])
+        # Every answer of the edited component is requested again, the second one only sends the missing ones
+        self.assertEqual(3 * REQUESTS_PER_COMPONENT, server.requests)
+
+    def test_component_edited_while_a_batch_is_pending(self):
+        server = self.start_server()
+        with mock.patch.object(screening_batch, "wait_for_openai_batch",
+                               interrupt_after(screening_batch.wait_for_openai_batch, 0)):
+            with self.assertRaises(KeyboardInterrupt):
+                screening_batch.batch_screening(backend="openai")
+
+        edited = self.yaml_dump.replace("A TEST COMPONENT CREATED BY ISRA", "An edited component")
+        with open(self.get_path("second"), "w") as f:
+            f.write(edited)
+        components = self.screen("openai", server)
+
+        self.assert_screened(components)
+        self.assertIn("An edited component", components["second"])
+        # The answers of the pending batch for the edited component are outdated, so they are requested again
+        self.assertEqual(2, len(server.httpd.batches))
+        self.assertEqual(3 * REQUESTS_PER_COMPONENT, server.requests)
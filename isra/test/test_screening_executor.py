@@ -0,0 +1,86 @@
+import json
+import random
+import threading
+import time
+import unittest
+
+from isra.src.screening.screening_executor import ScreeningExecutor
+
+
+class InFlightCounter:
+    """Counts the tasks running at the same time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def task(self, duration):
+        def run(attempt):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(duration)
+            with self.lock:
+                self.in_flight -= 1
+            return duration
+        return run
+
+
+def failing_task(failures, error=json.JSONDecodeError("Expecting value", "", 0)):
+    """Returns a task that raises the error in its first attempts and returns the number of the attempt afterwards"""
+    def run(attempt):
+        if attempt < failures:
+            raise error
+        return attempt
+    return run
+
+
+class ScreeningExecutorTests(unittest.TestCase):
+    """Runs fake tasks instead of LLM requests"""
+
+    def test_results_in_task_order(self):
+        rng = random.Random(7)
+        durations = [rng.uniform(0, 0.05) for _ in range(20)]
+        counter = InFlightCounter()
+
+        results = ScreeningExecutor(max_concurrency=8, requests_per_minute=60000, max_retries=0).run(
+            [counter.task(duration) for duration in durations])
+
+        self.assertEqual(durations, [result.value for result in results])
+        self.assertTrue(all(result.error is None and result.attempts == 1 for result in results))
+
+    def test_retries_with_backoff(self):
+        executor = ScreeningExecutor(max_concurrency=4, requests_per_minute=60000, max_retries=3, backoff=0)
+        results = executor.run([failing_task(0), failing_task(2), failing_task(2, TimeoutError()), failing_task(10)])
+
+        self.assertEqual([0, 2, 2, None], [result.value for result in results])
+        self.assertEqual([1, 3, 3, 4], [result.attempts for result in results])
+        self.assertIsNone(results[1].error)
+        self.assertIsInstance(results[3].error, json.JSONDecodeError)
+
+    def test_backoff_grows_with_the_attempts(self):
+        started = time.monotonic()
+        ScreeningExecutor(max_concurrency=1, requests_per_minute=60000, max_retries=2, backoff=0.1).run(
+            [failing_task(2)])
+        # The waits are 0.1s and 0.2s, with up to half of them taken off by the jitter
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+    def test_other_errors_stop_the_run(self):
+        executor = ScreeningExecutor(max_concurrency=2, requests_per_minute=60000, max_retries=3, backoff=0)
+        with self.assertRaises(KeyError):
+            executor.run([failing_task(0), failing_task(1, KeyError("field"))])
+
+    def test_concurrency_cap(self):
+        counter = InFlightCounter()
+        ScreeningExecutor(max_concurrency=3, requests_per_minute=60000, max_retries=0).run(
+            [counter.task(0.05) for _ in range(12)])
+        self.assertEqual(3, counter.max_in_flight)
+
+    def test_requests_per_minute_cap(self):
+        counter = InFlightCounter()
+        started = time.monotonic()
+        # The bucket starts with a token per worker, the rest of the tasks start every 0.1s
+        ScreeningExecutor(max_concurrency=2, requests_per_minute=600, max_retries=0).run(
+            [counter.task(0) for _ in range(6)])
+        self.assertGreaterEqual(time.monotonic() - started, 0.35)
@@ -0,0 +1,269 @@
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+from isra.test.aux_ile_functions import make_version, set_project
+from isra.src.ile.backend.app.facades.project_facade import ProjectFacade
+from isra.src.ile.backend.app.models import (
+    IRRelation, IRRiskPattern, IRRuleAction, IRRuleCondition, IRThreat, IRUseCase, MergeLibraryRequest
+)
+from isra.src.ile.backend.app.services.data_service import DataService
+from isra.src.ile.backend.app.services.library_service import LibraryService
+from isra.src.ile.backend.app.services.test_service import TestRunHistory, TestService
+
+
+def make_faulty_version(version_ref):
+    """Returns a version where every test finds at least one error"""
+    v = make_version(version_ref, libraries=4)
+    v.controls["c0-0-0"].desc = "Contrôle"
+    v.controls["c0-0-1"].test.steps = "Étape"
+    v.controls["c1-0-0"].state = "Required"
+    v.weaknesses["w0-1-0"].desc = "Faiblesse ß"
+    v.weaknesses["w0-1-1"].test.steps = "Ω"
+    v.threats["t1-1-1"].desc = "Menace é"
+    v.usecases["unused"] = IRUseCase(ref="unused-usecase", name="Unused", uuid="unused")
+    v.threats["unused"] = IRThreat(ref="unused-threat", name="Unused", uuid="unused", desc="Unused")
+    v.references["ref3"].url = "https://example.com/with space"
+    v.categories["cat1"].name = ""
+
+    lib0, lib1, lib2 = v.libraries["lib0"], v.libraries["lib1"], v.libraries["lib2"]
+    lib0.relations["rel0-0-0"].control_uuid = ""
+    lib1.relations["rel1-1-0"].weakness_uuid = ""
+    lib2.relations["rel2-0-1"].mitigation = "30"
+    lib2.relations["extra"] = IRRelation(risk_pattern_uuid="rp2-1", usecase_uuid="uc0", threat_uuid="t2-1-0",
+                                         weakness_uuid="w2-1-1", control_uuid="c2-1-1", mitigation="20",
+                                         uuid="extra")
+    # Only the first mitigation of a control in a threat counts
+    lib2.relations["repeated"] = IRRelation(risk_pattern_uuid="rp2-1", usecase_uuid="uc0", threat_uuid="t2-1-0",
+                                            weakness_uuid="w2-1-1", control_uuid="c2-1-0", mitigation="40",
+                                            uuid="repeated")
+    lib1.component_definitions["cd1-0"].risk_pattern_refs.append("missing-risk-pattern")
+    lib1.component_definitions["cd1-1"].category_ref = ""
+    lib2.risk_patterns["lonely"] = IRRiskPattern(ref="lonely", name="Not imported", uuid="lonely")
+    lib2.risk_patterns["rp1-0"] = IRRiskPattern(ref="rp1-0", name="Duplicated", uuid="rp1-0")
+    lib0.rules[0].conditions.append(IRRuleCondition(name="CONDITION_UNKNOWN", field="id", value="x"))
+    lib0.rules[1].actions.append(IRRuleAction(name="IMPORT_RISK_PATTERN", value="ghost_::_rp", project="ghost"))
+    lib0.rules[1].actions.append(IRRuleAction(name="ACTION_UNKNOWN", value="x", project=""))
+    return v
+
+
+class BaselineTests:
+    """The tests as they were before the aggregates: every test walks the version on its own"""
+
+    def __init__(self):
+        self.library_service = LibraryService()
+        self.test_service = TestService()
+
+    def run(self, v):
+        """Returns the errors of every test, with the tests that didn't change taken from the test service"""
+        results = {}
+        for name in self.test_service._get_test_methods(None):
+            baseline = getattr(self, name, None)
+            results[name] = baseline(v) if baseline else getattr(self.test_service, name)(v, None)
+        return results
+
+    def test_correct_mitigation(self, v):
+        errors = []
+        for library_ref in v.libraries.keys():
+            report = self.library_service.check_mitigation(v.version, library_ref)
+            for rp in report.risk_patterns:
+                for item in rp.threats:
+                    if item.error:
+                        errors.append(f"{library_ref} -> {rp.risk_pattern_ref} -> {item.threat_ref} -> {item.message}")
+        return errors
+
+    def test_weaknesses_without_controls(self, v):
+        errors = []
+        for l in v.libraries.values():
+            for rel in l.relations.values():
+                if rel.risk_pattern_uuid != "CWE-7-KINGDOMS" and rel.weakness_uuid != "" and rel.control_uuid == "":
+                    errors.append(f"There is a weakness without controls on {rel.risk_pattern_uuid} -> "
+                                  f"{rel.usecase_uuid} -> {rel.threat_uuid} -> {rel.weakness_uuid}")
+        return errors
+
+    def test_orphaned_controls(self, v):
+        errors = []
+        for l in v.libraries.values():
+            if l.ref in ["IR-Functional-Components", "mitre-attack-framework"]:
+                continue
+            for rel in l.relations.values():
+                if rel.weakness_uuid == "" and rel.control_uuid != "":
+                    errors.append(f"There is an orphaned relation on {rel}")
+        return errors
+
+    def test_unused_usecases(self, v):
+        return self._get_unused_elements(v, v.usecases, "usecase_uuid")
+
+    def test_unused_threats(self, v):
+        return self._get_unused_elements(v, v.threats, "threat_uuid")
+
+    def test_unused_weaknesses(self, v):
+        return self._get_unused_elements(v, v.weaknesses, "weakness_uuid")
+
+    def test_unused_controls(self, v):
+        return self._get_unused_elements(v, v.controls, "control_uuid")
+
+    def test_integrity_component_definitions(self, v):
+        errors = []
+        for l in v.libraries.values():
+            for c in l.component_definitions.values():
+                if c.ref == "" or c.name == "" or c.category_ref == "" or not c.risk_pattern_refs:
+                    errors.append(f"Wrong component content: {c}")
+        return errors
+
+    def test_unimported_risk_pattern(self, v):
+        errors = []
+        actions = {"IMPORT_RISK_PATTERN", "EXTEND_RISK_PATTERN", "IMPORT_RISK_PATTERN_ORIGIN",
+                   "IMPORT_RISK_PATTERN_DESTINATION"}
+        rules = [r for l in v.libraries.values() for r in l.rules]
+        component_definitions = [c for l in v.libraries.values() for c in l.component_definitions.values()]
+        for l in v.libraries.values():
+            if l.ref == "mitre-attack-framework":
+                continue
+            for rp in l.risk_patterns.values():
+                found = any(rp.ref in comp.risk_pattern_refs for comp in component_definitions)
+                for r in rules:
+                    for ra in r.actions:
+                        if ra.name in actions and rp.ref in ra.value:
+                            found = True
+                            break
+                if not found:
+                    errors.append(f"Risk pattern {rp.ref} cannot be imported")
+        return errors
+
+    def test_wrong_risk_pattern_in_component(self, v):
+        errors = []
+        all_risk_patterns = {rp.ref for l in v.libraries.values() for rp in l.risk_patterns.values()}
+        for l in v.libraries.values():
+            for c in l.component_definitions.values():
+                for rp in c.risk_pattern_refs:
+                    if rp not in all_risk_patterns:
+                        errors.append(f"{c.ref}: risk pattern not found: {rp}")
+        return errors
+
+    def test_wrong_library_reference_in_rule(self, v):
+        errors = []
+        libraries = set(v.libraries.keys())
+        for l in v.libraries.values():
+            for r in l.rules:
+                for c in r.conditions:
+                    if c.name == "CONDITION_RISK_PATTERN_EXISTS" and c.value.split("_::_")[0] not in libraries:
+                        errors.append(f"A condition on rule '{r.name}' has a library reference wrong: {c.value}")
+                for a in r.actions:
+                    if a.name == "IMPORT_RISK_PATTERN":
+                        if a.value.split("_::_")[0] not in libraries:
+                            errors.append(f"An action on rule '{r.name}' has a library reference wrong: {a.value}")
+                        if a.project and a.project not in libraries:
+                            errors.append(f"An action on rule '{r.name}' has a library reference wrong: {a.project}")
+        return errors
+
+    def test_unhandled_rules_elements(self, v):
+        # Only the list of rules came from the aggregates, the handled elements are the same
+        rules = types.SimpleNamespace(rules=[r for l in v.libraries.values() for r in l.rules])
+        return self.test_service.test_unhandled_rules_elements(v, rules)
+
+    @staticmethod
+    def _get_unused_elements(v, elements, relation_field):
+        used = {getattr(rel, relation_field) for l in v.libraries.values() for rel in l.relations.values()}
+        unused = set(elements.keys()) - used
+        return [f"Unused: {unused}"] if unused else []
+
+
+class TestServiceTests(unittest.TestCase):
+    """The tests must find the same errors as before the aggregates, in the same order"""
+
+    def setUp(self):
+        self.v = make_faulty_version("v1")
+        set_project(self.v)
+
+    def test_same_results_as_baseline(self):
+        report = TestService().run_tests("v1", workers=1)
+        expected = BaselineTests().run(self.v)
+
+        self.assertEqual(expected, report.test_results)
+        self.assertEqual(list(expected), report.tests)
+        failed = [name for name, errors in report.test_results.items() if errors]
+        self.assertEqual(len(failed), report.num_failed_tests)
+        # Every test has something to find in the faulty version
+        self.assertEqual(set(), set(report.tests) - set(failed))
+
+    def test_same_results_with_several_workers_and_timeout(self):
+        sequential = TestService().run_tests("v1", workers=1)
+        concurrent = TestService().run_tests("v1", workers=2, timeout=60)
+
+        self.assertEqual(sequential.tests, concurrent.tests)
+        self.assertEqual(sequential.test_results, concurrent.test_results)
+        self.assertEqual(sequential.num_failed_tests, concurrent.num_failed_tests)
+
+    def test_timeout_with_one_worker_outside_the_main_thread(self):
+        def slow_test(service, v, aggregates):
+            time.sleep(5)
+            return []
+
+        # Requests are served from a thread pool, where interval timers can't be used
+        reports = []
+        with mock.patch.object(TestService, "test_empty_threat_desc", slow_test):
+            thread = threading.Thread(target=lambda: reports.append(TestService().run_tests(
+                "v1", test_names=["test_empty_threat_desc", "test_empty_control_desc"], workers=1, timeout=0.2)))
+            start = time.perf_counter()
+            thread.start()
+            thread.join()
+        self.assertLess(time.perf_counter() - start, 4)
+
+        self.assertEqual(["Test timed out after 0.2 seconds"], reports[0].test_results["test_empty_threat_desc"])
+        self.assertTrue(reports[0].test_results["test_empty_control_desc"])
+        self.assertEqual(2, reports[0].num_failed_tests)
+
+
+class IncrementalTestRunTests(unittest.TestCase):
+    """Incremental runs must give the same results as running every test again"""
+
+    def setUp(self):
+        self.v1 = make_faulty_version("v1")
+        self.v2 = make_version("v2", libraries=2)
+        set_project(self.v1, self.v2)
+
+    def assert_same_as_full_run(self):
+        incremental = TestService().run_tests("v1", workers=1, incremental=True)
+        full = TestService().run_tests("v1", workers=1)
+        self.assertEqual(full.test_results, incremental.test_results)
+        return incremental
+
+    def test_incremental_run_after_changes(self):
+        self.assert_same_as_full_run()
+        report = self.assert_same_as_full_run()
+        self.assertEqual(report.tests, report.reused_tests)
+
+        relation = self.v1.libraries["lib3"].relations["rel3-1-1"].model_copy(update={"control_uuid": ""})
+        LibraryService().update_relation("v1", "lib3", relation)
+        report = self.assert_same_as_full_run()
+        self.assertIn("test_empty_threat_desc", report.reused_tests)
+        self.assertNotIn("test_weaknesses_without_controls", report.reused_tests)
+
+    def test_incremental_run_after_merge_libraries(self):
+        self.assert_same_as_full_run()
+        ProjectFacade().merge_libraries(MergeLibraryRequest(src_version="v2", src_library="lib1",
+                                                            dst_version="v1", dst_library="lib0"))
+        report = self.assert_same_as_full_run()
+        self.assertEqual([], report.reused_tests)
+
+    def test_incremental_run_after_put_version(self):
+        self.assert_same_as_full_run()
+        DataService().remove_version("v1")
+        DataService().put_version(make_version("v1", libraries=1))
+        report = self.assert_same_as_full_run()
+        self.assertEqual([], report.reused_tests)
+
+    def test_stored_runs_are_not_modified(self):
+        TestService().run_tests("v1", workers=1)
+        stored = TestRunHistory().get("v1")
+        results = dict(stored.results)
+
+        relation = self.v1.libraries["lib3"].relations["rel3-1-1"].model_copy(update={"control_uuid": ""})
+        LibraryService().update_relation("v1", "lib3", relation)
+        TestService().run_tests("v1", workers=1, incremental=True)
+
+        self.assertEqual(results, stored.results)
+        self.assertIsNot(stored, TestRunHistory().get("v1"))
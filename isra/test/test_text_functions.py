@@ -0,0 +1,65 @@
+import difflib
+import random
+import string
+import unittest
+
+from isra.src.config.config import get_resource
+from isra.src.config.constants import CWE_CANDIDATES
+from isra.src.utils.text_functions import FuzzyMatchIndex, find_closest_match
+
+
+def mutate(word, rng):
+    """Returns the word with a few characters removed, added or replaced, like a wrong LLM answer"""
+    chars = list(word)
+    for _ in range(rng.randint(1, 4)):
+        position = rng.randrange(len(chars) + 1)
+        operation = rng.choice(("remove", "add", "replace"))
+        if operation == "remove" and position < len(chars):
+            del chars[position]
+        elif operation == "add":
+            chars.insert(position, rng.choice(string.ascii_lowercase + " -"))
+        elif position < len(chars):
+            chars[position] = rng.choice(string.ascii_lowercase)
+    return "".join(chars)
+
+
+class FuzzyMatchIndexTests(unittest.TestCase):
+    """The index must return the same matches as difflib.get_close_matches, in the same order"""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(1234)
+        cls.cwe_names = [d["name"] for d in get_resource(CWE_CANDIDATES, filetype="jsonl")]
+        # Short values with many ties, like the allowed values of the custom fields
+        cls.short_values = sorted({"".join(rng.choice("abcde") for _ in range(rng.randint(1, 6)))
+                                   for _ in range(300)})
+        cls.queries = [mutate(rng.choice(cls.cwe_names).lower(), rng) for _ in range(60)]
+        cls.queries += ["", "a", "sql injection", "cross-site scripting", "xxxxxxxx"]
+        cls.short_queries = [mutate(rng.choice(cls.short_values), rng) for _ in range(150)] + ["", "e"]
+
+    def assert_same_matches(self, values, queries, n, cutoff):
+        index = FuzzyMatchIndex(values)
+        keys = list(dict.fromkeys(v.lower() for v in values))
+        for query in queries:
+            expected = difflib.get_close_matches(query.lower(), keys, n=n, cutoff=cutoff)
+            self.assertEqual(expected, index.get_close_matches(query, n=n, cutoff=cutoff),
+                             f"query={query!r} n={n} cutoff={cutoff}")
+
+    def test_same_matches_as_difflib(self):
+        for n, cutoff in ((6, 0.6), (1, 0.6), (10, 0.8)):
+            self.assert_same_matches(self.cwe_names, self.queries, n, cutoff)
+
+    def test_same_matches_as_difflib_with_ties(self):
+        for n, cutoff in ((6, 0.6), (2, 0.3), (20, 0.0)):
+            self.assert_same_matches(self.short_values, self.short_queries, n, cutoff)
+
+    def test_repeated_query_uses_cached_matches(self):
+        index = FuzzyMatchIndex(self.cwe_names)
+        first = index.get_close_matches(self.queries[0])
+        first.append("modified")
+        self.assertEqual(first[:-1], index.get_close_matches(self.queries[0]))
+
+    def test_find_closest_match_returns_original_values(self):
+        values = ["Spoofing", "SPOOFING", "Tampering", "Repudiation"]
+        self.assertEqual({"Spoofing", "SPOOFING"}, set(find_closest_match("spofing", values)))
+        self.assertEqual([], find_closest_match("zzzzzz", values))
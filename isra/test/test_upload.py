@@ -0,0 +1,84 @@
+import contextlib
+import copy
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import isra.src.config.config as config
+import isra.src.utils.api_functions as api_functions
+from isra.src.component.mock_iriusrisk import MockIriusRiskServer
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), "test_files", "test1.irius")
+
+
+def slow(function, delay=0.2):
+    """Returns the function delayed, so that calls depending on it are sent before it finishes if they don't wait"""
+    def wrapper(*args, **kwargs):
+        time.sleep(delay)
+        return function(*args, **kwargs)
+    return wrapper
+
+
+def get_server_state(server):
+    """Returns the elements and relations stored by the server, without the IDs it generated"""
+    items = {collection: sorted(json.dumps({k: v for k, v in item.items() if k != "id" and not isinstance(v, dict)},
+                                           sort_keys=True) for item in collection_items.values())
+             for collection, collection_items in server.httpd.items.items()}
+    relations = sorted(json.dumps(relation, sort_keys=True) for relation in server.httpd.relations)
+    return items, relations
+
+
+class UploadTests(unittest.TestCase):
+    """Uploads a component to a local mock of the IriusRisk API"""
+
+    def setUp(self):
+        with open(TEMPLATE, "r") as f:
+            self.template = json.load(f)
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+
+    def upload(self, workers, server=None):
+        """Uploads the component with the given number of workers, to a new server if none is given"""
+        if server is None:
+            server = MockIriusRiskServer(latency=0.01).start()
+            self.addCleanup(server.stop)
+        properties = {
+            "iriusrisk_url": server.base_url, "iriusrisk_api_token": "token", "iriusrisk_timeout_seconds": "",
+            "iriusrisk_max_retries": "", "iriusrisk_api_spinner": "DISABLED", "company_name": "",
+            "component_output_path": self.folder.name, "iriusrisk_max_concurrency": str(workers),
+            "iriusrisk_requests_per_second": "1000"
+        }
+        state_folder = os.path.join(self.folder.name, server.base_url.rsplit(":", 1)[1])
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(mock.patch.object(config, "properties_s", properties))
+            stack.enter_context(mock.patch.object(api_functions, "UPLOAD_STATE_FOLDER", state_folder))
+            if workers > 1:
+                # New weaknesses and countermeasures take longer to create than the threats they are related to
+                stack.enter_context(mock.patch.object(api_functions, "post_weakness",
+                                                      slow(api_functions.post_weakness)))
+                stack.enter_context(mock.patch.object(api_functions, "post_countermeasure",
+                                                      slow(api_functions.post_countermeasure)))
+            stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+            api_functions.upload_component_to_iriusrisk(copy.deepcopy(self.template))
+        return server
+
+    def test_upload_with_several_workers(self):
+        sequential = self.upload(1)
+        concurrent = self.upload(8)
+
+        self.assertEqual(1, sequential.max_in_flight)
+        self.assertGreater(concurrent.max_in_flight, 1)
+        self.assertEqual(sum(sequential.calls.values()), sum(concurrent.calls.values()))
+        self.assertEqual(get_server_state(sequential), get_server_state(concurrent))
+
+    def test_upload_again_only_reads(self):
+        server = self.upload(8)
+        self.assertGreater(server.calls["POST"], 0)
+
+        server.calls.clear()
+        self.upload(8, server)
+        self.assertEqual({"GET"}, set(server.calls))